@@ -0,0 +1,148 @@
+"""
+精简的检测响应
+
+/api/detect 的默认响应里，大模型输出会出现两到三次（outputs.text 原文，以及从中解析出的
+json_data 和 markdown_content），再加上 metadata、file_info、input_params 等。这里提供:
+
+    - FastJSONResponse   用 orjson 一次性序列化（未安装时回退到标准库 json）；
+    - compact_result     去掉已被解析为 json_data/markdown_content 的原文 text，以及值为空的字段；
+                         模型只返回 JSON（没有 markdown_content）时保留 text，前端据此渲染检测结果；
+    - project            ?fields= 字段投影，支持点号路径，如 fields=dify_result.outputs.json_data,usage；
+    - CompressionMiddleware  按 Accept-Encoding 协商 brotli（需安装 brotli）或 gzip 压缩。
+
+压缩只作用于带 Content-Length 的完整响应，流式响应（如导出接口）原样透传。
+"""
+
+import gzip
+import json
+import importlib.util
+from typing import Any, Dict, Iterable, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 为可选依赖
+    orjson = None
+
+# 值为空时在精简模式下省略的字段
+OMIT_WHEN_EMPTY = (None, {}, [])
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 orjson 序列化的 JSON 响应"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """精简检测响应：原文已被解析时不再重复返回，省略空字段"""
+    compacted = {key: value for key, value in result.items() if value not in OMIT_WHEN_EMPTY}
+    dify_result = compacted.get("dify_result")
+    if isinstance(dify_result, dict) and isinstance(dify_result.get("outputs"), dict):
+        outputs = dify_result["outputs"]
+        if outputs.get("json_data") is not None and outputs.get("markdown_content"):
+            outputs = {key: value for key, value in outputs.items() if key != "text"}
+        compacted["dify_result"] = dict(dify_result, outputs=outputs)
+    return compacted
+
+
+def parse_fields(fields: Optional[str]) -> List[List[str]]:
+    return [field.strip().split(".") for field in (fields or "").split(",") if field.strip()]
+
+
+def project(data: Dict[str, Any], paths: Iterable[List[str]]) -> Dict[str, Any]:
+    """按点号路径选取字段，保留原有的嵌套结构；不存在的路径忽略"""
+    projected: Dict[str, Any] = {}
+    for path in paths:
+        source, target = data, projected
+        for depth, key in enumerate(path):
+            if not isinstance(source, dict) or key not in source:
+                break
+            if depth == len(path) - 1:
+                target[key] = source[key]
+            else:
+                source = source[key]
+                target = target.setdefault(key, {})
+    return projected
+
+
+def brotli_available() -> bool:
+    return importlib.util.find_spec("brotli") is not None
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """按客户端声明选择压缩算法，优先 brotli"""
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in accept_encoding.split(",")
+        if part.strip() and not part.strip().endswith(";q=0")
+    }
+    if "br" in accepted and brotli_available():
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(body, quality=5 if level is None else level)
+    return gzip.compress(body, compresslevel=6 if level is None else level)
+
+
+class CompressionMiddleware:
+    """按 Accept-Encoding 压缩完整的文本/JSON响应"""
+
+    COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            eligible = (
+                not message.get("more_body", False)
+                and "content-length" in headers
+                and "content-encoding" not in headers
+                and len(body) >= self.minimum_size
+                and headers.get("content-type", "").startswith(self.COMPRESSIBLE_TYPES)
+            )
+            if eligible:
+                body = compress(body, encoding)
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = dict(message, body=body)
+            await send(start_message)
+            start_message = None
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
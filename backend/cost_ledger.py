@@ -0,0 +1,257 @@
+"""
+检测费用台账
+
+每次检测结束后，从Dify返回的元数据中提取令牌数与费用，写入 cost_ledger 集合，
+并累加到 /metrics 的 dify_tokens_total / dify_cost_total 指标。
+流式传输时费用来自各节点 execution_metadata 的累加；阻塞传输只返回 total_tokens，
+此时若配置了 DIFY_PRICE_PER_1K_TOKENS 则按令牌数估算费用，否则费用记为未知。
+
+台账写入在后台进行，数据库不可用时只记录日志，不影响检测请求本身；
+写入失败后 60 秒内不再尝试，避免未连接数据库时积压大量等待超时的写入任务。
+
+汇总接口:
+    GET /api/costs/summary?group_by=user,food_type,day&start=2025-01-01&end=2025-02-01
+
+命中结果缓存（response_mode=cache）和预筛查直接判定（response_mode=prescreen）的检测没有调用Dify，
+台账中记为 0 令牌；汇总时单独计为 avoided_calls，不计入每个标签的平均令牌数与费用。
+
+配置（环境变量）:
+    COST_LEDGER_ENABLED        是否写入台账，默认 true
+    DIFY_PRICE_PER_1K_TOKENS   每千令牌估算价格（Dify未返回费用时使用），默认不估算
+    DIFY_PRICE_CURRENCY        估算价格的币种，默认 USD
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import APIRouter, HTTPException, Query
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 汇总接口允许的分组维度 -> 台账字段
+GROUP_FIELDS = {
+    "user": "user",
+    "food_type": "food_type",
+    "day": "day",
+    "response_mode": "response_mode",
+    "prompt_version": "prompt_version",
+}
+
+# 没有调用Dify的检测方式，不计入每个标签的平均用量
+AVOIDED_RESPONSE_MODES = ["cache", "prescreen"]
+
+tokens_total = metrics.counter("dify_tokens_total", "Dify工作流消耗的令牌数")
+cost_total = metrics.counter("dify_cost_total", "Dify工作流费用")
+
+# 写入失败后暂停写入的时长（秒）
+FAILURE_BACKOFF = 60.0
+
+# 持有后台写入任务的引用，避免任务被提前回收
+_pending: Set[asyncio.Task] = set()
+_paused_until = 0.0
+
+
+def ledger_enabled() -> bool:
+    return os.getenv("COST_LEDGER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def extract_usage(dify_data: Any) -> Dict[str, Any]:
+    """从Dify返回数据中提取令牌数、费用与耗时，兼容流式与阻塞两种结构"""
+    usage = {
+        "total_tokens": 0,
+        "total_price": 0.0,
+        "currency": "USD",
+        "price_source": "unknown",
+        "elapsed_time": 0.0,
+    }
+    if not isinstance(dify_data, dict):
+        return usage
+
+    data = dify_data.get("data") if isinstance(dify_data.get("data"), dict) else dify_data
+    # 流式解析结果的汇总在 metadata 中，阻塞响应直接放在 data 上
+    metadata = data.get("metadata") if isinstance(data.get("metadata"), dict) else data
+
+    usage["total_tokens"] = int(_to_float(metadata.get("total_tokens") or data.get("total_tokens")))
+    usage["elapsed_time"] = _to_float(metadata.get("elapsed_time") or data.get("elapsed_time"))
+    if metadata.get("total_price") not in (None, ""):
+        usage["total_price"] = _to_float(metadata.get("total_price"))
+        usage["currency"] = metadata.get("currency") or "USD"
+        usage["price_source"] = "dify"
+    elif os.getenv("DIFY_PRICE_PER_1K_TOKENS"):
+        usage["total_price"] = usage["total_tokens"] / 1000 * _to_float(os.getenv("DIFY_PRICE_PER_1K_TOKENS"))
+        usage["currency"] = os.getenv("DIFY_PRICE_CURRENCY", "USD")
+        usage["price_source"] = "estimated"
+    return usage
+
+
+async def _insert_entry(entry: Dict[str, Any]):
+    """写入一条台账记录（motor/beanie 延迟导入，不拖慢服务启动）"""
+    global _paused_until
+    try:
+        from .models import CostLedgerEntry
+        from .database import ensure_database
+    except ImportError:
+        from backend.models import CostLedgerEntry
+        from backend.database import ensure_database
+
+    try:
+        await ensure_database()
+        await CostLedgerEntry(**entry).insert()
+    except Exception as e:
+        _paused_until = time.monotonic() + FAILURE_BACKOFF
+        logger.warning(f"写入费用台账失败，{FAILURE_BACKOFF:.0f}s 内暂停写入: {e}")
+
+
+def record_detection_cost(
+    detection_id: str,
+    user: str,
+    food_type: str,
+    package_food_type: Optional[str],
+    response_mode: str,
+    dify_data: Any,
+    success: bool = True,
+    image_bytes: int = 0,
+    prompt_version: Optional[str] = None,
+) -> Dict[str, Any]:
+    """记录一次检测的用量，返回提取出的用量信息"""
+    usage = extract_usage(dify_data)
+    tokens_total.inc(usage["total_tokens"], food_type=food_type)
+    if usage["price_source"] != "unknown":
+        cost_total.inc(usage["total_price"], currency=usage["currency"], food_type=food_type)
+
+    if ledger_enabled() and time.monotonic() >= _paused_until:
+        now = datetime.now()
+        entry = dict(
+            usage,
+            detection_id=detection_id,
+            user=user,
+            food_type=food_type,
+            package_food_type=package_food_type,
+            response_mode=response_mode,
+            success=success,
+            image_bytes=image_bytes,
+            prompt_version=prompt_version,
+            day=now.strftime("%Y-%m-%d"),
+            created_at=now,
+        )
+        task = asyncio.get_running_loop().create_task(_insert_entry(entry))
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+    return usage
+
+
+def build_summary_pipeline(
+    group_by: List[str],
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    user: Optional[str] = None,
+    food_type: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """构建按维度汇总费用的聚合管道"""
+    match: Dict[str, Any] = {}
+    day_range: Dict[str, str] = {}
+    if start:
+        day_range["$gte"] = start.isoformat()
+    if end:
+        day_range["$lt"] = end.isoformat()
+    if day_range:
+        match["day"] = day_range
+    if user:
+        match["user"] = user
+    if food_type:
+        match["food_type"] = food_type
+
+    group_id = {name: f"${GROUP_FIELDS[name]}" for name in group_by}
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": group_id,
+            "detections": {"$sum": 1},
+            "failed": {"$sum": {"$cond": ["$success", 0, 1]}},
+            "avoided_calls": {"$sum": {"$cond": [{"$in": ["$response_mode", AVOIDED_RESPONSE_MODES]}, 1, 0]}},
+            "total_tokens": {"$sum": "$total_tokens"},
+            "total_price": {"$sum": "$total_price"},
+            "image_bytes": {"$sum": "$image_bytes"},
+            "currencies": {"$addToSet": "$currency"},
+        }},
+        {"$sort": {"total_price": -1, "total_tokens": -1}},
+    ]
+
+
+def summarize_group(row: Dict[str, Any]) -> Dict[str, Any]:
+    """整理聚合结果，补充每个标签的平均令牌数与费用（只按实际调用了Dify的检测平均）"""
+    detections = row["detections"] or 1
+    dify_calls = row["detections"] - row.get("avoided_calls", 0)
+    return {
+        **row["_id"],
+        "detections": row["detections"],
+        "failed": row["failed"],
+        "avoided_calls": row.get("avoided_calls", 0),
+        "total_tokens": row["total_tokens"],
+        "total_price": round(row["total_price"], 6),
+        "currencies": sorted(row["currencies"]),
+        "tokens_per_label": round(row["total_tokens"] / (dify_calls or 1), 1),
+        "price_per_label": round(row["total_price"] / (dify_calls or 1), 6),
+        "avg_image_bytes": int(row["image_bytes"] / detections),
+    }
+
+
+router = APIRouter()
+
+
+@router.get("/api/costs/summary")
+async def cost_summary(
+    group_by: str = Query("day", description="分组维度，逗号分隔: user/food_type/day/response_mode/prompt_version"),
+    start: Optional[date] = Query(None, description="起始日期（含）"),
+    end: Optional[date] = Query(None, description="结束日期（不含）"),
+    user: Optional[str] = Query(None, description="客户端标识"),
+    food_type: Optional[str] = Query(None, description="食品类型"),
+):
+    """按用户、食品类型、日期汇总令牌与费用，并给出每个标签的平均用量"""
+    dimensions = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in dimensions if name not in GROUP_FIELDS]
+    if unknown or not dimensions:
+        raise HTTPException(status_code=400, detail=f"不支持的分组维度: {','.join(unknown) or group_by}")
+
+    try:
+        from .models import CostLedgerEntry
+        from .database import ensure_database
+    except ImportError:
+        from backend.models import CostLedgerEntry
+        from backend.database import ensure_database
+
+    pipeline = build_summary_pipeline(dimensions, start, end, user, food_type)
+    try:
+        await ensure_database()
+        cursor = CostLedgerEntry.get_motor_collection().aggregate(pipeline)
+        rows = [summarize_group(row) async for row in cursor]
+    except Exception as e:
+        logger.error(f"汇总费用台账失败: {e}")
+        raise HTTPException(status_code=503, detail=f"费用台账不可用: {str(e)}")
+
+    return {
+        "group_by": dimensions,
+        "groups": rows,
+        "totals": {
+            "detections": sum(row["detections"] for row in rows),
+            "avoided_calls": sum(row["avoided_calls"] for row in rows),
+            "total_tokens": sum(row["total_tokens"] for row in rows),
+            "total_price": round(sum(row["total_price"] for row in rows), 6),
+        },
+    }
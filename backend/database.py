@@ -1,13 +1,17 @@
 import os
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 try:
-    from .models import DetectionRecord, UploadedFile, User, DetectionHistory
+    from .models import DetectionRecord, UploadedFile, User, DetectionHistory, CostLedgerEntry
+    from .mongo_monitor import CommandMetricsListener, MongoClientSettings, client_options
 except ImportError:
     try:
-        from models import DetectionRecord, UploadedFile, User, DetectionHistory
+        from models import DetectionRecord, UploadedFile, User, DetectionHistory, CostLedgerEntry
+        from mongo_monitor import CommandMetricsListener, MongoClientSettings, client_options
     except ImportError:
-        from backend.models import DetectionRecord, UploadedFile, User, DetectionHistory
+        from backend.models import DetectionRecord, UploadedFile, User, DetectionHistory, CostLedgerEntry
+        from backend.mongo_monitor import CommandMetricsListener, MongoClientSettings, client_options
 
 
 class Database:
@@ -16,6 +20,8 @@ class Database:
     def __init__(self):
         self.client: AsyncIOMotorClient = None
         self.database_name: str = None
+        # init_beanie 与索引创建都完成后才置位，连接失败后下次调用会重新初始化
+        self.initialized = False
     
     async def connect(self):
         """连接到MongoDB数据库"""
@@ -33,10 +39,19 @@ class Database:
             else:
                 connection_string = f"mongodb://{mongodb_host}:{mongodb_port}/{self.database_name}"
             
-            print(f"🔗 连接到MongoDB: {mongodb_host}:{mongodb_port}/{self.database_name}")
+            # 连接池、超时、压缩与读偏好（见 mongo_monitor.py）
+            settings = MongoClientSettings()
+            options = client_options(settings)
+            print(f"🔗 连接到MongoDB: {mongodb_host}:{mongodb_port}/{self.database_name} "
+                  f"(连接池 {settings.min_pool_size}-{settings.max_pool_size}, 读偏好 {settings.read_preference}, "
+                  f"压缩 {options.get('compressors', '无')})")
             
-            # 创建客户端连接
-            self.client = AsyncIOMotorClient(connection_string)
+            # 创建客户端连接，命令监听器记录每条命令的耗时与慢命令
+            self.client = AsyncIOMotorClient(
+                connection_string,
+                event_listeners=[CommandMetricsListener(settings.slow_command_ms)],
+                **options
+            )
             
             # 初始化Beanie ODM
             await init_beanie(
@@ -45,7 +60,8 @@ class Database:
                     DetectionRecord,
                     UploadedFile,
                     User,
-                    DetectionHistory
+                    DetectionHistory,
+                    CostLedgerEntry
                 ]
             )
             
@@ -53,12 +69,18 @@ class Database:
             
         except Exception as e:
             print(f"❌ MongoDB连接失败: {str(e)}")
+            # 不保留初始化失败的客户端，否则后续调用会误以为已连接
+            if self.client is not None:
+                self.client.close()
+                self.client = None
             raise e
     
     async def disconnect(self):
         """断开数据库连接"""
         if self.client:
             self.client.close()
+            self.client = None
+            self.initialized = False
             print("🔌 MongoDB连接已断开")
     
     async def health_check(self) -> bool:
@@ -95,6 +117,7 @@ class Database:
 
 # 创建全局数据库实例
 database = Database()
+_init_lock = asyncio.Lock()
 
 
 async def get_database() -> Database:
@@ -121,9 +144,20 @@ async def init_database():
         await DetectionHistory.get_motor_collection().create_index("detection_time")
         await DetectionHistory.get_motor_collection().create_index("overall_rating")
         
+        await CostLedgerEntry.get_motor_collection().create_index([("day", 1), ("user", 1), ("food_type", 1)])
+        
         print("✅ 数据库索引创建成功")
     except Exception as e:
         print(f"⚠️ 创建索引时出现警告: {str(e)}")
+    database.initialized = True
+
+
+async def ensure_database() -> Database:
+    """确保数据库已连接（按需初始化，供无数据库启动的简化版服务使用）"""
+    async with _init_lock:
+        if not database.initialized:
+            await init_database()
+    return database
 
 
 async def close_database():
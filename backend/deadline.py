@@ -0,0 +1,106 @@
+"""
+请求截止时间与客户端断开检测
+
+浏览器离开页面或 nginx 代理超时后，继续等待Dify只会白白消耗令牌。这里提供:
+
+    - Deadline           请求的截止时间，从接收请求开始计时，传递到 httpx 超时和重试循环；
+    - request_deadline   由 X-Request-Timeout 请求头（秒）与 DETECT_DEADLINE 配置得出截止时间，
+                         请求头只能缩短、不能延长服务端上限；
+    - run_until_disconnected  运行检测的同时监听客户端断开，断开时取消检测。
+
+取消检测会沿调用链传到 Dify 传输层，流式模式下根据已拿到的 task_id 调用Dify的任务停止接口。
+
+配置:
+    DETECT_DEADLINE   单次检测的最长时间（秒），默认 290（略小于 nginx 的 proxy_read_timeout 300s）
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Optional
+
+import httpx
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# nginx 的 "客户端关闭连接" 状态码，客户端已经收不到响应，只用于访问日志
+CLIENT_CLOSED_REQUEST = 499
+
+detection_cancelled_total = metrics.counter("detection_cancelled_total", "被取消的检测数")
+
+
+class ClientDisconnected(Exception):
+    """检测完成前客户端已断开"""
+
+
+class Deadline:
+    """请求截止时间（基于 time.monotonic）"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, base: httpx.Timeout) -> httpx.Timeout:
+        """把 httpx 的各项超时限制在剩余时间以内"""
+        remaining = max(self.remaining(), 0.001)
+
+        def cap(value: Optional[float]) -> float:
+            return remaining if value is None else min(value, remaining)
+
+        return httpx.Timeout(connect=cap(base.connect), read=cap(base.read), write=cap(base.write), pool=cap(base.pool))
+
+
+def request_deadline(timeout_header: Optional[str] = None) -> Deadline:
+    """按服务端上限和客户端声明的超时得出截止时间"""
+    seconds = float(os.getenv("DETECT_DEADLINE", "290"))
+    if timeout_header:
+        try:
+            requested = float(timeout_header)
+        except ValueError:
+            requested = None
+        if requested is not None and requested > 0:
+            seconds = min(seconds, requested)
+    return Deadline(seconds)
+
+
+async def wait_for_disconnect(request) -> None:
+    """等待客户端断开（请求体已读完后，ASGI 的下一条消息只可能是 http.disconnect）"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_until_disconnected(request, awaitable: Awaitable[Any]) -> Any:
+    """运行检测，客户端先断开时取消检测并抛出 ClientDisconnected"""
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not work.done():
+            work.cancel()
+    if not work.done() or work.cancelled():
+        # 等待被取消的检测完成清理（释放槽位、停止Dify任务）
+        try:
+            await work
+        except (asyncio.CancelledError, Exception):
+            pass
+        detection_cancelled_total.inc(reason="client_disconnect")
+        logger.warning("客户端已断开，取消检测")
+        raise ClientDisconnected()
+    return work.result()
@@ -0,0 +1,101 @@
+"""
+检测记录持久化
+
+/api/detect 拿到有效的检测JSON后，在后台写入一条 DetectionRecord（detection_records 集合），
+记录本次检测的提示词/工作流指纹（prompt_version）和提交的检测参数（input_params）。
+检测历史导出（export.py）和整改后的定向复核（/api/detections/{record_id}/recheck）读取这些记录，
+检测响应中的 record_id 就是记录的 _id。
+
+命中结果缓存或复用近重复结果时同样写入一条新记录，检测时间取本次请求的检测时间。
+预筛查直接判定的结果不是完整检测，不写入。
+
+与费用台账一样，写入在后台进行，数据库不可用时只记录日志，不影响检测请求本身；
+写入失败后 60 秒内不再尝试，此期间的检测不返回 record_id。
+
+配置（环境变量）:
+    DETECTION_HISTORY_ENABLED   是否写入检测记录，默认 true
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+try:
+    from .detection_schema import normalize_detection, to_record_fields
+    from .metrics import metrics
+except ImportError:
+    from backend.detection_schema import normalize_detection, to_record_fields
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+records_written_total = metrics.counter("detection_records_written_total", "写入的检测记录数（按结果）")
+
+# 写入失败后暂停写入的时长（秒）
+FAILURE_BACKOFF = 60.0
+
+# 持有后台写入任务的引用，避免任务被提前回收
+_pending: Set[asyncio.Task] = set()
+_paused_until = 0.0
+
+
+def history_enabled() -> bool:
+    return os.getenv("DETECTION_HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+def parse_detection_time(value: Optional[str]) -> datetime:
+    """表单中的检测时间（如 2025-01-01），无法解析时取当前时间"""
+    try:
+        return datetime.fromisoformat(value) if value else datetime.now()
+    except ValueError:
+        return datetime.now()
+
+
+async def _insert_record(document: Dict[str, Any]):
+    """写入一条检测记录（motor/beanie 延迟导入，不拖慢服务启动）"""
+    global _paused_until
+    try:
+        from .models import DetectionRecord
+        from .database import ensure_database
+    except ImportError:
+        from backend.models import DetectionRecord
+        from backend.database import ensure_database
+
+    try:
+        await ensure_database()
+        await DetectionRecord(**document).insert()
+        records_written_total.inc(result="ok")
+    except Exception as e:
+        _paused_until = time.monotonic() + FAILURE_BACKOFF
+        records_written_total.inc(result="failed")
+        logger.warning(f"写入检测记录失败，{FAILURE_BACKOFF:.0f}s 内暂停写入: {e}")
+
+
+def record_detection(
+    json_data: Any,
+    detection_time: Optional[str],
+    input_params: Dict[str, Any],
+    prompt_version: Optional[str] = None,
+) -> Optional[str]:
+    """在后台写入检测记录，返回记录ID；未开启、暂停写入或检测结果无效时返回 None"""
+    if not history_enabled() or time.monotonic() < _paused_until or not isinstance(json_data, dict):
+        return None
+    normalized = normalize_detection(json_data)
+    if not normalized.valid:
+        return None
+    from bson import ObjectId
+
+    record_id = ObjectId()
+    document = dict(
+        to_record_fields(normalized, prompt_version).model_dump(mode="json"),
+        id=record_id,
+        detection_time=parse_detection_time(detection_time),
+        input_params=input_params,
+    )
+    task = asyncio.get_running_loop().create_task(_insert_record(document))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+    return str(record_id)
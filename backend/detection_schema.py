@@ -0,0 +1,276 @@
+"""
+检测结果JSON的校验与规范化
+
+大模型输出的检测JSON格式并不稳定：合规率可能是 "75%"、"75"、0.75，
+问题数量与详细检测结果对不上，风险等级出现「高」「严重」「无风险」等多种写法。
+本模块在不重新调用Dify的前提下，把输出修复为统一格式:
+
+    - 合规率统一为 "NN%" 字符串（前端按 parseInt 读取），缺失或无法解析时按详细结果重算；
+    - 检测结果映射为 合格/不合格/豁免/待复核，风险等级映射为 高风险/中风险/低风险/无风险；
+    - 关键问题 = 不合格项中的高风险数，一般问题 = 不合格项中的中风险与低风险数，均按详细结果重算；
+    - 总体评级缺失或无法识别时按问题数推断。
+
+所有别名表和正则在模块加载时构建，规范化过程只做字典查找。
+缺少「详细检测结果」或结构无法修复的输出标记为无效（valid=False），调用方自行决定是否拒收。
+
+规范化结果可以直接映射为 DetectionRecord 的字段（见 to_record_fields），问题数与合规性评估一致:
+general_issues 即「一般问题」（中风险与低风险），low_risk_issues 是其中的低风险数。
+"""
+
+import re
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class CheckResult(str, Enum):
+    """单项检测结论"""
+    PASS = "合格"
+    FAIL = "不合格"
+    EXEMPT = "豁免"
+    REVIEW = "待复核"
+
+
+class RiskLevel(str, Enum):
+    """风险等级"""
+    HIGH = "高风险"
+    MEDIUM = "中风险"
+    LOW = "低风险"
+    NONE = "无风险"
+
+
+class OverallRating(str, Enum):
+    """总体评级"""
+    PASS = "合格"
+    BASIC = "基本合格"
+    FAIL = "不合格"
+
+
+def _alias_table(aliases: Dict[Enum, List[str]]) -> Dict[str, str]:
+    """别名 → 标准取值；同时收录原样和小写形式，标准写法一次字典查找即可命中"""
+    table = {}
+    for member, names in aliases.items():
+        for name in [member.value] + names:
+            table[name] = member.value
+            table[name.strip().lower()] = member.value
+    return table
+
+
+CHECK_RESULT_ALIASES = _alias_table({
+    CheckResult.PASS: ["符合", "符合要求", "通过", "正常", "合规", "pass", "passed", "ok", "✓", "✅"],
+    CheckResult.FAIL: ["不符合", "不符合要求", "未通过", "不合规", "缺失", "错误", "fail", "failed", "✗", "❌"],
+    CheckResult.EXEMPT: ["不适用", "免除", "可豁免", "n/a", "na", "exempt"],
+    CheckResult.REVIEW: ["待确认", "无法判断", "需复核", "需人工复核", "review"],
+})
+
+RISK_ALIASES = _alias_table({
+    RiskLevel.HIGH: ["高", "高危", "严重", "重大", "关键", "high", "critical", "severe"],
+    RiskLevel.MEDIUM: ["中", "中等", "一般", "中度", "medium", "moderate"],
+    RiskLevel.LOW: ["低", "轻微", "较低", "low", "minor"],
+    RiskLevel.NONE: ["无", "无风险", "-", "—", "none", "", "不适用"],
+})
+
+RATING_ALIASES = _alias_table({
+    OverallRating.PASS: ["符合", "合规", "通过", "pass"],
+    OverallRating.BASIC: ["基本符合", "基本合规", "部分合格", "partially compliant"],
+    OverallRating.FAIL: ["不符合", "不合规", "未通过", "fail"],
+})
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+# 热路径上直接比较字符串，避免反复访问枚举的 value
+_PASS, _FAIL = CheckResult.PASS.value, CheckResult.FAIL.value
+_REVIEW = CheckResult.REVIEW.value
+_HIGH, _MEDIUM, _LOW, _NONE = (level.value for level in RiskLevel)
+
+
+class DetectionRecordFields(BaseModel):
+    """与 DetectionRecord 对应的字段（不依赖beanie，便于在无数据库时使用）"""
+    product_name: str = Field("", description="产品名称")
+    product_type: str = Field("", description="产品类型")
+    package_size_category: str = Field("", description="包装面积分类")
+    overall_rating: OverallRating = Field(..., description="总体评级")
+    compliance_rate: float = Field(..., ge=0, le=100, description="合规率")
+    key_issues: int = Field(0, ge=0, description="关键问题数量")
+    general_issues: int = Field(0, ge=0, description="一般问题数量（中风险与低风险，同合规性评估的一般问题）")
+    low_risk_issues: int = Field(0, ge=0, description="低风险问题数量（包含在一般问题中）")
+    detection_result: Dict[str, Any] = Field(..., description="详细检测结果")
+    prompt_version: Optional[str] = Field(None, description="提示词/工作流指纹")
+
+
+class NormalizedDetection(BaseModel):
+    """规范化结果"""
+    valid: bool
+    data: Optional[Dict[str, Any]] = None
+    repairs: List[str] = []
+    errors: List[str] = []
+
+
+def coerce_percentage(value: Any) -> Optional[float]:
+    """把 "75%"、"75"、75、0.75、"约75.5 %" 统一为 0-100 的数值，无法解析时返回 None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+        has_percent = False
+    elif isinstance(value, str):
+        match = _NUMBER.search(value)
+        if not match:
+            return None
+        number = float(match.group(0))
+        has_percent = "%" in value or "％" in value
+    else:
+        return None
+    # 不带百分号的小数视为比例
+    if not has_percent and 0 < number <= 1 and not float(number).is_integer():
+        number *= 100
+    if number < 0 or number > 100:
+        return None
+    return round(number, 1)
+
+
+def coerce_count(value: Any) -> Optional[int]:
+    """把 2、"2"、"2个"、2.0 统一为非负整数，无法解析时返回 None"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, int):
+        return value if value >= 0 else None
+    if isinstance(value, float):
+        return int(value) if value >= 0 and value.is_integer() else None
+    if isinstance(value, str):
+        match = _NUMBER.search(value)
+        if match and float(match.group(0)) >= 0:
+            return int(float(match.group(0)))
+    return None
+
+
+def _lookup(table: Dict[str, str], value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    found = table.get(value)
+    return found if found is not None else table.get(value.strip().lower())
+
+
+def _format_percentage(number: float) -> str:
+    return f"{int(number)}%" if float(number).is_integer() else f"{number}%"
+
+
+def _normalize_item(item: Dict[str, Any], index: int, repairs: List[str]) -> Dict[str, Any]:
+    item = dict(item)
+    label = item.get("检测项目") or f"第{index + 1}项"
+
+    raw_result = item.get("检测结果")
+    result = _lookup(CHECK_RESULT_ALIASES, raw_result)
+    if result is None:
+        # 无法识别时按是否填写了问题描述推断
+        problem = str(item.get("问题描述") or "").strip()
+        result = _FAIL if problem and problem not in ("无", "-") else _REVIEW
+        repairs.append(f"{label}: 检测结果 {raw_result!r} 无法识别，推断为 {result}")
+    elif raw_result != result:
+        repairs.append(f"{label}: 检测结果 {raw_result!r} → {result}")
+    item["检测结果"] = result
+
+    raw_risk = item.get("风险等级")
+    risk = _lookup(RISK_ALIASES, raw_risk if raw_risk is not None else "")
+    if result == _FAIL and risk in (None, _NONE):
+        risk = _MEDIUM
+        repairs.append(f"{label}: 不合格项缺少风险等级，按中风险处理")
+    elif result != _FAIL and risk not in (None, _NONE):
+        repairs.append(f"{label}: {result}项的风险等级 {raw_risk!r} 已清除")
+        risk = _NONE
+    elif risk is None:
+        risk = _NONE
+        repairs.append(f"{label}: 风险等级 {raw_risk!r} 无法识别，按无风险处理")
+    elif raw_risk != risk:
+        repairs.append(f"{label}: 风险等级 {raw_risk!r} → {risk}")
+    item["风险等级"] = risk
+    return item
+
+
+def normalize_detection(json_data: Any) -> NormalizedDetection:
+    """校验并修复检测JSON，返回规范化结果"""
+    if not isinstance(json_data, dict):
+        return NormalizedDetection(valid=False, errors=["检测结果不是JSON对象"])
+
+    errors: List[str] = []
+    repairs: List[str] = []
+    data = dict(json_data)
+
+    raw_items = data.get("详细检测结果")
+    if not isinstance(raw_items, list):
+        return NormalizedDetection(valid=False, data=json_data, errors=["缺少「详细检测结果」列表"])
+    items = []
+    for index, item in enumerate(raw_items):
+        if not isinstance(item, dict):
+            repairs.append(f"第{index + 1}项不是对象，已丢弃")
+            continue
+        items.append(_normalize_item(item, index, repairs))
+    data["详细检测结果"] = items
+
+    # 按详细结果重算问题数
+    failed = [item["风险等级"] for item in items if item["检测结果"] == _FAIL]
+    high, medium = failed.count(_HIGH), failed.count(_MEDIUM)
+    low = len(failed) - high - medium
+    judged = len(failed) + sum(1 for item in items if item["检测结果"] == _PASS)
+
+    assessment = data.get("合规性评估")
+    if not isinstance(assessment, dict):
+        repairs.append("缺少「合规性评估」，已按详细结果生成")
+        assessment = {}
+    assessment = dict(assessment)
+
+    for field, expected in (("关键问题", high), ("一般问题", medium + low)):
+        reported = coerce_count(assessment.get(field))
+        if reported != expected:
+            repairs.append(f"{field}: {assessment.get(field)!r} → {expected}（按详细结果重算）")
+        assessment[field] = expected
+
+    rate = coerce_percentage(assessment.get("合规率"))
+    if rate is None:
+        if not judged:
+            errors.append("合规率无法解析，且没有可用于重算的检测项")
+            rate = 0.0
+        else:
+            rate = round((judged - len(failed)) / judged * 100, 1)
+            repairs.append(f"合规率: {assessment.get('合规率')!r} → {_format_percentage(rate)}（按详细结果重算）")
+    elif assessment.get("合规率") != _format_percentage(rate):
+        repairs.append(f"合规率: {assessment.get('合规率')!r} → {_format_percentage(rate)}")
+    assessment["合规率"] = _format_percentage(rate)
+
+    rating = _lookup(RATING_ALIASES, assessment.get("总体评级"))
+    if rating is None:
+        rating = (OverallRating.FAIL if high else OverallRating.BASIC if failed else OverallRating.PASS).value
+        repairs.append(f"总体评级: {assessment.get('总体评级')!r} → {rating}（按问题数推断）")
+    elif assessment.get("总体评级") != rating:
+        repairs.append(f"总体评级: {assessment.get('总体评级')!r} → {rating}")
+    assessment["总体评级"] = rating
+    data["合规性评估"] = assessment
+
+    if not isinstance(data.get("基本信息"), dict):
+        repairs.append("缺少「基本信息」，已补空对象")
+        data["基本信息"] = {}
+
+    return NormalizedDetection(valid=not errors, data=data, repairs=repairs, errors=errors)
+
+
+def to_record_fields(normalized: NormalizedDetection, prompt_version: Optional[str] = None) -> DetectionRecordFields:
+    """把规范化后的检测JSON映射为 DetectionRecord 字段"""
+    if not normalized.valid or normalized.data is None:
+        raise ValueError(f"检测结果无效: {'; '.join(normalized.errors)}")
+    data = normalized.data
+    info = data["基本信息"]
+    assessment = data["合规性评估"]
+    failed = [item["风险等级"] for item in data["详细检测结果"] if item["检测结果"] == _FAIL]
+    return DetectionRecordFields(
+        product_name=str(info.get("产品名称") or ""),
+        product_type=str(info.get("产品类型") or ""),
+        package_size_category=str(info.get("包装面积分类") or ""),
+        overall_rating=assessment["总体评级"],
+        compliance_rate=coerce_percentage(assessment["合规率"]),
+        key_issues=assessment["关键问题"],
+        general_issues=assessment["一般问题"],
+        low_risk_issues=failed.count(_LOW),
+        detection_result=data,
+        prompt_version=prompt_version,
+    )
@@ -0,0 +1,936 @@
+"""
+Dify API 客户端
+
+统一管理与Dify服务器的交互：文件上传、工作流调用以及响应解析。
+所有请求复用同一个 httpx.AsyncClient（连接池），工作流调用通过可插拔的传输方式完成：
+
+- blocking:  response_mode=blocking，等待Dify返回完整JSON
+- streaming: response_mode=streaming，异步逐行解析SSE事件
+
+两种传输方式都是异步的，不会阻塞事件循环。默认传输方式由环境变量
+DIFY_RESPONSE_MODE 决定（按部署选择），同一进程中的不同入口可以用 ResponseModeApp
+包装应用、为其请求指定自己的默认值（按应用选择），也可以在单次调用时指定（按请求选择）。
+
+每次调用从后端池（dify_pool）中选择一个Dify实例/应用密钥，上传、工作流运行和任务停止都在同一个后端上完成。
+
+调用方可以传入请求截止时间（deadline.Deadline），各项 httpx 超时和重试等待都不会超过剩余时间。
+工作流调用被放弃（客户端断开、截止时间已过、重试）时，流式模式会用已拿到的 task_id
+调用Dify的任务停止接口；阻塞模式拿不到 task_id，只记录浪费的等待时间。
+"""
+
+import os
+import re
+import json
+import uuid
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional, Iterable, Dict, Any, List, Tuple, Union
+
+import httpx
+import aiofiles
+
+try:
+    from .detection_schema import normalize_detection
+    from .deadline import Deadline, detection_cancelled_total
+    from .dify_pool import DifyBackend, DifyBackendConfig, DifyPool, DifyPoolSettings
+    from .hedging import hedge_policy
+    from .metrics import metrics
+except ImportError:
+    from backend.detection_schema import normalize_detection
+    from backend.deadline import Deadline, detection_cancelled_total
+    from backend.dify_pool import DifyBackend, DifyBackendConfig, DifyPool, DifyPoolSettings
+    from backend.hedging import hedge_policy
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Dify API配置（指向本地模拟服务时只需设置 DIFY_BASE_URL，如 http://127.0.0.1:5001/v1）
+DIFY_BASE_URL = os.getenv("DIFY_BASE_URL", "http://114.215.204.62/v1").rstrip("/")
+DIFY_API_URL = os.getenv("DIFY_API_URL", f"{DIFY_BASE_URL}/workflows/run")
+DIFY_FILE_URL = os.getenv("DIFY_FILE_URL", f"{DIFY_BASE_URL}/files/upload")
+DIFY_STOP_URL = os.getenv("DIFY_STOP_URL", f"{DIFY_BASE_URL}/workflows/tasks/{{task_id}}/stop")
+DIFY_API_TOKEN = os.getenv("DIFY_API_TOKEN", "app-xBO6kaetqL7HF0avy1cSZMTR")
+
+# 创建全局Dify后端池实例（未配置 DIFY_BACKENDS 时只有上面这一个后端）
+dify_pool = DifyPool.from_settings(DifyPoolSettings(), DifyBackendConfig(
+    name="default", base_url=DIFY_BASE_URL, api_token=DIFY_API_TOKEN,
+    run_url=DIFY_API_URL, file_url=DIFY_FILE_URL, stop_url=DIFY_STOP_URL
+))
+
+RESPONSE_MODES = ("blocking", "streaming")
+DEFAULT_RESPONSE_MODE = os.getenv("DIFY_RESPONSE_MODE", "blocking")
+# 当前请求所属应用的默认传输方式（由 ResponseModeApp 设置）
+_app_response_mode: ContextVar[Optional[str]] = ContextVar("dify_app_response_mode", default=None)
+
+# 连接池与超时配置
+HTTP_TIMEOUT = httpx.Timeout(
+    connect=30.0,  # 连接超时
+    read=300.0,    # 读取超时
+    write=30.0,    # 写入超时
+    pool=30.0      # 连接池超时
+)
+UPLOAD_TIMEOUT = httpx.Timeout(60.0, connect=30.0)
+STOP_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+# 剩余时间不足以完成一次尝试时不再重试
+MIN_ATTEMPT_SECONDS = 5.0
+HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=int(os.getenv("DIFY_MAX_KEEPALIVE", "20")),
+    max_connections=int(os.getenv("DIFY_MAX_CONNECTIONS", "100")),
+    keepalive_expiry=30.0
+)
+
+MIME_TYPE_MAP = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.pdf': 'application/pdf'
+}
+
+task_stops_total = metrics.counter("dify_task_stops_total", "放弃的Dify工作流运行的停止结果")
+wasted_tokens_total = metrics.counter("dify_wasted_tokens_total", "放弃的Dify工作流运行已消耗的令牌数")
+wasted_seconds_total = metrics.counter("dify_wasted_seconds_total", "放弃的Dify工作流运行已花费的秒数")
+
+_http_client: Optional[httpx.AsyncClient] = None
+# 后台执行的任务停止请求（保留引用，避免被垃圾回收）
+_stop_requests = set()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取共享的HTTP客户端（首次调用时创建）"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return _http_client
+
+
+def set_http_client(client: Optional[httpx.AsyncClient]):
+    """替换共享的HTTP客户端（用于测试或自定义传输）"""
+    global _http_client
+    _http_client = client
+
+
+async def close_http_client():
+    """关闭共享的HTTP客户端"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def default_response_mode() -> str:
+    """未指定传输方式时使用的默认值：应用的默认值优先，其次是部署默认值"""
+    return _app_response_mode.get() or DEFAULT_RESPONSE_MODE
+
+
+class ResponseModeApp:
+    """以指定的默认传输方式运行应用（ASGI包装，只影响经由该包装进入的请求）"""
+
+    def __init__(self, app, response_mode: str):
+        if response_mode not in RESPONSE_MODES:
+            raise ValueError(f"不支持的传输方式: {response_mode}")
+        self.app = app
+        self.response_mode = response_mode
+
+    async def __call__(self, scope, receive, send):
+        token = _app_response_mode.set(self.response_mode)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _app_response_mode.reset(token)
+
+
+def auth_headers(backend: Optional[DifyBackend] = None) -> Dict[str, str]:
+    return (backend or dify_pool.primary).headers()
+
+
+def is_backend_error(result: Dict[str, Any]) -> bool:
+    """调用结果是否说明后端本身不健康（5xx、429），工作流自身失败不算"""
+    status_code = result.get("status_code") or 0
+    return not result.get("success") and (status_code >= 500 or status_code == 429)
+
+
+# 工作流输出中可能存放大模型文本的字段，按优先级排列
+POSSIBLE_TEXT_FIELDS = ('text', 'result', 'output', 'content', 'answer', 'response')
+
+
+def separate_json_and_markdown(text_content):
+    """分离JSON和Markdown内容"""
+    logger.info("开始分离JSON和Markdown内容")
+
+    if not text_content or not isinstance(text_content, str):
+        logger.warning("输入内容为空或不是字符串")
+        return {
+            "json_data": None,
+            "markdown_content": text_content or ""
+        }
+
+    try:
+        # 方法1: 查找「不规范内容总结报告」的位置
+        report_index = text_content.find('不规范内容总结报告')
+        if report_index != -1:
+            logger.info(f"找到「不规范内容总结报告」位置: {report_index}")
+
+            # 分离JSON和Markdown（报告标题前常带有 "### " 等标记，JSON截止到其前最后一个右花括号）
+            json_end = text_content.rfind('}', 0, report_index) + 1
+            json_part = text_content[:json_end].strip()
+            markdown_part = text_content[json_end:].strip()
+
+            # 尝试解析JSON部分
+            try:
+                json_data = json.loads(json_part)
+                logger.info("成功解析JSON部分")
+                return {
+                    "json_data": json_data,
+                    "markdown_content": markdown_part
+                }
+            except json.JSONDecodeError as e:
+                logger.warning(f"JSON解析失败: {e}")
+
+        # 方法2: 使用正则表达式提取最大的JSON对象
+        logger.info("尝试使用正则表达式提取JSON")
+        json_match = re.search(r'\{.*\}', text_content, re.DOTALL)
+        if json_match:
+            json_candidate = json_match.group(0)
+            try:
+                json_data = json.loads(json_candidate)
+                logger.info("成功通过正则表达式解析JSON")
+
+                # 提取Markdown部分（JSON之后的内容）
+                markdown_start = json_match.end()
+                markdown_content = text_content[markdown_start:].strip()
+
+                return {
+                    "json_data": json_data,
+                    "markdown_content": markdown_content
+                }
+            except json.JSONDecodeError as e:
+                logger.warning(f"正则表达式提取的JSON解析失败: {e}")
+
+        # 方法3: 如果都失败，返回原始内容作为Markdown
+        logger.warning("无法分离JSON和Markdown，返回原始内容")
+        return {
+            "json_data": None,
+            "markdown_content": text_content
+        }
+
+    except Exception as e:
+        logger.error(f"分离JSON和Markdown时发生错误: {e}")
+        return {
+            "json_data": None,
+            "markdown_content": text_content
+        }
+
+
+def process_dify_response(dify_data):
+    """处理Dify响应数据，确保格式符合前端期望"""
+    logger.info("开始处理Dify响应数据")
+
+    try:
+        # 提取outputs数据
+        outputs = {}
+        metadata = {}
+
+        # 从不同可能的字段中提取数据
+        if isinstance(dify_data, dict):
+            # 提取输出数据
+            if 'data' in dify_data and 'outputs' in dify_data['data']:
+                outputs = dify_data['data']['outputs']
+            elif 'outputs' in dify_data:
+                outputs = dify_data['outputs']
+            elif 'data' in dify_data:
+                outputs = dify_data['data']
+            else:
+                outputs = dify_data
+
+            # 提取元数据
+            if 'data' in dify_data and 'metadata' in dify_data['data']:
+                metadata = dify_data['data']['metadata']
+            elif 'metadata' in dify_data:
+                metadata = dify_data['metadata']
+
+        logger.debug(f"提取的outputs: {outputs}")
+        logger.debug(f"提取的metadata: {metadata}")
+
+        # 查找文本内容
+        text_content = None
+        for field in POSSIBLE_TEXT_FIELDS:
+            if isinstance(outputs.get(field), str):
+                text_content = outputs[field]
+                logger.info(f"找到文本内容在字段: {field}")
+                break
+
+        if text_content:
+            # 分离JSON和Markdown内容
+            separated_data = separate_json_and_markdown(text_content)
+
+            # 更新outputs，添加分离后的数据
+            outputs['json_data'] = separated_data['json_data']
+            outputs['markdown_content'] = separated_data['markdown_content']
+
+            # 校验并修复检测JSON（合规率、问题数、风险等级等），无需重新调用Dify
+            if separated_data['json_data'] is not None:
+                normalized = normalize_detection(separated_data['json_data'])
+                if normalized.data is not None:
+                    outputs['json_data'] = normalized.data
+                outputs['validation'] = {
+                    "valid": normalized.valid,
+                    "repairs": normalized.repairs,
+                    "errors": normalized.errors,
+                }
+                if normalized.repairs or normalized.errors:
+                    logger.info(f"检测结果已修复 {len(normalized.repairs)} 处，错误 {len(normalized.errors)} 处")
+
+            # 保留原始文本
+            if 'text' not in outputs:
+                outputs['text'] = text_content
+
+        # 构建符合前端期望的结构
+        processed_result = {
+            "outputs": outputs,
+            "metadata": metadata
+        }
+
+        logger.info("Dify响应数据处理完成")
+        return processed_result
+
+    except Exception as e:
+        logger.error(f"处理Dify响应数据时发生错误: {e}")
+        import traceback
+        logger.error(f"堆栈跟踪: {traceback.format_exc()}")
+
+        # 返回原始数据作为fallback
+        return {
+            "outputs": dify_data if isinstance(dify_data, dict) else {"raw_data": dify_data},
+            "metadata": {}
+        }
+
+
+class StreamingResponseParser:
+    """Dify SSE事件的增量解析器，逐行喂入，最后汇总结果"""
+
+    def __init__(self):
+        self.workflow_data = {
+            "task_id": None,
+            "workflow_run_id": None,
+            "workflow_id": None,
+            "status": None,
+            "outputs": {},
+            "total_tokens": 0,
+            "total_price": 0.0,
+            "currency": "USD",
+            "elapsed_time": 0.0,
+            "total_steps": 0,
+            "created_at": None,
+            "finished_at": None,
+            "event_count": 0
+        }
+
+    @property
+    def task_id(self) -> Optional[str]:
+        return self.workflow_data["task_id"]
+
+    def feed_line(self, line: str):
+        """处理一行SSE数据"""
+        if not line or not line.startswith("data: "):
+            return
+
+        workflow_data = self.workflow_data
+        json_str = line[6:]  # 去掉"data: "前缀
+        try:
+            event_data = json.loads(json_str)
+        except json.JSONDecodeError as e:
+            logger.warning(f"JSON解析失败: {json_str[:200]} - {e}")
+            return
+
+        try:
+            event_type = event_data.get("event")
+            data = event_data.get("data") or {}
+            workflow_data["event_count"] += 1
+
+            # 根据事件类型处理
+            if event_type == "workflow_started":
+                workflow_data["task_id"] = event_data.get("task_id")
+                workflow_data["workflow_run_id"] = event_data.get("workflow_run_id")
+                workflow_data["workflow_id"] = data.get("workflow_id")
+                workflow_data["created_at"] = data.get("created_at")
+                logger.info(f"工作流开始: {workflow_data['task_id']}")
+
+            elif event_type == "node_started":
+                logger.debug(f"节点开始: {data.get('title')} ({data.get('node_type')})")
+
+            elif event_type == "node_finished":
+                # 累计执行时间
+                workflow_data["elapsed_time"] += data.get("elapsed_time") or 0
+
+                # 提取执行元数据
+                metadata = data.get("execution_metadata") or {}
+                if metadata:
+                    workflow_data["total_tokens"] += metadata.get("total_tokens") or 0
+                    # 确保total_price是数字类型
+                    price = metadata.get("total_price", 0.0)
+                    if isinstance(price, str):
+                        try:
+                            price = float(price)
+                        except (ValueError, TypeError):
+                            price = 0.0
+                    workflow_data["total_price"] += price or 0.0
+                    workflow_data["currency"] = metadata.get("currency", "USD")
+
+                # 提取输出数据
+                outputs = data.get("outputs") or {}
+                if outputs:
+                    workflow_data["outputs"].update(outputs)
+
+                logger.debug(f"节点完成: {data.get('title')} ({data.get('status')})")
+
+            elif event_type == "workflow_finished":
+                workflow_data["status"] = data.get("status")
+                workflow_data["finished_at"] = data.get("finished_at")
+                workflow_data["total_steps"] = data.get("total_steps", 0)
+
+                # 最终输出
+                final_outputs = data.get("outputs") or {}
+                if final_outputs:
+                    workflow_data["outputs"].update(final_outputs)
+
+                # 最终统计
+                final_tokens = data.get("total_tokens")
+                if final_tokens:
+                    workflow_data["total_tokens"] = final_tokens
+
+                logger.info(f"工作流完成: {workflow_data['status']}, 总令牌: {workflow_data['total_tokens']}")
+
+            elif event_type in ("tts_message", "tts_message_end", "ping"):
+                pass
+
+            else:
+                logger.debug(f"未处理的事件类型: {event_type}")
+
+        except Exception as e:
+            logger.error(f"处理事件数据失败: {e}")
+
+    def result(self) -> Dict[str, Any]:
+        """汇总解析结果"""
+        workflow_data = self.workflow_data
+        if workflow_data["status"] == "succeeded":
+            logger.info("流式响应解析成功!")
+            return {
+                "success": True,
+                "data": {
+                    "workflow_run_id": workflow_data["workflow_run_id"],
+                    "workflow_id": workflow_data["workflow_id"],
+                    "task_id": workflow_data["task_id"],
+                    "status": workflow_data["status"],
+                    "outputs": workflow_data["outputs"],
+                    "metadata": {
+                        "total_tokens": workflow_data["total_tokens"],
+                        "total_price": workflow_data["total_price"],
+                        "currency": workflow_data["currency"],
+                        "elapsed_time": workflow_data["elapsed_time"],
+                        "total_steps": workflow_data["total_steps"]
+                    },
+                    "created_at": workflow_data["created_at"],
+                    "finished_at": workflow_data["finished_at"],
+                    "event_count": workflow_data["event_count"]
+                }
+            }
+        elif workflow_data["status"] == "failed":
+            logger.error("工作流执行失败")
+            return {
+                "success": False,
+                "error": "工作流执行失败",
+                "data": workflow_data
+            }
+        else:
+            logger.warning(f"工作流状态异常: {workflow_data['status']}")
+            return {
+                "success": False,
+                "error": f"工作流状态异常: {workflow_data['status']}",
+                "data": workflow_data
+            }
+
+
+def parse_streaming_response(lines: Iterable[str]):
+    """解析Dify流式响应（同步版本，输入为SSE文本行）"""
+    parser = StreamingResponseParser()
+    for line in lines:
+        parser.feed_line(line)
+    return parser.result()
+
+
+class DifyTransport:
+    """工作流传输方式基类"""
+
+    response_mode = None
+
+    def __init__(self, client_factory=get_http_client):
+        self.client_factory = client_factory
+
+    async def run_workflow(self, payload: Dict[str, Any], deadline: Optional[Deadline] = None,
+                           backend: Optional[DifyBackend] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @staticmethod
+    def _timeout_kwargs(deadline: Optional[Deadline]) -> Dict[str, Any]:
+        return {"timeout": deadline.timeout(HTTP_TIMEOUT)} if deadline else {}
+
+    def _abandoned(self, payload: Dict[str, Any], started: float, backend: DifyBackend,
+                   task_id: Optional[str] = None, tokens: int = 0):
+        """记录被放弃的工作流运行，能拿到 task_id 时在后台停止Dify任务"""
+        wasted_seconds_total.inc(time.monotonic() - started, response_mode=self.response_mode)
+        if tokens:
+            wasted_tokens_total.inc(tokens, response_mode=self.response_mode)
+        if task_id:
+            schedule_task_stop(task_id, payload.get("user"), backend)
+        else:
+            task_stops_total.inc(result="no_task_id")
+
+    def _error_result(self, response: httpx.Response, error_text: str):
+        logger.error(f"Dify API调用失败! 状态码: {response.status_code}")
+        logger.error(f"响应内容: {error_text[:1000]}")
+        return {
+            "success": False,
+            "error": f"Dify API调用失败: {response.status_code} - {error_text}",
+            "message": "检测失败",
+            "status_code": response.status_code
+        }
+
+
+class BlockingTransport(DifyTransport):
+    """阻塞模式：等待Dify返回完整的JSON结果"""
+
+    response_mode = "blocking"
+
+    async def run_workflow(self, payload, deadline=None, backend=None):
+        client = self.client_factory()
+        backend = backend or dify_pool.primary
+        started = time.monotonic()
+        try:
+            response = await client.post(
+                backend.run_url,
+                headers={**backend.headers(), "Content-Type": "application/json"},
+                json=payload,
+                **self._timeout_kwargs(deadline)
+            )
+        except BaseException as e:
+            # 阻塞模式在完成前拿不到 task_id，无法停止远端运行
+            if not isinstance(e, httpx.ConnectError):
+                self._abandoned(payload, started, backend)
+            raise
+        logger.info(f"HTTP响应状态码: {response.status_code}")
+
+        if response.status_code != 200:
+            return self._error_result(response, response.text)
+
+        try:
+            result = response.json()
+        except Exception as json_error:
+            logger.error(f"JSON解析失败: {str(json_error)}")
+            logger.error(f"原始响应内容: {response.text[:1000]}...")
+            return {
+                "success": False,
+                "error": f"响应解析失败: {str(json_error)}",
+                "message": "响应格式错误",
+                "raw_response": response.text[:500]
+            }
+
+        data = result.get("data") if isinstance(result, dict) else None
+        if isinstance(data, dict) and data.get("status") == "failed":
+            return {
+                "success": False,
+                "error": f"工作流执行失败: {data.get('error')}",
+                "message": "检测失败",
+                "data": result
+            }
+
+        return {
+            "success": True,
+            "data": result,
+            "message": "Dify Workflow调用成功"
+        }
+
+
+class StreamingTransport(DifyTransport):
+    """流式模式：异步逐行读取SSE事件"""
+
+    response_mode = "streaming"
+
+    async def run_workflow(self, payload, deadline=None, backend=None):
+        client = self.client_factory()
+        backend = backend or dify_pool.primary
+        started = time.monotonic()
+        parser = StreamingResponseParser()
+        try:
+            async with client.stream(
+                "POST",
+                backend.run_url,
+                headers={
+                    **backend.headers(),
+                    "Content-Type": "application/json",
+                    "User-Agent": "Food-Safety-Label-Detection/1.0"
+                },
+                json=payload,
+                **self._timeout_kwargs(deadline)
+            ) as response:
+                logger.info(f"HTTP响应状态码: {response.status_code}")
+
+                if response.status_code != 200:
+                    await response.aread()
+                    return self._error_result(response, response.text)
+
+                async for line in response.aiter_lines():
+                    parser.feed_line(line)
+        except BaseException as e:
+            # 被取消、超时或连接中断：工作流仍在Dify上运行，按 task_id 停止
+            if parser.workflow_data["status"] is None and not isinstance(e, httpx.ConnectError):
+                self._abandoned(payload, started, backend, parser.task_id, parser.workflow_data["total_tokens"])
+            raise
+
+        result = parser.result()
+        if result["success"]:
+            result["message"] = "Dify Workflow调用成功"
+        else:
+            result.setdefault("message", "检测失败")
+        return result
+
+
+TRANSPORTS = {
+    "blocking": BlockingTransport,
+    "streaming": StreamingTransport,
+}
+
+
+def get_transport(response_mode: Optional[str] = None) -> DifyTransport:
+    """按名称获取传输方式，未指定时使用部署默认值"""
+    response_mode = response_mode or default_response_mode()
+    if response_mode not in TRANSPORTS:
+        raise ValueError(f"不支持的传输方式: {response_mode}")
+    return TRANSPORTS[response_mode]()
+
+
+async def stop_workflow_task(task_id: str, user_id: Optional[str], backend: Optional[DifyBackend] = None) -> bool:
+    """调用Dify的任务停止接口（仅对流式运行有效），失败时只记录日志"""
+    backend = backend or dify_pool.primary
+    try:
+        response = await get_http_client().post(
+            backend.stop_url(task_id),
+            headers={**backend.headers(), "Content-Type": "application/json"},
+            json={"user": user_id},
+            timeout=STOP_TIMEOUT
+        )
+    except Exception as e:
+        logger.warning(f"停止Dify任务 {task_id} 失败: {e}")
+        task_stops_total.inc(result="failed")
+        return False
+    stopped = response.status_code == 200
+    task_stops_total.inc(result="stopped" if stopped else "failed")
+    if stopped:
+        logger.info(f"已停止Dify任务 {task_id}")
+    else:
+        logger.warning(f"停止Dify任务 {task_id} 失败: {response.status_code} - {response.text[:200]}")
+    return stopped
+
+
+def schedule_task_stop(task_id: str, user_id: Optional[str], backend: Optional[DifyBackend] = None):
+    """在后台停止Dify任务；调用方通常正在被取消，不能等待停止请求完成"""
+    task = asyncio.get_running_loop().create_task(stop_workflow_task(task_id, user_id, backend))
+    _stop_requests.add(task)
+    task.add_done_callback(_stop_requests.discard)
+
+
+async def upload_image_to_dify(file_path: str, user_id: str, deadline: Optional[Deadline] = None,
+                               backend: Optional[DifyBackend] = None):
+    """上传文件到Dify服务器（文件ID只在该后端上有效）"""
+    backend = backend or dify_pool.primary
+    try:
+        logger.info(f"开始上传文件到Dify: {file_path}")
+
+        # 根据文件扩展名确定MIME类型
+        file_ext = os.path.splitext(file_path)[1].lower()
+        mime_type = MIME_TYPE_MAP.get(file_ext, 'image/jpeg')
+
+        # 准备文件上传（异步读取，避免阻塞事件循环）
+        async with aiofiles.open(file_path, 'rb') as f:
+            content = await f.read()
+        files = {
+            "file": (os.path.basename(file_path), content, mime_type)
+        }
+        data = {"user": user_id}
+
+        response = await get_http_client().post(
+            backend.file_url,
+            headers=backend.headers(),
+            files=files,
+            data=data,
+            timeout=deadline.timeout(UPLOAD_TIMEOUT) if deadline else UPLOAD_TIMEOUT
+        )
+
+        logger.info(f"Dify文件上传响应状态码: {response.status_code}")
+
+        if response.status_code == 201:  # 201 表示创建成功
+            file_info = response.json()
+            logger.info(f"文件上传成功，文件ID: {file_info.get('id')}")
+            return file_info
+        else:
+            logger.error(f"文件上传失败，状态码: {response.status_code}")
+            logger.error(f"错误内容: {response.text}")
+            return None
+    except Exception as e:
+        logger.error(f"上传文件时发生错误: {str(e)}")
+        import traceback
+        logger.error(f"堆栈跟踪: {traceback.format_exc()}")
+        return None
+
+
+def build_workflow_payload(tag_images, food_type: str, package_food_type: str, single_or_multi: str,
+                           package_size: str, response_mode: str, user_id: str,
+                           extra_inputs: Optional[Dict[str, Any]] = None):
+    """构建工作流请求数据，extra_inputs 为附加的工作流输入（如本地预筛查结论）"""
+    return {
+        "inputs": {
+            "TagImage": tag_images,
+            "Foodtype": food_type,
+            "PackageFoodType": package_food_type,
+            "SingleOrMulti": single_or_multi,
+            "PackageSize": package_size,
+            **(extra_inputs or {})
+        },
+        "response_mode": response_mode,
+        "user": user_id
+    }
+
+
+async def prepare_tag_image(image_file_path: str, user_id: str, deadline: Optional[Deadline] = None,
+                            backend: Optional[DifyBackend] = None,
+                            pre_uploaded: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """把一张标签图片转换为工作流的 TagImage 条目，返回 (条目, 耗时信息)
+
+    pre_uploaded 为 文件路径 -> 预上传条目（pre_upload.PreUpload），已在该后端上预上传的图片不再上传。
+    """
+    started = time.perf_counter()
+    pre_upload = (pre_uploaded or {}).get(image_file_path)
+    tag_image = await pre_upload.tag_image(backend or dify_pool.primary, deadline) if pre_upload else None
+    reused = tag_image is not None
+    # 检查文件路径类型，决定使用本地文件还是远程URL
+    if reused:
+        logger.info(f"使用预上传的Dify文件ID: {tag_image['upload_file_id']}")
+    elif image_file_path.startswith("http"):
+        # 远程URL方式
+        logger.info("使用远程URL方式上传图片")
+        tag_image = {
+            "type": "image",
+            "transfer_method": "remote_url",
+            "url": image_file_path
+        }
+    else:
+        # 本地文件，先上传到Dify服务器，然后使用文件ID
+        logger.info("使用Dify文件上传方式处理图片")
+        file_info = await upload_image_to_dify(image_file_path, user_id, deadline, backend)
+
+        if file_info and file_info.get('id'):
+            # 使用上传后的文件ID
+            tag_image = {
+                "type": "image",
+                "transfer_method": "local_file",
+                "upload_file_id": file_info['id']
+            }
+            logger.info(f"使用Dify文件ID: {file_info['id']}")
+        else:
+            raise Exception(f"图片上传Dify服务器失败，请检查: {os.path.basename(image_file_path)}")
+    timing = {
+        "file": os.path.basename(image_file_path),
+        "transfer_method": tag_image["transfer_method"],
+        "upload_ms": round((time.perf_counter() - started) * 1000, 2),
+        "pre_uploaded": reused,
+    }
+    return tag_image, timing
+
+
+async def prepare_tag_images(image_file_paths: List[str], user_id: str, deadline: Optional[Deadline] = None,
+                             backend: Optional[DifyBackend] = None, pre_uploaded: Optional[Dict[str, Any]] = None
+                             ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """在共享的HTTP客户端上并发上传多张标签图片，保持原有顺序"""
+    prepared = await asyncio.gather(*(prepare_tag_image(path, user_id, deadline, backend, pre_uploaded)
+                                      for path in image_file_paths))
+    return [tag_image for tag_image, _ in prepared], [timing for _, timing in prepared]
+
+
+def deadline_exceeded_result(deadline: Deadline, attempts: int) -> Dict[str, Any]:
+    logger.error(f"超过请求截止时间（{deadline.seconds:g}秒），放弃调用Dify")
+    detection_cancelled_total.inc(reason="deadline")
+    return {
+        "success": False,
+        "error": f"检测超时: 超过请求截止时间 {deadline.seconds:g} 秒",
+        "message": "检测超时",
+        "deadline_exceeded": True,
+        "attempts": attempts
+    }
+
+
+async def call_dify_workflow(image_file_path: Union[str, List[str]], food_type: str, package_food_type: str,
+                             single_or_multi: str, package_size: str, max_retries: int = 2,
+                             response_mode: Optional[str] = None, extra_inputs: Optional[Dict[str, Any]] = None,
+                             deadline: Optional[Deadline] = None, pre_uploaded: Optional[Dict[str, Any]] = None,
+                             categories: Iterable[str] = ()):
+    """调用Dify Workflow API进行食品标签检测，带重试机制
+
+    image_file_path 可以是单张图片，也可以是同一产品多个面（正面、背面、侧面）的图片列表，
+    多张图片并发上传后在一次工作流运行中作为 TagImage 列表提交。
+    传入 deadline 时，每次尝试（上传 + 工作流）都限制在剩余时间内，剩余时间不足时不再重试。
+    每次尝试的上传和工作流运行都在同一个后端上完成，重试时优先换一个后端。
+    开启对冲（hedging.py）时，运行时间超过近期延迟分位数的尝试会在另一个后端上再发起一次，先成功者胜出。
+    pre_uploaded 中的图片已在后台预上传（pre_upload.py），优先选择持有这些文件ID的后端并跳过上传。
+    categories 为检测参数成立的类别条件（prompt_assembly.route_categories），优先路由到服务这些类别的专门工作流。
+    """
+    image_file_paths = [image_file_path] if isinstance(image_file_path, str) else list(image_file_path)
+
+    try:
+        transport = get_transport(response_mode)
+    except ValueError as e:
+        return {"success": False, "error": str(e), "message": "参数错误"}
+
+    async def run_on(backend: DifyBackend) -> Dict[str, Any]:
+        """在一个后端上完成上传和工作流运行"""
+        user_id = f"user-{uuid.uuid4().hex[:8]}"
+        started = time.monotonic()
+        async with dify_pool.track(backend) as call:
+            upload_started = time.perf_counter()
+            tag_images, image_timings = await prepare_tag_images(image_file_paths, user_id, deadline, backend,
+                                                                 pre_uploaded)
+            logger.info(f"{len(tag_images)} 张图片准备完成，耗时 {(time.perf_counter() - upload_started) * 1000:.1f}ms")
+
+            payload = build_workflow_payload(
+                tag_images, food_type, package_food_type, single_or_multi, package_size,
+                transport.response_mode, user_id, extra_inputs
+            )
+            logger.debug("请求载荷: " + json.dumps(payload, ensure_ascii=False))
+
+            result = await transport.run_workflow(payload, deadline, backend)
+            call.healthy = not is_backend_error(result)
+        if result["success"]:
+            hedge_policy.observe(time.monotonic() - started)
+        result["image_timings"] = image_timings
+        result["backend"] = backend.name
+        return result
+
+    # 预上传的文件都在同一个后端上时优先使用该后端
+    pre_upload_backends = {entry.backend_name for entry in (pre_uploaded or {}).values()}
+    prefer = pre_upload_backends.pop() if len(pre_upload_backends) == 1 else None
+    tried_backends: List[str] = []
+    for attempt in range(max_retries + 1):
+        if attempt > 0 and not dify_pool.reachable():
+            # 健康探测显示所有后端都不可达，重试只会再等一轮超时
+            logger.error("健康探测显示所有Dify后端均不可用，放弃重试")
+            return {
+                "success": False,
+                "error": "健康探测显示所有Dify后端均不可用",
+                "message": "Dify服务暂不可用，请稍后重试",
+                "attempts": attempt
+            }
+        backend = dify_pool.choose(exclude=tried_backends, prefer=prefer, categories=categories)
+        # 换到另一个后端重试时不需要退避
+        backoff = 2 ** attempt if attempt > 0 and backend.name in tried_backends else 0
+        if deadline and deadline.remaining() < backoff + (MIN_ATTEMPT_SECONDS if attempt > 0 else 0):
+            return deadline_exceeded_result(deadline, attempt)
+        tried_backends.append(backend.name)
+        try:
+            if attempt > 0:
+                logger.info(f"第 {attempt + 1} 次尝试调用Dify API...")
+                await asyncio.sleep(backoff)  # 指数退避
+
+            logger.info("=" * 60)
+            logger.info(f"开始调用Dify Workflow API (尝试 {attempt + 1}/{max_retries + 1}, 传输方式: {transport.response_mode})")
+            logger.info(f"图片文件路径: {', '.join(image_file_paths)}")
+            logger.info(f"食品类型: {food_type}, 包装食品类型: {package_food_type}, "
+                        f"单包装或多包装: {single_or_multi}, 包装尺寸: {package_size}")
+
+            logger.info(f"Dify后端: {backend.name} ({backend.run_url})")
+
+            async with asyncio.timeout(deadline.remaining() if deadline else None):
+                result = await hedge_policy.run(
+                    lambda: run_on(backend),
+                    lambda: run_on(dify_pool.choose(exclude=[backend.name], categories=categories)),
+                    succeeded=lambda result: result["success"]
+                )
+            if is_backend_error(result) and len(dify_pool.backends) > 1 and attempt < max_retries:
+                # 后端本身出错（5xx、429），换一个后端重试
+                logger.warning(f"Dify后端 {backend.name} 返回 {result.get('status_code')}，换后端重试")
+                continue
+            logger.info(f"Dify API调用结果: success={result['success']}")
+            logger.info("=" * 60)
+            return result
+
+        except httpx.ReadError as e:
+            logger.error(f"读取响应时发生错误: {str(e)}")
+            logger.error("这通常表示Dify服务器处理完成但在传输响应时连接中断")
+
+            if attempt < max_retries:
+                logger.info(f"将在 {2 ** (attempt + 1)} 秒后重试...")
+                continue
+            else:
+                logger.error("已达到最大重试次数，放弃重试")
+                return {
+                    "success": False,
+                    "error": f"读取响应失败: {str(e)}",
+                    "message": "响应读取中断，但Dify服务器可能已处理完成",
+                    "suggestion": "请检查Dify服务器日志确认处理状态",
+                    "attempts": attempt + 1
+                }
+        except httpx.ConnectError as e:
+            logger.error(f"连接错误: {str(e)}")
+
+            if attempt < max_retries:
+                logger.info(f"连接失败，将在 {2 ** (attempt + 1)} 秒后重试...")
+                continue
+            else:
+                logger.error("已达到最大重试次数，放弃重试")
+                return {
+                    "success": False,
+                    "error": f"连接Dify服务器失败: {str(e)}",
+                    "message": "无法连接到Dify服务器",
+                    "attempts": attempt + 1
+                }
+        except (httpx.TimeoutException, TimeoutError) as e:
+            if deadline and deadline.expired:
+                # 截止时间已过（asyncio.timeout 到期或 httpx 超时被限制在剩余时间内），不再重试
+                return deadline_exceeded_result(deadline, attempt + 1)
+            logger.error(f"请求超时: {str(e)}")
+
+            if attempt < max_retries:
+                logger.info(f"请求超时，将在 {2 ** (attempt + 1)} 秒后重试...")
+                continue
+            else:
+                logger.error("已达到最大重试次数，放弃重试")
+                return {
+                    "success": False,
+                    "error": f"请求超时: {str(e)}",
+                    "message": "请求超时",
+                    "attempts": attempt + 1
+                }
+        except Exception as e:
+            logger.error(f"发生未预期异常: {str(e)}")
+            logger.error(f"异常类型: {type(e).__name__}")
+            import traceback
+            logger.error(f"堆栈跟踪:\n{traceback.format_exc()}")
+
+            if attempt < max_retries:
+                logger.info(f"发生异常，将在 {2 ** (attempt + 1)} 秒后重试...")
+                continue
+            else:
+                logger.error("已达到最大重试次数，放弃重试")
+                return {
+                    "success": False,
+                    "error": str(e),
+                    "message": "检测过程中发生错误",
+                    "attempts": attempt + 1
+                }
+
+    # 如果所有重试都失败了（理论上不应该到这里）
+    return {
+        "success": False,
+        "error": "所有重试尝试都失败",
+        "message": "检测失败",
+        "attempts": max_retries + 1
+    }
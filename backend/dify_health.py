@@ -0,0 +1,197 @@
+"""
+Dify健康探测
+
+后台任务按固定间隔对后端池中的每个Dify后端发起轻量请求（GET /v1/info，使用该后端的应用密钥），
+同时检查可达性和鉴权，不运行工作流、不消耗令牌。
+
+每个后端保留最近若干次探测的结果、延迟 EWMA、连续失败次数和最近一次错误:
+    - 鉴权失败（401/403）立即判定为不可用（重试也不会好转）；
+    - 连接错误、超时、5xx 等连续达到 DIFY_PROBE_FAILURES 次判定为不可用；
+    - 一次探测成功即恢复。
+判定结果写入 DifyBackend.probe_healthy，路由（dify_pool.choose）和重试（call_dify_workflow）据此跳过
+不可用的后端；汇总结果在每次探测后预先计算好，/health 读取时是 O(1) 的。
+
+配置:
+    DIFY_PROBE_INTERVAL   探测间隔（秒），默认 15，0 表示不启动探测
+    DIFY_PROBE_TIMEOUT    单次探测超时（秒），默认 5
+    DIFY_PROBE_FAILURES   连续失败多少次判定为不可用，默认 2
+    DIFY_PROBE_HISTORY    保留的最近探测结果数，默认 20
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+try:
+    from .dify_pool import DifyBackend, DifyPool
+    from .metrics import metrics
+    from . import dify_client
+except ImportError:
+    from backend.dify_pool import DifyBackend, DifyPool
+    from backend.metrics import metrics
+    from backend import dify_client
+
+logger = logging.getLogger(__name__)
+
+probe_up = metrics.gauge("dify_probe_up", "各Dify后端的健康探测结论（1 可用 / 0 不可用）")
+probe_latency = metrics.gauge("dify_probe_latency_ewma_seconds", "各Dify后端健康探测延迟 EWMA（秒）")
+probes_total = metrics.counter("dify_probes_total", "健康探测次数（ok / auth_failed / http_error / unreachable）")
+
+# 探测延迟 EWMA 的平滑系数
+LATENCY_ALPHA = 0.3
+
+
+class BackendHealth:
+    """单个后端的滚动健康状态"""
+
+    def __init__(self, name: str, history: int):
+        self.name = name
+        self.results: deque = deque(maxlen=history)
+        self.status = "unknown"
+        self.latency_ewma: Optional[float] = None
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[str] = None
+        self.last_ok: Optional[str] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "status": self.status,
+            "latency_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "success_rate": round(sum(self.results) / len(self.results), 3) if self.results else None,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_checked": self.last_checked,
+            "last_ok": self.last_ok,
+        }
+
+
+class DifyHealthProber:
+    """定期探测后端池中的Dify后端"""
+
+    def __init__(self, pool: DifyPool, interval: float = 15.0, timeout: float = 5.0, failures: int = 2,
+                 history: int = 20, client_factory: Callable[[], httpx.AsyncClient] = None):
+        self.pool = pool
+        self.interval = interval
+        self.timeout = httpx.Timeout(timeout)
+        self.failures = max(1, failures)
+        self.history = history
+        self.client_factory = client_factory or dify_client.get_http_client
+        self._health: Dict[str, BackendHealth] = {}
+        self._summary: Dict[str, Any] = {"status": "unknown", "backends": []}
+        self._task: Optional[asyncio.Task] = None
+
+    def _state(self, backend: DifyBackend) -> BackendHealth:
+        health = self._health.get(backend.name)
+        if health is None:
+            health = self._health[backend.name] = BackendHealth(backend.name, self.history)
+        return health
+
+    async def probe_backend(self, backend: DifyBackend) -> BackendHealth:
+        """探测一个后端并更新其健康状态"""
+        health = self._state(backend)
+        started = time.perf_counter()
+        try:
+            response = await self.client_factory().get(backend.info_url, headers=backend.headers(),
+                                                       timeout=self.timeout)
+            if response.status_code == 200:
+                outcome, error = "ok", None
+            elif response.status_code in (401, 403):
+                outcome, error = "auth_failed", f"鉴权失败: HTTP {response.status_code}"
+            else:
+                outcome, error = "http_error", f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            outcome, error = "unreachable", f"{type(e).__name__}: {e}"
+        latency = time.perf_counter() - started
+
+        now = datetime.now().isoformat()
+        health.last_checked = now
+        health.results.append(outcome == "ok")
+        probes_total.inc(backend=backend.name, result=outcome)
+        if outcome == "ok":
+            health.consecutive_failures = 0
+            health.last_ok = now
+            health.latency_ewma = latency if health.latency_ewma is None else (
+                LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * health.latency_ewma
+            )
+            probe_latency.set(health.latency_ewma, backend=backend.name)
+            health.status = "healthy"
+        else:
+            health.consecutive_failures += 1
+            health.last_error = error
+            if outcome == "auth_failed" or health.consecutive_failures >= self.failures:
+                health.status = outcome
+            elif health.status != "unknown":
+                health.status = "degraded"
+
+        healthy = health.status not in ("auth_failed", "http_error", "unreachable")
+        if healthy != (backend.probe_healthy is not False):
+            if healthy:
+                logger.info(f"Dify后端 {backend.name} 健康探测恢复")
+            else:
+                logger.warning(f"Dify后端 {backend.name} 健康探测判定不可用: {error}")
+        backend.probe_healthy = healthy
+        probe_up.set(1 if healthy else 0, backend=backend.name)
+        return health
+
+    async def probe_once(self) -> Dict[str, Any]:
+        """并发探测所有后端，返回新的汇总"""
+        await asyncio.gather(*(self.probe_backend(backend) for backend in self.pool.backends))
+        self._summary = self._summarize()
+        return self._summary
+
+    def _summarize(self) -> Dict[str, Any]:
+        backends: List[Dict[str, Any]] = [self._state(backend).snapshot() for backend in self.pool.backends]
+        statuses = [backend["status"] for backend in backends]
+        if all(status == "healthy" for status in statuses):
+            status = "healthy"
+        elif any(status in ("healthy", "degraded") for status in statuses):
+            status = "degraded"
+        elif all(status == "unknown" for status in statuses):
+            status = "unknown"
+        else:
+            status = "unhealthy"
+        return {"status": status, "interval": self.interval, "backends": backends}
+
+    def summary(self) -> Dict[str, Any]:
+        """最近一次探测的汇总（预先计算，O(1)）"""
+        return self._summary
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe_once()
+            except Exception as e:
+                logger.warning(f"Dify健康探测失败: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """启动后台探测"""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 创建全局健康探测实例
+dify_health = DifyHealthProber(
+    dify_client.dify_pool,
+    interval=float(os.getenv("DIFY_PROBE_INTERVAL", "15")),
+    timeout=float(os.getenv("DIFY_PROBE_TIMEOUT", "5")),
+    failures=int(os.getenv("DIFY_PROBE_FAILURES", "2")),
+    history=int(os.getenv("DIFY_PROBE_HISTORY", "20")),
+)
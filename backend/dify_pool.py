@@ -0,0 +1,245 @@
+"""
+Dify后端池
+
+单个Dify实例（一个应用密钥）的并发与限流决定了整体吞吐。后端池把流量分到多个
+Dify实例/应用密钥上:
+
+    - 路由: 选择 EWMA延迟 × (进行中请求数 + 1) / 权重 最小的后端，
+      新加入、还没有延迟样本的后端按其他后端的平均延迟计算，会被尽快用上；
+    - 摘除: 连续失败（连接错误、超时、5xx/429）达到阈值的后端摘除一段时间，
+      到期后恢复，恢复后再失败一次立即重新摘除；健康探测（dify_health.py）判定不可用的后端
+      在探测恢复前也不参与路由；全部不可用时仍选择最早恢复的后端；
+    - 粘性: 上传得到的文件ID只在对应实例上有效，一次检测尝试的上传、工作流运行、
+      任务停止都在同一个后端上完成，重试时优先换一个后端；
+    - 分类: 配置了 categories 的后端是为某些产品类别单独发布的精简工作流（条件名称见
+      prompt_assembly.py，如 non_direct、imported），只接收这些类别的检测；这些后端都不可用时
+      回退到未配置 categories 的通用后端。
+
+配置（pydantic-settings，环境变量前缀 DIFY_）:
+    DIFY_BACKENDS          JSON 数组，如
+                           [{"name": "a", "base_url": "http://h1/v1", "api_token": "app-..."},
+                            {"name": "b", "base_url": "http://h2/v1", "api_token": "app-...", "weight": 2},
+                            {"name": "nd", "base_url": "http://h2/v1", "api_token": "app-...",
+                             "categories": ["non_direct"]}]
+                           未配置时使用 DIFY_BASE_URL / DIFY_API_URL / DIFY_FILE_URL / DIFY_API_TOKEN 组成的单个后端
+    DIFY_EJECT_FAILURES    连续失败多少次后摘除，默认 3
+    DIFY_EJECT_SECONDS     摘除时长（秒），默认 30
+    DIFY_EWMA_ALPHA        延迟 EWMA 的平滑系数，默认 0.3
+"""
+
+import time
+import random
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional
+
+from pydantic import BaseModel, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+backend_outstanding = metrics.gauge("dify_backend_outstanding", "各Dify后端进行中的请求数")
+backend_latency = metrics.gauge("dify_backend_latency_ewma_seconds", "各Dify后端的延迟 EWMA（秒）")
+backend_requests_total = metrics.counter("dify_backend_requests_total", "各Dify后端的请求数")
+backend_ejections_total = metrics.counter("dify_backend_ejections_total", "Dify后端被摘除的次数")
+
+
+class DifyBackendConfig(BaseModel):
+    """单个Dify后端（实例 + 应用密钥）"""
+
+    name: str
+    base_url: str
+    api_token: str
+    run_url: Optional[str] = None
+    file_url: Optional[str] = None
+    stop_url: Optional[str] = None
+    info_url: Optional[str] = None
+    weight: float = Field(1.0, gt=0)
+    categories: List[str] = []
+
+
+class DifyPoolSettings(BaseSettings):
+    """后端池配置"""
+
+    model_config = SettingsConfigDict(env_prefix="DIFY_")
+
+    backends: List[DifyBackendConfig] = []
+    eject_failures: int = Field(3, ge=1)
+    eject_seconds: float = Field(30.0, ge=0)
+    ewma_alpha: float = Field(0.3, gt=0, le=1)
+
+
+class DifyBackend:
+    """后端的地址、密钥与运行状态"""
+
+    def __init__(self, config: DifyBackendConfig):
+        base_url = config.base_url.rstrip("/")
+        self.name = config.name
+        self.base_url = base_url
+        self.api_token = config.api_token
+        self.weight = config.weight
+        self.categories = frozenset(config.categories)
+        self.run_url = config.run_url or f"{base_url}/workflows/run"
+        self.file_url = config.file_url or f"{base_url}/files/upload"
+        self.stop_url_template = config.stop_url or f"{base_url}/workflows/tasks/{{task_id}}/stop"
+        self.info_url = config.info_url or f"{base_url}/info"
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        # 健康探测结论：None 表示尚未探测
+        self.probe_healthy: Optional[bool] = None
+
+    def stop_url(self, task_id: str) -> str:
+        return self.stop_url_template.format(task_id=task_id)
+
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_token}"}
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until and self.probe_healthy is not False
+
+    def snapshot(self, now: float) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "run_url": self.run_url,
+            "weight": self.weight,
+            "categories": sorted(self.categories),
+            "outstanding": self.outstanding,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "ejected_for": round(max(0.0, self.ejected_until - now), 1),
+            "probe_healthy": self.probe_healthy,
+        }
+
+
+class BackendCall:
+    """一次后端调用的结果；healthy 为 None 表示被取消，不计入健康统计"""
+
+    def __init__(self, backend: DifyBackend):
+        self.backend = backend
+        self.healthy: Optional[bool] = True
+
+
+class DifyPool:
+    """多个Dify后端之间的负载均衡"""
+
+    def __init__(self, backends: Iterable[DifyBackendConfig], eject_failures: int = 3,
+                 eject_seconds: float = 30.0, ewma_alpha: float = 0.3):
+        self.backends = [DifyBackend(config) for config in backends]
+        if not self.backends:
+            raise ValueError("Dify后端池至少需要一个后端")
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.ewma_alpha = ewma_alpha
+        for backend in self.backends:
+            backend_outstanding.set_function(lambda backend=backend: backend.outstanding, backend=backend.name)
+
+    @classmethod
+    def from_settings(cls, settings: DifyPoolSettings, default: DifyBackendConfig) -> "DifyPool":
+        return cls(settings.backends or [default], settings.eject_failures, settings.eject_seconds,
+                   settings.ewma_alpha)
+
+    @property
+    def primary(self) -> DifyBackend:
+        return self.backends[0]
+
+    def get(self, name: Optional[str]) -> DifyBackend:
+        for backend in self.backends:
+            if backend.name == name:
+                return backend
+        return self.primary
+
+    def reachable(self) -> bool:
+        """健康探测是否认为至少有一个后端可用（尚未探测的后端视为可用）"""
+        return any(backend.probe_healthy is not False for backend in self.backends)
+
+    def _cost(self, backend: DifyBackend, default_latency: float) -> float:
+        latency = backend.latency_ewma if backend.latency_ewma is not None else default_latency
+        return latency * (backend.outstanding + 1) / backend.weight
+
+    @staticmethod
+    def _route(candidates: List[DifyBackend], categories: Iterable[str]) -> List[DifyBackend]:
+        """服务这些类别的专门后端；没有时使用通用后端"""
+        wanted = set(categories)
+        dedicated = [backend for backend in candidates if backend.categories & wanted]
+        if dedicated:
+            return dedicated
+        return [backend for backend in candidates if not backend.categories] or candidates
+
+    def choose(self, exclude: Iterable[str] = (), prefer: Optional[str] = None,
+               categories: Iterable[str] = ()) -> DifyBackend:
+        """选择代价最小的可用后端，尽量避开 exclude 中的后端；prefer 可用、未被排除且服务该类别时直接选择它
+
+        categories 为本次检测成立的类别条件，优先选择服务这些类别的专门后端。
+        """
+        now = time.monotonic()
+        available = [backend for backend in self.backends if backend.available(now)]
+        if not available:
+            # 全部被摘除或探测不可用：仍要选一个，选最早恢复的
+            backend = min(self.backends, key=lambda backend: backend.ejected_until)
+            logger.warning(f"所有Dify后端都不可用，使用最早恢复的后端 {backend.name}")
+            return backend
+        excluded = set(exclude)
+        candidates = self._route(
+            [backend for backend in available if backend.name not in excluded] or available, categories
+        )
+        for backend in candidates:
+            if backend.name == prefer and backend.name not in excluded:
+                return backend
+        known = [backend.latency_ewma for backend in self.backends if backend.latency_ewma is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        return min(candidates, key=lambda backend: (self._cost(backend, default_latency), random.random()))
+
+    def record(self, backend: DifyBackend, latency: float, healthy: Optional[bool]):
+        """记录一次调用的结果"""
+        if healthy is None:
+            backend_requests_total.inc(backend=backend.name, result="cancelled")
+            return
+        backend_requests_total.inc(backend=backend.name, result="ok" if healthy else "error")
+        if healthy:
+            backend.consecutive_failures = 0
+            previous = backend.latency_ewma
+            backend.latency_ewma = latency if previous is None else (
+                self.ewma_alpha * latency + (1 - self.ewma_alpha) * previous
+            )
+            backend_latency.set(backend.latency_ewma, backend=backend.name)
+            return
+        backend.consecutive_failures += 1
+        if backend.consecutive_failures >= self.eject_failures:
+            self.eject(backend, f"连续失败 {backend.consecutive_failures} 次")
+
+    def eject(self, backend: DifyBackend, reason: str):
+        """摘除后端；恢复后再失败一次会立即重新摘除"""
+        backend.ejected_until = time.monotonic() + self.eject_seconds
+        backend.consecutive_failures = self.eject_failures - 1
+        backend_ejections_total.inc(backend=backend.name)
+        logger.warning(f"摘除Dify后端 {backend.name} {self.eject_seconds:g} 秒: {reason}")
+
+    @asynccontextmanager
+    async def track(self, backend: DifyBackend):
+        """在后端上执行一次调用，统计进行中请求数、延迟和健康状况"""
+        call = BackendCall(backend)
+        backend.outstanding += 1
+        started = time.monotonic()
+        try:
+            yield call
+        except asyncio.CancelledError:
+            call.healthy = None
+            raise
+        except BaseException:
+            call.healthy = False
+            raise
+        finally:
+            backend.outstanding -= 1
+            self.record(backend, time.monotonic() - started, call.healthy)
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        now = time.monotonic()
+        return [backend.snapshot(now) for backend in self.backends]
@@ -0,0 +1,504 @@
+"""
+检测历史批量导出
+
+按服务端游标分批读取 DetectionRecord，将「详细检测结果」逐条展开为行，
+以流式方式写出 CSV / XLSX / Parquet，整个导出过程不会把全部数据载入内存。
+
+每一行都带有 resume_token 列（检测时间 + 记录ID + 检测项目序号），导出中断后可将最后一行的
+resume_token 作为 resume_after 参数传入，从断点继续导出；中断在一条记录的中间时，
+续传从该记录的下一个检测项目开始。
+
+命令行用法:
+    python -m backend.export --format csv --start 2025-01-01 --end 2025-04-01 -o q1.csv
+    python -m backend.export --format csv -o q1.csv --resume   # 从已有CSV的最后一行继续
+"""
+
+import os
+import io
+import csv
+import sys
+import asyncio
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+from typing import Optional, AsyncIterator, Iterator, Dict, Any, List
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# 记录级字段（每个检测项目行都会重复携带）
+RECORD_COLUMNS = [
+    "record_id",
+    "product_name",
+    "product_type",
+    "package_size_category",
+    "detection_time",
+    "overall_rating",
+    "compliance_rate",
+    "key_issues",
+    "general_issues",
+    "low_risk_issues",
+]
+
+# 「详细检测结果」中单个检测项目的字段
+ITEM_COLUMNS = [
+    "检测类别",
+    "检测项目",
+    "标准要求",
+    "检测结果",
+    "实际情况",
+    "问题描述",
+    "风险等级",
+    "违反条款",
+    "应更正为",
+    "整改建议",
+]
+
+COLUMNS = RECORD_COLUMNS + ["item_index"] + ITEM_COLUMNS + ["resume_token"]
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", ".csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+
+
+async def _detection_collection():
+    """按需连接数据库并返回检测记录集合（motor/beanie 延迟导入，不拖慢服务启动）"""
+    try:
+        from .models import DetectionRecord
+        from .database import ensure_database
+    except ImportError:
+        from backend.models import DetectionRecord
+        from backend.database import ensure_database
+
+    await ensure_database()
+    return DetectionRecord.get_motor_collection()
+
+
+def make_resume_token(detection_time: datetime, record_id, item_index: Optional[int] = None) -> str:
+    """生成断点续传令牌：检测时间 + 记录ID（+ 检测项目序号，没有检测项目的记录不带序号）"""
+    token = f"{detection_time.isoformat()}|{record_id}"
+    return token if item_index is None else f"{token}|{item_index}"
+
+
+def parse_resume_token(token: str):
+    """解析断点续传令牌，返回 (检测时间, 记录ID, 检测项目序号或None)"""
+    from bson import ObjectId
+
+    try:
+        parts = token.split("|")
+        if len(parts) not in (2, 3):
+            raise ValueError(token)
+        item_index = int(parts[2]) if len(parts) == 3 else None
+        if item_index is not None and item_index < 0:
+            raise ValueError(token)
+        return datetime.fromisoformat(parts[0]), ObjectId(parts[1]), item_index
+    except Exception:
+        raise ValueError(f"无效的resume_token: {token}")
+
+
+def build_query(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    product_name: Optional[str] = None,
+    product_type: Optional[str] = None,
+    resume_after: Optional[str] = None,
+) -> Dict[str, Any]:
+    """构建MongoDB查询条件"""
+    conditions: List[Dict[str, Any]] = []
+
+    time_range: Dict[str, Any] = {}
+    if start:
+        time_range["$gte"] = start
+    if end:
+        time_range["$lt"] = end
+    if time_range:
+        conditions.append({"detection_time": time_range})
+
+    if product_name:
+        conditions.append({"product_name": product_name})
+    if product_type:
+        conditions.append({"product_type": product_type})
+
+    # 基于 (detection_time, _id) 的键集分页，保证续传时不重不漏；
+    # 令牌带检测项目序号时包含该记录本身，已导出的项目由 iter_detection_batches 跳过
+    if resume_after:
+        last_time, last_id, item_index = parse_resume_token(resume_after)
+        conditions.append({
+            "$or": [
+                {"detection_time": {"$gt": last_time}},
+                {"detection_time": last_time, "_id": {"$gt" if item_index is None else "$gte": last_id}},
+            ]
+        })
+
+    if not conditions:
+        return {}
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def flatten_detection(doc: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """将一条检测记录按「详细检测结果」展开为多行"""
+    detection_time = doc.get("detection_time")
+    resumable = isinstance(detection_time, datetime) and "_id" in doc
+    base = {
+        "record_id": str(doc.get("_id", "")),
+        "product_name": doc.get("product_name"),
+        "product_type": doc.get("product_type"),
+        "package_size_category": doc.get("package_size_category"),
+        "detection_time": detection_time.isoformat() if isinstance(detection_time, datetime) else detection_time,
+        "overall_rating": doc.get("overall_rating"),
+        "compliance_rate": doc.get("compliance_rate"),
+        "key_issues": doc.get("key_issues"),
+        "general_issues": doc.get("general_issues"),
+        "low_risk_issues": doc.get("low_risk_issues"),
+        "resume_token": make_resume_token(detection_time, doc["_id"]) if resumable else None,
+    }
+
+    detection_result = doc.get("detection_result") or {}
+    items = detection_result.get("详细检测结果") or []
+
+    if not items:
+        # 没有检测项目的记录也导出一行，避免审计时漏记录
+        row = dict(base, item_index=None)
+        for column in ITEM_COLUMNS:
+            row[column] = None
+        yield row
+        return
+
+    for index, item in enumerate(items):
+        row = dict(base, item_index=index)
+        if resumable:
+            row["resume_token"] = make_resume_token(detection_time, doc["_id"], index)
+        item = item if isinstance(item, dict) else {}
+        for column in ITEM_COLUMNS:
+            value = item.get(column)
+            row[column] = value if value is None or isinstance(value, (str, int, float)) else str(value)
+        yield row
+
+
+async def iter_detection_batches(
+    query: Dict[str, Any],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    resume_after: Optional[str] = None,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """使用服务端游标分批读取检测记录，并逐批返回展开后的行
+
+    resume_after 带检测项目序号时，跳过该记录中已经导出的检测项目。
+    """
+    _, resume_id, resume_index = parse_resume_token(resume_after) if resume_after else (None, None, None)
+    collection = await _detection_collection()
+    cursor = collection.find(
+        query,
+        sort=[("detection_time", 1), ("_id", 1)],
+        batch_size=batch_size,
+        no_cursor_timeout=False,
+    )
+
+    rows: List[Dict[str, Any]] = []
+    try:
+        async for doc in cursor:
+            doc_rows = flatten_detection(doc)
+            if resume_index is not None and doc.get("_id") == resume_id:
+                doc_rows = (row for row in doc_rows
+                            if row["item_index"] is not None and row["item_index"] > resume_index)
+            rows.extend(doc_rows)
+            if len(rows) >= batch_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+    finally:
+        await cursor.close()
+
+
+class CsvExportWriter:
+    """CSV导出：每批行直接编码为字节块返回"""
+
+    def __init__(self, write_header: bool = True):
+        self.write_header = write_header
+
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        buffer = io.StringIO()
+        if self.write_header:
+            # 带BOM，方便Excel直接打开中文
+            buffer.write("\ufeff")
+        writer = csv.DictWriter(buffer, fieldnames=COLUMNS, extrasaction="ignore")
+        if self.write_header:
+            writer.writeheader()
+            self.write_header = False
+        writer.writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+
+class XlsxExportWriter:
+    """XLSX导出：openpyxl只写模式，行数据边写边落盘"""
+
+    def __init__(self, path: str):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise RuntimeError("导出XLSX需要安装openpyxl")
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("检测明细")
+        self.sheet.append(COLUMNS)
+
+    def write_batch(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            self.sheet.append([row.get(column) for column in COLUMNS])
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class ParquetExportWriter:
+    """Parquet导出：每批写入一个行组（列式存储）"""
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("导出Parquet需要安装pyarrow")
+        self._pa = pa
+        fields = []
+        for column in COLUMNS:
+            if column in ("compliance_rate",):
+                fields.append(pa.field(column, pa.float64()))
+            elif column in ("key_issues", "general_issues", "low_risk_issues", "item_index"):
+                fields.append(pa.field(column, pa.int64()))
+            else:
+                fields.append(pa.field(column, pa.string()))
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write_batch(self, rows: List[Dict[str, Any]]):
+        columns = {}
+        for field in self.schema:
+            values = [row.get(field.name) for row in rows]
+            if field.type == self._pa.string():
+                values = [None if value is None else str(value) for value in values]
+            else:
+                values = [_to_number(value, field.type == self._pa.int64()) for value in values]
+            columns[field.name] = values
+        self.writer.write_table(self._pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def _to_number(value, integer: bool):
+    """数值列容错转换，如 "75%" -> 75.0"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(str(value).strip().rstrip("%"))
+    except ValueError:
+        return None
+    return int(number) if integer else number
+
+
+def create_file_writer(export_format: str, path: str):
+    """按格式创建落盘型导出器"""
+    if export_format == "xlsx":
+        return XlsxExportWriter(path)
+    if export_format == "parquet":
+        return ParquetExportWriter(path)
+    raise ValueError(f"不支持的导出格式: {export_format}")
+
+
+async def stream_csv(query: Dict[str, Any], batch_size: int, write_header: bool = True,
+                     resume_after: Optional[str] = None) -> AsyncIterator[bytes]:
+    """以CSV字节块流式输出"""
+    writer = CsvExportWriter(write_header=write_header)
+    if write_header:
+        yield writer.encode([])
+    async for rows in iter_detection_batches(query, batch_size, resume_after):
+        yield writer.encode(rows)
+
+
+async def export_to_file(export_format: str, query: Dict[str, Any], path: str, batch_size: int,
+                         resume_after: Optional[str] = None) -> int:
+    """导出到本地文件（XLSX/Parquet），返回导出的行数"""
+    writer = await run_in_threadpool(create_file_writer, export_format, path)
+    total = 0
+    try:
+        async for rows in iter_detection_batches(query, batch_size, resume_after):
+            await run_in_threadpool(writer.write_batch, rows)
+            total += len(rows)
+    finally:
+        await run_in_threadpool(writer.close)
+    return total
+
+
+async def stream_file(path: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    """分块读取导出文件并在完成后删除"""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = await run_in_threadpool(f.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            logger.warning(f"无法清理导出临时文件: {path}")
+
+
+router = APIRouter()
+
+
+@router.get("/api/export/detections")
+async def export_detections(
+    format: str = Query("csv", description="导出格式: csv/xlsx/parquet"),
+    start: Optional[datetime] = Query(None, description="检测时间起点（含）"),
+    end: Optional[datetime] = Query(None, description="检测时间终点（不含）"),
+    product_name: Optional[str] = Query(None, description="产品名称"),
+    product_type: Optional[str] = Query(None, description="产品类型"),
+    batch_size: int = Query(DEFAULT_BATCH_SIZE, ge=1, le=MAX_BATCH_SIZE, description="游标批大小"),
+    resume_after: Optional[str] = Query(None, description="断点续传令牌（上次导出最后一行的resume_token）"),
+):
+    """批量导出检测历史，按检测项目展开为行"""
+    export_format = format.lower()
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}")
+
+    try:
+        query = build_query(start, end, product_name, product_type, resume_after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    media_type, extension = EXPORT_FORMATS[export_format]
+    filename = f"detections_{datetime.now().strftime('%Y%m%d%H%M%S')}{extension}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    logger.info(f"开始导出检测历史: format={export_format}, query={query}")
+
+    if export_format == "csv":
+        # 续传时不再输出表头，方便直接追加到已有文件
+        return StreamingResponse(
+            stream_csv(query, batch_size, write_header=resume_after is None, resume_after=resume_after),
+            media_type=media_type,
+            headers=headers,
+        )
+
+    # XLSX/Parquet 需要在文件尾写入元数据，先分批落盘再流式返回
+    fd, path = tempfile.mkstemp(suffix=extension, prefix="export_")
+    os.close(fd)
+    try:
+        total = await export_to_file(export_format, query, path, batch_size, resume_after)
+    except RuntimeError as e:
+        os.remove(path)
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception:
+        os.remove(path)
+        raise
+
+    logger.info(f"导出完成，共 {total} 行")
+    headers["X-Export-Rows"] = str(total)
+    return StreamingResponse(stream_file(path), media_type=media_type, headers=headers)
+
+
+def read_last_resume_token(path: str) -> Optional[str]:
+    """读取已有CSV导出文件最后一行的resume_token
+
+    文件不存在、为空或只有表头时返回 None；最后一行不完整（导出中途中断）或没有有效令牌时抛出 ValueError。
+    resume_token 是每行的最后一列，且不含逗号、引号和换行，即使前面的字段是带换行的多行字段，
+    令牌也总在文件的最后一个物理行上，因此只需读取最后一个物理行。
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        f.seek(position - 1)
+        if f.read(1) != b"\n":
+            raise ValueError("最后一行不完整（导出中途中断），请删除不完整的最后一行后再续传")
+        # 从文件尾部向前读取，直到包含最后一个物理行的开头
+        block = b""
+        while position > 0:
+            step = min(8192, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step) + block
+            if b"\n" in block.rstrip(b"\r\n"):
+                break
+    last_line = block.rstrip(b"\r\n").rsplit(b"\n", 1)[-1].decode("utf-8-sig")
+    token = last_line.rsplit(",", 1)[-1].strip()
+    if token == COLUMNS[-1]:
+        # 只有表头
+        return None
+    if not token:
+        raise ValueError("最后一行没有resume_token，无法确定断点")
+    parse_resume_token(token)
+    return token
+
+
+async def run_cli(args) -> int:
+    """命令行导出入口"""
+    resume_after = args.resume_after
+    append = False
+    if args.resume:
+        if args.format != "csv":
+            print("❌ --resume 仅支持CSV格式", file=sys.stderr)
+            return 2
+        try:
+            resume_after = read_last_resume_token(args.output)
+        except ValueError as e:
+            # 续传绝不覆盖已导出的数据
+            print(f"❌ 无法从 {args.output} 续传: {e}", file=sys.stderr)
+            return 2
+        # 已有文件（包括只有表头的文件）一律追加
+        append = os.path.exists(args.output) and os.path.getsize(args.output) > 0
+        if resume_after:
+            print(f"↩️  从断点继续导出: {resume_after}", file=sys.stderr)
+
+    try:
+        start = datetime.fromisoformat(args.start) if args.start else None
+        end = datetime.fromisoformat(args.end) if args.end else None
+        query = build_query(start, end, args.product_name, args.product_type, resume_after)
+    except ValueError as e:
+        print(f"❌ 参数错误: {e}", file=sys.stderr)
+        return 2
+
+    if args.format == "csv":
+        with open(args.output, "ab" if append else "wb") as f:
+            async for chunk in stream_csv(query, args.batch_size, write_header=not append, resume_after=resume_after):
+                f.write(chunk)
+        print(f"✅ 导出完成: {args.output}", file=sys.stderr)
+        return 0
+
+    total = await export_to_file(args.format, query, args.output, args.batch_size, resume_after)
+    print(f"✅ 导出完成: {args.output}（{total} 行）", file=sys.stderr)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="批量导出检测历史")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv", help="导出格式")
+    parser.add_argument("--start", help="检测时间起点（ISO格式，含）")
+    parser.add_argument("--end", help="检测时间终点（ISO格式，不含）")
+    parser.add_argument("--product-name", help="按产品名称过滤")
+    parser.add_argument("--product-type", help="按产品类型过滤")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="游标批大小")
+    parser.add_argument("--resume-after", help="断点续传令牌")
+    parser.add_argument("--resume", action="store_true", help="从已有CSV输出文件的最后一行继续")
+    parser.add_argument("-o", "--output", required=True, help="输出文件路径")
+    args = parser.parse_args(argv)
+    return asyncio.run(run_cli(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
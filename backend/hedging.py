@@ -0,0 +1,149 @@
+"""
+Dify工作流调用的对冲请求
+
+Dify的延迟是长尾分布：多数运行约40秒完成，少数会卡住几分钟直到读超时。
+开启对冲后，一次运行超过最近成功运行延迟的某个分位数（默认 p95）仍未完成时，
+再发起第二次运行（配置了多个后端时发到另一个后端），先成功的结果胜出，另一个被取消
+（流式运行会调用Dify的任务停止接口）。
+
+对冲会产生额外的令牌费用，因此:
+    - 样本不足 DIFY_HEDGE_MIN_SAMPLES 时不对冲；
+    - 对冲等待时间不低于 DIFY_HEDGE_MIN_DELAY 秒；
+    - 每分钟最多发起 DIFY_HEDGE_BUDGET 次对冲（令牌桶），预算用完时只等待原请求。
+
+配置（pydantic-settings，环境变量前缀 DIFY_HEDGE_）:
+    DIFY_HEDGE_ENABLED       是否开启，默认 false
+    DIFY_HEDGE_PERCENTILE    触发对冲的延迟分位数，默认 95
+    DIFY_HEDGE_MIN_SAMPLES   开始对冲所需的最少样本数，默认 20
+    DIFY_HEDGE_WINDOW        保留的最近延迟样本数，默认 200
+    DIFY_HEDGE_MIN_DELAY     最短对冲等待时间（秒），默认 5
+    DIFY_HEDGE_BUDGET        每分钟最多对冲次数，默认 2
+"""
+
+import math
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+try:
+    from .metrics import metrics
+    from .rate_limit import TokenBucket
+except ImportError:
+    from backend.metrics import metrics
+    from backend.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+hedges_total = metrics.counter("dify_hedges_total", "对冲请求（launched / budget_exhausted / hedge_won / primary_won）")
+hedge_delay = metrics.gauge("dify_hedge_delay_seconds", "当前的对冲触发延迟（秒）")
+
+
+class HedgeSettings(BaseSettings):
+    """对冲配置"""
+
+    model_config = SettingsConfigDict(env_prefix="DIFY_HEDGE_")
+
+    enabled: bool = False
+    percentile: float = Field(95.0, gt=0, lt=100)
+    min_samples: int = Field(20, ge=1)
+    window: int = Field(200, ge=1)
+    min_delay: float = Field(5.0, ge=0)
+    budget: float = Field(2.0, ge=0)
+
+
+class LatencyWindow:
+    """最近若干次成功运行的延迟"""
+
+    def __init__(self, size: int = 200):
+        self._samples: deque = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """最近邻秩分位数"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(1, math.ceil(p / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+
+class HedgePolicy:
+    """何时对冲、是否还有预算"""
+
+    def __init__(self, settings: HedgeSettings):
+        self.settings = settings
+        self.latencies = LatencyWindow(settings.window)
+        self.budget = TokenBucket(rate=settings.budget / 60.0, burst=settings.budget)
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled and self.settings.budget > 0
+
+    def observe(self, seconds: float):
+        self.latencies.observe(seconds)
+
+    def delay(self) -> Optional[float]:
+        """对冲等待时间；未开启或样本不足时返回 None"""
+        if not self.enabled or len(self.latencies) < self.settings.min_samples:
+            return None
+        delay = max(self.settings.min_delay, self.latencies.percentile(self.settings.percentile))
+        hedge_delay.set(delay)
+        return delay
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "samples": len(self.latencies),
+            "delay": self.delay(),
+            "budget_tokens": round(self.budget.tokens, 2),
+        }
+
+    async def run(self, primary: Callable[[], Awaitable[T]], hedge: Callable[[], Awaitable[T]],
+                  succeeded: Callable[[T], bool] = lambda result: True) -> T:
+        """执行 primary，超过对冲延迟仍未完成时再执行 hedge，返回先成功的结果
+
+        两者都失败时以 primary 的结果（或异常）为准；返回前取消仍在运行的一方。
+        """
+        delay = self.delay()
+        if delay is None:
+            return await primary()
+
+        tasks = [asyncio.ensure_future(primary())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if self.budget.consume() > 0:
+                    hedges_total.inc(outcome="budget_exhausted")
+                else:
+                    hedges_total.inc(outcome="launched")
+                    logger.info(f"Dify运行超过 {delay:.1f} 秒（p{self.settings.percentile:g}）仍未完成，发起对冲请求")
+                    tasks.append(asyncio.ensure_future(hedge()))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if task in done and not task.cancelled() and task.exception() is None and succeeded(task.result()):
+                        if len(tasks) > 1:
+                            hedges_total.inc(outcome="hedge_won" if task is tasks[1] else "primary_won")
+                        return task.result()
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+# 创建全局对冲策略实例
+hedge_policy = HedgePolicy(HedgeSettings())
@@ -0,0 +1,150 @@
+"""
+检测请求的幂等键
+
+Dify工作流一次要跑几十秒到几分钟，前端或 nginx 先超时后用户往往会再点一次"检测"，
+每次重试都会启动一个新的、计费的工作流运行。客户端为同一次提交带上
+Idempotency-Key 请求头（或表单字段 RequestId）后:
+
+    - 第一次请求启动检测，检测作为独立任务运行，发起请求的连接断开后检测仍继续；
+    - 检测仍在进行时的重复请求挂到同一个任务上等待结果；
+    - 检测完成后的重复请求直接返回保存的结果（响应头 Idempotent-Replayed: true）；
+    - 同一个键提交了不同的图片或参数时返回 422；
+    - 检测失败不保存，重试会重新检测。
+
+幂等键按客户端（API Key / IP）隔离。完成的结果保存 IDEMPOTENCY_TTL 秒（默认 3600），
+最多保存 IDEMPOTENCY_MAX_ENTRIES 条（默认 1000），超出后淘汰最早完成的条目。
+
+所有等待者都断开后，检测再继续 IDEMPOTENCY_ABANDON_GRACE 秒（默认 30）等待重试挂上来，
+期间没有新的等待者则取消检测（停止Dify任务），不再为没人要的结果付费。
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+try:
+    from .metrics import metrics
+    from .deadline import detection_cancelled_total
+except ImportError:
+    from backend.metrics import metrics
+    from backend.deadline import detection_cancelled_total
+
+logger = logging.getLogger(__name__)
+
+# 幂等键最大长度
+MAX_KEY_LENGTH = 255
+
+idempotency_requests_total = metrics.counter("idempotency_requests_total", "带幂等键的检测请求数")
+idempotency_entries = metrics.gauge("idempotency_entries", "保存的幂等键条目数")
+
+IdempotencyKey = Tuple[str, str]
+
+
+class IdempotencyConflict(Exception):
+    """同一个幂等键对应了不同的请求内容"""
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "task", "result", "completed_at", "waiters")
+
+    def __init__(self, fingerprint: str, task: asyncio.Task):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.result: Optional[Dict[str, Any]] = None
+        self.completed_at: Optional[float] = None
+        self.waiters = 0
+
+
+class IdempotencyStore:
+    """进行中的检测任务与已完成结果的登记表"""
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 1000, abandon_grace: float = 30.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.abandon_grace = abandon_grace
+        self._entries: "OrderedDict[IdempotencyKey, _Entry]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expire(self, now: float):
+        # 按完成顺序排列，过期或超出数量的条目都在最前面；进行中的条目不淘汰
+        completed = [key for key, entry in self._entries.items() if entry.completed_at is not None]
+        overflow = len(self._entries) - self.max_entries
+        for key in completed:
+            if now - self._entries[key].completed_at <= self.ttl and overflow <= 0:
+                break
+            del self._entries[key]
+            overflow -= 1
+        idempotency_entries.set(len(self._entries))
+
+    def _finish(self, key: IdempotencyKey, entry: _Entry, task: asyncio.Task):
+        if self._entries.get(key) is not entry:
+            return
+        if task.cancelled() or task.exception() is not None:
+            # 失败的检测不保存，重试时重新检测
+            del self._entries[key]
+        else:
+            entry.result = task.result()
+            entry.completed_at = time.monotonic()
+            self._entries.move_to_end(key)
+        idempotency_entries.set(len(self._entries))
+
+    async def run(
+        self,
+        key: IdempotencyKey,
+        fingerprint: str,
+        factory: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Tuple[Dict[str, Any], str]:
+        """执行或复用检测，返回 (结果, 状态)，状态为 new / attached / replayed"""
+        self._expire(time.monotonic())
+        entry = self._entries.get(key)
+        if entry is not None and entry.fingerprint != fingerprint:
+            idempotency_requests_total.inc(result="conflict")
+            raise IdempotencyConflict(key[1])
+        if entry is not None and entry.result is not None:
+            idempotency_requests_total.inc(result="replayed")
+            return entry.result, "replayed"
+        if entry is not None:
+            idempotency_requests_total.inc(result="attached")
+            logger.info(f"幂等键 {key[1]} 的检测仍在进行，等待已有任务的结果")
+            return await self._wait(key, entry), "attached"
+
+        task = asyncio.ensure_future(factory())
+        entry = _Entry(fingerprint, task)
+        self._entries[key] = entry
+        task.add_done_callback(lambda done: self._finish(key, entry, done))
+        idempotency_entries.set(len(self._entries))
+        idempotency_requests_total.inc(result="new")
+        return await self._wait(key, entry), "new"
+
+    async def _wait(self, key: IdempotencyKey, entry: _Entry) -> Dict[str, Any]:
+        # 发起请求的连接断开时检测继续进行，重试可以挂到同一个任务上
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.task)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.task.done():
+                asyncio.get_running_loop().call_later(self.abandon_grace, self._abandon, key, entry)
+
+    def _abandon(self, key: IdempotencyKey, entry: _Entry):
+        if entry.waiters == 0 and not entry.task.done():
+            logger.warning(f"幂等键 {key[1]} 的检测已无人等待，取消检测")
+            detection_cancelled_total.inc(reason="abandoned")
+            entry.task.cancel()
+
+    def clear(self):
+        self._entries.clear()
+        idempotency_entries.set(0)
+
+
+# 创建全局幂等键登记实例
+idempotency_store = IdempotencyStore(
+    float(os.getenv("IDEMPOTENCY_TTL", "3600")),
+    int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "1000")),
+    float(os.getenv("IDEMPOTENCY_ABANDON_GRACE", "30")),
+)
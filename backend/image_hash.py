@@ -0,0 +1,240 @@
+"""
+标签图片感知哈希与近重复检测
+
+同一包装重新拍摄（光线、裁切、手机不同）后字节完全不同，精确哈希缓存无法命中。
+这里对上传的标签图片计算两种64位感知哈希:
+
+    pHash  灰度缩放到32x32后做二维DCT，取左上8x8低频系数与中位数比较
+    dHash  灰度缩放到9x8，比较相邻像素的明暗变化
+
+所有历史上传的 pHash 存放在多索引哈希中（按16位分段建表），按汉明距离半径查询时
+只需查找少量段值，只对一小部分历史上传做完整比较；候选再用 dHash 二次确认，降低误判。
+只有检测参数（Foodtype、包装类型、单件/多件、包装尺寸等）完全相同的上传才算近重复。
+
+近重复处理方式（环境变量 NEAR_DUP_MODE）:
+    off    不计算哈希
+    flag   在响应中标注近重复的历史检测（默认）
+    serve  历史检测的结果仍在结果缓存中（且提示词/工作流版本相同）时直接复用
+
+其他配置:
+    NEAR_DUP_PHASH_DISTANCE   pHash 最大汉明距离，默认 8
+    NEAR_DUP_DHASH_DISTANCE   dHash 最大汉明距离，默认 12
+    NEAR_DUP_MAX_ENTRIES      索引保留的上传数，默认 50000，超出后丢弃最早的一半并重建
+
+Pillow 与 NumPy 在首次计算哈希时才导入，不影响服务启动。索引只保存在进程内存中。
+"""
+
+import io
+import os
+import time
+import logging
+from collections import deque
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUP_MODES = ("off", "flag", "serve")
+
+HASHABLE_TYPES = ("image/jpeg", "image/png")
+
+near_duplicate_total = metrics.counter("near_duplicate_total", "近重复标签图片命中次数")
+image_hash_seconds = metrics.histogram(
+    "image_hash_seconds", "感知哈希计算耗时（秒）",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+def near_dup_mode() -> str:
+    mode = os.getenv("NEAR_DUP_MODE", "flag").lower()
+    return mode if mode in NEAR_DUP_MODES else "flag"
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+_dct_matrix = None
+
+
+def _dct(size: int):
+    """DCT-II 变换矩阵（首次使用时计算）"""
+    global _dct_matrix
+    if _dct_matrix is None or _dct_matrix.shape[0] != size:
+        import numpy as np
+
+        n = np.arange(size)
+        matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+        matrix[0] *= 1 / np.sqrt(2)
+        _dct_matrix = matrix * np.sqrt(2 / size)
+    return _dct_matrix
+
+
+def _bits_to_int(bits) -> int:
+    value = 0
+    for bit in bits.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _grayscale(image, size: Tuple[int, int]):
+    import numpy as np
+    from PIL import Image
+
+    return np.asarray(image.resize(size, Image.Resampling.LANCZOS), dtype=np.float64)
+
+
+def phash(image, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """pHash（image 为灰度 PIL 图像）"""
+    import numpy as np
+
+    size = hash_size * highfreq_factor
+    pixels = _grayscale(image, (size, size))
+    dct = _dct(size)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    return _bits_to_int(low > np.median(low))
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """dHash（image 为灰度 PIL 图像）"""
+    pixels = _grayscale(image, (hash_size + 1, hash_size))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def compute_hashes(content: bytes) -> Tuple[int, int]:
+    """计算图片内容的 (pHash, dHash)；同步执行，调用方应放到线程池中运行"""
+    from PIL import Image, ImageOps
+
+    started = time.perf_counter()
+    with Image.open(io.BytesIO(content)) as image:
+        # JPEG 可以直接按缩小的尺寸解码，省去大部分解码开销
+        image.draft("L", (128, 128))
+        gray = ImageOps.exif_transpose(image).convert("L")
+    hashes = phash(gray), dhash(gray)
+    image_hash_seconds.observe(time.perf_counter() - started)
+    return hashes
+
+
+class MultiIndexHash:
+    """汉明距离半径查询的多索引哈希
+
+    把64位哈希切成 chunks 段，每段各建一张 段值 → 条目 的哈希表。
+    由抽屉原理，距离不超过 r 的两个哈希至少有一段的距离不超过 r // chunks，
+    因此只需在每张表中查找与查询段距离不超过 r // chunks 的段值，再对候选做完整比较。
+    """
+
+    def __init__(self, bits: int = 64, chunks: int = 4):
+        self.chunks = chunks
+        self.chunk_bits = bits // chunks
+        self._chunk_mask = (1 << self.chunk_bits) - 1
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(chunks)]
+        self._keys: List[int] = []
+        self._items: List[Any] = []
+        self._flip_masks: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _masks(self, radius: int) -> List[int]:
+        """段内翻转不超过 radius 位的全部掩码"""
+        masks = self._flip_masks.get(radius)
+        if masks is None:
+            masks = [0]
+            for bit_count in range(1, radius + 1):
+                masks += [sum(1 << bit for bit in bits) for bits in combinations(range(self.chunk_bits), bit_count)]
+            self._flip_masks[radius] = masks
+        return masks
+
+    def add(self, key: int, item: Any):
+        position = len(self._keys)
+        self._keys.append(key)
+        self._items.append(item)
+        for index, table in enumerate(self._tables):
+            table.setdefault((key >> (index * self.chunk_bits)) & self._chunk_mask, []).append(position)
+
+    def search(self, key: int, radius: int) -> Tuple[List[Tuple[int, Any]], int]:
+        """返回 ([(距离, 条目)], 做完整比较的候选数)，按距离升序"""
+        masks = self._masks(radius // self.chunks)
+        candidates = set()
+        for index, table in enumerate(self._tables):
+            chunk = (key >> (index * self.chunk_bits)) & self._chunk_mask
+            for mask in masks:
+                positions = table.get(chunk ^ mask)
+                if positions:
+                    candidates.update(positions)
+        found = []
+        for position in candidates:
+            distance = (key ^ self._keys[position]).bit_count()
+            if distance <= radius:
+                found.append((distance, self._items[position]))
+        found.sort(key=lambda pair: pair[0])
+        return found, len(candidates)
+
+
+class NearDuplicateIndex:
+    """历史上传的近重复索引"""
+
+    def __init__(self, phash_distance: int = 8, dhash_distance: int = 12, max_entries: int = 50000):
+        self.phash_distance = phash_distance
+        self.dhash_distance = dhash_distance
+        self.max_entries = max_entries
+        self._entries: deque = deque()
+        self._index = MultiIndexHash()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, hashes: Tuple[int, int], params_key: str, **info):
+        entry = dict(info, phash=hashes[0], dhash=hashes[1], params_key=params_key)
+        self._entries.append(entry)
+        self._index.add(hashes[0], entry)
+        if len(self._entries) > self.max_entries:
+            self._rebuild(self.max_entries // 2)
+
+    def _rebuild(self, keep: int):
+        while len(self._entries) > keep:
+            self._entries.popleft()
+        self._index = MultiIndexHash()
+        for entry in self._entries:
+            self._index.add(entry["phash"], entry)
+
+    def find(self, hashes: Tuple[int, int], params_key: str) -> Optional[Dict[str, Any]]:
+        """查找检测参数相同、pHash 与 dHash 都足够接近的最近一次上传"""
+        candidates, _ = self._index.search(hashes[0], self.phash_distance)
+        best = None
+        for distance, entry in candidates:
+            if entry["params_key"] != params_key:
+                continue
+            dhash_distance = hamming(hashes[1], entry["dhash"])
+            if dhash_distance > self.dhash_distance:
+                continue
+            score = (distance + dhash_distance, -entry.get("created_at", 0))
+            if best is None or score < best[0]:
+                best = (score, dict(entry, distance=distance, dhash_distance=dhash_distance))
+        return best[1] if best else None
+
+
+# 创建全局近重复索引实例
+near_duplicate_index = NearDuplicateIndex(
+    int(os.getenv("NEAR_DUP_PHASH_DISTANCE", "8")),
+    int(os.getenv("NEAR_DUP_DHASH_DISTANCE", "12")),
+    int(os.getenv("NEAR_DUP_MAX_ENTRIES", "50000")),
+)
+
+
+async def hash_upload(content: bytes, content_type: str) -> Optional[Tuple[int, int]]:
+    """在线程池中计算上传图片的感知哈希；不支持的类型或无法解码的图片返回 None"""
+    from starlette.concurrency import run_in_threadpool
+
+    if content_type not in HASHABLE_TYPES:
+        return None
+    try:
+        return await run_in_threadpool(compute_hashes, content)
+    except Exception as e:
+        logger.warning(f"感知哈希计算失败: {e}")
+        return None
@@ -0,0 +1,137 @@
+"""
+事件循环延迟监控与慢回调检测
+
+- 延迟采样：协程每隔 interval 秒休眠一次，实际唤醒时间与预期的差值即事件循环延迟，
+  记录到 event_loop_lag_seconds 指标；
+- 阻塞检测：后台看门狗线程检查事件循环心跳，若超过 threshold 秒未更新，
+  说明有回调阻塞了事件循环，此时抓取事件循环线程的调用栈并写入日志，
+  同一次阻塞只记录一次。
+
+配置（环境变量）:
+    LOOP_MONITOR_ENABLED         是否启用，默认 true
+    LOOP_MONITOR_INTERVAL        采样间隔（秒），默认 0.25
+    LOOP_SLOW_CALLBACK_SECONDS   阻塞告警阈值（秒），默认 0.2
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Optional
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+loop_lag = metrics.histogram("event_loop_lag_seconds", "事件循环调度延迟", buckets=LAG_BUCKETS)
+loop_lag_last = metrics.gauge("event_loop_lag_last_seconds", "最近一次采样的事件循环延迟")
+loop_lag_max = metrics.gauge("event_loop_lag_max_seconds", "进程启动以来的最大事件循环延迟")
+loop_blocked = metrics.counter("event_loop_blocked_total", "事件循环被阻塞超过阈值的次数")
+loop_blocked_seconds = metrics.counter("event_loop_blocked_seconds_total", "事件循环被阻塞的累计时长")
+
+
+class EventLoopMonitor:
+    """事件循环延迟监控器"""
+
+    def __init__(self, interval: float = 0.25, threshold: float = 0.2, stack_limit: int = 30):
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_limit = stack_limit
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _sample(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            self.last_lag = lag
+            loop_lag.observe(lag)
+            loop_lag_last.set(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+                loop_lag_max.set(lag)
+
+    def _watch(self):
+        reported_heartbeat = None
+        check_interval = min(self.threshold / 2, self.interval)
+        while not self._stop.wait(check_interval):
+            heartbeat = self._heartbeat
+            # 预期下一次心跳在 interval 之后，超出部分才算阻塞
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for < self.threshold or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=self.stack_limit)) if frame else "（无法获取调用栈）"
+            loop_blocked.inc()
+            logger.warning(f"事件循环已被阻塞 {blocked_for:.3f}s（阈值 {self.threshold}s），当前调用栈:\n{stack}")
+            self._record_block_duration(heartbeat)
+
+    def _record_block_duration(self, heartbeat: float):
+        # 等待阻塞结束，统计本次阻塞的总时长
+        while not self._stop.wait(0.01):
+            if self._heartbeat != heartbeat:
+                blocked_total = max(0.0, self._heartbeat - heartbeat - self.interval)
+                loop_blocked_seconds.inc(blocked_total)
+                logger.warning(f"事件循环阻塞结束，共阻塞约 {blocked_total:.3f}s")
+                return
+
+    def start(self):
+        """在当前事件循环中启动监控"""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"事件循环监控已启动: 采样间隔 {self.interval}s, 阻塞阈值 {self.threshold}s")
+
+    async def stop(self):
+        """停止监控"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1.0)
+            self._watchdog = None
+
+    def snapshot(self) -> dict:
+        return {
+            "last_lag_ms": round(self.last_lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "blocked_count": int(loop_blocked.value()),
+        }
+
+
+# 创建全局监控实例
+loop_monitor = EventLoopMonitor(
+    interval=float(os.getenv("LOOP_MONITOR_INTERVAL", "0.25")),
+    threshold=float(os.getenv("LOOP_SLOW_CALLBACK_SECONDS", "0.2")),
+)
+
+
+def loop_monitor_enabled() -> bool:
+    return os.getenv("LOOP_MONITOR_ENABLED", "true").lower() in ("1", "true", "yes")
@@ -1,24 +1,93 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from typing import List, Optional
 import json
 import os
 import uuid
-import httpx
-import base64
+import time
 import asyncio
+import hashlib
 import logging
+import httpx
 from datetime import datetime
 
+try:
+    from .export import router as export_router
+    from .metrics import router as metrics_router
+    from .cost_ledger import record_detection_cost, router as cost_router
+    from .detection_history import record_detection
+    from .prescreen import (
+        prescreen_mode,
+        run_prescreen,
+        should_short_circuit,
+        findings_as_workflow_input,
+        build_prescreen_result,
+    )
+    from .loop_monitor import loop_monitor, loop_monitor_enabled
+    from .rate_limit import ClientContext, TokenBucket, rate_limit, bulk_rate_limit, router as admin_router
+    from .scheduler import dify_scheduler
+    from .upload_spool import upload_spool
+    from .pre_upload import pre_upload_store, pre_uploaded_files
+    from .prompt_assembly import assembled_prompt_input, prompt_assembly_mode, prompt_context, route_categories
+    from . import recheck
+    from .idempotency import MAX_KEY_LENGTH, IdempotencyConflict, idempotency_store
+    from .deadline import CLIENT_CLOSED_REQUEST, ClientDisconnected, request_deadline, run_until_disconnected
+    from .compact_response import CompressionMiddleware, FastJSONResponse, compact_result, parse_fields, project
+    from .prompt_registry import prompt_registry, router as version_router
+    from .result_cache import request_digest, restamp, result_cache
+    from .image_hash import hash_upload, near_dup_mode, near_duplicate_index, near_duplicate_total
+    from . import dify_client
+    from .dify_health import dify_health
+    from .dify_client import (
+        RESPONSE_MODES,
+        call_dify_workflow,
+        process_dify_response,
+        separate_json_and_markdown,
+        parse_streaming_response,
+        get_transport,
+        close_http_client,
+    )
+except ImportError:
+    from backend.export import router as export_router
+    from backend.metrics import router as metrics_router
+    from backend.cost_ledger import record_detection_cost, router as cost_router
+    from backend.detection_history import record_detection
+    from backend.prescreen import (
+        prescreen_mode,
+        run_prescreen,
+        should_short_circuit,
+        findings_as_workflow_input,
+        build_prescreen_result,
+    )
+    from backend.loop_monitor import loop_monitor, loop_monitor_enabled
+    from backend.rate_limit import ClientContext, TokenBucket, rate_limit, bulk_rate_limit, router as admin_router
+    from backend.scheduler import dify_scheduler
+    from backend.upload_spool import upload_spool
+    from backend.pre_upload import pre_upload_store, pre_uploaded_files
+    from backend.prompt_assembly import assembled_prompt_input, prompt_assembly_mode, prompt_context, route_categories
+    from backend import recheck
+    from backend.idempotency import MAX_KEY_LENGTH, IdempotencyConflict, idempotency_store
+    from backend.deadline import CLIENT_CLOSED_REQUEST, ClientDisconnected, request_deadline, run_until_disconnected
+    from backend.compact_response import CompressionMiddleware, FastJSONResponse, compact_result, parse_fields, project
+    from backend.prompt_registry import prompt_registry, router as version_router
+    from backend.result_cache import request_digest, restamp, result_cache
+    from backend.image_hash import hash_upload, near_dup_mode, near_duplicate_index, near_duplicate_total
+    from backend import dify_client
+    from backend.dify_health import dify_health
+    from backend.dify_client import (
+        RESPONSE_MODES,
+        call_dify_workflow,
+        process_dify_response,
+        separate_json_and_markdown,
+        parse_streaming_response,
+        get_transport,
+        close_http_client,
+    )
+
 # 配置日志
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Dify API配置
-DIFY_API_URL = "http://114.215.204.62/v1/workflows/run"
-DIFY_FILE_URL = "http://114.215.204.62/v1/files/upload"
-DIFY_API_TOKEN = "app-xBO6kaetqL7HF0avy1cSZMTR"
-
 app = FastAPI(
     title="食品安全标签检测系统API - MVP版本",
     description="简化版食品标签合规性检测系统",
@@ -33,407 +102,47 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 按 Accept-Encoding 压缩响应（brotli/gzip）
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024")))
 
-async def upload_image_to_dify(file_path: str, user_id: str):
-    """上传文件到Dify服务器"""
-    try:
-        logger.info(f"开始上传文件到Dify: {file_path}")
-        
-        # 根据文件扩展名确定MIME类型
-        file_ext = os.path.splitext(file_path)[1].lower()
-        mime_type_map = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.pdf': 'application/pdf'
-        }
-        mime_type = mime_type_map.get(file_ext, 'image/jpeg')
-        
-        # 准备文件上传
-        with open(file_path, 'rb') as f:
-            files = {
-                "file": (os.path.basename(file_path), f, mime_type)
-            }
-            data = {"user": user_id}
-            
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    DIFY_FILE_URL,
-                    headers={"Authorization": f"Bearer {DIFY_API_TOKEN}"},
-                    files=files,
-                    data=data
-                )
-        
-        logger.info(f"Dify文件上传响应状态码: {response.status_code}")
-        logger.info(f"Dify文件上传响应内容: {response.text}")
-        
-        if response.status_code == 201:  # 201 表示创建成功
-            file_info = response.json()
-            logger.info(f"文件上传成功，文件ID: {file_info.get('id')}")
-            return file_info
-        else:
-            logger.error(f"文件上传失败，状态码: {response.status_code}")
-            logger.error(f"错误内容: {response.text}")
-            return None
-    except Exception as e:
-        logger.error(f"上传文件时发生错误: {str(e)}")
-        import traceback
-        logger.error(f"堆栈跟踪: {traceback.format_exc()}")
-        return None
+# 检测历史导出（批量接口，按批量优先级限流）
+app.include_router(export_router, dependencies=[Depends(bulk_rate_limit)])
+# 限流配置管理
+app.include_router(admin_router)
+# 费用台账汇总
+app.include_router(cost_router)
+# 提示词/工作流版本
+app.include_router(version_router)
+# 运行指标
+app.include_router(metrics_router)
 
-def separate_json_and_markdown(text_content):
-    """分离JSON和Markdown内容"""
-    logger.info("开始分离JSON和Markdown内容")
-    
-    if not text_content or not isinstance(text_content, str):
-        logger.warning("输入内容为空或不是字符串")
-        return {
-            "json_data": None,
-            "markdown_content": text_content or ""
-        }
-    
-    try:
-        # 方法1: 查找「不规范内容总结报告」的位置
-        report_index = text_content.find('不规范内容总结报告')
-        if report_index != -1:
-            logger.info(f"找到「不规范内容总结报告」位置: {report_index}")
-            
-            # 分离JSON和Markdown
-            json_part = text_content[:report_index].strip()
-            markdown_part = text_content[report_index:].strip()
-            
-            # 尝试解析JSON部分
-            try:
-                json_data = json.loads(json_part)
-                logger.info("成功解析JSON部分")
-                return {
-                    "json_data": json_data,
-                    "markdown_content": markdown_part
-                }
-            except json.JSONDecodeError as e:
-                logger.warning(f"JSON解析失败: {e}")
-        
-        # 方法2: 使用正则表达式提取最大的JSON对象
-        logger.info("尝试使用正则表达式提取JSON")
-        import re
-        json_match = re.search(r'\{.*\}', text_content, re.DOTALL)
-        if json_match:
-            json_candidate = json_match.group(0)
-            try:
-                json_data = json.loads(json_candidate)
-                logger.info("成功通过正则表达式解析JSON")
-                
-                # 提取Markdown部分（JSON之后的内容）
-                markdown_start = json_match.end()
-                markdown_content = text_content[markdown_start:].strip()
-                
-                return {
-                    "json_data": json_data,
-                    "markdown_content": markdown_content
-                }
-            except json.JSONDecodeError as e:
-                logger.warning(f"正则表达式提取的JSON解析失败: {e}")
-        
-        # 方法3: 如果都失败，返回原始内容作为Markdown
-        logger.warning("无法分离JSON和Markdown，返回原始内容")
-        return {
-            "json_data": None,
-            "markdown_content": text_content
-        }
-        
-    except Exception as e:
-        logger.error(f"分离JSON和Markdown时发生错误: {e}")
-        return {
-            "json_data": None,
-            "markdown_content": text_content
-        }
 
-def process_dify_response(dify_data):
-    """处理Dify响应数据，确保格式符合前端期望"""
-    logger.info("开始处理Dify响应数据")
-    
-    try:
-        # 提取outputs数据
-        outputs = {}
-        metadata = {}
-        
-        # 从不同可能的字段中提取数据
-        if isinstance(dify_data, dict):
-            # 提取输出数据
-            if 'data' in dify_data and 'outputs' in dify_data['data']:
-                outputs = dify_data['data']['outputs']
-            elif 'outputs' in dify_data:
-                outputs = dify_data['outputs']
-            elif 'data' in dify_data:
-                outputs = dify_data['data']
-            else:
-                outputs = dify_data
-            
-            # 提取元数据
-            if 'data' in dify_data and 'metadata' in dify_data['data']:
-                metadata = dify_data['data']['metadata']
-            elif 'metadata' in dify_data:
-                metadata = dify_data['metadata']
-        
-        logger.info(f"提取的outputs: {outputs}")
-        logger.info(f"提取的metadata: {metadata}")
-        
-        # 查找文本内容
-        text_content = None
-        possible_text_fields = ['text', 'result', 'output', 'content', 'answer', 'response']
-        
-        for field in possible_text_fields:
-            if field in outputs and isinstance(outputs[field], str):
-                text_content = outputs[field]
-                logger.info(f"找到文本内容在字段: {field}")
-                break
-        
-        if text_content:
-            # 分离JSON和Markdown内容
-            separated_data = separate_json_and_markdown(text_content)
-            
-            # 更新outputs，添加分离后的数据
-            outputs['json_data'] = separated_data['json_data']
-            outputs['markdown_content'] = separated_data['markdown_content']
-            
-            # 保留原始文本
-            if 'text' not in outputs:
-                outputs['text'] = text_content
-        
-        # 构建符合前端期望的结构
-        processed_result = {
-            "outputs": outputs,
-            "metadata": metadata
-        }
-        
-        logger.info("Dify响应数据处理完成")
-        return processed_result
-        
-    except Exception as e:
-        logger.error(f"处理Dify响应数据时发生错误: {e}")
-        import traceback
-        logger.error(f"堆栈跟踪: {traceback.format_exc()}")
-        
-        # 返回原始数据作为fallback
-        return {
-            "outputs": dify_data if isinstance(dify_data, dict) else {"raw_data": dify_data},
-            "metadata": {}
-        }
+@app.on_event("startup")
+async def start_loop_monitor():
+    """启动事件循环延迟监控"""
+    if loop_monitor_enabled():
+        loop_monitor.start()
 
-async def call_dify_workflow(image_file_path: str, food_type: str, package_food_type: str, single_or_multi: str, package_size: str, max_retries: int = 2):
-    """调用Dify Workflow API进行食品标签检测，带重试机制"""
-    
-    for attempt in range(max_retries + 1):
-        try:
-            if attempt > 0:
-                logger.info(f"第 {attempt + 1} 次尝试调用Dify API...")
-                await asyncio.sleep(2 ** attempt)  # 指数退避
-            
-            logger.info("=" * 60)
-            logger.info(f"开始调用Dify Workflow API (尝试 {attempt + 1}/{max_retries + 1})")
-            logger.info(f"图片文件路径: {image_file_path}")
-            logger.info(f"食品类型: {food_type}")
-            logger.info(f"包装食品类型: {package_food_type}")
-            logger.info(f"单包装或多包装: {single_or_multi}")
-            logger.info(f"包装尺寸: {package_size}")
-            logger.info(f"Dify API URL: {DIFY_API_URL}")
-            logger.info(f"Dify API Token: {DIFY_API_TOKEN[:20]}...")
-            
-            # 检查文件路径类型，决定使用本地文件还是远程URL
-            if image_file_path.startswith("http"):
-                # 远程URL方式
-                logger.info("使用远程URL方式上传图片")
-                tag_image = {
-                    "type": "image",
-                    "transfer_method": "remote_url",
-                    "url": image_file_path
-                }
-            else:
-                # 本地文件，先上传到Dify服务器，然后使用文件ID
-                logger.info("使用Dify文件上传方式处理图片")
-                user_id = f"user-{uuid.uuid4().hex[:8]}"
-                file_info = await upload_image_to_dify(image_file_path, user_id)
-                
-                if file_info and file_info.get('id'):
-                    # 使用上传后的文件ID
-                    tag_image = {
-                        "type": "image",
-                        "transfer_method": "local_file", 
-                        "upload_file_id": file_info['id']
-                    }
-                    logger.info(f"使用Dify文件ID: {file_info['id']}")
-                else:
-                    raise Exception(f"图片上传Dify服务器失败，请检查")
-            
-            # 构建请求数据
-            payload = {
-                "inputs": {
-                    "TagImage": [tag_image],
-                    "Foodtype": food_type,
-                    "PackageFoodType": package_food_type,
-                    "SingleOrMulti": single_or_multi,
-                    "PackageSize": package_size
-                },
-                "response_mode": "blocking",
-                "user": f"user-{uuid.uuid4().hex[:8]}"
-            }
-            
-            logger.info("请求载荷:")
-            logger.info(json.dumps(payload, indent=2, ensure_ascii=False))
-            
-            # 发送请求到Dify API
-            logger.info("开始发送HTTP请求到Dify API...")
-            
-            # 配置更健壮的HTTP客户端
-            timeout = httpx.Timeout(
-                connect=30.0,  # 连接超时
-                read=300.0,    # 读取超时
-                write=30.0,    # 写入超时
-                pool=30.0      # 连接池超时
-            )
-            
-            # 配置重试机制的限制
-            limits = httpx.Limits(
-                max_keepalive_connections=5,
-                max_connections=10,
-                keepalive_expiry=30.0
-            )
-            
-            async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
-                logger.info("发送POST请求...")
-                response = await client.post(
-                    DIFY_API_URL,
-                    headers={
-                        "Authorization": f"Bearer {DIFY_API_TOKEN}",
-                        "Content-Type": "application/json"
-                    },
-                    json=payload
-                )
-                
-                logger.info(f"HTTP响应状态码: {response.status_code}")
-                logger.info(f"HTTP响应头: {dict(response.headers)}")
-                
-                if response.status_code == 200:
-                    try:
-                        # 尝试解析JSON响应
-                        logger.info("开始解析JSON响应...")
-                        result = response.json()
-                        logger.info("Dify API调用成功!")
-                        logger.info("响应内容:")
-                        logger.info(json.dumps(result, indent=2, ensure_ascii=False))
-                        logger.info("=" * 60)
-                        return {
-                            "success": True,
-                            "data": result,
-                            "message": "Dify Workflow调用成功"
-                        }
-                    except Exception as json_error:
-                        logger.error(f"JSON解析失败: {str(json_error)}")
-                        logger.error(f"原始响应内容: {response.text[:1000]}...")
-                        return {
-                            "success": False,
-                            "error": f"响应解析失败: {str(json_error)}",
-                            "message": "响应格式错误",
-                            "raw_response": response.text[:500]
-                        }
-                else:
-                    error_text = response.text
-                    logger.error(f"Dify API调用失败!")
-                    logger.error(f"状态码: {response.status_code}")
-                    logger.error(f"响应内容: {error_text}")
-                    logger.info("=" * 60)
-                    return {
-                        "success": False,
-                        "error": f"Dify API调用失败: {response.status_code} - {error_text}",
-                        "message": "检测失败"
-                    }
-                    
-        except httpx.ReadError as e:
-            logger.error(f"读取响应时发生错误: {str(e)}")
-            logger.error("这通常表示Dify服务器处理完成但在传输响应时连接中断")
-            logger.error("可能的原因:")
-            logger.error("1. 响应数据量过大")
-            logger.error("2. 服务器处理时间过长")
-            logger.error("3. 网络连接不稳定")
-            logger.info("虽然出现ReadError，但Dify服务器可能已经成功处理了请求")
-            
-            if attempt < max_retries:
-                logger.info(f"将在 {2 ** (attempt + 1)} 秒后重试...")
-                continue
-            else:
-                logger.error("已达到最大重试次数，放弃重试")
-                logger.info("=" * 60)
-                return {
-                    "success": False,
-                    "error": f"读取响应失败: {str(e)}",
-                    "message": "响应读取中断，但Dify服务器可能已处理完成",
-                    "suggestion": "请检查Dify服务器日志确认处理状态",
-                    "attempts": attempt + 1
-                }
-        except httpx.ConnectError as e:
-            logger.error(f"连接错误: {str(e)}")
-            logger.error("可能的原因:")
-            logger.error("1. Dify服务器无法访问")
-            logger.error("2. 网络连接问题") 
-            logger.error("3. URL地址错误")
-            
-            if attempt < max_retries:
-                logger.info(f"连接失败，将在 {2 ** (attempt + 1)} 秒后重试...")
-                continue
-            else:
-                logger.error("已达到最大重试次数，放弃重试")
-                logger.info("=" * 60)
-                return {
-                    "success": False,
-                    "error": f"连接Dify服务器失败: {str(e)}",
-                    "message": "无法连接到Dify服务器",
-                    "attempts": attempt + 1
-                }
-        except httpx.TimeoutException as e:
-            logger.error(f"请求超时: {str(e)}")
-            logger.error("超时类型可能包括:")
-            logger.error("1. 连接超时 - 无法建立连接")
-            logger.error("2. 读取超时 - 等待响应超时")
-            logger.error("3. 写入超时 - 发送数据超时")
-            
-            if attempt < max_retries:
-                logger.info(f"请求超时，将在 {2 ** (attempt + 1)} 秒后重试...")
-                continue
-            else:
-                logger.error("已达到最大重试次数，放弃重试")
-                logger.info("=" * 60)
-                return {
-                    "success": False,
-                    "error": f"请求超时: {str(e)}",
-                    "message": "请求超时",
-                    "attempts": attempt + 1
-                }
-        except Exception as e:
-            logger.error(f"发生未预期异常: {str(e)}")
-            logger.error(f"异常类型: {type(e).__name__}")
-            import traceback
-            logger.error(f"堆栈跟踪:\n{traceback.format_exc()}")
-            
-            if attempt < max_retries:
-                logger.info(f"发生异常，将在 {2 ** (attempt + 1)} 秒后重试...")
-                continue
-            else:
-                logger.error("已达到最大重试次数，放弃重试")
-                logger.info("=" * 60)
-                return {
-                    "success": False,
-                    "error": str(e),
-                    "message": "检测过程中发生错误",
-                    "attempts": attempt + 1
-                }
-    
-    # 如果所有重试都失败了（理论上不应该到这里）
-    return {
-        "success": False,
-        "error": "所有重试尝试都失败",
-        "message": "检测失败",
-        "attempts": max_retries + 1
-    }
+
+@app.on_event("startup")
+async def start_upload_spool():
+    """清理上次进程遗留的暂存文件，并启动后台清理任务"""
+    await upload_spool.start()
+
+
+@app.on_event("startup")
+async def start_dify_health():
+    """启动Dify后台健康探测"""
+    dify_health.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    """关闭共享的Dify HTTP客户端"""
+    await loop_monitor.stop()
+    await upload_spool.stop()
+    await dify_health.stop()
+    await close_http_client()
 
 @app.get("/")
 async def root():
@@ -441,20 +150,64 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查接口"""
+    """健康检查接口
+
+    服务本身存活即返回 200（供容器健康检查使用）；Dify的可达性来自后台健康探测的最近结果，
+    所有Dify后端都不可用时 status 为 degraded。
+    """
+    dify = dify_health.summary()
     return {
-        "status": "healthy",
+        "status": "degraded" if dify["status"] == "unhealthy" else "healthy",
         "timestamp": datetime.now().isoformat(),
-        "version": "mvp"
+        "version": "mvp",
+        "dify": dify
     }
 
+# 完整工作流诊断（/api/test-dify）会消耗Dify令牌，全局限制最短调用间隔（秒）
+DIFY_DIAGNOSTIC_INTERVAL = float(os.getenv("DIFY_DIAGNOSTIC_INTERVAL", "300"))
+dify_diagnostic_bucket = TokenBucket(rate=1.0 / max(DIFY_DIAGNOSTIC_INTERVAL, 1e-6), burst=1.0)
+last_dify_diagnostic: dict = {}
+
+
 @app.get("/api/test-dify")
-async def test_dify_connection():
-    """测试Dify API连接"""
+async def test_dify_connection(response_mode: Optional[str] = None, backend: Optional[str] = None):
+    """Dify完整工作流诊断
+
+    用远程图片实际运行一次工作流（会消耗令牌），用于排查工作流本身的问题；日常的连通性和鉴权
+    检查请看 /health 中的 dify 字段。每 DIFY_DIAGNOSTIC_INTERVAL 秒最多运行一次，
+    间隔内再次调用返回 429 和上一次的诊断结果。
+    """
+    try:
+        transport = get_transport(response_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    retry_after = dify_diagnostic_bucket.consume()
+    if retry_after > 0:
+        return FastJSONResponse(
+            status_code=429,
+            content={
+                "success": False,
+                "message": f"Dify完整诊断每 {DIFY_DIAGNOSTIC_INTERVAL:g} 秒最多运行一次",
+                "retry_after": int(retry_after) + 1,
+                "last_result": last_dify_diagnostic or None
+            },
+            headers={"Retry-After": str(int(retry_after) + 1)}
+        )
+
+    result = await run_dify_diagnostic(transport, dify_client.dify_pool.get(backend))
+    last_dify_diagnostic.clear()
+    last_dify_diagnostic.update(result, checked_at=datetime.now().isoformat())
+    return result
+
+
+async def run_dify_diagnostic(transport, target):
+    """在指定后端上运行一次完整的测试工作流"""
+    dify_url = target.run_url
     try:
         logger.info("开始测试Dify API连接...")
-        logger.info(f"Dify API URL: {DIFY_API_URL}")
-        logger.info(f"Dify API Token: {DIFY_API_TOKEN[:20]}...")
+        logger.info(f"Dify API URL: {dify_url}")
+        logger.info(f"传输方式: {transport.response_mode}")
         
         # 构建简单的测试请求
         test_payload = {
@@ -478,51 +231,34 @@ async def test_dify_connection():
                 "Foodtype": "糕点",
                 "PackageFoodType": "直接提供给消费者的预包装食品",
                 "SingleOrMulti": "多件",
-                "PackageSize": "最大表面面积大于35cm2"
+                "PackageSize": "最大表面面积大于35cm2",
+                # 工作流引用组装后的提示词时，测试请求也要带上
+                **assembled_prompt_input(prompt_context("直接提供给消费者的预包装食品", "最大表面面积大于35cm2", None))
             },
-            "response_mode": "blocking",
+            "response_mode": transport.response_mode,
             "user": f"test-user-{uuid.uuid4().hex[:8]}"
         }
         
         logger.info("发送测试请求到Dify API...")
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            response = await client.post(
-                DIFY_API_URL,
-                headers={
-                    "Authorization": f"Bearer {DIFY_API_TOKEN}",
-                    "Content-Type": "application/json"
-                },
-                json=test_payload
-            )
-            
-            logger.info(f"测试响应状态码: {response.status_code}")
-            logger.info(f"测试响应头: {dict(response.headers)}")
-            
-            try:
-                response_json = response.json()
-                logger.info(f"测试响应返回: {response_json}")
-            except Exception as json_error:
-                logger.warning(f"无法解析响应JSON: {json_error}")
-                response_json = "无法解析为JSON"
-            
-            result = {
-                "success": True,
-                "dify_url": DIFY_API_URL,
-                "status_code": response.status_code,
-                "response_headers": dict(response.headers),
-                "response_text": response.text[:500] + "..." if len(response.text) > 500 else response.text,
-                "message": "Dify API连接测试完成"
-            }
-            
-            result["response_json"] = response_json
-            return result
+        test_result = await transport.run_workflow(test_payload, backend=target)
+        logger.info(f"测试结果: success={test_result['success']}")
+        
+        return {
+            "success": test_result["success"],
+            "backend": target.name,
+            "dify_url": dify_url,
+            "response_mode": transport.response_mode,
+            "error": test_result.get("error"),
+            "response_json": test_result.get("data"),
+            "message": "Dify API连接测试完成" if test_result["success"] else "Dify API返回错误"
+        }
             
     except httpx.ReadError as e:
         logger.error(f"测试时读取响应失败: {str(e)}")
         return {
             "success": False,
             "error": f"读取响应失败: {str(e)}",
-            "dify_url": DIFY_API_URL,
+            "dify_url": dify_url,
             "message": "响应读取中断，但服务器可能已处理请求"
         }
     except httpx.ConnectError as e:
@@ -530,9 +266,17 @@ async def test_dify_connection():
         return {
             "success": False,
             "error": f"连接失败: {str(e)}",
-            "dify_url": DIFY_API_URL,
+            "dify_url": dify_url,
             "message": "无法连接到Dify服务器"
         }
+    except httpx.TimeoutException as e:
+        logger.error(f"测试时请求超时: {str(e)}")
+        return {
+            "success": False,
+            "error": f"请求超时: {str(e)}",
+            "dify_url": dify_url,
+            "message": "请求超时"
+        }
     except Exception as e:
         logger.error(f"测试Dify API时发生异常: {str(e)}")
         import traceback
@@ -543,130 +287,512 @@ async def test_dify_connection():
             "message": "测试失败"
         }
 
+# 单次检测允许提交的标签图片数（同一产品的正面、背面、侧面等）
+MAX_IMAGES_PER_DETECTION = int(os.getenv("MAX_IMAGES_PER_DETECTION", "6"))
+ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/png", "application/pdf"]
+
+
+def collect_files(file: Optional[List[UploadFile]], upload_ids: Optional[List[str]], client: ClientContext) -> list:
+    """本次提交的图片：直接上传的文件 + 预上传句柄对应的文件"""
+    files = list(file or [])
+    for upload_id in upload_ids or []:
+        pre_upload = pre_upload_store.get(client.key, upload_id)
+        if pre_upload is None:
+            raise HTTPException(status_code=404, detail=f"上传句柄不存在或已过期: {upload_id}")
+        files.append(pre_upload)
+    return files
+
+
+def validate_files(files: list):
+    if not files:
+        raise HTTPException(status_code=400, detail="请上传标签图片")
+    if len(files) > MAX_IMAGES_PER_DETECTION:
+        raise HTTPException(status_code=400, detail=f"单次检测最多提交 {MAX_IMAGES_PER_DETECTION} 张图片")
+    if any(upload.content_type not in ALLOWED_CONTENT_TYPES for upload in files):
+        raise HTTPException(status_code=400, detail="不支持的文件类型")
+
+
+@app.post("/api/upload")
+async def pre_upload_label(
+    file: UploadFile = File(...),
+    PackageFoodType: Optional[str] = Form(None),
+    PackageSize: Optional[str] = Form(None),
+    SpecialRequirement: Optional[str] = Form(None),
+    client: ClientContext = Depends(rate_limit)
+):
+    """预上传标签图片
+
+    用户填写检测表单期间就把图片写入暂存区并在后台上传到Dify，返回的 upload_id
+    可以作为 /api/detect 的 UploadId 表单字段代替 file，检测时跳过上传阶段。
+    已知的 PackageFoodType / PackageSize / SpecialRequirement 一并提交时，按检测时的类别路由选择Dify后端。
+    """
+    if file.content_type not in ALLOWED_CONTENT_TYPES:
+        raise HTTPException(status_code=400, detail="不支持的文件类型")
+    data = await file.read()
+    if not data:
+        raise HTTPException(status_code=400, detail="文件为空")
+    try:
+        pre_upload = await pre_upload_store.create(
+            client.key, file.filename, file.content_type, data,
+            categories=route_categories(prompt_context(PackageFoodType, PackageSize, SpecialRequirement))
+        )
+    except OSError as e:
+        logger.error(f"预上传文件保存失败: {e}")
+        raise HTTPException(status_code=500, detail="文件保存失败")
+    logger.info(f"预上传: {file.filename} ({len(data)} bytes) -> {pre_upload.handle}，Dify后端 {pre_upload.backend_name}")
+    return {
+        "success": True,
+        "upload_id": pre_upload.handle,
+        "filename": pre_upload.filename,
+        "file_type": pre_upload.content_type,
+        "file_size": pre_upload.size,
+        "expires_in": pre_upload_store.ttl
+    }
+
+
 @app.post("/api/detect")
 async def detect_label(
-    file: UploadFile = File(...),
+    request: Request,
+    file: Optional[List[UploadFile]] = File(None),
+    UploadId: Optional[List[str]] = Form(None),
     Foodtype: str = Form(...),
     PackageFoodType: str = Form(...),
     SingleOrMulti: str = Form(...),
     PackageSize: str = Form(...),
     DetectionTime: str = Form(...),
-    SpecialRequirement: Optional[str] = Form(None)
+    SpecialRequirement: Optional[str] = Form(None),
+    ResponseMode: Optional[str] = Form(None),
+    LabelText: Optional[str] = Form(None),
+    RequestId: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    request_timeout: Optional[str] = Header(None, alias="X-Request-Timeout"),
+    client: ClientContext = Depends(rate_limit),
+    compact: bool = Query(False, description="精简响应：不重复返回已解析的原文，省略空字段"),
+    fields: Optional[str] = Query(None, description="只返回指定字段，逗号分隔的点号路径，如 dify_result.outputs.json_data,usage")
 ):
-    """简化版标签检测接口 - 直接调用Dify API返回结果"""
-    try:
-        logger.info("=" * 80)
-        logger.info("收到新的检测请求 /api/detect")
-        logger.info(f"文件名: {file.filename}")
-        logger.info(f"文件类型: {file.content_type}")
-        logger.info(f"文件大小: {file.size}")
-        logger.info(f"食品类型: {Foodtype}")
-        logger.info(f"包装食品类型: {PackageFoodType}")
-        logger.info(f"单包装或多包装: {SingleOrMulti}")
-        logger.info(f"包装尺寸: {PackageSize}")
-        logger.info(f"检测时间: {DetectionTime}")
-        logger.info(f"特殊要求: {SpecialRequirement}")
-        logger.info("=" * 80)
-        
-        # 验证文件
-        if file.content_type not in ["image/jpeg", "image/png", "application/pdf"]:
-            raise HTTPException(status_code=400, detail="不支持的文件类型")
-        
-        # 保存上传的文件
-        upload_dir = "uploads"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        file_id = str(uuid.uuid4())
-        file_extension = os.path.splitext(file.filename)[1]
-        file_path = os.path.join(upload_dir, f"{file_id}{file_extension}")
-        
-        logger.info(f"保存文件到: {file_path}")
-        
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        logger.info(f"文件保存成功，文件大小: {len(content)} bytes")
-        
-        # 检查文件是否存在
-        if os.path.exists(file_path):
-            logger.info(f"确认文件已保存: {file_path}")
-            logger.info(f"文件实际大小: {os.path.getsize(file_path)} bytes")
-        else:
-            logger.error(f"文件保存失败: {file_path}")
-            raise HTTPException(status_code=500, detail="文件保存失败")
-        
-        # 调用Dify Workflow API
-        logger.info("准备调用Dify Workflow API...")
-        dify_result = await call_dify_workflow(
-            image_file_path=file_path,
-            food_type=Foodtype,
-            package_food_type=PackageFoodType,
-            single_or_multi=SingleOrMulti,
-            package_size=PackageSize
-        )
-        
-        logger.info(f"Dify API调用结果: success={dify_result['success']}")
-        if not dify_result["success"]:
-            logger.error(f"Dify API调用失败: {dify_result['error']}")
-            # 即使失败也清理文件
-            try:
-                os.remove(file_path)
-                logger.info(f"已清理临时文件: {file_path}")
-            except:
-                logger.warning(f"无法清理临时文件: {file_path}")
-            raise HTTPException(status_code=500, detail=dify_result["error"])
-        
-        logger.info("Dify API调用成功，开始处理返回数据...")
-        
-        # 解析Dify返回的结果
-        dify_data = dify_result["data"]
-        logger.info(f"Dify返回数据类型: {type(dify_data)}")
-        logger.info(f"Dify返回数据内容: {json.dumps(dify_data, indent=2, ensure_ascii=False) if isinstance(dify_data, dict) else str(dify_data)}")
-        
-        # 处理Dify返回的数据，确保格式符合前端期望
-        processed_dify_result = process_dify_response(dify_data)
-        
-        # 构建符合前端期望的响应结构
-        result = {
-            "success": True,
-            "detection_time": DetectionTime,
-            "file_info": {
-                "filename": file.filename,
-                "file_type": file.content_type,
-                "file_size": file.size
-            },
-            "input_params": {
+    """简化版标签检测接口 - 直接调用Dify API返回结果
+
+    file 字段可以重复提交多次，同一产品多个面的标签图片在一次工作流运行中检测。
+    已通过 /api/upload 预上传的图片用 UploadId 字段（可重复）提交，不再上传到Dify。
+    带 Idempotency-Key 请求头（或 RequestId 表单字段）的重复提交复用同一次检测。
+    检测受请求截止时间约束（X-Request-Timeout 只能缩短 DETECT_DEADLINE），客户端断开时取消检测。
+    """
+    deadline = request_deadline(request_timeout)
+    files = collect_files(file, UploadId, client)
+    logger.info("=" * 80)
+    logger.info("收到新的检测请求 /api/detect")
+    for upload in files:
+        logger.info(f"文件: {upload.filename}, 类型: {upload.content_type}, 大小: {upload.size}")
+    logger.info(f"食品类型: {Foodtype}")
+    logger.info(f"包装食品类型: {PackageFoodType}")
+    logger.info(f"单包装或多包装: {SingleOrMulti}")
+    logger.info(f"包装尺寸: {PackageSize}")
+    logger.info(f"检测时间: {DetectionTime}")
+    logger.info(f"特殊要求: {SpecialRequirement}")
+    logger.info(f"传输方式: {ResponseMode or dify_client.default_response_mode()}")
+    logger.info(f"客户端: {client.key}, 优先级: {client.priority}")
+    logger.info("=" * 80)
+    
+    # 验证文件
+    validate_files(files)
+    
+    if ResponseMode and ResponseMode not in RESPONSE_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的传输方式: {ResponseMode}")
+    
+    request_key = idempotency_key or RequestId
+    if request_key is not None and not 0 < len(request_key) <= MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"幂等键长度应为 1-{MAX_KEY_LENGTH} 个字符")
+    
+    # 先读出全部内容：带幂等键的检测在独立任务中运行，可能比本次请求活得更久
+    contents = [await upload.read() for upload in files]
+    
+    async def run_detection() -> dict:
+        file_paths: List[str] = []
+        try:
+            # 保存上传的文件到暂存区（按内容命名，请求结束后释放租约，由后台任务清理）
+            file_id = str(uuid.uuid4())
+            stored = await asyncio.gather(
+                *(upload_spool.store(data, os.path.splitext(upload.filename)[1]) for upload, data in zip(files, contents)),
+                return_exceptions=True
+            )
+            file_paths.extend(path for path in stored if isinstance(path, str))
+            failed = [error for error in stored if isinstance(error, BaseException)]
+            if failed:
+                logger.error(f"文件保存失败: {failed[0]}")
+                raise HTTPException(status_code=500, detail="文件保存失败")
+            total_bytes = sum(len(data) for data in contents)
+            
+            logger.info(f"文件保存成功: {', '.join(file_paths)}，总大小: {total_bytes} bytes")
+            
+            # 各图片上传到Dify的耗时（仅在实际调用Dify时产生）
+            image_timings = None
+            
+            # 同一图片、同样参数、同一提示词/工作流版本的结果可以直接复用
+            detect_params = (
+                Foodtype, PackageFoodType, SingleOrMulti, PackageSize, SpecialRequirement, LabelText, prescreen_mode(),
+                prompt_assembly_mode()
+            )
+            cache_digest = request_digest(b"".join(hashlib.sha256(data).digest() for data in contents), detect_params)
+            prompt_version = prompt_registry.fingerprint
+            cached_result = result_cache.get(prompt_version, cache_digest)
+            cache_status = "hit" if cached_result is not None else ("miss" if result_cache.enabled else "off")
+            
+            # 近重复检测：同一包装重新拍摄的图片，检测参数相同时标注或复用历史结果
+            image_hashes = None
+            near_duplicate = None
+            params_key = request_digest(b"", detect_params)
+            if cached_result is None and near_dup_mode() != "off" and len(files) == 1:
+                image_hashes = await hash_upload(contents[0], files[0].content_type)
+                match = near_duplicate_index.find(image_hashes, params_key) if image_hashes else None
+                if match:
+                    near_duplicate = {
+                        "detection_id": match["detection_id"],
+                        "phash_distance": match["distance"],
+                        "dhash_distance": match["dhash_distance"],
+                        "served": False,
+                    }
+                    if near_dup_mode() == "serve":
+                        cached_result = result_cache.get(prompt_version, match["cache_digest"])
+                        if cached_result is not None:
+                            near_duplicate["served"] = True
+                            cache_status = "near_duplicate"
+                    near_duplicate_total.inc(action="serve" if near_duplicate["served"] else "flag")
+                    logger.info(f"检测到近重复图片: 历史检测 {match['detection_id']}, "
+                                f"pHash距离 {match['distance']}, 复用结果: {near_duplicate['served']}")
+            
+            # 本地预筛查：离线文字提取 + 规则检查，毫秒级给出初步结论（命中缓存时跳过）
+            prescreen = None
+            if cached_result is None and prescreen_mode() != "off":
+                prescreen = await run_prescreen(
+                    file_paths, [upload.content_type for upload in files],
+                    PackageFoodType, PackageSize, SpecialRequirement, LabelText
+                )
+                logger.info(f"本地预筛查: {prescreen['status']}, 耗时 {prescreen['elapsed_ms']}ms, "
+                            f"发现问题 {prescreen.get('summary', {}).get('failed', 0)} 个")
+            
+            if cached_result is not None:
+                logger.info(f"命中结果缓存（{cache_status}，版本 {prompt_version}），跳过Dify调用")
+                # 缓存的是首次检测的结果，检测时间和检测ID换成本次请求的值
+                processed_dify_result = restamp(cached_result, DetectionTime, file_id)
+                usage = record_detection_cost(
+                    detection_id=file_id,
+                    user=client.key,
+                    food_type=Foodtype,
+                    package_food_type=PackageFoodType,
+                    response_mode="cache",
+                    dify_data=None,
+                    image_bytes=total_bytes,
+                    prompt_version=prompt_version
+                )
+            elif prescreen and should_short_circuit(prescreen):
+                # 预筛查已发现高风险问题，不再调用Dify
+                logger.info("预筛查发现高风险问题，跳过Dify调用")
+                processed_dify_result = build_prescreen_result(prescreen, PackageFoodType, PackageSize, DetectionTime)
+                usage = record_detection_cost(
+                    detection_id=file_id,
+                    user=client.key,
+                    food_type=Foodtype,
+                    package_food_type=PackageFoodType,
+                    response_mode="prescreen",
+                    dify_data=None,
+                    image_bytes=total_bytes,
+                    prompt_version=prompt_version
+                )
+            else:
+                # 调用Dify Workflow API
+                # 在Dify并发池中按客户端加权公平排队
+                logger.info("准备调用Dify Workflow API...")
+                # 按检测参数只保留适用的提示词段落，并优先路由到该类别的专门工作流
+                context = prompt_context(PackageFoodType, PackageSize, SpecialRequirement)
+                extra_inputs = dict(findings_as_workflow_input(prescreen) if prescreen else {},
+                                    **assembled_prompt_input(context))
+                async with dify_scheduler.slot(client.key, client.priority, client.weight):
+                    dify_result = await call_dify_workflow(
+                        image_file_path=file_paths,
+                        food_type=Foodtype,
+                        package_food_type=PackageFoodType,
+                        single_or_multi=SingleOrMulti,
+                        package_size=PackageSize,
+                        response_mode=ResponseMode,
+                        extra_inputs=extra_inputs or None,
+                        deadline=deadline,
+                        pre_uploaded=pre_uploaded_files(files) or None,
+                        categories=route_categories(context)
+                    )
+            
+                logger.info(f"Dify API调用结果: success={dify_result['success']}")
+                image_timings = dify_result.get("image_timings")
+            
+                # 工作流重新发布后 workflow_id 会变化，版本指纹随之更新
+                if dify_result["success"]:
+                    prompt_registry.observe_workflow(dify_result["data"], dify_result.get("backend"))
+                    prompt_version = prompt_registry.fingerprint
+            
+                # 记录本次检测的令牌与费用
+                usage = record_detection_cost(
+                    detection_id=file_id,
+                    user=client.key,
+                    food_type=Foodtype,
+                    package_food_type=PackageFoodType,
+                    response_mode=ResponseMode or dify_client.default_response_mode(),
+                    dify_data=dify_result.get("data"),
+                    success=dify_result["success"],
+                    image_bytes=total_bytes,
+                    prompt_version=prompt_version
+                )
+                logger.info(f"令牌用量: {usage['total_tokens']}, 费用: {usage['total_price']} {usage['currency']}")
+            
+                if not dify_result["success"]:
+                    logger.error(f"Dify API调用失败: {dify_result['error']}")
+                    status_code = 504 if dify_result.get("deadline_exceeded") else 500
+                    raise HTTPException(status_code=status_code, detail=dify_result["error"])
+            
+                logger.info("Dify API调用成功，开始处理返回数据...")
+            
+                # 解析Dify返回的结果
+                dify_data = dify_result["data"]
+                logger.info(f"Dify返回数据类型: {type(dify_data)}")
+                logger.debug(f"Dify返回数据内容: {json.dumps(dify_data, ensure_ascii=False) if isinstance(dify_data, dict) else str(dify_data)}")
+            
+                # 处理Dify返回的数据，确保格式符合前端期望
+                processed_dify_result = process_dify_response(dify_data)
+                if processed_dify_result["outputs"].get("validation", {}).get("valid"):
+                    result_cache.put(prompt_version, cache_digest, processed_dify_result)
+                if image_hashes:
+                    near_duplicate_index.add(
+                        image_hashes, params_key, detection_id=file_id, cache_digest=cache_digest, created_at=time.time()
+                    )
+            
+            input_params = {
                 "Foodtype": Foodtype,
                 "PackageFoodType": PackageFoodType,
                 "SingleOrMulti": SingleOrMulti,
                 "PackageSize": PackageSize,
                 "SpecialRequirement": SpecialRequirement
-            },
-            "dify_result": processed_dify_result,
-            "message": "检测完成"
-        }
-        
-        logger.info("检测完成，准备返回结果")
-        
-        # 清理临时文件
-        try:
-            os.remove(file_path)
-            logger.info(f"已清理临时文件: {file_path}")
-        except:
-            logger.warning(f"无法清理临时文件: {file_path}")
-        
-        return result
-        
-    except HTTPException:
-        # 重新抛出HTTP异常，不修改
-        raise
+            }
+            # 完整检测（包括复用的结果）写入检测记录，预筛查直接判定的结果不写入
+            record_id = None
+            if (processed_dify_result.get("metadata") or {}).get("source") != "prescreen":
+                record_id = record_detection(
+                    processed_dify_result["outputs"].get("json_data"), DetectionTime, input_params, prompt_version
+                )
+            
+            # 构建符合前端期望的响应结构
+            result = {
+                "success": True,
+                "detection_id": file_id,
+                "record_id": record_id,
+                "detection_time": DetectionTime,
+                "file_info": {
+                    "filename": files[0].filename,
+                    "file_type": files[0].content_type,
+                    "file_size": files[0].size
+                },
+                "files": [
+                    {
+                        "filename": upload.filename,
+                        "file_type": upload.content_type,
+                        "file_size": upload.size,
+                        **(timing or {})
+                    }
+                    for upload, timing in zip(files, image_timings or [None] * len(files))
+                ],
+                "input_params": input_params,
+                "dify_result": processed_dify_result,
+                "usage": usage,
+                "prescreen": prescreen,
+                "prompt_version": prompt_version,
+                "cache": cache_status,
+                "near_duplicate": near_duplicate,
+                "message": "检测完成"
+            }
+            return result
+            
+        except HTTPException:
+            # 重新抛出HTTP异常，不修改
+            raise
+        except Exception as e:
+            logger.error(f"检测过程中发生异常: {str(e)}")
+            logger.error(f"异常类型: {type(e).__name__}")
+            import traceback
+            logger.error(f"完整堆栈跟踪:\n{traceback.format_exc()}")
+            raise HTTPException(status_code=500, detail=f"检测失败: {str(e)}")
+        finally:
+            # 无论成功与否都释放暂存文件租约，删除由后台清理任务完成
+            for file_path in file_paths:
+                upload_spool.release(file_path)
+    
+    headers = {}
+    if request_key:
+        # 同一个键只能对应同样的图片和参数
+        request_fingerprint = request_digest(
+            b"".join(hashlib.sha256(data).digest() for data in contents),
+            (Foodtype, PackageFoodType, SingleOrMulti, PackageSize, DetectionTime,
+             SpecialRequirement, ResponseMode, LabelText)
+        )
+        detection = idempotency_store.run((client.key, request_key), request_fingerprint, run_detection)
+    else:
+        detection = run_detection()
+    
+    try:
+        outcome = await run_until_disconnected(request, detection)
+    except ClientDisconnected:
+        # 客户端已收不到响应
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key 已用于内容不同的检测请求")
+    
+    if request_key:
+        result, status = outcome
+        if status != "new":
+            logger.info(f"幂等键 {request_key}: {status}，复用检测 {result['detection_id']}")
+            headers["Idempotent-Replayed"] = "true"
+    else:
+        result = outcome
+    
+    logger.info("检测完成，准备返回结果")
+    if compact:
+        result = compact_result(result)
+    if fields:
+        result = project(result, parse_fields(fields))
+    # 直接返回响应对象，只序列化一次
+    return FastJSONResponse(result, headers=headers)
+
+
+@app.post("/api/detections/{record_id}/recheck")
+async def recheck_detection(
+    record_id: str,
+    file: Optional[List[UploadFile]] = File(None),
+    UploadId: Optional[List[str]] = Form(None),
+    Foodtype: Optional[str] = Form(None),
+    PackageFoodType: Optional[str] = Form(None),
+    SingleOrMulti: Optional[str] = Form(None),
+    PackageSize: Optional[str] = Form(None),
+    ResponseMode: Optional[str] = Form(None),
+    request_timeout: Optional[str] = Header(None, alias="X-Request-Timeout"),
+    client: ClientContext = Depends(rate_limit)
+):
+    """整改后的定向复核：只重新检测原记录中不合格的项目，并把新结论合并回原记录
+
+    record_id 是 /api/detect 响应中的 record_id（检测记录由 detection_history 写入）。
+    检测参数未提交时沿用原检测提交的参数，没有时取原记录的产品类型和包装面积分类。
+    """
+    deadline = request_deadline(request_timeout)
+    files = collect_files(file, UploadId, client)
+    validate_files(files)
+    if ResponseMode and ResponseMode not in RESPONSE_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的传输方式: {ResponseMode}")
+
+    try:
+        record = await recheck.load_record(record_id)
+    except recheck.RecheckError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"检测过程中发生异常: {str(e)}")
-        logger.error(f"异常类型: {type(e).__name__}")
-        import traceback
-        logger.error(f"完整堆栈跟踪:\n{traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=f"检测失败: {str(e)}")
+        logger.error(f"读取检测记录失败: {e}")
+        raise HTTPException(status_code=503, detail=f"检测记录不可用: {str(e)}")
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"检测记录不存在: {record_id}")
+
+    previous = record.get("detection_result") or {}
+    try:
+        targets = recheck.failed_items(previous)
+    except recheck.RecheckError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not targets:
+        return {"success": True, "record_id": record_id, "rechecked": [], "changes": [],
+                "message": "原记录没有不合格项目，无需复核"}
+    target_names = [item.get("检测项目") for item in targets]
+    logger.info(f"定向复核 {record_id}: {', '.join(map(str, target_names))}")
+
+    info = previous.get("基本信息") or {}
+    params = record.get("input_params") or {}
+    food_type = Foodtype or params.get("Foodtype") or info.get("食品类型") or record.get("product_type", "")
+    contents = [await upload.read() for upload in files]
+    package_food_type = PackageFoodType or params.get("PackageFoodType") or record.get("product_type", "")
+    package_size = PackageSize or params.get("PackageSize") or record.get("package_size_category", "")
+    # 原检测的特殊要求，没有时用原记录识别出的产品类型（如「进口食品」）决定是否保留进口食品段落
+    context = prompt_context(package_food_type, package_size,
+                             params.get("SpecialRequirement") or str(info.get("产品类型") or record.get("product_type", "")))
+    file_paths: List[str] = []
+    try:
+        for upload, data in zip(files, contents):
+            file_paths.append(await upload_spool.store(data, os.path.splitext(upload.filename)[1]))
+        async with dify_scheduler.slot(client.key, client.priority, client.weight):
+            dify_result = await call_dify_workflow(
+                image_file_path=file_paths,
+                food_type=food_type,
+                package_food_type=package_food_type,
+                single_or_multi=SingleOrMulti or params.get("SingleOrMulti") or "单件",
+                package_size=package_size,
+                response_mode=ResponseMode,
+                extra_inputs=dict(recheck.build_recheck_input(targets), **assembled_prompt_input(context)),
+                deadline=deadline,
+                pre_uploaded=pre_uploaded_files(files) or None,
+                categories=route_categories(context)
+            )
+    finally:
+        for file_path in file_paths:
+            upload_spool.release(file_path)
+
+    if dify_result["success"]:
+        prompt_registry.observe_workflow(dify_result["data"], dify_result.get("backend"))
+    prompt_version = prompt_registry.fingerprint
+    usage = record_detection_cost(
+        detection_id=record_id,
+        user=client.key,
+        food_type=food_type,
+        package_food_type=package_food_type,
+        response_mode="recheck",
+        dify_data=dify_result.get("data"),
+        success=dify_result["success"],
+        image_bytes=sum(len(data) for data in contents),
+        prompt_version=prompt_version
+    )
+    if not dify_result["success"]:
+        logger.error(f"复核调用Dify失败: {dify_result['error']}")
+        raise HTTPException(status_code=504 if dify_result.get("deadline_exceeded") else 500,
+                            detail=dify_result["error"])
+
+    outputs = process_dify_response(dify_result["data"])["outputs"]
+    try:
+        merged, changes = recheck.merge_recheck(previous, outputs.get("json_data") or {}, targets)
+    except recheck.RecheckError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    try:
+        baseline, samples = await recheck.full_run_baseline(food_type)
+    except Exception as e:
+        logger.warning(f"读取完整检测的令牌基线失败: {e}")
+        baseline, samples = None, 0
+    savings = recheck.token_savings(usage["total_tokens"], baseline, samples)
+    logger.info(f"复核令牌 {usage['total_tokens']}，完整检测基线 {savings['full_run_tokens']}，"
+                f"节省 {savings['saved_pct']}%")
+
+    entry = {
+        "checked_at": datetime.now().isoformat(),
+        "items": target_names,
+        "changes": changes,
+        "usage": usage,
+        "token_savings": savings,
+        "prompt_version": prompt_version,
+    }
+    try:
+        await recheck.save_recheck(record_id, merged, entry, prompt_version)
+    except Exception as e:
+        logger.error(f"保存复核结果失败: {e}")
+        raise HTTPException(status_code=503, detail=f"保存复核结果失败: {str(e)}")
+
+    return FastJSONResponse({
+        "success": True,
+        "record_id": record_id,
+        "rechecked": target_names,
+        "changes": changes,
+        "detection_result": merged,
+        "usage": usage,
+        "token_savings": savings,
+        "prompt_version": prompt_version,
+        "message": "复核完成"
+    })
 
 if __name__ == "__main__":
     import uvicorn
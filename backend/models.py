@@ -27,11 +27,14 @@ class DetectionRecord(Document):
     overall_rating: str = Field(..., description="总体评级")
     compliance_rate: float = Field(..., description="合规率")
     key_issues: int = Field(default=0, description="关键问题数量")
-    general_issues: int = Field(default=0, description="一般问题数量")
-    low_risk_issues: int = Field(default=0, description="低风险问题数量")
+    general_issues: int = Field(default=0, description="一般问题数量（中风险与低风险，同合规性评估的一般问题）")
+    low_risk_issues: int = Field(default=0, description="低风险问题数量（包含在一般问题中）")
     
     # 详细结果
     detection_result: Dict[str, Any] = Field(..., description="详细检测结果")
+    prompt_version: Optional[str] = Field(None, description="提示词/工作流指纹")
+    input_params: Dict[str, Any] = Field(default_factory=dict, description="检测时提交的参数")
+    rechecks: List[Dict[str, Any]] = Field(default_factory=list, description="整改后的定向复核记录")
     
     # 元数据
     created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
@@ -160,3 +163,56 @@ class DetectionHistory(Document):
             }
         }
     )
+
+
+class CostLedgerEntry(Document):
+    """单次检测的令牌与费用台账"""
+    
+    class Settings:
+        name = "cost_ledger"
+        indexes = [
+            "detection_id",
+            "user",
+            "food_type",
+            "day"
+        ]
+    
+    detection_id: str = Field(..., description="检测请求ID")
+    user: str = Field(..., description="客户端标识（API Key 或 IP）")
+    food_type: str = Field(..., description="食品类型")
+    package_food_type: Optional[str] = Field(None, description="包装食品类型")
+    response_mode: str = Field(..., description="Dify传输方式")
+    success: bool = Field(default=True, description="检测是否成功")
+    
+    # 用量
+    total_tokens: int = Field(default=0, description="令牌总数")
+    total_price: float = Field(default=0.0, description="费用")
+    currency: str = Field(default="USD", description="币种")
+    price_source: str = Field(default="dify", description="费用来源: dify/estimated/unknown")
+    elapsed_time: float = Field(default=0.0, description="工作流耗时(秒)")
+    image_bytes: int = Field(default=0, description="上传图片大小(字节)")
+    prompt_version: Optional[str] = Field(None, description="提示词/工作流指纹")
+    
+    # 时间
+    day: str = Field(..., description="日期（YYYY-MM-DD），用于按天汇总")
+    created_at: datetime = Field(default_factory=datetime.now, description="创建时间")
+    
+    model_config = ConfigDict(
+        arbitrary_types_allowed=True,
+        json_schema_extra={
+            "example": {
+                "detection_id": "0b6f3c1e-6c1f-4d55-9f1a-2f1f8a7f2c10",
+                "user": "team-a",
+                "food_type": "糕点",
+                "package_food_type": "直接提供给消费者的预包装食品",
+                "response_mode": "blocking",
+                "total_tokens": 5321,
+                "total_price": 0.0213,
+                "currency": "USD",
+                "price_source": "dify",
+                "elapsed_time": 41.2,
+                "image_bytes": 482113,
+                "day": "2025-01-01"
+            }
+        }
+    )
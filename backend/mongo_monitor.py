@@ -0,0 +1,157 @@
+"""
+MongoDB 连接池配置与命令监控
+
+Database.connect 用这里的配置创建 AsyncIOMotorClient:
+
+    - 连接池: 最大/最小连接数、空闲连接回收时间、等待空闲连接的超时；
+    - 超时: 服务器选择超时默认 5 秒（PyMongo 默认 30 秒，数据库不可用时检测历史、统计接口
+      要等很久才报错），连接超时默认 5 秒，套接字超时默认不限；
+    - 压缩: 按顺序与服务器协商 zstd（需安装 zstandard）/ snappy（需安装 python-snappy）/ zlib，
+      未安装的算法跳过；默认不压缩，数据库不在本机时建议开启；
+    - 读偏好: 副本集上可以把历史查询、统计聚合分到从节点（secondaryPreferred）。
+
+命令监听器（PyMongo CommandListener）记录每种命令的耗时与结果，超过 MONGODB_SLOW_COMMAND_MS
+的命令记录慢命令日志。日志只包含命令名、集合和查询条件的字段名，不包含字段值。
+
+配置（pydantic-settings，环境变量前缀 MONGODB_）:
+    MONGODB_MAX_POOL_SIZE                最大连接数，默认 100
+    MONGODB_MIN_POOL_SIZE                最小连接数，默认 0
+    MONGODB_MAX_IDLE_TIME_MS             空闲连接回收时间（毫秒），默认不回收
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS        等待空闲连接的超时（毫秒），默认不限
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS  服务器选择超时（毫秒），默认 5000
+    MONGODB_CONNECT_TIMEOUT_MS           连接超时（毫秒），默认 5000
+    MONGODB_SOCKET_TIMEOUT_MS            套接字读写超时（毫秒），默认不限
+    MONGODB_COMPRESSORS                  压缩算法，逗号分隔，如 zstd,snappy,zlib，默认不压缩
+    MONGODB_READ_PREFERENCE              primary（默认）/ primaryPreferred / secondary / secondaryPreferred / nearest
+    MONGODB_SLOW_COMMAND_MS              慢命令阈值（毫秒），默认 100
+"""
+
+import logging
+import importlib.util
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import Field, model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from pymongo import monitoring
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 压缩算法 -> 需要的模块（zlib 为标准库）
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+COMMAND_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+command_duration = metrics.histogram("mongo_command_duration_seconds", "MongoDB命令耗时", buckets=COMMAND_BUCKETS)
+commands_total = metrics.counter("mongo_commands_total", "MongoDB命令数（按结果）")
+slow_commands_total = metrics.counter("mongo_slow_commands_total", "超过阈值的MongoDB慢命令数")
+
+
+class MongoClientSettings(BaseSettings):
+    """MongoDB 客户端配置"""
+
+    model_config = SettingsConfigDict(env_prefix="MONGODB_")
+
+    max_pool_size: int = Field(100, ge=1)
+    min_pool_size: int = Field(0, ge=0)
+    max_idle_time_ms: Optional[int] = Field(None, gt=0)
+    wait_queue_timeout_ms: Optional[int] = Field(None, gt=0)
+    server_selection_timeout_ms: int = Field(5000, gt=0)
+    connect_timeout_ms: int = Field(5000, gt=0)
+    socket_timeout_ms: Optional[int] = Field(None, gt=0)
+    compressors: str = ""
+    read_preference: Literal["primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest"] = "primary"
+    slow_command_ms: float = Field(100.0, ge=0)
+
+    @model_validator(mode="after")
+    def check_pool_size(self) -> "MongoClientSettings":
+        if self.min_pool_size > self.max_pool_size:
+            raise ValueError("MONGODB_MIN_POOL_SIZE 不能大于 MONGODB_MAX_POOL_SIZE")
+        return self
+
+
+def available_compressors(names: str) -> List[str]:
+    """配置的压缩算法中已安装的部分，保持顺序"""
+    available = []
+    for name in (part.strip().lower() for part in names.split(",")):
+        if not name:
+            continue
+        module = COMPRESSOR_MODULES.get(name)
+        if module is None:
+            logger.warning(f"不支持的MongoDB压缩算法: {name}")
+        elif importlib.util.find_spec(module) is None:
+            logger.warning(f"MongoDB压缩算法 {name} 需要安装 {module}，已跳过")
+        else:
+            available.append(name)
+    return available
+
+
+def client_options(settings: MongoClientSettings) -> Dict[str, Any]:
+    """AsyncIOMotorClient 的关键字参数"""
+    options: Dict[str, Any] = {
+        "maxPoolSize": settings.max_pool_size,
+        "minPoolSize": settings.min_pool_size,
+        "serverSelectionTimeoutMS": settings.server_selection_timeout_ms,
+        "connectTimeoutMS": settings.connect_timeout_ms,
+        "readPreference": settings.read_preference,
+    }
+    for option, value in (("maxIdleTimeMS", settings.max_idle_time_ms),
+                          ("waitQueueTimeoutMS", settings.wait_queue_timeout_ms),
+                          ("socketTimeoutMS", settings.socket_timeout_ms)):
+        if value is not None:
+            options[option] = value
+    compressors = available_compressors(settings.compressors)
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> str:
+    """命令的形状：查询条件的字段名或聚合管道的阶段名，不含字段值"""
+    if command_name == "aggregate":
+        stages = [next(iter(stage), "?") for stage in command.get("pipeline") or [] if isinstance(stage, dict)]
+        return " | ".join(stages)
+    for key in ("filter", "q", "query"):
+        if isinstance(command.get(key), dict):
+            return "{" + ", ".join(command[key]) + "}"
+    statements = command.get("updates") or command.get("deletes")
+    first = statements[0] if isinstance(statements, list) and statements else None
+    if isinstance(first, dict) and isinstance(first.get("q"), dict):
+        return "{" + ", ".join(first["q"]) + "}"
+    return ""
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """记录MongoDB命令耗时与慢命令日志（PyMongo 在执行命令的线程中同步回调）"""
+
+    def __init__(self, slow_command_ms: float = 100.0):
+        self.slow_seconds = slow_command_ms / 1000
+        # (连接, 请求ID) -> (集合, 命令形状)，命令成功或失败时取出
+        self._pending: Dict[Tuple[Any, int], Tuple[str, str]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        command = event.command
+        collection = command.get(event.command_name)
+        self._pending[(event.connection_id, event.request_id)] = (
+            f"{event.database_name}.{collection}" if isinstance(collection, str) else event.database_name,
+            command_shape(event.command_name, command),
+        )
+
+    def _finished(self, event, result: str):
+        seconds = event.duration_micros / 1e6
+        target, shape = self._pending.pop((event.connection_id, event.request_id), ("?", ""))
+        command_duration.observe(seconds, command=event.command_name)
+        commands_total.inc(command=event.command_name, result=result)
+        if seconds >= self.slow_seconds:
+            slow_commands_total.inc(command=event.command_name)
+            detail = f"{target} {shape}" if shape else target
+            logger.warning(f"MongoDB慢命令: {event.command_name} {detail} 耗时 {seconds * 1000:.1f}ms ({result})")
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finished(event, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finished(event, "failed")
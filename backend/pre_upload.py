@@ -0,0 +1,170 @@
+"""
+标签图片预上传
+
+用户通常先选图片，再花 20-60 秒选择食品类型、包装类型等表单项，而检测要等表单提交后才开始
+把图片上传到Dify。预上传把这段时间利用起来:
+
+    - POST /api/upload 立即接收文件，校验后写入暂存区（upload_spool），返回上传句柄；
+    - 同时在后台把文件上传到后端池选出的Dify后端，得到的文件ID只在该后端上有效；
+      请求带上 PackageFoodType / PackageSize / SpecialRequirement 时按检测时同样的类别条件
+      （prompt_assembly.route_categories）选择后端，配置了专门工作流时文件也在检测要用的后端上；
+      不带这些参数时选择通用后端；
+    - /api/detect 提交 UploadId 表单字段（可重复）代替 file 字段，检测直接使用暂存区中的文件，
+      并优先路由到持有文件ID的后端，跳过上传阶段；后台上传尚未完成时等待它完成（不会重复上传），
+      失败或检测换到了其他后端时按原流程上传。
+
+句柄按客户端（API Key / IP）隔离，有效期内可以重复使用（检测失败后重试不需要重新上传）。
+句柄持有暂存文件的租约，过期后释放租约、取消未完成的后台上传；Dify端的文件没有删除接口，
+由Dify自行清理。
+
+图片按原样上传，不缩放或重新编码：直接提交到 /api/detect 的图片也不做处理，
+预上传与否模型看到的图片、结果缓存和近重复检测的内容哈希都保持一致。
+
+配置:
+    PRE_UPLOAD_TTL           句柄有效期（秒），默认 900
+    PRE_UPLOAD_MAX_ENTRIES   最多保存的句柄数，默认 500，超出后淘汰最早的句柄
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+import aiofiles
+
+try:
+    from .deadline import Deadline
+    from .dify_pool import DifyBackend
+    from .metrics import metrics
+    from .upload_spool import upload_spool
+    from . import dify_client
+except ImportError:
+    from backend.deadline import Deadline
+    from backend.dify_pool import DifyBackend
+    from backend.metrics import metrics
+    from backend.upload_spool import upload_spool
+    from backend import dify_client
+
+logger = logging.getLogger(__name__)
+
+pre_uploads_total = metrics.counter("pre_uploads_total", "预上传（created / uploaded / failed / expired）")
+pre_upload_hits_total = metrics.counter("pre_upload_hits_total", "检测时预上传的使用情况（hit / waited / miss）")
+pre_upload_entries = metrics.gauge("pre_upload_entries", "保存的预上传句柄数")
+
+
+class PreUpload:
+    """一个预上传的文件；filename / content_type / size / read() 与 UploadFile 一致，检测接口可以直接使用"""
+
+    def __init__(self, handle: str, client_key: str, filename: str, content_type: str, size: int, path: str,
+                 backend: DifyBackend):
+        self.handle = handle
+        self.client_key = client_key
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.path = path
+        self.backend_name = backend.name
+        self.created_at = time.monotonic()
+        self.user_id = f"user-{uuid.uuid4().hex[:8]}"
+        self.task: Optional[asyncio.Task] = None
+
+    async def read(self) -> bytes:
+        async with aiofiles.open(self.path, "rb") as f:
+            return await f.read()
+
+    async def tag_image(self, backend: DifyBackend, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """在 backend 上可用的 TagImage 条目；后台上传未完成时等待，失败或不在该后端上时返回 None"""
+        if self.task is None or backend.name != self.backend_name:
+            pre_upload_hits_total.inc(result="miss")
+            return None
+        waited = not self.task.done()
+        try:
+            # 检测被取消时后台上传继续，句柄仍可复用
+            async with asyncio.timeout(deadline.remaining() if deadline else None):
+                file_info = await asyncio.shield(self.task)
+        except Exception:
+            file_info = None
+        if not file_info or not file_info.get("id"):
+            pre_upload_hits_total.inc(result="miss")
+            return None
+        pre_upload_hits_total.inc(result="waited" if waited else "hit")
+        return {"type": "image", "transfer_method": "local_file", "upload_file_id": file_info["id"]}
+
+
+class PreUploadStore:
+    """预上传句柄登记表"""
+
+    def __init__(self, ttl: float = 900.0, max_entries: int = 500):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, PreUpload]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _discard(self, entry: PreUpload):
+        if entry.task is not None and not entry.task.done():
+            entry.task.cancel()
+        upload_spool.release(entry.path)
+        pre_uploads_total.inc(result="expired")
+
+    def _expire(self, now: float):
+        # 按创建顺序排列，过期或超出数量的条目都在最前面
+        overflow = len(self._entries) - self.max_entries
+        while self._entries:
+            handle, entry = next(iter(self._entries.items()))
+            if now - entry.created_at <= self.ttl and overflow <= 0:
+                break
+            del self._entries[handle]
+            self._discard(entry)
+            overflow -= 1
+        pre_upload_entries.set(len(self._entries))
+
+    async def _upload(self, entry: PreUpload) -> Optional[Dict[str, Any]]:
+        started = time.perf_counter()
+        file_info = await dify_client.upload_image_to_dify(
+            entry.path, entry.user_id, backend=dify_client.dify_pool.get(entry.backend_name)
+        )
+        pre_uploads_total.inc(result="uploaded" if file_info and file_info.get("id") else "failed")
+        logger.info(f"预上传 {entry.handle} 到Dify后端 {entry.backend_name} "
+                    f"{'完成' if file_info else '失败'}，耗时 {(time.perf_counter() - started) * 1000:.1f}ms")
+        return file_info
+
+    async def create(self, client_key: str, filename: str, content_type: str, data: bytes,
+                     categories: Iterable[str] = ()) -> PreUpload:
+        """写入暂存区并在后台上传到Dify，返回预上传条目
+
+        categories 为检测参数成立的类别条件，与检测时一样优先选择服务这些类别的专门后端。
+        """
+        self._expire(time.monotonic())
+        path = await upload_spool.store(data, os.path.splitext(filename or "")[1])
+        entry = PreUpload(uuid.uuid4().hex, client_key, filename, content_type, len(data), path,
+                          dify_client.dify_pool.choose(categories=categories))
+        entry.task = asyncio.ensure_future(self._upload(entry))
+        self._entries[entry.handle] = entry
+        pre_uploads_total.inc(result="created")
+        pre_upload_entries.set(len(self._entries))
+        return entry
+
+    def get(self, client_key: str, handle: str) -> Optional[PreUpload]:
+        """按句柄取预上传条目；不存在、已过期或属于其他客户端时返回 None"""
+        self._expire(time.monotonic())
+        entry = self._entries.get(handle)
+        if entry is None or entry.client_key != client_key:
+            return None
+        return entry
+
+
+def pre_uploaded_files(files) -> Dict[str, PreUpload]:
+    """检测文件中预上传条目的 暂存路径 -> 条目 映射"""
+    return {upload.path: upload for upload in files if isinstance(upload, PreUpload)}
+
+
+# 创建全局预上传登记表实例
+pre_upload_store = PreUploadStore(
+    ttl=float(os.getenv("PRE_UPLOAD_TTL", "900")),
+    max_entries=int(os.getenv("PRE_UPLOAD_MAX_ENTRIES", "500")),
+)
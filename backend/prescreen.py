@@ -0,0 +1,248 @@
+"""
+本地预筛查
+
+在调用Dify之前，对标签做离线的文字提取和规则检查，按 prompts/prompt.md 中
+直接提供给消费者的预包装食品的10项强制标示内容，给出毫秒级的初步结论。
+规则来自 rule_engine 加载的规则目录（backend/rules/gb7718.json）。
+整个过程不访问网络。
+
+文字来源（按优先级）:
+    1. 请求中的 LabelText 字段（调用方已有的标签文字，如数字标签、PDF文字层）
+    2. PDF 文字层（需要 pypdf）
+    3. 本地OCR（rapidocr_onnxruntime 或 pytesseract，均为可选依赖）
+都不可用时预筛查标记为 skipped，不影响正常检测。
+
+预筛查模式（环境变量 PRESCREEN_MODE）:
+    off            不执行
+    annotate       执行并在响应中附带 prescreen 结果（默认）
+    enrich         另外把预筛查发现作为工作流输入传给Dify（输入名见 PRESCREEN_INPUT_NAME）
+    short_circuit  发现高风险问题且文字足够可信时直接返回预筛查结果，不再调用Dify
+
+其他配置:
+    PRESCREEN_INPUT_NAME       enrich 模式下的工作流输入名，默认 PreScreenFindings
+    PRESCREEN_MIN_TEXT_CHARS   文字少于该长度时只给出结论、不做短路，默认 40
+"""
+
+import os
+import time
+import logging
+import importlib.util
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+try:
+    from .rule_engine import RESULT_FAIL, RESULT_PASS, default_catalogue
+except ImportError:
+    from backend.rule_engine import RESULT_FAIL, RESULT_PASS, default_catalogue
+
+logger = logging.getLogger(__name__)
+
+PRESCREEN_MODES = ("off", "annotate", "enrich", "short_circuit")
+
+
+def prescreen_mode() -> str:
+    mode = os.getenv("PRESCREEN_MODE", "annotate").lower()
+    return mode if mode in PRESCREEN_MODES else "annotate"
+
+
+def build_context(package_food_type: str, package_size: str, special_requirement: Optional[str]) -> Dict[str, bool]:
+    """根据检测参数确定豁免条件"""
+    return {
+        "imported": "进口" in (special_requirement or ""),
+        "non_direct": (package_food_type or "").startswith("非直接"),
+        "tiny_package": "小于10cm2" in (package_size or ""),
+    }
+
+
+def evaluate_rules(text: str, context: Optional[Dict[str, bool]] = None) -> List[Dict[str, Any]]:
+    """用编译后的规则目录检查标签文字，返回与 详细检测结果 同结构的条目"""
+    return default_catalogue().evaluate(text, context)
+
+
+def summarize_findings(findings: List[Dict[str, Any]]) -> Dict[str, int]:
+    summary = {"checked": 0, "failed": 0, "高风险": 0, "中风险": 0, "低风险": 0}
+    for finding in findings:
+        if finding["检测结果"] in (RESULT_PASS, RESULT_FAIL):
+            summary["checked"] += 1
+        if finding["检测结果"] == RESULT_FAIL:
+            summary["failed"] += 1
+            summary[finding["风险等级"]] += 1
+    return summary
+
+
+# ---------------------------------------------------------------------------
+# 文字提取（可选依赖全部延迟导入）
+# ---------------------------------------------------------------------------
+
+_ocr_engine = None
+
+
+def available_extractors() -> List[str]:
+    """当前环境可用的文字提取方式"""
+    names = []
+    if importlib.util.find_spec("pypdf"):
+        names.append("pdf_text")
+    if importlib.util.find_spec("rapidocr_onnxruntime"):
+        names.append("rapidocr")
+    if importlib.util.find_spec("pytesseract"):
+        names.append("tesseract")
+    return names
+
+
+def _extract_pdf_text(file_path: str) -> str:
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def _ocr_rapidocr(file_path: str) -> str:
+    global _ocr_engine
+    from rapidocr_onnxruntime import RapidOCR
+
+    if _ocr_engine is None:
+        _ocr_engine = RapidOCR()
+    result, _ = _ocr_engine(file_path)
+    return "\n".join(line[1] for line in result or [])
+
+
+def _ocr_tesseract(file_path: str) -> str:
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(file_path) as image:
+        return pytesseract.image_to_string(image, lang=os.getenv("TESSERACT_LANG", "chi_sim+eng"))
+
+
+def extract_label_text(file_path: str, content_type: str) -> Tuple[str, Optional[str]]:
+    """提取标签文字，返回 (文字, 提取方式)；同步执行，调用方应放到线程池中运行"""
+    extractors = available_extractors()
+    attempts = []
+    if content_type == "application/pdf" and "pdf_text" in extractors:
+        attempts.append(("pdf_text", _extract_pdf_text))
+    if content_type in ("image/jpeg", "image/png"):
+        if "rapidocr" in extractors:
+            attempts.append(("rapidocr", _ocr_rapidocr))
+        if "tesseract" in extractors:
+            attempts.append(("tesseract", _ocr_tesseract))
+
+    for name, extractor in attempts:
+        try:
+            text = extractor(file_path)
+        except Exception as e:
+            logger.warning(f"文字提取失败（{name}）: {e}")
+            continue
+        if text.strip():
+            return text, name
+    return "", None
+
+
+async def run_prescreen(
+    file_path: Union[str, List[str]],
+    content_type: Union[str, List[str]],
+    package_food_type: str,
+    package_size: str,
+    special_requirement: Optional[str] = None,
+    label_text: Optional[str] = None,
+) -> Dict[str, Any]:
+    """执行预筛查，返回结论与耗时
+
+    file_path/content_type 也可以是同一产品多个面的文件列表，各面提取的文字合并后统一检查。
+    """
+    from starlette.concurrency import run_in_threadpool
+
+    started = time.perf_counter()
+    if label_text and label_text.strip():
+        text, engine = label_text, "provided"
+    else:
+        file_paths = [file_path] if isinstance(file_path, str) else file_path
+        content_types = [content_type] * len(file_paths) if isinstance(content_type, str) else content_type
+        texts, engine = [], None
+        for path, path_content_type in zip(file_paths, content_types):
+            part, part_engine = await run_in_threadpool(extract_label_text, path, path_content_type)
+            if part:
+                texts.append(part)
+                engine = engine or part_engine
+        text = "\n".join(texts)
+    extract_ms = (time.perf_counter() - started) * 1000
+
+    if not text:
+        return {
+            "status": "skipped",
+            "reason": "没有可用的标签文字（未提供 LabelText，且本地无可用的文字提取引擎）",
+            "engine": None,
+            "elapsed_ms": round(extract_ms, 2),
+        }
+
+    rules_started = time.perf_counter()
+    findings = evaluate_rules(text, build_context(package_food_type, package_size, special_requirement))
+    rules_ms = (time.perf_counter() - rules_started) * 1000
+    min_chars = int(os.getenv("PRESCREEN_MIN_TEXT_CHARS", "40"))
+    return {
+        "status": "completed",
+        "engine": engine,
+        "text_chars": len(text),
+        "reliable": len(text.strip()) >= min_chars,
+        "findings": findings,
+        "summary": summarize_findings(findings),
+        "extract_ms": round(extract_ms, 2),
+        "rules_ms": round(rules_ms, 3),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def should_short_circuit(prescreen: Dict[str, Any]) -> bool:
+    """short_circuit 模式下，文字可信且发现高风险问题时跳过Dify"""
+    return (
+        prescreen_mode() == "short_circuit"
+        and prescreen.get("status") == "completed"
+        and prescreen.get("reliable", False)
+        and prescreen["summary"]["高风险"] > 0
+    )
+
+
+def findings_as_workflow_input(prescreen: Dict[str, Any]) -> Dict[str, str]:
+    """enrich 模式下传给Dify的附加输入：预筛查发现的问题清单"""
+    if prescreen_mode() != "enrich" or prescreen.get("status") != "completed":
+        return {}
+    lines = [
+        f"- {f['检测项目']}: {f['检测结果']}{'（' + f['问题描述'] + '）' if f['问题描述'] else ''}"
+        for f in prescreen["findings"]
+        if f["检测结果"] in (RESULT_PASS, RESULT_FAIL)
+    ]
+    return {os.getenv("PRESCREEN_INPUT_NAME", "PreScreenFindings"): "本地预筛查结论（供参考）:\n" + "\n".join(lines)}
+
+
+def build_prescreen_result(prescreen: Dict[str, Any], product_type: str, package_size: str,
+                           detection_time: str) -> Dict[str, Any]:
+    """把预筛查结论组装为与Dify输出相同结构的 dify_result，用于短路返回"""
+    summary = prescreen["summary"]
+    findings = prescreen["findings"]
+    failed = [f for f in findings if f["检测结果"] == RESULT_FAIL]
+    checked = summary["checked"] or 1
+    json_data = {
+        "基本信息": {
+            "产品名称": "",
+            "产品类型": product_type,
+            "包装面积分类": package_size,
+            "检测时间": detection_time,
+        },
+        "合规性评估": {
+            "总体评级": "不合格",
+            "关键问题": summary["高风险"],
+            "一般问题": summary["中风险"] + summary["低风险"],
+            "合规率": f"{round((checked - summary['failed']) / checked * 100)}%",
+        },
+        "详细检测结果": findings,
+    }
+    report_lines = ["### 不规范内容总结报告（本地预筛查）", "",
+                    f"- 问题总数：{summary['failed']}个（高风险{summary['高风险']}个，"
+                    f"中风险{summary['中风险']}个，低风险{summary['低风险']}个）",
+                    "- 合规状态：不合格", ""]
+    for index, finding in enumerate(failed, 1):
+        report_lines.append(f"{index}. [{finding['风险等级']}] {finding['检测项目']}：{finding['问题描述']}"
+                            f" → {finding['整改建议']}")
+    report_lines += ["", "> 本结果由本地规则预筛查生成，未调用大模型；整改后可重新提交完整检测。"]
+    return {
+        "outputs": {"json_data": json_data, "markdown_content": "\n".join(report_lines)},
+        "metadata": {"source": "prescreen", "total_tokens": 0},
+    }
@@ -0,0 +1,175 @@
+"""
+按检测参数组装提示词
+
+prompts/prompt.md 覆盖所有产品类别，但每次检测只用得上其中一部分：非直接提供给消费者的产品
+用不到直接消费者的10项必备内容清单，非进口食品用不到进口食品附加检测，最大表面面积超过60cm²的包装
+用不到「功能类别+INS编码」的标示方式。提示词中用 HTML 注释标出这些段落的适用条件（渲染时不可见）:
+
+    <!-- if: imported -->        条件成立时保留
+    <!-- unless: non_direct -->  条件不成立时保留
+    <!-- end -->                 段落结束（可以嵌套）
+
+条件取自检测参数，每个条件为 True / False / None:
+
+    non_direct   产品类型以「非直接」开头为 True，以「直接」开头为 False
+    imported     特殊要求提到进口为 True，写明国产或非进口为 False
+    over_60cm2   包装尺寸写明最大表面面积大于等于60cm²的下限时为 True（表单现有选项都不满足）
+
+参数缺失或不能据此判断时为 None，表示「不确定」，if 与 unless 段落都保留——宁可多给模型一段说明，
+也不能把合法的标示方式或需要的检查删掉。
+
+组装后的提示词以附加工作流输入（默认变量名 LabelPrompt，可用 PROMPT_INPUT_NAME 修改）交给Dify，
+工作流的 LLM 节点需要引用该变量代替内置提示词。也可以为某些类别单独发布精简的工作流，
+在后端池中用 categories 把这些类别路由过去（见 dify_pool.py）。
+
+配置:
+    PROMPT_ASSEMBLY     off（默认，不发送组装后的提示词）/ input（作为工作流输入发送）
+    PROMPT_INPUT_NAME   工作流输入变量名，默认 LabelPrompt
+    PROMPT_FILE         提示词文件，默认 prompts/prompt.md
+"""
+
+import os
+import re
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from .metrics import metrics
+    from .prompt_registry import DEFAULT_PROMPT_DIR
+except ImportError:
+    from backend.metrics import metrics
+    from backend.prompt_registry import DEFAULT_PROMPT_DIR
+
+logger = logging.getLogger(__name__)
+
+PROMPT_ASSEMBLY_MODES = ("off", "input")
+DEFAULT_PROMPT_FILE = os.path.join(DEFAULT_PROMPT_DIR, "prompt.md")
+
+_CONDITION = re.compile(r"^\s*<!--\s*(if|unless):\s*(\w+)\s*-->\s*$")
+_END = re.compile(r"^\s*<!--\s*end\s*-->\s*$")
+_BLANK_LINES = re.compile(r"\n{3,}")
+# 「大于60cm2」「>100cm²」等写明的面积下限
+_AREA_LOWER_BOUND = re.compile(r"(?:大于等于|大于|超过|≥|>|＞)\s*(\d+(?:\.\d+)?)\s*cm")
+_CJK = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+_WORD = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+prompt_tokens_saved_total = metrics.counter("prompt_tokens_saved_total", "按检测参数组装提示词节省的输入令牌数（估算）")
+
+
+def prompt_assembly_mode() -> str:
+    mode = os.getenv("PROMPT_ASSEMBLY", "off").lower()
+    return mode if mode in PROMPT_ASSEMBLY_MODES else "off"
+
+
+def prompt_input_name() -> str:
+    return os.getenv("PROMPT_INPUT_NAME", "LabelPrompt")
+
+
+def prompt_context(package_food_type: Optional[str], package_size: Optional[str],
+                   special_requirement: Optional[str]) -> Dict[str, Optional[bool]]:
+    """检测参数对应的段落条件；不能判断的条件为 None"""
+    food_type = (package_food_type or "").strip()
+    requirement = special_requirement or ""
+    non_direct = True if food_type.startswith("非直接") else False if food_type.startswith("直接") else None
+    if "非进口" in requirement or "国产" in requirement:
+        imported = False
+    else:
+        imported = True if "进口" in requirement else None
+    bound = _AREA_LOWER_BOUND.search(package_size or "")
+    over_60cm2 = True if bound and float(bound.group(1)) >= 60 else None
+    return {"non_direct": non_direct, "imported": imported, "over_60cm2": over_60cm2}
+
+
+def route_categories(context: Dict[str, Optional[bool]]) -> List[str]:
+    """成立的条件，用于把检测路由到专门的工作流"""
+    return [name for name, value in context.items() if value]
+
+
+def assemble(template: str, context: Optional[Dict[str, Optional[bool]]] = None) -> str:
+    """按条件保留段落并去掉标记；context 为 None 时保留全部段落（完整提示词）"""
+    context = context or {}
+    kept: List[str] = []
+    # 每层嵌套是否保留
+    stack: List[bool] = []
+    for line in template.splitlines():
+        match = _CONDITION.match(line)
+        if match:
+            keyword, name = match.groups()
+            value = context.get(name)
+            stack.append(value is None or value == (keyword == "if"))
+            continue
+        if _END.match(line):
+            if not stack:
+                raise ValueError("提示词中的 <!-- end --> 没有对应的条件")
+            stack.pop()
+            continue
+        if all(stack):
+            kept.append(line)
+    if stack:
+        raise ValueError("提示词中的条件段落缺少 <!-- end -->")
+    return _BLANK_LINES.sub("\n\n", "\n".join(kept)).strip() + "\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """估算令牌数：中文字符和全角标点各记 1 个，英文单词、数字串和其他符号各记 1 个
+
+    只用于比较同一提示词不同组装结果的相对大小，不等于模型分词器的实际计数。
+    """
+    return len(_CJK.findall(text)) + len(_WORD.findall(text))
+
+
+class PromptAssembler:
+    """读取提示词模板并按条件缓存组装结果；文件修改时间或大小变化后重新读取"""
+
+    def __init__(self, path: str = DEFAULT_PROMPT_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stat: Optional[Tuple[int, int]] = None
+        self._template = ""
+        self._full_tokens = 0
+        self._assembled: Dict[Tuple[Tuple[str, Optional[bool]], ...], Tuple[str, int]] = {}
+
+    def _load(self):
+        stat = os.stat(self.path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key == self._stat:
+            return
+        with self._lock:
+            if key == self._stat:
+                return
+            with open(self.path, encoding="utf-8") as f:
+                template = f.read()
+            self._assembled = {}
+            self._template = template
+            self._full_tokens = estimate_tokens(assemble(template))
+            self._stat = key
+            logger.info(f"加载提示词模板 {self.path}，完整提示词约 {self._full_tokens} 令牌")
+
+    def assemble(self, context: Dict[str, Optional[bool]]) -> Tuple[str, int]:
+        """返回 (组装后的提示词, 相对完整提示词节省的估算令牌数)"""
+        self._load()
+        key = tuple(sorted(context.items()))
+        cached = self._assembled.get(key)
+        if cached is None:
+            prompt = assemble(self._template, context)
+            cached = self._assembled[key] = (prompt, self._full_tokens - estimate_tokens(prompt))
+        return cached
+
+
+def assembled_prompt_input(context: Dict[str, Optional[bool]]) -> Dict[str, str]:
+    """组装后的提示词作为附加工作流输入；未开启或模板不可用时返回空字典（工作流使用内置提示词）"""
+    if prompt_assembly_mode() != "input":
+        return {}
+    try:
+        prompt, saved = prompt_assembler.assemble(context)
+    except (OSError, ValueError) as e:
+        logger.warning(f"组装提示词失败，使用工作流内置提示词: {e}")
+        return {}
+    if saved > 0:
+        prompt_tokens_saved_total.inc(saved)
+    return {prompt_input_name(): prompt}
+
+
+# 创建全局提示词组装实例
+prompt_assembler = PromptAssembler(os.getenv("PROMPT_FILE", DEFAULT_PROMPT_FILE))
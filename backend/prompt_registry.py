@@ -0,0 +1,171 @@
+"""
+提示词与工作流版本登记
+
+检测结果的质量和可缓存性取决于两部分配置：
+    - 提示词文件（prompts/*.md）
+    - Dify 工作流（接口地址、应用、工作流版本）
+登记处对这些配置计算一个短指纹，每次检测都带上该指纹；结果缓存以指纹作为键的一部分，
+提示词或工作流一变，旧结果自然不再命中，无需整体清空缓存。
+
+指纹组成:
+    prompts    prompts 目录下每个 .md 文件的 SHA-256（按文件名排序）
+    workflow   后端池中各后端的工作流地址、应用令牌的摘要（不暴露令牌本身）、DIFY_WORKFLOW_VERSION，
+               以及各后端最近一次返回的 workflow_id（工作流重新发布后会变化）
+
+文件只在距离上次检查超过 PROMPT_REGISTRY_REFRESH 秒（默认5秒）时才重新 stat，
+且仅在修改时间或大小变化时重新计算哈希，检测热路径上读取指纹是O(1)的。
+
+配置:
+    PROMPT_DIR               提示词目录，默认为项目根目录下的 prompts
+    DIFY_WORKFLOW_VERSION    工作流版本说明（如发布号），可选
+    PROMPT_REGISTRY_REFRESH  文件检查间隔（秒），默认 5
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PROMPT_DIR = os.path.join(PROJECT_ROOT, "prompts")
+
+# 保留的历史版本数量
+HISTORY_SIZE = 20
+
+version_changes_total = metrics.counter("prompt_version_changes_total", "提示词/工作流指纹变化次数")
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PromptRegistry:
+    """提示词与工作流配置指纹"""
+
+    def __init__(self, prompt_dir: str = DEFAULT_PROMPT_DIR, refresh_interval: float = 5.0):
+        self.prompt_dir = prompt_dir
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._checked_at = float("-inf")
+        self._file_stats: Dict[str, Tuple[float, int]] = {}
+        self._file_hashes: Dict[str, str] = {}
+        # 后端名称 -> 最近一次看到的 workflow_id（不同Dify实例上同一工作流的ID不同）
+        self._workflow_ids: Dict[str, str] = {}
+        self._current: Optional[Dict[str, Any]] = None
+        self.history: List[Dict[str, Any]] = []
+
+    def _workflow_component(self) -> Dict[str, Optional[str]]:
+        try:
+            from .dify_client import dify_pool
+        except ImportError:
+            from backend.dify_client import dify_pool
+
+        tokens = ",".join(backend.api_token for backend in dify_pool.backends)
+        return {
+            "api_url": ",".join(backend.run_url for backend in dify_pool.backends),
+            "app": hashlib.sha256(tokens.encode("utf-8")).hexdigest()[:12],
+            "workflow_version": os.getenv("DIFY_WORKFLOW_VERSION") or None,
+            "workflow_id": ",".join(self._workflow_ids[name] for name in sorted(self._workflow_ids)) or None,
+        }
+
+    def _scan_prompts(self) -> bool:
+        """检查提示词文件，有变化时更新哈希并返回 True"""
+        try:
+            names = sorted(name for name in os.listdir(self.prompt_dir) if name.endswith(".md"))
+        except FileNotFoundError:
+            names = []
+        stats = {}
+        for name in names:
+            stat = os.stat(os.path.join(self.prompt_dir, name))
+            stats[name] = (stat.st_mtime, stat.st_size)
+        if stats == self._file_stats:
+            return False
+        self._file_hashes = {
+            name: (self._file_hashes[name] if self._file_stats.get(name) == stats[name]
+                   else _sha256_file(os.path.join(self.prompt_dir, name)))
+            for name in names
+        }
+        self._file_stats = stats
+        return True
+
+    def _rebuild(self):
+        workflow = self._workflow_component()
+        digest = hashlib.sha256()
+        for name, file_hash in self._file_hashes.items():
+            digest.update(f"prompt:{name}:{file_hash}\n".encode("utf-8"))
+        for key, value in workflow.items():
+            digest.update(f"workflow:{key}:{value or ''}\n".encode("utf-8"))
+        fingerprint = digest.hexdigest()[:16]
+        if self._current and self._current["fingerprint"] == fingerprint:
+            return
+        self._current = {
+            "fingerprint": fingerprint,
+            "prompts": {name: file_hash[:12] for name, file_hash in self._file_hashes.items()},
+            "workflow": workflow,
+            "first_seen": datetime.now().isoformat(),
+        }
+        self.history = ([self._current] + self.history)[:HISTORY_SIZE]
+        if len(self.history) > 1:
+            version_changes_total.inc()
+            logger.info(f"提示词/工作流指纹变化: {self.history[1]['fingerprint']} → {fingerprint}")
+
+    def current(self) -> Dict[str, Any]:
+        """当前生效的版本信息（按间隔检查文件变化）"""
+        now = time.monotonic()
+        if self._current is not None and now - self._checked_at < self.refresh_interval:
+            return self._current
+        with self._lock:
+            if self._current is None or now - self._checked_at >= self.refresh_interval:
+                changed = self._scan_prompts()
+                self._checked_at = now
+                if changed or self._current is None:
+                    self._rebuild()
+        return self._current
+
+    @property
+    def fingerprint(self) -> str:
+        return self.current()["fingerprint"]
+
+    def observe_workflow(self, dify_data: Any, backend: Optional[str] = None):
+        """记录Dify响应中的 workflow_id；工作流重新发布后指纹随之变化"""
+        if not isinstance(dify_data, dict):
+            return
+        data = dify_data.get("data") if isinstance(dify_data.get("data"), dict) else dify_data
+        workflow_id = data.get("workflow_id")
+        backend = backend or "default"
+        if workflow_id and workflow_id != self._workflow_ids.get(backend):
+            with self._lock:
+                self._workflow_ids[backend] = workflow_id
+                if self._current is not None:
+                    self._rebuild()
+
+
+# 创建全局版本登记实例
+prompt_registry = PromptRegistry(
+    os.getenv("PROMPT_DIR", DEFAULT_PROMPT_DIR),
+    float(os.getenv("PROMPT_REGISTRY_REFRESH", "5")),
+)
+
+router = APIRouter(prefix="/api", tags=["versions"])
+
+
+@router.get("/prompt-version")
+async def prompt_version():
+    """当前提示词/工作流指纹及最近的历史版本"""
+    return {"current": prompt_registry.current(), "history": prompt_registry.history}
@@ -0,0 +1,247 @@
+"""
+按客户端的令牌桶限流
+
+客户端以 X-API-Key 请求头标识，只承认已登记的密钥（RATE_LIMIT_API_KEYS 与 RATE_LIMIT_OVERRIDES 中的键），
+未携带或未登记的密钥按客户端IP计算——否则客户端每次换一个密钥就能得到新的令牌桶，或者冒用其他团队的
+密钥获得其调度优先级。客户端IP取连接的对端地址；对端属于 RATE_LIMIT_TRUSTED_PROXIES（如同一容器内的nginx）
+时改取 nginx 设置的 X-Real-IP（X-Forwarded-For 可由客户端伪造，不使用）。
+每个客户端一个令牌桶，每个请求消耗一个令牌，令牌不足时返回 429 并给出 Retry-After。
+通过限流的请求携带客户端标识与优先级进入 Dify 并发池的加权公平调度（见 scheduler.py）。
+
+限流策略可在运行时通过 /api/admin/rate-limits 查看与修改（需要 X-Admin-Token 请求头）。
+
+配置（环境变量）:
+    RATE_LIMIT_ENABLED       是否启用，默认 true
+    RATE_LIMIT_RATE          默认每秒补充的令牌数，默认 1
+    RATE_LIMIT_BURST         默认桶容量，默认 20
+    RATE_LIMIT_OVERRIDES     按客户端覆盖的策略（JSON），如 {"team-a-key": {"rate": 5, "burst": 100, "priority": "bulk"}}
+    RATE_LIMIT_API_KEYS      已登记的 API Key（逗号分隔），使用默认策略，各自一个令牌桶
+    RATE_LIMIT_TRUSTED_PROXIES  可信反向代理的地址段（逗号分隔的CIDR，如 127.0.0.1/32），默认为空（不信任 X-Real-IP）
+    ADMIN_TOKEN              管理接口令牌，未配置时管理接口不可用
+"""
+
+import os
+import json
+import time
+import hmac
+import logging
+import ipaddress
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from pydantic import BaseModel, Field, field_validator
+
+try:
+    from .metrics import metrics
+    from .scheduler import PRIORITY_WEIGHTS, dify_scheduler
+except ImportError:
+    from backend.metrics import metrics
+    from backend.scheduler import PRIORITY_WEIGHTS, dify_scheduler
+
+logger = logging.getLogger(__name__)
+
+# 超过该数量后清理已回满的令牌桶
+MAX_BUCKETS = 10000
+
+rate_limited_total = metrics.counter("rate_limited_total", "被限流拒绝的请求数")
+rate_limit_allowed_total = metrics.counter("rate_limit_allowed_total", "通过限流的请求数")
+
+
+class RateLimitPolicy(BaseModel):
+    """单个客户端的限流策略"""
+    rate: float = Field(..., gt=0, description="每秒补充的令牌数")
+    burst: float = Field(..., ge=1, description="桶容量")
+    priority: str = Field("interactive", description="调度优先级: interactive / bulk")
+    weight: Optional[float] = Field(None, gt=0, description="调度权重，未设置时按优先级取默认值")
+
+    @field_validator("priority")
+    @classmethod
+    def check_priority(cls, value: str) -> str:
+        if value not in PRIORITY_WEIGHTS:
+            raise ValueError(f"优先级无效: {value}")
+        return value
+
+
+class RateLimitConfig(BaseModel):
+    """限流与调度的运行时配置"""
+    enabled: bool = True
+    default: RateLimitPolicy
+    overrides: Dict[str, RateLimitPolicy] = {}
+    api_keys: List[str] = Field([], description="已登记的API Key（使用默认策略）；overrides 中的键同样视为已登记")
+    max_concurrency: Optional[int] = Field(None, ge=1, description="Dify并发上限")
+
+
+class ClientContext(BaseModel):
+    """通过限流的请求所属客户端"""
+    key: str
+    priority: str
+    weight: float
+
+
+class TokenBucket:
+    """令牌桶"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, cost: float = 1.0) -> float:
+        """尝试消耗令牌，成功返回 0，否则返回需要等待的秒数"""
+        self.refill(time.monotonic())
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """按客户端标识维护令牌桶"""
+
+    def __init__(self, config: RateLimitConfig, trusted_proxies: Iterable[str] = ()):
+        self.config = config
+        self.trusted_proxies = [ipaddress.ip_network(cidr.strip(), strict=False) for cidr in trusted_proxies]
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def policy_for(self, key: str) -> RateLimitPolicy:
+        return self.config.overrides.get(key, self.config.default)
+
+    def update(self, config: RateLimitConfig):
+        """替换限流配置，已有令牌桶按新策略重建"""
+        self.config = config
+        self._buckets.clear()
+        if config.max_concurrency:
+            dify_scheduler.set_max_concurrency(config.max_concurrency)
+        logger.info(f"限流配置已更新: 默认 {config.default.rate}/s, 容量 {config.default.burst}, "
+                    f"覆盖 {len(config.overrides)} 个客户端, 登记 {len(config.api_keys)} 个密钥")
+
+    def known_key(self, api_key: str) -> bool:
+        return api_key in self.config.overrides or api_key in self.config.api_keys
+
+    def from_trusted_proxy(self, host: str) -> bool:
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    def client_key(self, request: Request, api_key: Optional[str]) -> str:
+        if api_key and self.known_key(api_key):
+            return api_key
+        peer = request.client.host if request.client else "unknown"
+        if self.from_trusted_proxy(peer):
+            real_ip = request.headers.get("x-real-ip", "").strip()
+            if real_ip:
+                return f"ip:{real_ip}"
+        return f"ip:{peer}"
+
+    def _bucket(self, key: str, policy: RateLimitPolicy) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_BUCKETS:
+                self._prune()
+            bucket = self._buckets[key] = TokenBucket(policy.rate, policy.burst)
+        return bucket
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self._buckets[key]
+
+    def check(self, key: str, requested_priority: Optional[str] = None) -> ClientContext:
+        """检查并消耗令牌，超限时抛出 429"""
+        policy = self.policy_for(key)
+        priority = policy.priority
+        # 请求方只能主动降级为批量，不能提升优先级
+        if requested_priority == "bulk":
+            priority = "bulk"
+        weight = policy.weight or PRIORITY_WEIGHTS.get(priority, 1.0)
+        client = ClientContext(key=key, priority=priority, weight=weight)
+
+        if not self.config.enabled:
+            return client
+        retry_after = self._bucket(key, policy).consume()
+        if retry_after > 0:
+            rate_limited_total.inc(priority=priority)
+            logger.warning(f"客户端 {key} 请求过于频繁，{retry_after:.1f}s 后可重试")
+            raise HTTPException(
+                status_code=429,
+                detail="请求过于频繁，请稍后重试",
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+            )
+        rate_limit_allowed_total.inc(priority=priority)
+        return client
+
+
+def load_config() -> RateLimitConfig:
+    """从环境变量读取限流配置"""
+    overrides = json.loads(os.getenv("RATE_LIMIT_OVERRIDES", "{}"))
+    return RateLimitConfig(
+        enabled=os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes"),
+        default=RateLimitPolicy(
+            rate=float(os.getenv("RATE_LIMIT_RATE", "1")),
+            burst=float(os.getenv("RATE_LIMIT_BURST", "20")),
+        ),
+        overrides=overrides,
+        api_keys=[key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()],
+    )
+
+
+# 创建全局限流器实例
+rate_limiter = RateLimiter(
+    load_config(),
+    trusted_proxies=[cidr for cidr in os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "").split(",") if cidr.strip()],
+)
+
+
+async def rate_limit(
+    request: Request,
+    x_api_key: Optional[str] = Header(None),
+    x_request_priority: Optional[str] = Header(None),
+) -> ClientContext:
+    """FastAPI 依赖：对当前请求限流，返回客户端上下文"""
+    return rate_limiter.check(rate_limiter.client_key(request, x_api_key), x_request_priority)
+
+
+async def bulk_rate_limit(
+    request: Request,
+    x_api_key: Optional[str] = Header(None),
+) -> ClientContext:
+    """FastAPI 依赖：批量接口的限流，固定为批量优先级"""
+    return rate_limiter.check(rate_limiter.client_key(request, x_api_key), "bulk")
+
+
+def require_admin(x_admin_token: Optional[str]):
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="未配置管理令牌，管理接口不可用")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=401, detail="管理令牌无效")
+
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.get("/rate-limits")
+async def get_rate_limits(x_admin_token: Optional[str] = Header(None)):
+    """查看当前限流配置与调度器状态"""
+    require_admin(x_admin_token)
+    config = rate_limiter.config.model_copy(update={"max_concurrency": dify_scheduler.max_concurrency})
+    return {"config": config.model_dump(), "scheduler": dify_scheduler.snapshot()}
+
+
+@router.put("/rate-limits")
+async def update_rate_limits(config: RateLimitConfig, x_admin_token: Optional[str] = Header(None)):
+    """运行时修改限流配置"""
+    require_admin(x_admin_token)
+    rate_limiter.update(config)
+    return {"success": True, "config": config.model_dump(), "scheduler": dify_scheduler.snapshot()}
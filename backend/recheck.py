@@ -0,0 +1,227 @@
+"""
+整改后的定向复核
+
+厂家按检测结果整改标签后，通常只有「详细检测结果」中两三个不合格项需要重新检查。
+复核只把这些项目交给Dify，并把新结论合并回原来的 DetectionRecord:
+
+    - 从原记录中取出检测结果为「不合格」（以及「待复核」）的检测项目；
+    - 以附加工作流输入（默认变量名 RecheckItems，可用 RECHECK_INPUT_NAME 修改）告诉工作流
+      只检测这些项目、只输出这些项目的详细检测结果，不再输出总结报告；
+      Dify工作流的提示词需要引用该变量（未配置该变量的工作流会忽略它并做完整检测，合并结果仍然正确）；
+    - 新结论按「检测项目」替换原记录中的对应项，其他项目保持不变；合规率、问题数和总体评级按合并后的
+      详细结果重算，已合格项目从「不规范内容汇总」和「整改优先级排序」中移除；
+    - 原记录追加一条复核记录（时间、复核项目、变化、令牌用量）。
+
+原记录由 /api/detect 在检测完成后写入（见 detection_history），复核接口的 record_id 就是检测响应中的
+record_id；关闭了 DETECTION_HISTORY_ENABLED、数据库不可用或预筛查直接判定的检测没有记录，复核返回 404。
+复核时未提交的检测参数沿用原检测提交的参数（记录的 input_params）。
+
+令牌节省与同一食品类型最近的完整检测对比：基线取费用台账中该食品类型最近
+RECHECK_BASELINE_SAMPLES 次（默认 50）成功的完整检测的平均令牌数，台账不可用时节省量记为未知。
+"""
+
+import os
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .detection_schema import normalize_detection, to_record_fields
+    from .metrics import metrics
+except ImportError:
+    from backend.detection_schema import normalize_detection, to_record_fields
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 需要复核的检测结果
+RECHECK_RESULTS = ("不合格", "待复核")
+# 不规范内容汇总中的分级列表
+ISSUE_LEVELS = ("高风险问题", "中风险问题", "低风险问题")
+
+recheck_total = metrics.counter("recheck_total", "定向复核次数")
+recheck_saved_tokens_total = metrics.counter("recheck_saved_tokens_total", "定向复核相对完整检测节省的令牌数（估算）")
+
+
+class RecheckError(Exception):
+    """原记录无法复核"""
+
+
+def recheck_input_name() -> str:
+    return os.getenv("RECHECK_INPUT_NAME", "RecheckItems")
+
+
+def failed_items(detection_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """原检测结果中需要复核的检测项目"""
+    items = detection_result.get("详细检测结果")
+    if not isinstance(items, list):
+        raise RecheckError("原记录缺少「详细检测结果」")
+    return [item for item in items if isinstance(item, dict) and item.get("检测结果") in RECHECK_RESULTS]
+
+
+def build_recheck_input(items: List[Dict[str, Any]]) -> Dict[str, str]:
+    """复核模式的附加工作流输入：只检测这些项目"""
+    lines = []
+    for item in items:
+        line = f"- {item.get('检测类别') or '未分类'} / {item.get('检测项目')}"
+        details = "；".join(
+            f"{field}: {item[field]}" for field in ("问题描述", "违反条款", "应更正为") if item.get(field)
+        )
+        lines.append(f"{line}（上次{details}）" if details else line)
+    return {recheck_input_name(): (
+        "复核模式：标签已按上次检测结果整改，只需检测以下上次不合格的项目。"
+        "「详细检测结果」只输出这些项目（检测项目名称保持不变），不需要输出不规范内容总结报告。\n"
+        + "\n".join(lines)
+    )}
+
+
+def _resolved(entry: Any, resolved: set) -> bool:
+    """汇总条目是否指向已合格的检测项目（条目名称通常是「检测项目 + 问题」，如「日期标示不明确」）"""
+    if not isinstance(entry, dict):
+        return False
+    names = [str(entry.get(key) or "") for key in ("检测项目", "问题项目", "问题")]
+    return any(item and item in name for item in resolved for name in names)
+
+
+def _prune_issues(detection: Dict[str, Any], resolved: set) -> None:
+    """从汇总与整改优先级中移除已合格的项目"""
+    summary = detection.get("不规范内容汇总")
+    if isinstance(summary, dict):
+        detection["不规范内容汇总"] = {
+            level: [issue for issue in issues if not _resolved(issue, resolved)]
+            if level in ISSUE_LEVELS and isinstance(issues, list) else issues
+            for level, issues in summary.items()
+        }
+    priorities = detection.get("整改优先级排序")
+    if isinstance(priorities, list):
+        kept = [dict(entry) if isinstance(entry, dict) else entry
+                for entry in priorities if not _resolved(entry, resolved)]
+        for rank, entry in enumerate(kept, 1):
+            if isinstance(entry, dict):
+                entry["优先级"] = rank
+        detection["整改优先级排序"] = kept
+
+
+def merge_recheck(previous: Dict[str, Any], recheck: Dict[str, Any],
+                  targets: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """把复核结论合并进原检测结果，返回 (合并后的检测结果, 变化列表)
+
+    只接受复核目标项目的新结论；复核输出中缺少的项目保持原结论。
+    """
+    target_names = {item.get("检测项目") for item in targets}
+    verdicts = {
+        item.get("检测项目"): item
+        for item in recheck.get("详细检测结果") or []
+        if isinstance(item, dict) and item.get("检测项目") in target_names
+    }
+    checked_at = datetime.now().isoformat()
+
+    merged = dict(previous)
+    changes = []
+    items = []
+    for item in previous.get("详细检测结果") or []:
+        name = item.get("检测项目") if isinstance(item, dict) else None
+        if name in verdicts:
+            updated = dict(item, **verdicts.pop(name), 复核时间=checked_at)
+            changes.append({"检测项目": name, "原结论": item.get("检测结果"), "新结论": updated.get("检测结果")})
+            item = updated
+        items.append(item)
+    merged["详细检测结果"] = items
+
+    # 合规率与总体评级按合并后的详细结果重算
+    assessment = dict(merged.get("合规性评估") or {})
+    assessment.pop("合规率", None)
+    assessment.pop("总体评级", None)
+    merged["合规性评估"] = assessment
+    normalized = normalize_detection(merged)
+    if not normalized.valid:
+        raise RecheckError(f"合并后的检测结果无效: {'; '.join(normalized.errors)}")
+    merged = normalized.data
+    statistics = merged.get("不规范内容统计")
+    if isinstance(statistics, dict):
+        risks = [item["风险等级"] for item in merged["详细检测结果"] if item["检测结果"] == "不合格"]
+        merged["不规范内容统计"] = dict(statistics, 问题总数=len(risks), 高风险=risks.count("高风险"),
+                                  中风险=risks.count("中风险"), 低风险=risks.count("低风险"))
+
+    resolved = {change["检测项目"] for change in changes if change["新结论"] not in RECHECK_RESULTS}
+    _prune_issues(merged, resolved)
+    return merged, changes
+
+
+def token_savings(recheck_tokens: int, baseline: Optional[float], samples: int = 0) -> Dict[str, Any]:
+    """复核相对完整检测的令牌节省"""
+    savings: Dict[str, Any] = {
+        "recheck_tokens": recheck_tokens,
+        "full_run_tokens": round(baseline) if baseline else None,
+        "baseline_samples": samples,
+        "saved_tokens": None,
+        "saved_pct": None,
+    }
+    if baseline and recheck_tokens:
+        savings["saved_tokens"] = round(baseline - recheck_tokens)
+        savings["saved_pct"] = round((baseline - recheck_tokens) / baseline * 100, 1)
+        if savings["saved_tokens"] > 0:
+            recheck_saved_tokens_total.inc(savings["saved_tokens"])
+    return savings
+
+
+async def _collections():
+    """按需连接数据库（motor/beanie 延迟导入，不拖慢服务启动）"""
+    try:
+        from .models import CostLedgerEntry, DetectionRecord
+        from .database import ensure_database
+    except ImportError:
+        from backend.models import CostLedgerEntry, DetectionRecord
+        from backend.database import ensure_database
+
+    await ensure_database()
+    return DetectionRecord.get_motor_collection(), CostLedgerEntry.get_motor_collection()
+
+
+def _object_id(record_id: str):
+    from bson import ObjectId
+    from bson.errors import InvalidId
+
+    try:
+        return ObjectId(record_id)
+    except (InvalidId, TypeError):
+        raise RecheckError(f"无效的检测记录ID: {record_id}")
+
+
+async def load_record(record_id: str) -> Optional[Dict[str, Any]]:
+    """读取原检测记录，不存在时返回 None"""
+    object_id = _object_id(record_id)
+    records, _ = await _collections()
+    return await records.find_one({"_id": object_id})
+
+
+async def full_run_baseline(food_type: str) -> Tuple[Optional[float], int]:
+    """同一食品类型最近成功的完整检测的平均令牌数，返回 (平均值, 样本数)"""
+    limit = int(os.getenv("RECHECK_BASELINE_SAMPLES", "50"))
+    _, ledger = await _collections()
+    rows = [row async for row in ledger.aggregate([
+        {"$match": {"food_type": food_type, "success": True, "total_tokens": {"$gt": 0},
+                    "response_mode": {"$in": ["blocking", "streaming"]}}},
+        {"$sort": {"created_at": -1}},
+        {"$limit": limit},
+        {"$group": {"_id": None, "avg": {"$avg": "$total_tokens"}, "samples": {"$sum": 1}}},
+    ])]
+    if not rows:
+        return None, 0
+    return rows[0]["avg"], rows[0]["samples"]
+
+
+async def save_recheck(record_id: str, merged: Dict[str, Any], entry: Dict[str, Any],
+                       prompt_version: Optional[str] = None):
+    """把合并后的结果写回原记录，并追加复核记录"""
+    fields = to_record_fields(normalize_detection(merged), prompt_version).model_dump(
+        include={"overall_rating", "compliance_rate", "key_issues", "general_issues", "low_risk_issues",
+                 "detection_result", "prompt_version"},
+        mode="json",
+    )
+    records, _ = await _collections()
+    await records.update_one(
+        {"_id": _object_id(record_id)},
+        {"$set": dict(fields, updated_at=datetime.now()), "$push": {"rechecks": entry}},
+    )
+    recheck_total.inc()
@@ -0,0 +1,108 @@
+"""
+检测结果缓存
+
+同一张标签图片、同样的检测参数、同一提示词/工作流版本，Dify给出的结论是可复用的。
+缓存键由版本指纹和请求摘要组成:
+
+    (prompt_registry 指纹, sha256(图片内容 + 检测参数))
+
+提示词或工作流变化后指纹随之变化，旧版本的条目不会再命中，按LRU自然淘汰，
+不需要整体清空，新旧版本可以在滚动发布期间共存。
+
+检测时间不参与缓存键，命中时用 restamp 把结果中的检测时间和检测ID换成本次请求的值
+（outputs.text 是首次检测时Dify返回的原文，保持不变）。
+
+配置:
+    RESULT_CACHE_SIZE   最多缓存的结果数，默认 256，设为 0 关闭缓存
+    RESULT_CACHE_TTL    条目有效期（秒），默认 86400
+"""
+
+import os
+import copy
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from backend.metrics import metrics
+
+cache_requests_total = metrics.counter("result_cache_requests_total", "检测结果缓存查询次数")
+cache_entries = metrics.gauge("result_cache_entries", "检测结果缓存条目数")
+
+CacheKey = Tuple[str, str]
+
+
+def request_digest(content: bytes, params: Iterable[Optional[str]]) -> str:
+    """图片内容与检测参数的摘要"""
+    digest = hashlib.sha256(content)
+    for value in params:
+        digest.update(b"\x00" + (value or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def restamp(result: Dict[str, Any], detection_time: Optional[str], detection_id: str) -> Dict[str, Any]:
+    """把命中缓存的结果中的检测时间和检测ID换成本次请求的值（原地修改并返回）"""
+    outputs = result.get("outputs") if isinstance(result.get("outputs"), dict) else {}
+    json_data = outputs.get("json_data")
+    info = json_data.get("基本信息") if isinstance(json_data, dict) else None
+    if isinstance(info, dict) and detection_time:
+        info["检测时间"] = detection_time
+    for container in (result, result.get("metadata")):
+        if isinstance(container, dict) and "detection_id" in container:
+            container["detection_id"] = detection_id
+    return result
+
+
+class ResultCache:
+    """按版本指纹分代的LRU结果缓存"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 86400.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, fingerprint: str, digest: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        key = (fingerprint, digest)
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+                cache_entries.set(len(self._entries))
+            cache_requests_total.inc(result="miss")
+            return None
+        self._entries.move_to_end(key)
+        cache_requests_total.inc(result="hit")
+        return copy.deepcopy(entry[1])
+
+    def put(self, fingerprint: str, digest: str, value: Dict[str, Any]):
+        if not self.enabled:
+            return
+        key = (fingerprint, digest)
+        self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        cache_entries.set(len(self._entries))
+
+    def stats(self) -> Dict[str, Any]:
+        generations: Dict[str, int] = {}
+        for fingerprint, _ in self._entries:
+            generations[fingerprint] = generations.get(fingerprint, 0) + 1
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "generations": generations}
+
+    def clear(self):
+        self._entries.clear()
+        cache_entries.set(0)
+
+
+# 创建全局结果缓存实例
+result_cache = ResultCache(int(os.getenv("RESULT_CACHE_SIZE", "256")), float(os.getenv("RESULT_CACHE_TTL", "86400")))
@@ -0,0 +1,246 @@
+"""
+GB 7718 规则引擎
+
+从结构化的规则目录（backend/rules/gb7718.json）加载规则，字段与 详细检测结果 对应：
+检测类别、检测项目、标准要求、风险等级、违反条款、整改建议。
+
+规则中的条件由关键词（字面量）和正则组成。加载时把所有规则的全部关键词，
+连同各正则声明的锚点词，编译进同一个 Aho-Corasick 自动机。
+检查一段标签文字时:
+    1. 文字做一次归一化（NFKC 全角转半角、去空白、转小写）；
+    2. 自动机扫描一遍，得到命中的关键词集合；
+    3. 只有锚点词命中的正则才会执行（预过滤），关键词条件直接查命中集合。
+因此无论规则有多少条，文字只被完整扫描一次。
+
+用法:
+    from backend.rule_engine import default_catalogue
+    findings = default_catalogue().evaluate(text, {"imported": False})
+"""
+
+import os
+import re
+import json
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+DEFAULT_CATALOGUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules", "gb7718.json")
+
+# 结论取值与 详细检测结果.检测结果 一致，另增「待复核」表示无法离线判断
+RESULT_PASS = "合格"
+RESULT_FAIL = "不合格"
+RESULT_EXEMPT = "豁免"
+RESULT_REVIEW = "待复核"
+
+RISK_LEVELS = ("高风险", "中风险", "低风险")
+
+def normalize_text(text: str) -> str:
+    """匹配前的归一化：全角转半角，去除行内空白（OCR常在汉字间插入空格），统一小写"""
+    if not unicodedata.is_normalized("NFKC", text):
+        text = unicodedata.normalize("NFKC", text)
+    return "\n".join(["".join(line.split()) for line in text.lower().split("\n")])
+
+
+class AhoCorasick:
+    """Aho-Corasick 多模式匹配自动机"""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build()
+
+    def _add(self, keyword: str):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(len(self.keywords))
+        self.keywords.append(keyword)
+
+    def _build(self):
+        # 按广度优先计算失败指针，并把失败转移展开成完整的确定性转移表，
+        # 扫描时每个字符只需一次字典查找
+        self._delta: List[Dict[str, int]] = [dict(self._goto[0])]
+        self._delta.extend({} for _ in range(len(self._goto) - 1))
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            fail_state = self._fail[state]
+            self._delta[state] = {**self._delta[fail_state], **self._goto[state]}
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                self._fail[next_state] = self._delta[fail_state].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Set[int]:
+        """扫描一遍文字，返回命中的关键词编号集合"""
+        delta, output = self._delta, self._output
+        hits: Set[int] = set()
+        state = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            if output[state]:
+                hits.update(output[state])
+        return hits
+
+
+class Condition:
+    """关键词或正则满足其一即成立的条件"""
+
+    __slots__ = ("keyword_ids", "patterns")
+
+    def __init__(self, keyword_ids: List[int], patterns: List[tuple]):
+        self.keyword_ids = keyword_ids
+        # (编译后的正则, 锚点关键词编号列表；为空表示不做预过滤)
+        self.patterns = patterns
+
+    def match(self, text: str, hits: Set[int], keywords: List[str], prefilter: bool = True) -> Optional[str]:
+        for keyword_id in self.keyword_ids:
+            if keyword_id in hits:
+                return keywords[keyword_id]
+        for regex, anchor_ids in self.patterns:
+            if prefilter and anchor_ids and not any(anchor_id in hits for anchor_id in anchor_ids):
+                continue
+            found = regex.search(text)
+            if found:
+                return found.group(0)
+        return None
+
+
+class RuleCatalogue:
+    """编译后的规则目录"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.version = data.get("version", "")
+        self.standard = data.get("standard", "")
+        self._keyword_index: Dict[str, int] = {}
+        self.rules: List[Dict[str, Any]] = [self._compile_rule(rule) for rule in data["rules"]]
+        self.automaton = AhoCorasick(self._keyword_index)
+        self.pattern_count = sum(
+            len(condition.patterns)
+            for rule in self.rules
+            for condition in list(rule["required"].values()) + list(rule["forbidden"].values())
+            + ([rule["trigger"]] if rule["trigger"] else [])
+        )
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_CATALOGUE_PATH) -> "RuleCatalogue":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _keyword_id(self, keyword: str) -> int:
+        keyword = normalize_text(keyword)
+        if keyword not in self._keyword_index:
+            self._keyword_index[keyword] = len(self._keyword_index)
+        return self._keyword_index[keyword]
+
+    def _compile_condition(self, spec: Optional[Dict[str, Any]]) -> Optional[Condition]:
+        if not spec:
+            return None
+        keyword_ids = [self._keyword_id(keyword) for keyword in spec.get("keywords", [])]
+        patterns = [
+            (re.compile(pattern["regex"], re.IGNORECASE), [self._keyword_id(a) for a in pattern.get("anchors", [])])
+            for pattern in spec.get("patterns", [])
+        ]
+        return Condition(keyword_ids, patterns)
+
+    def _compile_rule(self, rule: Dict[str, Any]) -> Dict[str, Any]:
+        for field in ("id", "检测类别", "检测项目", "标准要求", "风险等级", "违反条款", "整改建议"):
+            if field not in rule:
+                raise ValueError(f"规则缺少字段 {field}: {rule.get('id', rule)}")
+        if rule["风险等级"] not in RISK_LEVELS:
+            raise ValueError(f"规则 {rule['id']} 的风险等级无效: {rule['风险等级']}")
+        return dict(
+            rule,
+            required={name: self._compile_condition(spec) for name, spec in rule.get("required", {}).items()},
+            forbidden={name: self._compile_condition(spec) for name, spec in rule.get("forbidden", {}).items()},
+            trigger=self._compile_condition(rule.get("trigger")),
+            exempt=rule.get("exempt", []),
+            applies_to=rule.get("applies_to", []),
+        )
+
+    @staticmethod
+    def _finding(rule: Dict[str, Any], result: str, actual: str, problems: Iterable[str] = ()) -> Dict[str, Any]:
+        failed = result == RESULT_FAIL
+        return {
+            "检测类别": rule["检测类别"],
+            "检测项目": rule["检测项目"],
+            "标准要求": rule["标准要求"],
+            "检测结果": result,
+            "实际情况": actual,
+            "问题描述": "；".join(problems) if failed else "",
+            "风险等级": rule["风险等级"] if failed else "",
+            "违反条款": rule["违反条款"] if failed else "",
+            "应更正为": "",
+            "整改建议": rule["整改建议"] if failed else "",
+            "规则": rule["id"],
+        }
+
+    def evaluate(self, text: str, context: Optional[Dict[str, bool]] = None,
+                 prefilter: bool = True) -> List[Dict[str, Any]]:
+        """对标签文字执行全部规则，返回与 详细检测结果 同结构的条目
+
+        prefilter=False 时不使用自动机的命中结果过滤正则，仅用于基准对比。
+        """
+        normalized = normalize_text(text)
+        return self.evaluate_normalized(normalized, self.automaton.search(normalized), context, prefilter)
+
+    def evaluate_normalized(self, normalized: str, hits: Set[int], context: Optional[Dict[str, bool]] = None,
+                            prefilter: bool = True) -> List[Dict[str, Any]]:
+        """在已归一化的文字和关键词命中集合上执行规则"""
+        context = context or {}
+        keywords = self.automaton.keywords
+
+        findings = []
+        for rule in self.rules:
+            if rule["applies_to"] and not any(context.get(name) for name in rule["applies_to"]):
+                continue
+            exempt_by = [name for name in rule["exempt"] if context.get(name)]
+            if exempt_by:
+                findings.append(self._finding(rule, RESULT_EXEMPT, f"豁免: {','.join(exempt_by)}"))
+                continue
+            if rule.get("manual"):
+                findings.append(self._finding(rule, RESULT_REVIEW, "无法离线判断，需由模型或人工复核"))
+                continue
+            if rule["trigger"] and rule["trigger"].match(normalized, hits, keywords, prefilter) is None:
+                findings.append(self._finding(rule, RESULT_PASS, "不适用"))
+                continue
+
+            problems, evidence = [], []
+            for name, condition in rule["required"].items():
+                matched = condition.match(normalized, hits, keywords, prefilter)
+                if matched is None:
+                    problems.append(name)
+                else:
+                    evidence.append(matched)
+            for name, condition in rule["forbidden"].items():
+                matched = condition.match(normalized, hits, keywords, prefilter)
+                if matched is not None:
+                    problems.append(f"{name}（{matched}）")
+
+            if problems:
+                findings.append(self._finding(rule, RESULT_FAIL, "；".join(evidence) or "未识别到相关标示", problems))
+            else:
+                findings.append(self._finding(rule, RESULT_PASS, "；".join(evidence)))
+        return findings
+
+
+_default_catalogue: Optional[RuleCatalogue] = None
+
+
+def default_catalogue() -> RuleCatalogue:
+    """加载默认规则目录（首次调用时编译，之后复用）"""
+    global _default_catalogue
+    if _default_catalogue is None:
+        _default_catalogue = RuleCatalogue.load(os.getenv("RULE_CATALOGUE_PATH", DEFAULT_CATALOGUE_PATH))
+    return _default_catalogue
@@ -0,0 +1,138 @@
+"""
+Dify并发池的加权公平调度
+
+所有Dify工作流调用都要先从调度器获取一个并发槽位。槽位不足时请求进入等待，
+按加权公平排队（WFQ）出队：每个客户端是一个独立的流，请求的虚拟完成时间为
+    max(当前虚拟时间, 该流上一个请求的完成时间) + 1 / 权重
+虚拟完成时间最小者优先获得槽位。交互式请求的权重远高于批量请求，
+因此批量任务再多也只会占用与权重成比例的份额，不会饿死交互式检测。
+
+配置（环境变量）:
+    DIFY_MAX_CONCURRENCY   Dify并发上限，默认 8
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_WEIGHTS = {
+    "interactive": 8.0,
+    "bulk": 1.0,
+}
+
+queue_depth = metrics.gauge("dify_queue_depth", "等待Dify并发槽位的请求数")
+in_flight = metrics.gauge("dify_in_flight", "正在占用Dify并发槽位的请求数")
+queue_wait = metrics.histogram(
+    "dify_queue_wait_seconds", "等待Dify并发槽位的时间",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+
+
+class FairScheduler:
+    """加权公平排队的并发池"""
+
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._queue: List[Tuple[float, int, asyncio.Future, str]] = []
+        self._sequence = itertools.count()
+
+    def set_max_concurrency(self, max_concurrency: int):
+        """运行时调整并发上限"""
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._dispatch()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future, _ in self._queue if not future.done())
+
+    def _finish_tag(self, flow: str, weight: float) -> float:
+        start = max(self.virtual_time, self._last_finish.get(flow, 0.0))
+        finish = start + 1.0 / max(weight, 1e-6)
+        self._last_finish[flow] = finish
+        return finish
+
+    def _dispatch(self):
+        while self._queue and self.active < self.max_concurrency:
+            tag, _, future, flow = heapq.heappop(self._queue)
+            if future.done():
+                # 已取消的等待者
+                continue
+            self.virtual_time = max(self.virtual_time, tag)
+            self.active += 1
+            future.set_result(None)
+        self._update_gauges()
+        # 没有排队时清理流状态，避免客户端标识无限增长
+        if not self._queue:
+            self._last_finish = {
+                flow: finish for flow, finish in self._last_finish.items() if finish > self.virtual_time
+            }
+
+    def _update_gauges(self):
+        queue_depth.set(self.waiting)
+        in_flight.set(self.active)
+
+    async def acquire(self, flow: str, weight: float = 1.0):
+        """获取并发槽位"""
+        started = time.monotonic()
+        if self.active < self.max_concurrency and not self._queue:
+            self.active += 1
+            self._update_gauges()
+            queue_wait.observe(0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        tag = self._finish_tag(flow, weight)
+        heapq.heappush(self._queue, (tag, next(self._sequence), future, flow))
+        self._update_gauges()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 槽位已分配但调用方被取消，归还槽位
+                self.release()
+            else:
+                future.cancel()
+                self._update_gauges()
+            raise
+        queue_wait.observe(time.monotonic() - started)
+
+    def release(self):
+        """归还并发槽位"""
+        self.active = max(0, self.active - 1)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, flow: str, priority: str = "interactive", weight: Optional[float] = None):
+        """占用一个并发槽位的上下文管理器"""
+        effective_weight = weight if weight is not None else PRIORITY_WEIGHTS.get(priority, 1.0)
+        await self.acquire(flow, effective_weight)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "waiting": self.waiting,
+        }
+
+
+# 创建全局调度器实例
+dify_scheduler = FairScheduler(max_concurrency=int(os.getenv("DIFY_MAX_CONCURRENCY", "8")))
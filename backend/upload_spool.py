@@ -0,0 +1,211 @@
+"""
+上传文件暂存区
+
+检测过程中上传的标签图片需要落盘（本地预筛查、上传到Dify都要读取文件）。
+暂存区统一管理这些文件，请求路径上只做写入和租约登记，删除全部由后台清理任务完成:
+
+    - 文件按内容的 SHA-256 命名，同一张图片并发提交时只写一份；
+    - 写入先落到 .part 临时文件再原子改名，进程中途退出不会留下半截文件；
+    - 每个请求持有文件租约，结束时（无论成功还是异常）释放租约；
+    - 租约登记、复用已有文件前的存在检查与清理时的删除在同一把锁内进行，
+      清理线程不会删掉请求刚刚复用的文件；
+    - 后台清理任务删除没有租约、且超过保留时间的文件，总大小超过配额时从最旧的开始删除；
+    - 启动时清理上次进程遗留的孤儿文件和 .part 临时文件。
+
+配置:
+    UPLOAD_DIR             暂存目录，默认 uploads
+    SPOOL_RETENTION        释放租约后保留的秒数，默认 300
+    SPOOL_MAX_BYTES        暂存区总大小配额，默认 1GiB
+    SPOOL_SWEEP_INTERVAL   清理间隔（秒），默认 30
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import aiofiles
+
+try:
+    from .metrics import metrics
+except ImportError:
+    from backend.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TEMP_SUFFIX = ".part"
+
+spool_bytes = metrics.gauge("upload_spool_bytes", "上传暂存区占用的字节数")
+spool_files = metrics.gauge("upload_spool_files", "上传暂存区文件数")
+spool_leased = metrics.gauge("upload_spool_leased_files", "正在被请求使用的暂存文件数")
+spool_removed_total = metrics.counter("upload_spool_removed_total", "暂存区清理删除的文件数")
+
+
+class UploadSpool:
+    """内容寻址的上传文件暂存区"""
+
+    def __init__(self, root: str = "uploads", retention: float = 300.0, max_bytes: int = 1 << 30,
+                 sweep_interval: float = 30.0):
+        self.root = root
+        self.retention = retention
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        # 文件名 -> 租约数
+        self._leases: Dict[str, int] = {}
+        # 文件名 -> 最近一次释放租约的时间（time.time()）
+        self._released_at: Dict[str, float] = {}
+        # 事件循环（store/release）与线程池中的清理任务（sweep）共用
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    async def store(self, data: bytes, extension: str = "") -> str:
+        """写入文件并登记租约，返回文件路径；内容相同的文件只写一次"""
+        name = hashlib.sha256(data).hexdigest() + extension.lower()
+        path = self.path_for(name)
+        with self._lock:
+            self._leases[name] = self._leases.get(name, 0) + 1
+            exists = os.path.exists(path)
+        spool_leased.set(len(self._leases))
+        try:
+            if not exists:
+                os.makedirs(self.root, exist_ok=True)
+                temp_path = f"{path}.{uuid.uuid4().hex[:8]}{TEMP_SUFFIX}"
+                async with aiofiles.open(temp_path, "wb") as f:
+                    await f.write(data)
+                os.replace(temp_path, path)
+                spool_files.inc()
+                spool_bytes.inc(len(data))
+        except BaseException:
+            self.release(path)
+            raise
+        return path
+
+    def release(self, path: str):
+        """释放租约；文件由后台清理任务删除"""
+        name = os.path.basename(path)
+        with self._lock:
+            count = self._leases.get(name, 0) - 1
+            if count > 0:
+                self._leases[name] = count
+            else:
+                self._leases.pop(name, None)
+                self._released_at[name] = time.time()
+        spool_leased.set(len(self._leases))
+
+    def _scan(self) -> List[Tuple[str, float, int]]:
+        entries = []
+        try:
+            with os.scandir(self.root) as iterator:
+                for entry in iterator:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        entries.append((entry.name, stat.st_mtime, stat.st_size))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _remove(self, name: str, reason: str) -> bool:
+        # 扫描期间可能有请求刚刚取得租约；持锁删除，store 要么在删除前看到文件并登记租约，要么重新写入
+        with self._lock:
+            if name in self._leases:
+                return False
+            try:
+                os.remove(self.path_for(name))
+            except FileNotFoundError:
+                return False
+            except OSError as e:
+                logger.warning(f"删除暂存文件失败 {name}: {e}")
+                return False
+            self._released_at.pop(name, None)
+        spool_removed_total.inc(reason=reason)
+        return True
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, int]:
+        """执行一次清理（同步，应在线程池中运行），返回各原因删除的文件数"""
+        now = time.time() if now is None else now
+        removed = {"expired": 0, "quota": 0, "temp": 0}
+        remaining = []
+        for name, mtime, size in self._scan():
+            leased = name in self._leases
+            if name.endswith(TEMP_SUFFIX):
+                # 正在写入的临时文件不超过保留时间时不动
+                if now - mtime > max(self.retention, 60) and self._remove(name, "temp"):
+                    removed["temp"] += 1
+                    continue
+            elif not leased and now - max(mtime, self._released_at.get(name, 0)) >= self.retention:
+                if self._remove(name, "expired"):
+                    removed["expired"] += 1
+                    continue
+            remaining.append((name, mtime, size, leased))
+
+        total = sum(size for _, _, size, _ in remaining)
+        if total > self.max_bytes:
+            for name, _, size, leased in sorted(remaining, key=lambda item: item[1]):
+                if total <= self.max_bytes:
+                    break
+                if not leased and not name.endswith(TEMP_SUFFIX) and self._remove(name, "quota"):
+                    removed["quota"] += 1
+                    total -= size
+            remaining = [item for item in remaining if os.path.exists(self.path_for(item[0]))]
+
+        spool_files.set(len(remaining))
+        spool_bytes.set(sum(size for _, _, size, _ in remaining))
+        return removed
+
+    def recover(self) -> int:
+        """启动时清理上次进程遗留的文件（此时没有任何租约）"""
+        removed = 0
+        for name, _, _ in self._scan():
+            if name not in self._leases and self._remove(name, "orphan"):
+                removed += 1
+        if removed:
+            logger.info(f"暂存区启动恢复: 清理遗留文件 {removed} 个")
+        self.sweep()
+        return removed
+
+    async def _run(self):
+        from starlette.concurrency import run_in_threadpool
+
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = await run_in_threadpool(self.sweep)
+                if any(removed.values()):
+                    logger.info(f"暂存区清理: {removed}")
+            except Exception as e:
+                logger.warning(f"暂存区清理失败: {e}")
+
+    async def start(self):
+        """启动恢复并开始后台清理"""
+        from starlette.concurrency import run_in_threadpool
+
+        if self._task is not None:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        await run_in_threadpool(self.recover)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 创建全局暂存区实例
+upload_spool = UploadSpool(
+    root=os.getenv("UPLOAD_DIR", "uploads"),
+    retention=float(os.getenv("SPOOL_RETENTION", "300")),
+    max_bytes=int(os.getenv("SPOOL_MAX_BYTES", str(1 << 30))),
+    sweep_interval=float(os.getenv("SPOOL_SWEEP_INTERVAL", "30")),
+)
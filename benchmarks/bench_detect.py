@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+/api/detect 端到端负载基准
+
+启动本地Dify模拟服务（test/mock_dify_server.py）和后端服务两个子进程，
+按指定并发向 /api/detect 发送请求，覆盖三类负载:
+
+    small_jpeg     小尺寸JPEG（约 640x480）
+    large_png      大尺寸PNG（约 3000x2000）
+    multipage_pdf  多页PDF（默认 5 页）
+
+记录指标: 延迟 p50/p95/p99、吞吐量、事件循环延迟（压测期间轮询 /health 的响应时间，
+以及后端 /metrics 中的 event_loop_* 指标）、后端进程 RSS 与打开的文件描述符数。
+结果保存为JSON，便于跨提交对比。
+
+用法:
+    python benchmarks/bench_detect.py --concurrency 20 --requests 200
+    python benchmarks/bench_detect.py --payload large_png --latency normal:1,0.2 --response-mode streaming
+"""
+
+import io
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from results import PROJECT_ROOT, percentile, save_result  # noqa: E402
+
+PAYLOADS = ("small_jpeg", "large_png", "multipage_pdf")
+
+FORM_FIELDS = {
+    "Foodtype": "糕点",
+    "PackageFoodType": "直接提供给消费者的预包装食品",
+    "SingleOrMulti": "单件",
+    "PackageSize": "最大表面面积大于35cm2",
+    "DetectionTime": "2025-01-01",
+}
+
+
+def build_payload(kind: str, pdf_pages: int = 5):
+    """生成测试文件，返回 (文件名, 内容, MIME类型)"""
+    from PIL import Image
+    import numpy as np
+
+    rng = np.random.default_rng(7718)
+    buffer = io.BytesIO()
+    if kind == "small_jpeg":
+        pixels = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(buffer, format="JPEG", quality=85)
+        return "label.jpg", buffer.getvalue(), "image/jpeg"
+    if kind == "large_png":
+        # 渐变叠加少量噪声，体积接近真实拍摄的标签大图
+        gradient = np.linspace(0, 255, 3000, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 12, (2000, 3000, 3))
+        pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+        Image.fromarray(pixels).save(buffer, format="PNG")
+        return "label.png", buffer.getvalue(), "image/png"
+    if kind == "multipage_pdf":
+        pages = [
+            Image.fromarray(rng.integers(0, 255, (1100, 850, 3), dtype=np.uint8))
+            for _ in range(pdf_pages)
+        ]
+        pages[0].save(buffer, format="PDF", save_all=True, append_images=pages[1:])
+        return "label.pdf", buffer.getvalue(), "application/pdf"
+    raise ValueError(f"未知的负载类型: {kind}")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, timeout: float = 30.0):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            time.sleep(0.05)
+    raise RuntimeError(f"服务未就绪: {url}")
+
+
+def process_stats(pid: int) -> dict:
+    """读取进程 RSS（MB）与打开的文件描述符数（仅Linux）"""
+    stats = {"rss_mb": None, "open_fds": None}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    stats["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+        stats["open_fds"] = len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        pass
+    return stats
+
+
+class Services:
+    """模拟Dify与后端服务子进程"""
+
+    def __init__(self, latency: str, response_mode: str):
+        self.mock_port = free_port()
+        self.backend_port = free_port()
+        self.latency = latency
+        self.response_mode = response_mode
+        self.processes = []
+
+    @property
+    def backend_url(self) -> str:
+        return f"http://127.0.0.1:{self.backend_port}"
+
+    @property
+    def backend_pid(self) -> int:
+        return self.processes[1].pid
+
+    def __enter__(self):
+        env = dict(os.environ, PYTHONPATH=PROJECT_ROOT)
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "test/mock_dify_server.py", "--port", str(self.mock_port),
+             "--latency", self.latency, "--seed", "7718"],
+            cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+        wait_ready(f"http://127.0.0.1:{self.mock_port}/mock/stats")
+
+        backend_env = dict(
+            env,
+            DIFY_BASE_URL=f"http://127.0.0.1:{self.mock_port}/v1",
+            DIFY_RESPONSE_MODE=self.response_mode,
+            BACKEND_HOST="127.0.0.1",
+            BACKEND_PORT=str(self.backend_port),
+            BACKEND_RELOAD="false",
+            # 压测客户端只有一个来源IP，关闭限流以测量后端本身
+            RATE_LIMIT_ENABLED="false",
+            # 压测环境没有MongoDB
+            COST_LEDGER_ENABLED="false",
+            # 压测反复提交同一张图片，关闭结果缓存以测量完整链路
+            RESULT_CACHE_SIZE="0",
+        )
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "run_backend_simple.py"],
+            cwd=PROJECT_ROOT, env=backend_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+        wait_ready(f"{self.backend_url}/health")
+        return self
+
+    def __exit__(self, *exc):
+        for proc in reversed(self.processes):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+async def scrape_metrics(client: httpx.AsyncClient) -> dict:
+    """读取后端自身记录的事件循环指标"""
+    wanted = {
+        "event_loop_lag_max_seconds": "lag_max_ms",
+        "event_loop_blocked_total": "blocked_total",
+        "event_loop_blocked_seconds_total": "blocked_ms",
+    }
+    values = {}
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return values
+    for line in response.text.splitlines():
+        name, _, value = line.partition(" ")
+        if name in wanted:
+            number = float(value)
+            values[wanted[name]] = round(number * 1000, 2) if wanted[name].endswith("_ms") else number
+    return values
+
+
+async def run_load(services: Services, payload, concurrency: int, total_requests: int) -> dict:
+    filename, content, mime_type = payload
+    latencies, failures = [], 0
+    health_latencies = []
+    resource_samples = []
+    done = asyncio.Event()
+
+    limits = httpx.Limits(max_connections=concurrency + 2, max_keepalive_connections=concurrency + 2)
+    async with httpx.AsyncClient(base_url=services.backend_url, timeout=600.0, limits=limits) as client:
+        queue = asyncio.Queue()
+        for _ in range(total_requests):
+            queue.put_nowait(None)
+
+        async def worker():
+            nonlocal failures
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                try:
+                    response = await client.post(
+                        "/api/detect",
+                        files={"file": (filename, content, mime_type)},
+                        data=FORM_FIELDS,
+                    )
+                    if response.status_code != 200:
+                        failures += 1
+                except httpx.HTTPError:
+                    failures += 1
+                latencies.append(time.perf_counter() - started)
+
+        async def monitor():
+            # /health 不做任何工作，其响应时间主要反映后端事件循环的排队延迟
+            async with httpx.AsyncClient(base_url=services.backend_url, timeout=30.0) as probe:
+                while not done.is_set():
+                    started = time.perf_counter()
+                    try:
+                        await probe.get("/health")
+                        health_latencies.append(time.perf_counter() - started)
+                    except httpx.HTTPError:
+                        pass
+                    resource_samples.append(process_stats(services.backend_pid))
+                    await asyncio.sleep(0.1)
+
+        monitor_task = asyncio.create_task(monitor())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await monitor_task
+        server_metrics = await scrape_metrics(client)
+
+    rss = [sample["rss_mb"] for sample in resource_samples if sample["rss_mb"] is not None]
+    fds = [sample["open_fds"] for sample in resource_samples if sample["open_fds"] is not None]
+    return {
+        "requests": total_requests,
+        "failures": failures,
+        "payload_bytes": len(content),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "mean": round(statistics.mean(latencies) * 1000, 1) if latencies else 0.0,
+        },
+        "event_loop_lag_ms": {
+            "p50": round(percentile(health_latencies, 50) * 1000, 2),
+            "p99": round(percentile(health_latencies, 99) * 1000, 2),
+            "max": round(max(health_latencies) * 1000, 2) if health_latencies else 0.0,
+        },
+        "server_event_loop": server_metrics,
+        "rss_mb": {"max": max(rss) if rss else None, "end": rss[-1] if rss else None},
+        "open_fds": {"max": max(fds) if fds else None, "end": fds[-1] if fds else None},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="/api/detect 端到端负载基准")
+    parser.add_argument("--payload", choices=PAYLOADS + ("all",), default="all", help="负载类型")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发数")
+    parser.add_argument("--requests", type=int, default=50, help="每类负载的请求总数")
+    parser.add_argument("--latency", default="fixed:0.5", help="模拟Dify的工作流耗时分布")
+    parser.add_argument("--response-mode", choices=("blocking", "streaming"), default="blocking")
+    parser.add_argument("--pdf-pages", type=int, default=5, help="PDF页数")
+    parser.add_argument("--no-save", action="store_true", help="不保存结果")
+    args = parser.parse_args()
+
+    kinds = PAYLOADS if args.payload == "all" else (args.payload,)
+    results = {}
+    with Services(args.latency, args.response_mode) as services:
+        for kind in kinds:
+            payload = build_payload(kind, args.pdf_pages)
+            print(f"▶️  {kind}: {len(payload[1]) / 1024:.0f}KB, 并发 {args.concurrency}, 共 {args.requests} 个请求")
+            result = asyncio.run(run_load(services, payload, args.concurrency, args.requests))
+            results[kind] = result
+            print(f"   延迟 p50/p95/p99: {result['latency_ms']['p50']}/{result['latency_ms']['p95']}/"
+                  f"{result['latency_ms']['p99']}ms, 吞吐 {result['throughput_rps']} req/s, "
+                  f"失败 {result['failures']}, 事件循环延迟 p99 {result['event_loop_lag_ms']['p99']}ms, "
+                  f"RSS {result['rss_mb']['max']}MB, FD {result['open_fds']['max']}")
+
+    if not args.no_save:
+        path = save_result("detect", {
+            "config": {
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "latency": args.latency,
+                "response_mode": args.response_mode,
+                "pdf_pages": args.pdf_pages,
+            },
+            "results": results,
+        })
+        print(f"📝 结果已保存: {os.path.relpath(path, PROJECT_ROOT)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+对冲请求的尾延迟基准
+
+按缩放后的时间模拟长尾的Dify延迟分布（默认：95% 的运行在 35-45 秒完成，5% 卡住 300 秒），
+请求按固定间隔到达，分别在关闭对冲、开启对冲（p95 触发，每分钟预算若干次）下运行，
+比较 p50/p95/p99/最大延迟以及额外的运行时间（被取消的对冲方已消耗的时间，即多付的费用）。
+
+实际运行的是 backend.hedging.HedgePolicy.run，只是把每次Dify运行替换为 asyncio.sleep。
+
+用法:
+    python benchmarks/bench_hedge.py
+    python benchmarks/bench_hedge.py --requests 2000 --stall-rate 0.03 --budget 4
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from results import PROJECT_ROOT, percentile, save_result  # noqa: E402
+
+sys.path.insert(0, PROJECT_ROOT)
+from backend.hedging import HedgePolicy, HedgeSettings  # noqa: E402
+
+# 1 秒模拟时间 = SCALE 秒真实时间
+SCALE = 0.001
+
+
+def sample_latency(rng: random.Random, stall_rate: float, stall: float) -> float:
+    return stall if rng.random() < stall_rate else rng.uniform(35.0, 45.0)
+
+
+async def simulate(args, hedging: bool) -> dict:
+    rng = random.Random(args.seed)
+    policy = HedgePolicy(HedgeSettings(
+        enabled=hedging, percentile=args.percentile, min_samples=20,
+        # 预算按模拟时间换算：每模拟分钟 args.budget 次
+        budget=args.budget / SCALE, min_delay=0.0,
+    ))
+    for _ in range(200):
+        policy.observe(sample_latency(rng, args.stall_rate, args.stall) * SCALE)
+
+    extra = {"runs": 0, "seconds": 0.0}
+
+    async def fake_run(is_hedge: bool):
+        latency = sample_latency(rng, args.stall_rate, args.stall) * SCALE
+        started = time.perf_counter()
+        if is_hedge:
+            extra["runs"] += 1
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            if is_hedge:
+                extra["seconds"] += time.perf_counter() - started
+        policy.observe(latency)
+        return {"success": True}
+
+    latencies = []
+
+    async def request():
+        started = time.perf_counter()
+        await policy.run(lambda: fake_run(False), lambda: fake_run(True), lambda result: result["success"])
+        latencies.append((time.perf_counter() - started) / SCALE)
+
+    tasks = []
+    for _ in range(args.requests):
+        tasks.append(asyncio.ensure_future(request()))
+        await asyncio.sleep(args.interval * SCALE)
+    await asyncio.gather(*tasks)
+
+    total_run_seconds = sum(latencies)
+    return {
+        "p50": round(percentile(latencies, 50), 1),
+        "p95": round(percentile(latencies, 95), 1),
+        "p99": round(percentile(latencies, 99), 1),
+        "max": round(max(latencies), 1),
+        "hedges": extra["runs"],
+        "extra_run_pct": round(extra["seconds"] / SCALE / total_run_seconds * 100, 2) if hedging else 0.0,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="对冲请求的尾延迟基准")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--interval", type=float, default=2.0, help="请求到达间隔（模拟秒）")
+    parser.add_argument("--stall-rate", type=float, default=0.05)
+    parser.add_argument("--stall", type=float, default=300.0, help="卡住的运行的延迟（模拟秒）")
+    parser.add_argument("--percentile", type=float, default=95.0)
+    parser.add_argument("--budget", type=float, default=2.0, help="每分钟对冲预算")
+    parser.add_argument("--seed", type=int, default=7718)
+    parser.add_argument("--no-save", action="store_true", help="不保存结果")
+    args = parser.parse_args()
+
+    results = {}
+    for name, hedging in (("off", False), ("hedged", True)):
+        results[name] = asyncio.run(simulate(args, hedging))
+        r = results[name]
+        print(f"{name:<7} p50 {r['p50']:>6.1f}s  p95 {r['p95']:>6.1f}s  p99 {r['p99']:>6.1f}s  "
+              f"max {r['max']:>6.1f}s  对冲 {r['hedges']:>4} 次  额外运行时间 {r['extra_run_pct']:.1f}%")
+
+    if not args.no_save:
+        path = save_result("hedge", {"params": vars(args), "results": results})
+        print(f"📝 结果已保存: {os.path.relpath(path, PROJECT_ROOT)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
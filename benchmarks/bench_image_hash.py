@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+感知哈希与近重复索引基准
+
+1. 对合成标签图片计算 pHash + dHash 的耗时（JPEG，1200x900）；
+2. 汉明距离半径查询：多索引哈希（生产路径）、BK 树与线性扫描的对比。索引规模 N 逐级增大，
+   记录每次查询做完整比较的候选比例与耗时。各方式的查询结果必须一致，否则基准直接失败。
+
+   BK 树在 64 位哈希、半径 8 时剪枝效果很差（需访问约一半节点），纯 Python 实现下比线性扫描还慢，
+   这里保留作对照。
+
+用法:
+    python benchmarks/bench_image_hash.py
+    python benchmarks/bench_image_hash.py --sizes 10000 100000 --radius 8
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from results import PROJECT_ROOT, percentile, save_result  # noqa: E402
+
+sys.path.insert(0, PROJECT_ROOT)
+from backend.image_hash import MultiIndexHash, compute_hashes, hamming  # noqa: E402
+
+
+class BKTree:
+    """以汉明距离为度量的 BK 树（仅作对照）"""
+
+    def __init__(self):
+        self._root = None
+
+    def add(self, key: int, item):
+        if self._root is None:
+            self._root = [key, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            if distance not in node[2]:
+                node[2][distance] = [key, [item], {}]
+                return
+            node = node[2][distance]
+
+    def search(self, key: int, radius: int):
+        found, visited, stack = [], 0, [self._root]
+        while stack:
+            node = stack.pop()
+            visited += 1
+            distance = hamming(key, node[0])
+            if distance <= radius:
+                found.extend((distance, item) for item in node[1])
+            stack.extend(child for child_distance, child in node[2].items()
+                         if distance - radius <= child_distance <= distance + radius)
+        return found, visited
+
+
+def synthetic_jpeg(seed: int) -> bytes:
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (1200, 900), (240, 230, 200))
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randrange(1200), rng.randrange(900)
+        draw.rectangle([x, y, x + rng.randint(20, 300), y + rng.randint(10, 60)],
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def bench_hashing(images: int) -> dict:
+    contents = [synthetic_jpeg(seed) for seed in range(images)]
+    compute_hashes(contents[0])
+    timings = []
+    for content in contents:
+        started = time.perf_counter()
+        compute_hashes(content)
+        timings.append(time.perf_counter() - started)
+    return {
+        "images": images,
+        "p50_ms": round(percentile(timings, 50) * 1000, 2),
+        "p99_ms": round(percentile(timings, 99) * 1000, 2),
+    }
+
+
+def bench_lookup(size: int, radius: int, queries: int, seed: int = 7718) -> dict:
+    rng = random.Random(seed)
+    keys = [rng.getrandbits(64) for _ in range(size)]
+    indexes = {"multi_index": MultiIndexHash(), "bk_tree": BKTree()}
+    for index in indexes.values():
+        for position, key in enumerate(keys):
+            index.add(key, position)
+
+    # 一半查询是已有哈希的轻微扰动（近重复），一半是随机哈希
+    targets = []
+    for index in range(queries):
+        if index % 2 == 0:
+            key = rng.choice(keys)
+            for _ in range(rng.randint(0, radius)):
+                key ^= 1 << rng.randrange(64)
+            targets.append(key)
+        else:
+            targets.append(rng.getrandbits(64))
+
+    timings = {name: [] for name in list(indexes) + ["linear"]}
+    visited_ratio = {name: [] for name in indexes}
+    for query in targets:
+        started = time.perf_counter()
+        expected = sorted(position for position, key in enumerate(keys) if hamming(query, key) <= radius)
+        timings["linear"].append(time.perf_counter() - started)
+
+        for name, index in indexes.items():
+            started = time.perf_counter()
+            found, visited = index.search(query, radius)
+            timings[name].append(time.perf_counter() - started)
+            if sorted(position for _, position in found) != expected:
+                raise SystemExit(f"❌ {name} 查询结果与线性扫描不一致（N={size}）")
+            visited_ratio[name].append(visited / size)
+
+    result = {"size": size}
+    for name, values in timings.items():
+        result[name] = {"p50_us": round(percentile(values, 50) * 1e6, 1)}
+        if name in visited_ratio:
+            result[name]["compared_p50"] = round(percentile(visited_ratio[name], 50), 4)
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="感知哈希与近重复索引基准")
+    parser.add_argument("--images", type=int, default=50, help="计算哈希的图片数量")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 100000], help="索引规模")
+    parser.add_argument("--radius", type=int, default=8, help="pHash 汉明距离半径")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--no-save", action="store_true", help="不保存结果")
+    args = parser.parse_args()
+
+    hashing = bench_hashing(args.images)
+    print(f"🖼️  pHash+dHash: p50 {hashing['p50_ms']}ms, p99 {hashing['p99_ms']}ms（{args.images} 张 1200x900 JPEG）")
+
+    lookups = []
+    for size in args.sizes:
+        result = bench_lookup(size, args.radius, args.queries)
+        lookups.append(result)
+        print(f"N={size:>7}: 多索引哈希 p50 {result['multi_index']['p50_us']:>8.1f}µs"
+              f"（比较 {result['multi_index']['compared_p50']:.2%}）  "
+              f"BK树 p50 {result['bk_tree']['p50_us']:>9.1f}µs（比较 {result['bk_tree']['compared_p50']:.1%}）  "
+              f"线性扫描 p50 {result['linear']['p50_us']:>9.1f}µs")
+
+    if not args.no_save:
+        path = save_result("image_hash", {
+            "config": {"images": args.images, "sizes": args.sizes, "radius": args.radius, "queries": args.queries},
+            "hashing": hashing,
+            "lookups": lookups,
+        })
+        print(f"📝 结果已保存: {os.path.relpath(path, PROJECT_ROOT)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+响应处理函数的微基准
+
+覆盖 separate_json_and_markdown、process_dify_response、parse_streaming_response
+以及检测JSON的校验规范化（normalize_detection，含一批随机扰动的输出），
+输入来自 test/output.json（与真实Dify输出同等规模）。结果保存为JSON，便于跨提交对比。
+
+用法:
+    python benchmarks/bench_micro.py
+    python benchmarks/bench_micro.py --repeat 7 --number 200
+"""
+
+import os
+import sys
+import copy
+import json
+import random
+import timeit
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from results import PROJECT_ROOT, save_result  # noqa: E402
+
+sys.path.insert(0, PROJECT_ROOT)
+from backend.dify_client import (  # noqa: E402
+    separate_json_and_markdown,
+    process_dify_response,
+    parse_streaming_response,
+)
+from backend.detection_schema import normalize_detection  # noqa: E402
+
+# 大模型输出中常见的格式偏差
+RATE_VARIANTS = ["75%", "75", 75, 0.75, "75.0 %", "约75%", "七成五", None]
+COUNT_VARIANTS = [2, "2", "2个", 2.0, "两个", None]
+RISK_VARIANTS = {"高风险": ["高", "严重", "High"], "中风险": ["中", "一般", "medium"], "无风险": ["无", "", None]}
+RESULT_VARIANTS = {"合格": ["符合", "通过", "pass"], "不合格": ["不符合要求", "不符合", "fail"]}
+
+
+def load_text() -> str:
+    with open(os.path.join(PROJECT_ROOT, "test", "output.json"), encoding="utf-8") as f:
+        detection = json.load(f)
+    return (
+        json.dumps(detection, ensure_ascii=False, indent=2)
+        + "\n\n### 不规范内容总结报告\n\n**一、问题概览**\n- 问题总数：5个\n"
+    )
+
+
+def perturb_detections(count: int, seed: int = 7718) -> list:
+    """用固定随机种子生成一批带有格式偏差的检测JSON"""
+    with open(os.path.join(PROJECT_ROOT, "test", "output.json"), encoding="utf-8") as f:
+        detection = json.load(f)
+    rng = random.Random(seed)
+    batch = []
+    for _ in range(count):
+        variant = copy.deepcopy(detection)
+        assessment = variant["合规性评估"]
+        assessment["合规率"] = rng.choice(RATE_VARIANTS)
+        assessment["关键问题"] = rng.choice(COUNT_VARIANTS)
+        assessment["一般问题"] = rng.choice(COUNT_VARIANTS)
+        for item in variant["详细检测结果"]:
+            if rng.random() < 0.3:
+                item["风险等级"] = rng.choice(RISK_VARIANTS.get(item["风险等级"], [item["风险等级"]]))
+            if rng.random() < 0.2:
+                item["检测结果"] = rng.choice(RESULT_VARIANTS.get(item["检测结果"], [item["检测结果"]]))
+        if rng.random() < 0.05:
+            del variant["详细检测结果"]
+        batch.append(variant)
+    return batch
+
+
+def build_sse_lines(text: str, nodes: int = 8) -> list:
+    events = [{"event": "workflow_started", "task_id": "task", "workflow_run_id": "run",
+               "data": {"workflow_id": "wf", "created_at": 0}}]
+    for index in range(nodes):
+        events.append({"event": "node_started", "data": {"node_id": f"n{index}", "title": f"节点{index}"}})
+        events.append({"event": "node_finished", "data": {
+            "node_id": f"n{index}", "title": f"节点{index}", "status": "succeeded", "elapsed_time": 1.5,
+            "execution_metadata": {"total_tokens": 500, "total_price": "0.001", "currency": "USD"},
+        }})
+    events.append({"event": "workflow_finished", "data": {
+        "status": "succeeded", "outputs": {"text": text}, "total_steps": nodes, "total_tokens": 4000,
+    }})
+    lines = []
+    for event in events:
+        lines.append("data: " + json.dumps(event, ensure_ascii=False))
+        lines.append("")
+    return lines
+
+
+def bench(func, repeat: int, number: int) -> dict:
+    timings = timeit.repeat(func, repeat=repeat, number=number)
+    per_call = [timing / number * 1e6 for timing in timings]
+    return {
+        "best_us": round(min(per_call), 2),
+        "median_us": round(sorted(per_call)[len(per_call) // 2], 2),
+        "ops_per_s": round(1e6 / min(per_call), 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="响应处理函数的微基准")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=100)
+    parser.add_argument("--no-save", action="store_true", help="不保存结果")
+    args = parser.parse_args()
+
+    # 基准关注函数本身的开销，屏蔽日志输出
+    logging.disable(logging.CRITICAL)
+
+    text = load_text()
+    plain_markdown = "### 检测报告\n" + "内容无JSON。\n" * 200
+    blocking_response = {"task_id": "task", "data": {"status": "succeeded", "outputs": {"text": text}}}
+    streaming_data = {"outputs": {"text": text}, "metadata": {"total_tokens": 4000}}
+    sse_lines = build_sse_lines(text)
+    perturbed = perturb_detections(100)
+    normalized = [normalize_detection(item) for item in perturbed]
+    print(f"🧪 扰动输出 {len(perturbed)} 份: 有效 {sum(n.valid for n in normalized)} 份, "
+          f"修复 {sum(len(n.repairs) for n in normalized)} 处")
+
+    cases = {
+        "separate_json_and_markdown.report_marker": lambda: separate_json_and_markdown(text),
+        "separate_json_and_markdown.regex_fallback": lambda: separate_json_and_markdown(
+            text.replace("不规范内容总结报告", "总结")),
+        "separate_json_and_markdown.no_json": lambda: separate_json_and_markdown(plain_markdown),
+        "process_dify_response.blocking": lambda: process_dify_response(copy.deepcopy(blocking_response)),
+        "process_dify_response.streaming": lambda: process_dify_response(copy.deepcopy(streaming_data)),
+        "parse_streaming_response": lambda: parse_streaming_response(sse_lines),
+        "normalize_detection.clean": lambda: normalize_detection(perturbed[0]),
+        "normalize_detection.perturbed_batch100": lambda: [normalize_detection(item) for item in perturbed],
+        "baseline.deepcopy": lambda: copy.deepcopy(blocking_response),
+    }
+
+    results = {}
+    for name, func in cases.items():
+        results[name] = bench(func, args.repeat, args.number)
+        print(f"{name:<48} {results[name]['best_us']:>10.1f}µs  {results[name]['ops_per_s']:>10.1f} ops/s")
+
+    if not args.no_save:
+        path = save_result("micro", {
+            "config": {"repeat": args.repeat, "number": args.number, "text_bytes": len(text.encode("utf-8"))},
+            "results": results,
+        })
+        print(f"📝 结果已保存: {os.path.relpath(path, PROJECT_ROOT)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+检测响应体积基准
+
+用 test/output.json（与真实Dify输出同等规模）构造一次典型的 /api/detect 响应，
+对比默认响应、精简响应（compact）、前端字段投影（fields）在不压缩、gzip、brotli 下的字节数，
+以及标准库 json 与 orjson 的序列化耗时。结果保存为JSON，便于跨提交对比。
+
+用法:
+    python benchmarks/bench_payload.py
+"""
+
+import os
+import sys
+import json
+import timeit
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from results import PROJECT_ROOT, save_result  # noqa: E402
+
+sys.path.insert(0, PROJECT_ROOT)
+from backend.compact_response import (  # noqa: E402
+    FastJSONResponse,
+    brotli_available,
+    compact_result,
+    compress,
+    parse_fields,
+    project,
+)
+from backend.dify_client import process_dify_response  # noqa: E402
+
+# 前端检测结果页实际用到的字段
+UI_FIELDS = ("detection_id,dify_result.outputs.json_data,dify_result.outputs.markdown_content,"
+             "dify_result.metadata,file_info,input_params,usage")
+
+
+def typical_result() -> dict:
+    with open(os.path.join(PROJECT_ROOT, "test", "output.json"), encoding="utf-8") as f:
+        detection = json.load(f)
+    text = (json.dumps(detection, ensure_ascii=False, indent=2)
+            + "\n\n### 不规范内容总结报告\n\n**一、问题概览**\n- 问题总数：5个\n" + "- 整改建议说明。\n" * 20)
+    dify_result = process_dify_response({"data": {
+        "outputs": {"text": text},
+        "metadata": {"total_tokens": 4000, "total_price": "0.012", "currency": "USD", "elapsed_time": 35.2},
+    }})
+    return {
+        "success": True,
+        "detection_id": "0b1f6c1e-0000-4000-8000-000000000000",
+        "detection_time": "2025-01-01 10:00:00",
+        "file_info": {"filename": "label.jpg", "file_type": "image/jpeg", "file_size": 316362},
+        "files": [{"filename": "label.jpg", "file_type": "image/jpeg", "file_size": 316362,
+                   "transfer_method": "local_file", "upload_ms": 120.5}],
+        "input_params": {"Foodtype": "糕点", "PackageFoodType": "直接提供给消费者的预包装食品",
+                         "SingleOrMulti": "单件", "PackageSize": "最大表面面积大于35cm2", "SpecialRequirement": None},
+        "dify_result": dify_result,
+        "usage": {"total_tokens": 4000, "total_price": 0.012, "currency": "USD", "price_source": "dify",
+                  "elapsed_time": 35.2},
+        "prescreen": None,
+        "prompt_version": "3f2a9c0d1e4b5a67",
+        "cache": "miss",
+        "near_duplicate": None,
+        "message": "检测完成",
+    }
+
+
+def starlette_default(content) -> bytes:
+    # 与 fastapi/starlette 默认 JSONResponse 的序列化方式一致
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="检测响应体积基准")
+    parser.add_argument("--number", type=int, default=500)
+    parser.add_argument("--no-save", action="store_true", help="不保存结果")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    result = typical_result()
+    variants = {
+        "default": result,
+        "compact": compact_result(result),
+        "compact+fields": project(compact_result(result), parse_fields(UI_FIELDS)),
+    }
+    encodings = ["identity", "gzip"] + (["br"] if brotli_available() else [])
+
+    sizes = {}
+    baseline = len(starlette_default(result))
+    for name, content in variants.items():
+        body = FastJSONResponse(content).body
+        sizes[name] = {"identity": len(body)}
+        for encoding in encodings[1:]:
+            sizes[name][encoding] = len(compress(body, encoding))
+        cells = "  ".join(f"{encoding} {sizes[name][encoding]:>7}B ({sizes[name][encoding] / baseline:>6.1%})"
+                          for encoding in encodings)
+        print(f"{name:<16} {cells}")
+    if "br" not in encodings:
+        print("（未安装 brotli，跳过 br）")
+
+    serialize = {
+        "json_us": round(min(timeit.repeat(lambda: starlette_default(result), number=args.number, repeat=3))
+                         / args.number * 1e6, 1),
+        "orjson_us": round(min(timeit.repeat(lambda: FastJSONResponse(result).body, number=args.number, repeat=3))
+                           / args.number * 1e6, 1),
+    }
+    print(f"序列化: json {serialize['json_us']}µs, orjson {serialize['orjson_us']}µs")
+
+    if not args.no_save:
+        path = save_result("payload", {"baseline_bytes": baseline, "sizes": sizes, "serialize": serialize})
+        print(f"📝 结果已保存: {os.path.relpath(path, PROJECT_ROOT)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
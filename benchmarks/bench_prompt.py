@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+按类别组装提示词的输入令牌基准
+
+对表单中每种 产品类型 × 包装尺寸 × 特殊要求（未填写 / 国产 / 进口）的组合，按 prompt_assembly 组装提示词，
+对比完整提示词与组装后的字符数、估算令牌数（中文按字计，见 prompt_assembly.estimate_tokens），
+以及组装本身的耗时（首次组装 / 命中缓存）。
+
+输入令牌减少带来的延迟变化按 --prefill-tps（模型预填充吞吐，令牌/秒）估算，只反映预填充阶段；
+实际的端到端延迟变化需要在工作流引用 LabelPrompt 变量的真实Dify上，分别以 PROMPT_ASSEMBLY=off / input
+运行检测对比。结果保存为JSON，便于跨提交对比。
+
+用法:
+    python benchmarks/bench_prompt.py
+    python benchmarks/bench_prompt.py --prefill-tps 1500
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from results import PROJECT_ROOT, save_result  # noqa: E402
+
+sys.path.insert(0, PROJECT_ROOT)
+from backend.prompt_assembly import (  # noqa: E402
+    DEFAULT_PROMPT_FILE,
+    PromptAssembler,
+    assemble,
+    estimate_tokens,
+    prompt_context,
+)
+
+# 与前端表单的选项一致
+PACKAGE_FOOD_TYPES = ("直接提供给消费者的预包装食品", "非直接提供给消费者的预包装食品")
+PACKAGE_SIZES = (
+    "包装总表面积≤100cm2或最大表面面积≤20cm2的食品",
+    "包装的总面积小于100cm2的食品",
+    "最大表面面积大于35cm2",
+    "最大表面面积小于10cm2",
+    "最大表面面积小于等于35cm2",
+)
+SPECIAL_REQUIREMENTS = ("", "国产", "进口食品")
+IMPORTED_LABELS = {True: "是", False: "否", None: "未知"}
+
+
+def time_us(func, number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return round((time.perf_counter() - started) / number * 1e6, 2)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="按类别组装提示词的输入令牌基准")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT_FILE, help="提示词文件")
+    parser.add_argument("--prefill-tps", type=float, default=2000.0, help="估算延迟用的预填充吞吐（令牌/秒）")
+    parser.add_argument("--number", type=int, default=2000, help="组装耗时的重复次数")
+    parser.add_argument("--no-save", action="store_true", help="不保存结果")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with open(args.prompt, encoding="utf-8") as f:
+        template = f.read()
+    full = assemble(template)
+    full_tokens = estimate_tokens(full)
+    print(f"完整提示词: {len(full)} 字符, 约 {full_tokens} 令牌")
+    print(f"{'产品类型':<6} {'包装尺寸':<24} {'进口':<4} {'字符':>6} {'令牌':>6} {'减少':>7} {'预填充':>9}")
+
+    rows = []
+    for package_food_type, package_size, special in itertools.product(
+            PACKAGE_FOOD_TYPES, PACKAGE_SIZES, SPECIAL_REQUIREMENTS):
+        context = prompt_context(package_food_type, package_size, special)
+        prompt = assemble(template, context)
+        tokens = estimate_tokens(prompt)
+        row = {
+            "package_food_type": package_food_type,
+            "package_size": package_size,
+            "imported": context["imported"],
+            "chars": len(prompt),
+            "tokens": tokens,
+            "saved_tokens": full_tokens - tokens,
+            "saved_pct": round((full_tokens - tokens) / full_tokens * 100, 1),
+            "prefill_saved_ms": round((full_tokens - tokens) / args.prefill_tps * 1000, 1),
+        }
+        rows.append(row)
+        kind = "非直接" if package_food_type.startswith("非直接") else "直接"
+        print(f"{kind:<6} {package_size[:22]:<24} {IMPORTED_LABELS[context['imported']]:<4} "
+              f"{row['chars']:>6} {tokens:>6} {row['saved_pct']:>6}% {row['prefill_saved_ms']:>7}ms")
+
+    context = prompt_context(PACKAGE_FOOD_TYPES[1], PACKAGE_SIZES[2], "")
+    assembler = PromptAssembler(args.prompt)
+    overhead = {
+        "assemble_us": time_us(lambda: assemble(template, context), args.number),
+        "cached_us": time_us(lambda: assembler.assemble(context), args.number),
+    }
+    average = sum(row["saved_pct"] for row in rows) / len(rows)
+    print(f"平均减少 {average:.1f}%（预填充按 {args.prefill_tps:g} 令牌/秒估算）; "
+          f"组装耗时: 首次 {overhead['assemble_us']}µs, 命中缓存 {overhead['cached_us']}µs")
+
+    if not args.no_save:
+        path = save_result("prompt", {
+            "full_chars": len(full), "full_tokens": full_tokens, "prefill_tps": args.prefill_tps,
+            "categories": rows, "average_saved_pct": round(average, 1), "overhead": overhead,
+        })
+        print(f"📝 结果已保存: {os.path.relpath(path, PROJECT_ROOT)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+GB 7718 规则引擎基准
+
+用固定随机种子合成数千条标签文字（随机缺失必备项、注入常见错误、模拟OCR空格和全角字符），
+对比三种执行方式处理整批文字的耗时:
+
+    compiled   Aho-Corasick 一次扫描 + 锚点预过滤正则（生产路径）
+    no_prefilter  Aho-Corasick 一次扫描，但所有正则都执行
+    naive      逐个关键词做子串查找 + 所有正则都执行（每条规则各自扫描文字）
+
+三种方式的检查结论必须一致，否则基准直接失败。
+
+另外向规则目录追加一条含 N 个合成关键词的规则（--scale），观察关键词数量增长时
+自动机一次扫描与逐词查找的差距。结果保存为JSON，便于跨提交对比。
+
+用法:
+    python benchmarks/bench_rules.py
+    python benchmarks/bench_rules.py --labels 10000 --repeat 5 --scale 0 1000 5000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from results import PROJECT_ROOT, percentile, save_result  # noqa: E402
+
+sys.path.insert(0, PROJECT_ROOT)
+from backend.rule_engine import DEFAULT_CATALOGUE_PATH, RuleCatalogue, default_catalogue, normalize_text  # noqa: E402
+
+# (片段, 缺陷版本) —— 缺陷版本为 None 时表示该项直接缺失
+FRAGMENTS = [
+    ("产品名称：{name}", None),
+    ("配料：小麦粉、白砂糖、{oil}、鸡蛋、{filling}、食品添加剂（山梨酸钾）", "小麦粉、白砂糖、{oil}、鸡蛋、{filling}"),
+    ("致敏物质提示：本产品含有小麦、鸡蛋", None),
+    ("营养成分表 项目 每100克 营养素参考值% 能量 {energy}千焦 蛋白质 6.0克 脂肪 20.1克", "营养成分表 蛋白质 6.0克"),
+    ("净含量：{weight}克", "净含量：{weight}"),
+    ("生产日期：{year}年{month:02d}月{day:02d}日 保质期：{shelf}个月", "生产日期：{day:02d}/{month:02d}/{year} 保质期：{shelf}个月"),
+    ("贮存条件：置于阴凉干燥处，避免阳光直射", None),
+    ("生产商：{company}有限公司 地址：{city}市工业园区{no}号 电话：0{area}-{phone}", "生产商：{company}有限公司 地址：{city}市"),
+    ("食品生产许可证编号：SC{license}", "食品生产许可证编号：SC{short_license}"),
+    ("产品标准代号：GB/T {standard}", None),
+]
+
+EXTRA_CLAIMS = ["不添加防腐剂", "零添加蔗糖", "可辅助降血糖", "精选原料 匠心工艺", "开袋即食"]
+
+
+def synthesize_labels(count: int, seed: int = 7718) -> list:
+    rng = random.Random(seed)
+    labels = []
+    for _ in range(count):
+        values = {
+            "name": rng.choice(["广式月饼", "全麦面包", "苏打饼干", "原味酸奶", "牛肉干", "海苔卷"]),
+            "oil": rng.choice(["植物油", "黄油", "棕榈油"]),
+            "filling": rng.choice(["莲蓉", "豆沙", "五仁", "奶黄"]),
+            "energy": rng.randint(800, 2400),
+            "weight": rng.choice([50, 100, 250, 500, 1000]),
+            "year": rng.randint(2023, 2025), "month": rng.randint(1, 12), "day": rng.randint(1, 28),
+            "shelf": rng.choice([3, 6, 9, 12]),
+            "company": rng.choice(["稻香村", "好味来", "丰收", "金穗"]),
+            "city": rng.choice(["北京", "苏州", "广州", "成都"]), "no": rng.randint(1, 999),
+            "area": rng.randint(10, 999), "phone": rng.randint(1000000, 99999999),
+            "license": "".join(str(rng.randint(0, 9)) for _ in range(14)),
+            "short_license": "".join(str(rng.randint(0, 9)) for _ in range(rng.randint(8, 13))),
+            "standard": rng.choice(["19855", "20977", "20981", "23780"]),
+        }
+        lines = []
+        for good, defective in FRAGMENTS:
+            roll = rng.random()
+            if roll < 0.08:
+                continue
+            template = defective if roll < 0.2 and defective else good
+            lines.append(template.format(**values))
+        if rng.random() < 0.3:
+            lines.insert(rng.randrange(len(lines) + 1), rng.choice(EXTRA_CLAIMS))
+        rng.shuffle(lines)
+        text = "\n".join(lines)
+        # 模拟OCR输出：字间空格与全角字符
+        if rng.random() < 0.3:
+            text = " ".join(text)
+        if rng.random() < 0.3:
+            text = text.replace(":", "：").translate(str.maketrans("0123456789", "０１２３４５６７８９"))
+        labels.append(text)
+    return labels
+
+
+def scaled_catalogue(extra_keywords: int, seed: int = 7718) -> RuleCatalogue:
+    """在默认规则目录上追加一条含大量合成关键词的禁用词规则"""
+    rng = random.Random(seed)
+    with open(DEFAULT_CATALOGUE_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+    keywords = {"".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(3)) for _ in range(extra_keywords)}
+    data["rules"].append({
+        "id": "synthetic", "检测类别": "基本要求", "检测项目": "合成禁用词", "标准要求": "基准用",
+        "风险等级": "低风险", "违反条款": "基准用", "整改建议": "基准用",
+        "forbidden": {"命中合成禁用词": {"keywords": sorted(keywords)}},
+    })
+    return RuleCatalogue(data)
+
+
+def naive_evaluator(catalogue: RuleCatalogue):
+    """逐个关键词做子串查找，不使用自动机，也不做正则预过滤"""
+    keywords = catalogue.automaton.keywords
+
+    def evaluate(text):
+        normalized = normalize_text(text)
+        hits = {index for index, keyword in enumerate(keywords) if keyword in normalized}
+        return catalogue.evaluate_normalized(normalized, hits, {}, prefilter=False)
+
+    return evaluate
+
+
+def run_batch(evaluate, labels: list, repeat: int) -> dict:
+    best, per_label = None, []
+    for _ in range(repeat):
+        timings = []
+        started = time.perf_counter()
+        for text in labels:
+            label_started = time.perf_counter()
+            evaluate(text)
+            timings.append(time.perf_counter() - label_started)
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best, per_label = elapsed, timings
+    return {
+        "batch_s": round(best, 4),
+        "labels_per_s": round(len(labels) / best, 1),
+        "per_label_us": {
+            "p50": round(percentile(per_label, 50) * 1e6, 1),
+            "p99": round(percentile(per_label, 99) * 1e6, 1),
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="GB 7718 规则引擎基准")
+    parser.add_argument("--labels", type=int, default=5000, help="合成标签数量")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=int, nargs="*", default=[1000, 5000], help="追加的合成关键词数量")
+    parser.add_argument("--no-save", action="store_true", help="不保存结果")
+    args = parser.parse_args()
+
+    compile_started = time.perf_counter()
+    catalogue = default_catalogue()
+    compile_ms = (time.perf_counter() - compile_started) * 1000
+    keywords = catalogue.automaton.keywords
+    labels = synthesize_labels(args.labels)
+
+    strategies = {
+        "compiled": lambda text: catalogue.evaluate(text, {}),
+        "no_prefilter": lambda text: catalogue.evaluate(text, {}, prefilter=False),
+        "naive": naive_evaluator(catalogue),
+    }
+
+    # 先校验三种方式结论一致
+    for text in labels[:500]:
+        expected = strategies["compiled"](text)
+        for name in ("no_prefilter", "naive"):
+            if strategies[name](text) != expected:
+                print(f"❌ {name} 的结论与 compiled 不一致:\n{text}")
+                return 1
+
+    failed = sum(
+        1 for text in labels for finding in catalogue.evaluate(text, {}) if finding["检测结果"] == "不合格"
+    )
+    print(f"📚 规则 {len(catalogue.rules)} 条, 关键词 {len(keywords)} 个, 正则 {catalogue.pattern_count} 个, "
+          f"编译 {compile_ms:.1f}ms")
+    print(f"🏷️  标签 {len(labels)} 条, 平均 {sum(map(len, labels)) / len(labels):.0f} 字符, 不合格项共 {failed} 个")
+
+    results = {}
+    for name, evaluate in strategies.items():
+        results[name] = run_batch(evaluate, labels, args.repeat)
+        print(f"{name:<14} {results[name]['batch_s']:>8.3f}s  {results[name]['labels_per_s']:>10.1f} 条/s  "
+              f"p50 {results[name]['per_label_us']['p50']:>7.1f}µs  p99 {results[name]['per_label_us']['p99']:>7.1f}µs")
+
+    scaling = {}
+    for extra in args.scale:
+        scaled = scaled_catalogue(extra)
+        scaling[extra] = {
+            "keywords": len(scaled.automaton.keywords),
+            "compiled": run_batch(lambda text: scaled.evaluate(text, {}), labels, args.repeat),
+            "naive": run_batch(naive_evaluator(scaled), labels, args.repeat),
+        }
+        print(f"关键词 {scaling[extra]['keywords']:>6} 个: compiled {scaling[extra]['compiled']['labels_per_s']:>9.1f} 条/s, "
+              f"naive {scaling[extra]['naive']['labels_per_s']:>9.1f} 条/s")
+
+    if not args.no_save:
+        path = save_result("rules", {
+            "config": {"labels": args.labels, "repeat": args.repeat, "scale": args.scale},
+            "catalogue": {"version": catalogue.version, "rules": len(catalogue.rules),
+                          "keywords": len(keywords), "patterns": catalogue.pattern_count,
+                          "compile_ms": round(compile_ms, 2)},
+            "results": results,
+            "scaling": scaling,
+        })
+        print(f"📝 结果已保存: {os.path.relpath(path, PROJECT_ROOT)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
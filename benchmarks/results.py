@@ -0,0 +1,89 @@
+"""
+基准测试结果的保存与对比
+
+结果以JSON保存到 benchmarks/results/ 下，文件名包含基准名称与git提交号，
+便于在不同提交之间对比:
+
+    python benchmarks/results.py benchmarks/results/micro-aaa.json benchmarks/results/micro-bbb.json
+"""
+
+import os
+import sys
+import json
+import math
+import platform
+import subprocess
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def percentile(values, q: float) -> float:
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def save_result(name: str, data: dict) -> str:
+    """保存基准结果，返回文件路径"""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    commit = git_commit()
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    result = {
+        "benchmark": name,
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        **data,
+    }
+    path = os.path.join(RESULTS_DIR, f"{name}-{commit}-{timestamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def _flatten(data, prefix=""):
+    items = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            items.update(_flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        items[prefix.rstrip(".")] = data
+    return items
+
+
+def compare(base_path: str, head_path: str):
+    """逐项对比两次结果中的数值指标"""
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(head_path, encoding="utf-8") as f:
+        head = json.load(f)
+    base_metrics = _flatten(base.get("results", {}))
+    head_metrics = _flatten(head.get("results", {}))
+
+    print(f"对比 {base.get('commit')} -> {head.get('commit')} ({base.get('benchmark')})")
+    for key in sorted(set(base_metrics) & set(head_metrics)):
+        old, new = base_metrics[key], head_metrics[key]
+        change = (new - old) / old * 100 if old else 0.0
+        print(f"{key:<60} {old:>14.4f} {new:>14.4f} {change:>+8.1f}%")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("用法: python benchmarks/results.py <基准结果.json> <对比结果.json>")
+        sys.exit(2)
+    compare(sys.argv[1], sys.argv[2])
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+后端冷启动基准测试
+
+1. 使用 `python -X importtime` 在全新解释器中导入检测服务入口模块，
+   解析每个模块的累计导入耗时，输出最慢的模块；
+2. （可选 --serve）通过 run_backend_simple.py 真正启动服务，
+   测量从进程启动到 /health 返回 200 的耗时。
+
+每次运行的结果追加到 benchmarks/results/startup.jsonl（附带git提交号），
+用于跟踪启动时间随提交的变化。超出冷启动预算时以非零状态码退出。
+
+用法:
+    python benchmarks/startup_importtime.py
+    python benchmarks/startup_importtime.py --serve --runs 5
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = os.path.join(PROJECT_ROOT, "benchmarks", "results", "startup.jsonl")
+
+ENTRY_MODULE = "backend.main_simple_fixed"
+
+# 检测服务冷启动预算（毫秒）
+# - 入口模块导入：fastapi + httpx 本身约占 600~900ms，预留余量
+# - 进程启动到 /health 可用：包含解释器启动、导入和uvicorn启动
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500"))
+SERVE_BUDGET_MS = float(os.getenv("STARTUP_SERVE_BUDGET_MS", "3000"))
+
+# 简化版服务在导入阶段不应加载的可选子系统
+FORBIDDEN_AT_IMPORT = ["motor", "beanie", "pymongo", "numpy", "PIL", "requests", "pyarrow", "openpyxl"]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def measure_import(module: str) -> dict:
+    """在全新解释器中导入模块，解析 -X importtime 输出"""
+    env = dict(os.environ, PYTHONPATH=PROJECT_ROOT)
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = {
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "depth": (len(indent) - 1) // 2,
+            }
+
+    entry = modules.get(module, {})
+    loaded = set(modules)
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(entry.get("cumulative_us", 0) / 1000, 1),
+        "module_count": len(modules),
+        "top_self": sorted(
+            ({"module": name, "self_ms": round(info["self_us"] / 1000, 1)} for name, info in modules.items()),
+            key=lambda item: item["self_ms"], reverse=True,
+        )[:15],
+        "top_level": sorted(
+            ({"module": name, "cumulative_ms": round(info["cumulative_us"] / 1000, 1)}
+             for name, info in modules.items() if info["depth"] <= 1),
+            key=lambda item: item["cumulative_ms"], reverse=True,
+        )[:15],
+        "forbidden_loaded": [name for name in FORBIDDEN_AT_IMPORT if name in loaded],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_serve(timeout: float = 30.0) -> float:
+    """启动服务并测量到 /health 可用的耗时（毫秒）"""
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=PROJECT_ROOT, BACKEND_HOST="127.0.0.1",
+               BACKEND_PORT=str(port), BACKEND_RELOAD="false")
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "run_backend_simple.py"], cwd=PROJECT_ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"服务在 {timeout}s 内未就绪")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="后端冷启动基准测试")
+    parser.add_argument("--module", default=ENTRY_MODULE, help="入口模块")
+    parser.add_argument("--runs", type=int, default=3, help="重复次数，取中位数")
+    parser.add_argument("--serve", action="store_true", help="同时测量进程启动到 /health 可用的耗时")
+    parser.add_argument("--no-save", action="store_true", help="不写入结果历史")
+    args = parser.parse_args()
+
+    samples = [measure_import(args.module) for _ in range(args.runs)]
+    median_run = sorted(samples, key=lambda sample: sample["import_ms"])[len(samples) // 2]
+
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "module": args.module,
+        "runs": args.runs,
+        "import_ms": statistics.median(sample["import_ms"] for sample in samples),
+        "process_wall_ms": statistics.median(sample["wall_ms"] for sample in samples),
+        "import_budget_ms": IMPORT_BUDGET_MS,
+        "module_count": median_run["module_count"],
+        "forbidden_loaded": median_run["forbidden_loaded"],
+        "top_level": median_run["top_level"],
+        "top_self": median_run["top_self"],
+    }
+
+    if args.serve:
+        result["serve_ms"] = round(statistics.median(measure_serve() for _ in range(args.runs)), 1)
+        result["serve_budget_ms"] = SERVE_BUDGET_MS
+
+    print(f"📦 {args.module} 导入耗时: {result['import_ms']}ms (预算 {IMPORT_BUDGET_MS:.0f}ms)")
+    print(f"🐍 解释器启动+导入: {result['process_wall_ms']}ms, 共加载 {result['module_count']} 个模块")
+    if "serve_ms" in result:
+        print(f"🚀 进程启动到 /health 可用: {result['serve_ms']}ms (预算 {SERVE_BUDGET_MS:.0f}ms)")
+    print("最慢的顶层导入:")
+    for item in result["top_level"][:10]:
+        print(f"   {item['cumulative_ms']:>8.1f}ms  {item['module']}")
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+        with open(RESULTS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        print(f"📝 结果已追加到 {os.path.relpath(RESULTS_FILE, PROJECT_ROOT)}")
+
+    failed = False
+    if result["forbidden_loaded"]:
+        print(f"❌ 导入阶段加载了可选子系统: {', '.join(result['forbidden_loaded'])}")
+        failed = True
+    if result["import_ms"] > IMPORT_BUDGET_MS:
+        print("❌ 导入耗时超出预算")
+        failed = True
+    if result.get("serve_ms", 0) > SERVE_BUDGET_MS:
+        print("❌ 冷启动耗时超出预算")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -69,7 +69,7 @@ print_success "必要文件检查通过"
 
 # 创建必要目录
 print_info "创建必要目录..."
-mkdir -p uploads results
+mkdir -p uploads
 print_success "目录创建完成"
 
 # 设置脚本权限
@@ -91,7 +91,6 @@ cp docker/supervisord.conf $DEPLOY_DIR/docker/
 
 # 创建必要的目录结构
 mkdir -p $DEPLOY_DIR/uploads
-mkdir -p $DEPLOY_DIR/results
 
 # 设置脚本权限
 chmod +x $DEPLOY_DIR/deploy_on_server.sh
@@ -6,6 +6,7 @@
 
 import sys
 import os
+import importlib.util
 import uvicorn
 
 # 添加项目根目录到Python路径
@@ -25,25 +26,23 @@ if __name__ == "__main__":
     print("   - 无数据库依赖")
     print("-" * 50)
     
-    # 测试简化版导入
-    try:
-        print("🔍 测试简化版模块导入...")
-        from backend.main_simple_fixed import app
-        print("✅ 成功导入简化版 backend.main_simple_fixed")
-        
-    except ImportError as e:
-        print(f"❌ 导入错误: {e}")
-        print("请检查依赖安装")
+    # 只检查模块是否存在，不提前导入：真正的导入交给uvicorn完成，避免启动时导入两次
+    if importlib.util.find_spec("backend.main_simple_fixed") is None:
+        print("❌ 找不到模块 backend.main_simple_fixed")
+        print("请检查项目目录结构")
         sys.exit(1)
     
-    print("✅ 所有模块导入成功，启动服务器...")
+    # 热重载会额外启动文件监控进程并在子进程中重新导入应用，仅在开发环境开启
+    reload = os.getenv("BACKEND_RELOAD", "false").lower() in ("1", "true", "yes")
+    
+    print(f"✅ 启动服务器... (热重载: {'开启' if reload else '关闭'})")
     print("-" * 50)
     
     # 启动uvicorn服务器
     uvicorn.run(
         "backend.main_simple_fixed:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
+        host=os.getenv("BACKEND_HOST", "0.0.0.0"),
+        port=int(os.getenv("BACKEND_PORT", "8000")),
+        reload=reload,
         log_level="info"
     )
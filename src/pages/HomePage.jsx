@@ -1,4 +1,4 @@
-import React, { useState } from 'react'
+import React, { useRef, useState } from 'react'
 import { 
   Card, 
   Upload, 
@@ -29,7 +29,7 @@ import UploadArea from '../components/UploadArea'
 import DetectionForm from '../components/DetectionForm'
 import DetectionResults from '../components/DetectionResults'
 import MarkdownDetectionResults from '../components/MarkdownDetectionResults'
-import { detectWithDify } from '../services/api'
+import { detectWithDify, uploadFile } from '../services/api'
 
 const { Sider, Content } = Layout
 const { Title, Text } = Typography
@@ -41,10 +41,24 @@ const HomePage = () => {
   const [detectionProgress, setDetectionProgress] = useState(0)
   const [detectionResults, setDetectionResults] = useState(null)
   const [resultType, setResultType] = useState(null) // 'legacy' 或 'markdown'
+  // 上一次提交的内容签名与幂等键：内容不变时重试复用同一个键
+  const lastSubmission = useRef({ signature: null, key: null })
+  // 预上传：文件 uid -> 上传句柄（Promise，失败时为 null）
+  const preUploads = useRef({})
 
   const handleFileUpload = (info) => {
     const { fileList } = info
     setUploadedFiles(fileList)
+
+    // 选择图片后立即预上传，用户填写表单期间后端就把图片上传到Dify
+    const routing = form.getFieldsValue(['PackageFoodType', 'PackageSize', 'SpecialRequirement'])
+    fileList.forEach(file => {
+      if (file.originFileObj && !(file.uid in preUploads.current)) {
+        preUploads.current[file.uid] = uploadFile(file.originFileObj, routing)
+          .then(response => response?.upload_id || null)
+          .catch(() => null)
+      }
+    })
     
     if (info.file.status === 'done') {
       message.success(`${info.file.name} 文件上传成功`)
@@ -76,10 +90,18 @@ const HomePage = () => {
 
       // 调用检测API
       const formData = new FormData()
-      // 只取第一个文件，因为新的API只支持单个文件
-      if (uploadedFiles.length > 0) {
-        formData.append('file', uploadedFiles[0].originFileObj)
+      // 同一产品的所有标签面一次提交；已预上传的文件只提交句柄，其余直接提交文件
+      const uploadIds = await Promise.all(uploadedFiles.map(uploaded => preUploads.current[uploaded.uid] || null))
+      const appendFiles = (useUploadIds) => {
+        uploadedFiles.forEach((uploaded, index) => {
+          if (useUploadIds && uploadIds[index]) {
+            formData.append('UploadId', uploadIds[index])
+          } else if (uploaded.originFileObj) {
+            formData.append('file', uploaded.originFileObj)
+          }
+        })
       }
+      appendFiles(true)
       
       // 添加表单数据
       Object.keys(values).forEach(key => {
@@ -99,7 +121,31 @@ const HomePage = () => {
         }
       })
 
-      const results = await detectWithDify(formData)
+      const signature = JSON.stringify([
+        ...uploadedFiles.map(({ originFileObj: file }) => [file?.name, file?.size, file?.lastModified]),
+        ...[...formData.entries()].filter(([key]) => key !== 'file' && key !== 'UploadId')
+      ])
+      if (lastSubmission.current.signature !== signature) {
+        lastSubmission.current = {
+          signature,
+          key: `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`
+        }
+      }
+
+      let results
+      try {
+        results = await detectWithDify(formData, lastSubmission.current.key)
+      } catch (error) {
+        if (!uploadIds.some(Boolean) || error.response?.status !== 404) {
+          throw error
+        }
+        // 预上传句柄已过期，改为直接提交全部文件
+        uploadedFiles.forEach(uploaded => delete preUploads.current[uploaded.uid])
+        formData.delete('UploadId')
+        formData.delete('file')
+        appendFiles(false)
+        results = await detectWithDify(formData, lastSubmission.current.key)
+      }
       
       clearInterval(progressInterval)
       setDetectionProgress(100)
@@ -155,6 +201,7 @@ const HomePage = () => {
   }
 
   const handleReset = () => {
+    preUploads.current = {}
     setUploadedFiles([])
     setDetectionResults(null)
     setResultType(null)
@@ -34,26 +34,38 @@ api.interceptors.response.use(
 // API函数
 export const detectLabel = async (formData) => {
   try {
-    const response = await api.post('/detect', formData)
+    // compact=1: 已解析出 json_data 和总结报告时不再重复返回大模型原文（只有 JSON 时保留原文）
+    const response = await api.post('/detect', formData, { params: { compact: 1 } })
     return response
   } catch (error) {
     throw error
   }
 }
 
-export const detectWithDify = async (formData) => {
+export const detectWithDify = async (formData, idempotencyKey) => {
   try {
-    const response = await api.post('/detect', formData)
+    // compact=1: 已解析出 json_data 和总结报告时不再重复返回大模型原文（只有 JSON 时保留原文）
+    // 同一次提交重试时带上相同的幂等键，后端复用进行中或已完成的检测
+    const response = await api.post('/detect', formData, {
+      params: { compact: 1 },
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {}
+    })
     return response
   } catch (error) {
     throw error
   }
 }
 
-export const uploadFile = async (file) => {
+// routing: 已填写的 PackageFoodType / PackageSize / SpecialRequirement，后端据此把文件预上传到检测要用的工作流
+export const uploadFile = async (file, routing = {}) => {
   try {
     const formData = new FormData()
     formData.append('file', file)
+    Object.entries(routing).forEach(([key, value]) => {
+      if (value) {
+        formData.append(key, Array.isArray(value) ? value.join(',') : value)
+      }
+    })
     const response = await api.post('/upload', formData)
     return response
   } catch (error) {
@@ -61,6 +73,16 @@ export const uploadFile = async (file) => {
   }
 }
 
+// 整改后定向复核：只重新检测原记录中不合格的项目（formData 中放新的标签图片或 UploadId）
+export const recheckDetection = async (recordId, formData) => {
+  try {
+    const response = await api.post(`/detections/${recordId}/recheck`, formData)
+    return response
+  } catch (error) {
+    throw error
+  }
+}
+
 export const getDetectionHistory = async (params = {}) => {
   try {
     const response = await api.get('/history', { params })
@@ -21,7 +21,7 @@ echo "   - 图片上传"
 echo "   - Dify API调用"
 echo "   - 结果展示"
 echo "   - 无数据库依赖"
-python run_backend_simple.py &
+BACKEND_RELOAD=true python run_backend_simple.py &
 BACKEND_PID=$!
 
 # 等待后端服务启动
@@ -37,7 +37,8 @@ echo "✅ MVP系统启动完成！"
 echo "📱 前端地址: http://localhost:3000"
 echo "🔧 后端地址: http://localhost:8000"
 echo "📚 API文档: http://localhost:8000/docs"
-echo "🧪 Dify测试: http://localhost:8000/api/test-dify"
+echo "🩺 Dify状态: http://localhost:8000/health"
+echo "🧪 Dify完整诊断: http://localhost:8000/api/test-dify"
 echo ""
 echo "🎯 MVP功能说明："
 echo "   1. 上传图片文件"
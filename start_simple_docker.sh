@@ -4,7 +4,7 @@
 echo "Starting Food Label Inspection Application in Docker..."
 
 # 创建必要的目录
-mkdir -p /app/uploads /app/results /var/log/nginx /var/log/supervisor
+mkdir -p /app/uploads /var/log/nginx /var/log/supervisor
 
 # 设置权限
 chown -R www-data:www-data /var/www/html
@@ -0,0 +1,49 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+import httpx
+import pytest
+
+# 保证从任意目录运行 pytest 时都能导入 backend 包
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# 测试环境没有MongoDB，默认不写入费用台账
+os.environ.setdefault("COST_LEDGER_ENABLED", "false")
+os.environ.setdefault("DETECTION_HISTORY_ENABLED", "false")
+# 测试请求都来自同一个IP，未登记的 API Key 共用一个令牌桶，默认关闭限流（限流测试自行开启）
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+# 并发测试反复提交同一张图片，默认关闭结果缓存
+os.environ.setdefault("RESULT_CACHE_SIZE", "0")
+# 上传文件写入临时暂存目录，不污染工作目录
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="label-spool-"))
+
+
+@pytest.fixture
+def dify_mock():
+    """用 httpx.MockTransport 模拟Dify并运行一段异步场景
+
+    dify_mock(handler, scenario, app=None) 把到Dify的HTTP客户端换成 handler 应答，
+    在新的事件循环中运行 scenario(client) 并返回其结果；client 是连到 app（默认 main_simple.app）的客户端。
+    结束时总会关闭到Dify的HTTP客户端，不影响后续测试。
+    """
+    from backend import dify_client
+
+    def run(handler, scenario, app=None):
+        if app is None:
+            from backend.main_simple import app
+
+        async def main():
+            dify_client.set_http_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+            try:
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                    return await scenario(client)
+            finally:
+                await dify_client.close_http_client()
+
+        return asyncio.run(main())
+
+    return run
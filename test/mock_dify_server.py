@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+本地Dify模拟服务（用于负载与延迟测试，不消耗真实Dify的令牌）
+
+实现的接口:
+    POST /v1/files/upload                     文件上传，返回201和文件ID
+    POST /v1/workflows/run                    工作流运行，支持 blocking / streaming(SSE)
+    POST /v1/workflows/tasks/{task_id}/stop   停止流式任务
+    GET  /v1/info                             应用基本信息（健康探测）
+    GET  /mock/config  POST /mock/config      查看/在运行时修改故障注入配置
+    GET  /mock/stats                          请求统计
+
+回放: 默认回放 test/output.json；--replay 可指定JSON/文本文件或目录（目录内文件轮流回放）。
+
+故障注入:
+    --latency      工作流耗时分布，如 fixed:0.5 / uniform:0.2,2 / normal:40,10 / lognormal:3.6,0.4
+    --upload-latency  文件上传耗时分布
+    --error-rate   返回 500 错误的比例
+    --reset-rate   响应中途断开连接的比例
+    --malformed-rate  返回损坏JSON（blocking）或损坏SSE事件（streaming）的比例
+
+用法:
+    python test/mock_dify_server.py --port 5001 --latency normal:2,0.5 --error-rate 0.05
+
+然后让后端指向它:
+    DIFY_BASE_URL=http://127.0.0.1:5001/v1 python run_backend_simple.py
+    DIFY_BASE_URL=http://127.0.0.1:5001/v1 bash test/test_workflow.sh
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import itertools
+from typing import Optional, List, Dict, Any
+
+from fastapi import FastAPI, Request, Form, File, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REPLAY = os.path.join(TEST_DIR, "output.json")
+
+
+class LatencyDistribution:
+    """延迟分布，格式为 名称:参数1,参数2"""
+
+    def __init__(self, spec: str = "fixed:0"):
+        self.spec = spec
+        name, _, params = spec.partition(":")
+        self.name = name.strip().lower()
+        self.params = [float(value) for value in params.split(",") if value.strip()]
+        samplers = {
+            "fixed": lambda: self.params[0] if self.params else 0.0,
+            "uniform": lambda: random.uniform(self.params[0], self.params[1]),
+            "normal": lambda: random.gauss(self.params[0], self.params[1]),
+            "lognormal": lambda: random.lognormvariate(self.params[0], self.params[1]),
+            "exponential": lambda: random.expovariate(1.0 / self.params[0]),
+        }
+        if self.name not in samplers:
+            raise ValueError(f"不支持的延迟分布: {spec}")
+        self._sampler = samplers[self.name]
+
+    def sample(self) -> float:
+        return max(0.0, self._sampler())
+
+
+def render_replay_text(content: Any) -> str:
+    """将回放数据转换为工作流输出的text字段（JSON + 总结报告）"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, dict) and isinstance(content.get("text"), str):
+        return content["text"]
+
+    statistics = content.get("不规范内容统计", {}) if isinstance(content, dict) else {}
+    product = content.get("基本信息", {}).get("产品名称", "") if isinstance(content, dict) else ""
+    report = [
+        "### 不规范内容总结报告",
+        "",
+        "**一、问题概览**",
+        f"- 检测产品：{product}",
+        f"- 问题总数：{statistics.get('问题总数', 0)}个",
+    ]
+    return json.dumps(content, ensure_ascii=False, indent=2) + "\n\n" + "\n".join(report)
+
+
+def load_replays(path: str) -> List[str]:
+    """加载回放数据"""
+    paths = [path]
+    if os.path.isdir(path):
+        paths = sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.endswith((".json", ".txt", ".md"))
+        )
+    replays = []
+    for file_path in paths:
+        with open(file_path, "r", encoding="utf-8") as f:
+            raw = f.read()
+        if file_path.endswith(".json"):
+            try:
+                replays.append(render_replay_text(json.loads(raw)))
+                continue
+            except json.JSONDecodeError:
+                pass
+        replays.append(raw)
+    if not replays:
+        raise ValueError(f"没有可回放的数据: {path}")
+    return replays
+
+
+class MockConfig:
+    """模拟服务配置（可在运行时通过 /mock/config 修改）"""
+
+    def __init__(
+        self,
+        latency: str = "fixed:0.5",
+        upload_latency: str = "fixed:0.05",
+        error_rate: float = 0.0,
+        reset_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        token: Optional[str] = None,
+        replay: str = DEFAULT_REPLAY,
+        seed: Optional[int] = None,
+    ):
+        self.latency = LatencyDistribution(latency)
+        self.upload_latency = LatencyDistribution(upload_latency)
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.malformed_rate = malformed_rate
+        self.token = token
+        self.replay = replay
+        self.replays = load_replays(replay)
+        self._replay_cycle = itertools.cycle(self.replays)
+        if seed is not None:
+            random.seed(seed)
+
+    def next_replay(self) -> str:
+        return next(self._replay_cycle)
+
+    def update(self, values: Dict[str, Any]):
+        if "latency" in values:
+            self.latency = LatencyDistribution(values["latency"])
+        if "upload_latency" in values:
+            self.upload_latency = LatencyDistribution(values["upload_latency"])
+        for key in ("error_rate", "reset_rate", "malformed_rate"):
+            if key in values:
+                setattr(self, key, float(values[key]))
+        if "token" in values:
+            self.token = values["token"] or None
+        if "replay" in values:
+            self.replays = load_replays(values["replay"])
+            self.replay = values["replay"]
+            self._replay_cycle = itertools.cycle(self.replays)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency.spec,
+            "upload_latency": self.upload_latency.spec,
+            "error_rate": self.error_rate,
+            "reset_rate": self.reset_rate,
+            "malformed_rate": self.malformed_rate,
+            "token": self.token,
+            "replay": self.replay,
+            "replay_count": len(self.replays),
+        }
+
+
+class ConnectionReset(Exception):
+    """模拟连接被对端重置"""
+
+
+async def reset_stream(first_chunk: bytes):
+    """先发送部分数据再中断连接"""
+    yield first_chunk
+    raise ConnectionReset("模拟连接重置")
+
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    config = config or MockConfig()
+    app = FastAPI(title="Mock Dify", description="本地Dify模拟服务")
+    app.state.config = config
+    stats = {
+        "uploads": 0,
+        "workflow_runs": 0,
+        "blocking": 0,
+        "streaming": 0,
+        "errors": 0,
+        "resets": 0,
+        "malformed": 0,
+        "stopped": 0,
+        "info": 0,
+        "in_flight": 0,
+        "max_in_flight": 0,
+    }
+    app.state.stats = stats
+    running_tasks: Dict[str, asyncio.Event] = {}
+
+    def check_auth(request: Request) -> Optional[JSONResponse]:
+        if config.token and request.headers.get("Authorization") != f"Bearer {config.token}":
+            return JSONResponse(status_code=401, content={"code": "unauthorized", "message": "Access token is invalid"})
+        return None
+
+    def roll(rate: float) -> bool:
+        return rate > 0 and random.random() < rate
+
+    @app.post("/v1/files/upload")
+    async def upload_file(request: Request, file: UploadFile = File(...), user: str = Form(...)):
+        denied = check_auth(request)
+        if denied:
+            return denied
+        content = await file.read()
+        await asyncio.sleep(config.upload_latency.sample())
+        stats["uploads"] += 1
+        if roll(config.error_rate):
+            stats["errors"] += 1
+            return JSONResponse(status_code=500, content={"code": "internal_server_error", "message": "模拟上传失败"})
+        extension = os.path.splitext(file.filename or "")[1].lstrip(".")
+        return JSONResponse(status_code=201, content={
+            "id": str(uuid.uuid4()),
+            "name": file.filename,
+            "size": len(content),
+            "extension": extension,
+            "mime_type": file.content_type,
+            "created_by": user,
+            "created_at": int(time.time()),
+        })
+
+    @app.post("/v1/workflows/run")
+    async def run_workflow(request: Request):
+        denied = check_auth(request)
+        if denied:
+            return denied
+        try:
+            payload = await request.json()
+        except json.JSONDecodeError:
+            return JSONResponse(status_code=400, content={"code": "invalid_param", "message": "请求体不是合法JSON"})
+
+        stats["workflow_runs"] += 1
+        response_mode = payload.get("response_mode", "blocking")
+        task_id = str(uuid.uuid4())
+        workflow_run_id = str(uuid.uuid4())
+        latency = config.latency.sample()
+        text = config.next_replay()
+
+        if roll(config.error_rate):
+            stats["errors"] += 1
+            await asyncio.sleep(latency * random.random())
+            return JSONResponse(status_code=500, content={"code": "internal_server_error", "message": "模拟工作流失败"})
+
+        reset = roll(config.reset_rate)
+        malformed = roll(config.malformed_rate)
+        outputs = {"text": text}
+        total_tokens = max(1, len(text) // 2)
+        created_at = int(time.time())
+
+        if response_mode == "streaming":
+            stats["streaming"] += 1
+            stop_event = asyncio.Event()
+            running_tasks[task_id] = stop_event
+
+            async def events():
+                stats["in_flight"] += 1
+                stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+                try:
+                    def sse(event: Dict[str, Any]) -> bytes:
+                        return f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+
+                    yield sse({"event": "workflow_started", "task_id": task_id, "workflow_run_id": workflow_run_id,
+                               "data": {"id": workflow_run_id, "workflow_id": "mock-workflow", "created_at": created_at}})
+                    nodes = ["开始", "标签识别", "合规检测", "结束"]
+                    for index, title in enumerate(nodes):
+                        step = latency / len(nodes)
+                        try:
+                            await asyncio.wait_for(stop_event.wait(), timeout=step)
+                            stats["stopped"] += 1
+                            yield sse({"event": "workflow_finished", "task_id": task_id,
+                                       "workflow_run_id": workflow_run_id,
+                                       "data": {"status": "stopped", "outputs": {}, "total_steps": index}})
+                            return
+                        except asyncio.TimeoutError:
+                            pass
+                        if reset and index == len(nodes) // 2:
+                            stats["resets"] += 1
+                            raise ConnectionReset("模拟连接重置")
+                        if malformed and index == 1:
+                            stats["malformed"] += 1
+                            yield b'data: {"event": "node_finished", "data": {"outputs": \n\n'
+                        yield sse({"event": "node_finished", "task_id": task_id, "workflow_run_id": workflow_run_id,
+                                   "data": {"node_id": f"node-{index}", "title": title, "status": "succeeded",
+                                            "elapsed_time": step,
+                                            "execution_metadata": {"total_tokens": total_tokens // len(nodes),
+                                                                   "total_price": "0.0001", "currency": "USD"}}})
+                    yield sse({"event": "workflow_finished", "task_id": task_id, "workflow_run_id": workflow_run_id,
+                               "data": {"id": workflow_run_id, "workflow_id": "mock-workflow", "status": "succeeded",
+                                        "outputs": outputs, "elapsed_time": latency, "total_tokens": total_tokens,
+                                        "total_steps": len(nodes), "created_at": created_at,
+                                        "finished_at": int(time.time())}})
+                finally:
+                    stats["in_flight"] -= 1
+                    running_tasks.pop(task_id, None)
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        stats["blocking"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            stats["in_flight"] -= 1
+
+        body = json.dumps({
+            "task_id": task_id,
+            "workflow_run_id": workflow_run_id,
+            "data": {
+                "id": workflow_run_id,
+                "workflow_id": "mock-workflow",
+                "status": "succeeded",
+                "outputs": outputs,
+                "error": None,
+                "elapsed_time": latency,
+                "total_tokens": total_tokens,
+                "total_steps": 4,
+                "created_at": created_at,
+                "finished_at": int(time.time()),
+            }
+        }, ensure_ascii=False).encode("utf-8")
+
+        if reset:
+            stats["resets"] += 1
+            return StreamingResponse(
+                reset_stream(body[: len(body) // 2]),
+                media_type="application/json",
+                headers={"Content-Length": str(len(body))},
+            )
+        if malformed:
+            stats["malformed"] += 1
+            body = body[: len(body) // 2]
+        return StreamingResponse(iter([body]), media_type="application/json")
+
+    @app.post("/v1/workflows/tasks/{task_id}/stop")
+    async def stop_task(task_id: str, request: Request):
+        denied = check_auth(request)
+        if denied:
+            return denied
+        stop_event = running_tasks.get(task_id)
+        if stop_event:
+            stop_event.set()
+        return {"result": "success"}
+
+    @app.get("/v1/info")
+    async def app_info(request: Request):
+        denied = check_auth(request)
+        if denied:
+            return denied
+        stats["info"] += 1
+        if roll(config.error_rate):
+            stats["errors"] += 1
+            return JSONResponse(status_code=500, content={"code": "internal_server_error", "message": "模拟服务错误"})
+        return {"name": "Mock Dify", "description": "本地Dify模拟服务", "tags": [], "mode": "workflow"}
+
+    @app.get("/mock/config")
+    async def get_config():
+        return config.to_dict()
+
+    @app.post("/mock/config")
+    async def update_config(values: Dict[str, Any]):
+        try:
+            config.update(values)
+        except (ValueError, OSError) as e:
+            return JSONResponse(status_code=400, content={"message": str(e)})
+        return config.to_dict()
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地Dify模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--latency", default="fixed:0.5", help="工作流耗时分布")
+    parser.add_argument("--upload-latency", default="fixed:0.05", help="文件上传耗时分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500错误的比例")
+    parser.add_argument("--reset-rate", type=float, default=0.0, help="中途断开连接的比例")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回损坏数据的比例")
+    parser.add_argument("--token", help="要求的Bearer令牌（不指定则不校验）")
+    parser.add_argument("--replay", default=DEFAULT_REPLAY, help="回放数据文件或目录")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    args = parser.parse_args()
+
+    import uvicorn
+    config = MockConfig(
+        latency=args.latency,
+        upload_latency=args.upload_latency,
+        error_rate=args.error_rate,
+        reset_rate=args.reset_rate,
+        malformed_rate=args.malformed_rate,
+        token=args.token,
+        replay=args.replay,
+        seed=args.seed,
+    )
+    print(f"🧪 Mock Dify 启动: http://{args.host}:{args.port}/v1")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+精简检测响应测试（compact、fields 投影、压缩协商）
+"""
+
+import io
+import asyncio
+
+import httpx
+
+from backend.compact_response import compact_result, parse_fields, project
+
+with open("test/output.json", encoding="utf-8") as f:
+    DETECTION_TEXT = f.read() + "\n\n### 不规范内容总结报告\n\n" + "- 整改建议说明。\n" * 40
+
+
+def fake_dify(request):
+    if request.url.path.endswith("/files/upload"):
+        return httpx.Response(201, json={"id": "file-1"})
+    return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded",
+                                                               "outputs": {"text": DETECTION_TEXT}}})
+
+
+def detect(client, params=None, headers=None):
+    return client.post(
+        "/api/detect",
+        params=params,
+        files={"file": ("label.jpg", io.BytesIO(b"\xff\xd8compact"), "image/jpeg")},
+        data={"Foodtype": "糕点", "PackageFoodType": "直接提供给消费者的预包装食品",
+              "SingleOrMulti": "单件", "PackageSize": "最大表面面积大于35cm2",
+              "DetectionTime": "2025-01-01", "ResponseMode": "blocking"},
+        headers=dict({"X-API-Key": "compact-test"}, **(headers or {})),
+    )
+
+
+def test_compact_drops_parsed_text_and_empty_fields():
+    result = {"prescreen": None, "message": "检测完成", "dify_result": {"outputs": {
+        "text": "原文", "json_data": {"合规率": "80%"}, "markdown_content": "报告"}}}
+
+    compacted = compact_result(result)
+
+    assert "prescreen" not in compacted
+    assert compacted["dify_result"]["outputs"] == {"json_data": {"合规率": "80%"}, "markdown_content": "报告"}
+    # 原始结果不被修改
+    assert result["dify_result"]["outputs"]["text"] == "原文"
+    # 解析失败时保留原文
+    unparsed = {"dify_result": {"outputs": {"text": "原文", "json_data": None, "markdown_content": "原文"}}}
+    assert compact_result(unparsed)["dify_result"]["outputs"]["text"] == "原文"
+
+
+def test_compact_keeps_text_when_model_returns_json_only(dify_mock):
+    """没有总结报告时 markdown_content 为空，前端要靠 text 渲染检测结果"""
+    json_only = {"outputs": {"text": '{"合规率": "80%"}', "json_data": {"合规率": "80%"}, "markdown_content": ""}}
+    assert compact_result({"dify_result": json_only})["dify_result"]["outputs"]["text"] == '{"合规率": "80%"}'
+
+    with open("test/output.json", encoding="utf-8") as f:
+        plain_json = f.read()
+
+    def json_only_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            return httpx.Response(201, json={"id": "file-1"})
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded",
+                                                                   "outputs": {"text": plain_json}}})
+
+    async def scenario(client):
+        return await detect(client, params={"compact": "1"})
+
+    response = dify_mock(json_only_dify, scenario)
+
+    assert response.status_code == 200
+    outputs = response.json()["dify_result"]["outputs"]
+    assert outputs["text"] == plain_json
+    assert outputs["json_data"] is not None
+
+
+def test_project_keeps_nested_paths_and_ignores_missing():
+    data = {"a": {"b": 1, "c": 2}, "d": 3}
+
+    assert project(data, parse_fields(" a.b , d, x.y ")) == {"a": {"b": 1}, "d": 3}
+
+
+def test_detect_compact_fields_and_gzip(monkeypatch, dify_mock):
+    monkeypatch.setenv("PRESCREEN_MODE", "off")
+    monkeypatch.setenv("NEAR_DUP_MODE", "off")
+
+    async def scenario(client):
+        full = await detect(client, headers={"Accept-Encoding": "identity"})
+        slim = await detect(client, params={"compact": "1", "fields": "detection_id,dify_result.outputs.json_data"},
+                            headers={"Accept-Encoding": "gzip"})
+        return full, slim
+
+    full, slim = dify_mock(fake_dify, scenario)
+
+    assert full.status_code == 200 and slim.status_code == 200
+    assert "content-encoding" not in full.headers
+    assert slim.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in slim.headers["vary"]
+    body = slim.json()
+    assert set(body) == {"detection_id", "dify_result"}
+    assert body["dify_result"] == {"outputs": {"json_data": full.json()["dify_result"]["outputs"]["json_data"]}}
+    assert int(slim.headers["content-length"]) < len(full.content) / 5
+
+
+def test_streaming_responses_pass_through_uncompressed():
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse, StreamingResponse
+    from starlette.routing import Route
+
+    from backend.compact_response import CompressionMiddleware
+
+    async def chunks():
+        for _ in range(10):
+            yield b"x" * 1024
+
+    inner = Starlette(routes=[
+        Route("/stream", lambda request: StreamingResponse(chunks(), media_type="text/csv")),
+        Route("/text", lambda request: PlainTextResponse("y" * 4096)),
+    ])
+    wrapped = CompressionMiddleware(inner, minimum_size=1024)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=wrapped), base_url="http://test") as client:
+            headers = {"Accept-Encoding": "gzip"}
+            return await client.get("/stream", headers=headers), await client.get("/text", headers=headers)
+
+    stream, text = asyncio.run(scenario())
+
+    assert "content-encoding" not in stream.headers
+    assert stream.content == b"x" * 10240
+    assert text.headers["content-encoding"] == "gzip"
+    assert text.text == "y" * 4096
@@ -0,0 +1,97 @@
+"""
+并发负载测试：Dify调用不应阻塞事件循环
+
+用模拟的Dify（每次工作流调用耗时 DIFY_DELAY 秒）并发发起多个 /api/detect 请求，
+如果请求被串行处理，总耗时约为 N * DIFY_DELAY；异步传输下应接近单次耗时。
+流式（原 requests 路径，main_simple）与阻塞两种传输方式都要覆盖。
+"""
+
+import io
+import json
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from backend import dify_client, main_simple, main_simple_fixed
+
+CONCURRENCY = 10
+DIFY_DELAY = 0.5
+
+WORKFLOW_TEXT = json.dumps({"基本信息": {"产品名称": "测试产品"}}, ensure_ascii=False) + "\n不规范内容总结报告\n无"
+
+
+async def fake_dify(request: httpx.Request) -> httpx.Response:
+    if request.url.path.endswith("/files/upload"):
+        return httpx.Response(201, json={"id": "file-1", "name": "label.jpg"})
+
+    await asyncio.sleep(DIFY_DELAY)
+    payload = json.loads(request.content)
+    outputs = {"text": WORKFLOW_TEXT}
+    if payload["response_mode"] == "streaming":
+        events = [
+            {"event": "workflow_started", "task_id": "task-1", "workflow_run_id": "run-1", "data": {}},
+            {"event": "node_finished", "data": {"elapsed_time": 0.1, "execution_metadata": {"total_tokens": 10}}},
+            {"event": "workflow_finished", "data": {"status": "succeeded", "outputs": outputs, "total_steps": 2}},
+        ]
+        body = "".join(f"data: {json.dumps(event, ensure_ascii=False)}\n\n" for event in events)
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+    return httpx.Response(200, json={"task_id": "task-1", "data": {"status": "succeeded", "outputs": outputs}})
+
+
+def concurrent_detections(response_mode: str):
+    async def scenario(client):
+        async def detect():
+            return await client.post(
+                "/api/detect",
+                files={"file": ("label.jpg", io.BytesIO(b"\xff\xd8fake-jpeg"), "image/jpeg")},
+                data={
+                    "Foodtype": "糕点",
+                    "PackageFoodType": "直接提供给消费者的预包装食品",
+                    "SingleOrMulti": "单件",
+                    "PackageSize": "最大表面面积大于35cm2",
+                    "DetectionTime": "2025-01-01",
+                    "ResponseMode": response_mode,
+                },
+            )
+
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(detect() for _ in range(CONCURRENCY)))
+        return responses, time.perf_counter() - started
+
+    return scenario
+
+
+@pytest.mark.parametrize("response_mode", ["streaming", "blocking"])
+def test_detect_requests_run_concurrently(response_mode, dify_mock):
+    responses, elapsed = dify_mock(fake_dify, concurrent_detections(response_mode))
+
+    for response in responses:
+        assert response.status_code == 200, response.text
+        outputs = response.json()["dify_result"]["outputs"]
+        assert outputs["json_data"]["基本信息"]["产品名称"] == "测试产品"
+
+    # 串行执行需要 CONCURRENCY * DIFY_DELAY = 5s，允许较大余量
+    assert elapsed < DIFY_DELAY * CONCURRENCY / 3, f"{CONCURRENCY}个并发请求耗时 {elapsed:.2f}s，疑似被串行处理"
+
+
+def test_main_simple_defaults_to_streaming_without_changing_the_shared_default(dify_mock):
+    modes = []
+
+    async def recording_dify(request):
+        if not request.url.path.endswith("/files/upload"):
+            modes.append(json.loads(request.content)["response_mode"])
+        return await fake_dify(request)
+
+    async def scenario(client):
+        form = {"Foodtype": "糕点", "PackageFoodType": "直接提供给消费者的预包装食品", "SingleOrMulti": "单件",
+                "PackageSize": "最大表面面积大于35cm2", "DetectionTime": "2025-01-01"}
+        return await client.post("/api/detect", data=form,
+                                  files={"file": ("label.jpg", io.BytesIO(b"\xff\xd8mode"), "image/jpeg")})
+
+    for app in (main_simple.app, main_simple_fixed.app):
+        assert dify_mock(recording_dify, scenario, app=app).status_code == 200
+
+    assert modes == ["streaming", dify_client.DEFAULT_RESPONSE_MODE]
+    assert dify_client.default_response_mode() == dify_client.DEFAULT_RESPONSE_MODE
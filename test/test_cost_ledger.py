@@ -0,0 +1,106 @@
+"""
+费用台账测试
+"""
+
+import asyncio
+from datetime import date
+
+import pytest
+
+from backend import cost_ledger
+
+
+STREAMING_DATA = {
+    "task_id": "task-1",
+    "outputs": {"text": "ok"},
+    "metadata": {"total_tokens": 1200, "total_price": 0.0042, "currency": "USD", "elapsed_time": 3.5},
+}
+
+BLOCKING_DATA = {
+    "task_id": "task-1",
+    "data": {"status": "succeeded", "outputs": {"text": "ok"}, "total_tokens": 800, "elapsed_time": 2.0},
+}
+
+
+def test_extract_usage_from_streaming_metadata():
+    usage = cost_ledger.extract_usage(STREAMING_DATA)
+
+    assert usage["total_tokens"] == 1200
+    assert usage["total_price"] == pytest.approx(0.0042)
+    assert usage["price_source"] == "dify"
+    assert usage["elapsed_time"] == pytest.approx(3.5)
+
+
+def test_extract_usage_estimates_price_for_blocking(monkeypatch):
+    assert cost_ledger.extract_usage(BLOCKING_DATA)["price_source"] == "unknown"
+
+    monkeypatch.setenv("DIFY_PRICE_PER_1K_TOKENS", "0.01")
+    usage = cost_ledger.extract_usage(BLOCKING_DATA)
+
+    assert usage["total_tokens"] == 800
+    assert usage["total_price"] == pytest.approx(0.008)
+    assert usage["price_source"] == "estimated"
+
+
+def test_record_detection_cost_writes_ledger_entry(monkeypatch):
+    written = []
+
+    async def fake_insert(entry):
+        written.append(entry)
+
+    monkeypatch.setenv("COST_LEDGER_ENABLED", "true")
+    monkeypatch.setattr(cost_ledger, "_insert_entry", fake_insert)
+    before = cost_ledger.tokens_total.value(food_type="糕点")
+
+    async def scenario():
+        usage = cost_ledger.record_detection_cost(
+            "det-1", "team-a", "糕点", "直接提供给消费者的预包装食品", "streaming",
+            STREAMING_DATA, image_bytes=1024,
+        )
+        await asyncio.gather(*cost_ledger._pending)
+        return usage
+
+    usage = asyncio.run(scenario())
+
+    assert usage["total_tokens"] == 1200
+    assert written[0]["user"] == "team-a"
+    assert written[0]["food_type"] == "糕点"
+    assert written[0]["image_bytes"] == 1024
+    assert len(written[0]["day"]) == 10
+    assert cost_ledger.tokens_total.value(food_type="糕点") - before == 1200
+
+
+def test_summary_pipeline_and_per_label_averages():
+    pipeline = cost_ledger.build_summary_pipeline(
+        ["user", "day"], start=date(2025, 1, 1), end=date(2025, 2, 1), food_type="糕点"
+    )
+
+    assert pipeline[0]["$match"] == {"day": {"$gte": "2025-01-01", "$lt": "2025-02-01"}, "food_type": "糕点"}
+    assert pipeline[1]["$group"]["_id"] == {"user": "$user", "day": "$day"}
+
+    row = cost_ledger.summarize_group({
+        "_id": {"user": "team-a", "day": "2025-01-02"},
+        "detections": 4, "failed": 1, "total_tokens": 4000, "total_price": 0.02,
+        "image_bytes": 4096, "currencies": ["USD"],
+    })
+    assert row["user"] == "team-a"
+    assert row["tokens_per_label"] == 1000
+    assert row["price_per_label"] == pytest.approx(0.005)
+
+
+def test_cache_and_prescreen_detections_are_excluded_from_per_label_averages():
+    pipeline = cost_ledger.build_summary_pipeline(["day"])
+    assert pipeline[1]["$group"]["avoided_calls"] == {
+        "$sum": {"$cond": [{"$in": ["$response_mode", ["cache", "prescreen"]]}, 1, 0]}
+    }
+
+    # 4 次检测中 2 次命中缓存或预筛查直接判定，没有消耗令牌
+    row = cost_ledger.summarize_group({
+        "_id": {"day": "2025-01-02"},
+        "detections": 4, "failed": 0, "avoided_calls": 2, "total_tokens": 4000, "total_price": 0.02,
+        "image_bytes": 4096, "currencies": ["USD"],
+    })
+    assert row["avoided_calls"] == 2
+    assert row["tokens_per_label"] == 2000
+    assert row["price_per_label"] == pytest.approx(0.01)
+    assert row["avg_image_bytes"] == 1024
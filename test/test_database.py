@@ -0,0 +1,118 @@
+"""
+MongoDB 客户端配置与命令监控测试
+
+与本地 mongod 的测试在未安装 mongod 时跳过。
+"""
+
+import socket
+import asyncio
+import logging
+import shutil
+import subprocess
+
+import pytest
+
+from backend.mongo_monitor import MongoClientSettings, client_options, command_duration, slow_commands_total
+
+
+def test_client_options_from_env(monkeypatch):
+    monkeypatch.setenv("MONGODB_MAX_POOL_SIZE", "20")
+    monkeypatch.setenv("MONGODB_MIN_POOL_SIZE", "2")
+    monkeypatch.setenv("MONGODB_SOCKET_TIMEOUT_MS", "30000")
+    monkeypatch.setenv("MONGODB_READ_PREFERENCE", "secondaryPreferred")
+    # 不支持的算法被跳过，zlib 为标准库始终可用
+    monkeypatch.setenv("MONGODB_COMPRESSORS", "lz4,zlib")
+
+    options = client_options(MongoClientSettings())
+
+    assert options == {"maxPoolSize": 20, "minPoolSize": 2, "serverSelectionTimeoutMS": 5000,
+                       "connectTimeoutMS": 5000, "readPreference": "secondaryPreferred",
+                       "socketTimeoutMS": 30000, "compressors": "zlib"}
+    monkeypatch.setenv("MONGODB_MIN_POOL_SIZE", "50")
+    with pytest.raises(ValueError):
+        MongoClientSettings()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def mongod(tmp_path):
+    if shutil.which("mongod") is None:
+        pytest.skip("未安装 mongod")
+    port = free_port()
+    process = subprocess.Popen(
+        ["mongod", "--dbpath", str(tmp_path), "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        yield port
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def test_commands_against_local_mongod_are_timed_and_slow_ones_logged(mongod, monkeypatch, caplog):
+    from backend.database import Database
+
+    monkeypatch.setenv("MONGODB_PORT", str(mongod))
+    monkeypatch.setenv("MONGODB_DATABASE", "food_safety_test")
+    monkeypatch.setenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "20000")
+    monkeypatch.setenv("MONGODB_COMPRESSORS", "zlib")
+    monkeypatch.setenv("MONGODB_SLOW_COMMAND_MS", "0")
+    inserts = command_duration.count(command="insert")
+    finds = command_duration.count(command="find")
+    slow = slow_commands_total.value(command="find")
+
+    async def scenario():
+        database = Database()
+        await database.connect()
+        try:
+            collection = database.client[database.database_name]["probe"]
+            await collection.insert_one({"product_name": "月饼", "overall_rating": "合格"})
+            return await collection.find_one({"product_name": "月饼"})
+        finally:
+            await database.disconnect()
+
+    with caplog.at_level(logging.WARNING, logger="backend.mongo_monitor"):
+        found = asyncio.run(scenario())
+
+    assert found["overall_rating"] == "合格"
+    assert command_duration.count(command="insert") == inserts + 1
+    assert command_duration.count(command="find") == finds + 1
+    assert slow_commands_total.value(command="find") == slow + 1
+    message = next(record.message for record in caplog.records if "find food_safety_test.probe" in record.message)
+    # 慢命令日志只记录字段名
+    assert "{product_name}" in message and "月饼" not in message
+
+
+def test_failed_first_connect_is_retried(monkeypatch):
+    from pymongo.errors import ServerSelectionTimeoutError
+    from backend import database as database_module
+
+    calls = []
+
+    async def init_beanie(**kwargs):
+        calls.append(kwargs["database"].name)
+        if len(calls) == 1:
+            raise ServerSelectionTimeoutError("localhost:1: connection refused")
+
+    monkeypatch.setattr(database_module, "init_beanie", init_beanie)
+    # 索引创建失败只记录警告，不影响重试
+    monkeypatch.setattr(database_module, "database", database_module.Database())
+
+    async def scenario():
+        with pytest.raises(ServerSelectionTimeoutError):
+            await database_module.ensure_database()
+        assert database_module.database.client is None
+        connected = await database_module.ensure_database()
+        again = await database_module.ensure_database()
+        await connected.disconnect()
+        return connected, again
+
+    connected, again = asyncio.run(scenario())
+
+    assert connected is again and len(calls) == 2
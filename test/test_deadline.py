@@ -0,0 +1,121 @@
+"""
+请求截止时间与取消测试
+"""
+
+import io
+import json
+import asyncio
+
+import httpx
+import pytest
+
+from backend import dify_client
+from backend.metrics import metrics
+from backend.deadline import ClientDisconnected, Deadline, request_deadline, run_until_disconnected
+from backend.idempotency import IdempotencyStore
+
+
+def counter_value(name, **labels):
+    return metrics.counter(name, "").value(**labels)
+
+
+def test_deadline_stops_the_streaming_run_and_returns_504(monkeypatch, dify_mock):
+    monkeypatch.setenv("PRESCREEN_MODE", "off")
+    monkeypatch.setenv("NEAR_DUP_MODE", "off")
+    stops = []
+    wasted_before = counter_value("dify_wasted_tokens_total", response_mode="streaming")
+
+    async def hanging_stream():
+        yield b'data: {"event": "workflow_started", "task_id": "task-42", "data": {"workflow_id": "wf"}}\n\n'
+        yield (b'data: {"event": "node_finished", "data": {"title": "LLM", '
+               b'"execution_metadata": {"total_tokens": 1200, "total_price": "0.004"}}}\n\n')
+        await asyncio.sleep(30)
+
+    async def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            return httpx.Response(201, json={"id": "file-1"})
+        if request.url.path.endswith("/stop"):
+            stops.append((request.url.path, json.loads(request.content)))
+            return httpx.Response(200, json={"result": "success"})
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=hanging_stream())
+
+    async def scenario(client):
+        response = await client.post(
+            "/api/detect",
+            files={"file": ("label.jpg", io.BytesIO(b"\xff\xd8deadline"), "image/jpeg")},
+            data={"Foodtype": "糕点", "PackageFoodType": "直接提供给消费者的预包装食品",
+                  "SingleOrMulti": "单件", "PackageSize": "最大表面面积大于35cm2",
+                  "DetectionTime": "2025-01-01", "ResponseMode": "streaming"},
+            headers={"X-API-Key": "deadline-test", "X-Request-Timeout": "0.5"},
+        )
+        # 停止请求在后台发出
+        await asyncio.sleep(0.05)
+        return response
+
+    response = dify_mock(fake_dify, scenario)
+
+    assert response.status_code == 504
+    assert len(stops) == 1
+    path, body = stops[0]
+    assert path.endswith("/workflows/tasks/task-42/stop")
+    assert body["user"].startswith("user-")
+    assert counter_value("dify_wasted_tokens_total", response_mode="streaming") - wasted_before == 1200
+
+
+def test_request_timeout_header_only_shortens_the_deadline(monkeypatch):
+    monkeypatch.setenv("DETECT_DEADLINE", "60")
+
+    assert request_deadline("5").seconds == 5
+    assert request_deadline("600").seconds == 60
+    assert request_deadline("abc").seconds == 60
+    assert Deadline(10).timeout(dify_client.HTTP_TIMEOUT).read <= 10
+
+
+def test_client_disconnect_cancels_the_detection():
+    class DisconnectingRequest:
+        async def receive(self):
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+    cancelled = []
+
+    async def detection():
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def scenario():
+        with pytest.raises(ClientDisconnected):
+            await run_until_disconnected(DisconnectingRequest(), detection())
+
+    asyncio.run(scenario())
+
+    assert cancelled == [True]
+
+
+def test_idempotent_run_is_cancelled_once_nobody_waits():
+    store = IdempotencyStore(abandon_grace=0.05)
+    cancelled = []
+
+    async def detection():
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def scenario():
+        waiter = asyncio.ensure_future(store.run(("c", "k"), "fp", detection))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.02)
+        # 宽限期内仍在运行，重试可以挂上来
+        assert not cancelled and len(store) == 1
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+
+    assert cancelled == [True]
+    assert len(store) == 0
@@ -0,0 +1,58 @@
+"""
+检测记录持久化测试
+"""
+
+import io
+import os
+
+import httpx
+
+from backend import detection_history
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "output.json"), encoding="utf-8") as f:
+    DETECTION_TEXT = f.read() + "\n\n### 不规范内容总结报告\n"
+
+FORM = {"Foodtype": "糕点", "PackageFoodType": "直接提供给消费者的预包装食品", "SingleOrMulti": "单件",
+        "PackageSize": "最大表面面积大于35cm2", "DetectionTime": "2025-03-15", "ResponseMode": "blocking"}
+
+
+def fake_dify(request):
+    if request.url.path.endswith("/files/upload"):
+        return httpx.Response(201, json={"id": "file-1"})
+    return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded",
+                                                               "outputs": {"text": DETECTION_TEXT}}})
+
+
+def test_detect_persists_the_record_with_prompt_version(monkeypatch, dify_mock):
+    monkeypatch.setenv("DETECTION_HISTORY_ENABLED", "true")
+    monkeypatch.setenv("PRESCREEN_MODE", "off")
+    monkeypatch.setenv("NEAR_DUP_MODE", "off")
+    inserted = []
+
+    async def insert_record(document):
+        inserted.append(document)
+
+    monkeypatch.setattr(detection_history, "_insert_record", insert_record)
+
+    response = dify_mock(fake_dify, lambda client: client.post(
+        "/api/detect", data=FORM, files={"file": ("label.jpg", io.BytesIO(b"\xff\xd8history"), "image/jpeg")},
+        headers={"X-API-Key": "history-test"},
+    ))
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    record, = inserted
+    assert body["record_id"] == str(record["id"])
+    assert record["prompt_version"] == body["prompt_version"] and record["prompt_version"]
+    assert record["detection_time"].isoformat() == "2025-03-15T00:00:00"
+    assert record["input_params"]["PackageFoodType"] == FORM["PackageFoodType"]
+    assert record["detection_result"]["详细检测结果"] == body["dify_result"]["outputs"]["json_data"]["详细检测结果"]
+
+
+def test_invalid_or_disabled_detections_are_not_recorded(monkeypatch):
+    monkeypatch.setenv("DETECTION_HISTORY_ENABLED", "false")
+    assert detection_history.record_detection({"详细检测结果": []}, None, {}) is None
+
+    monkeypatch.setenv("DETECTION_HISTORY_ENABLED", "true")
+    assert detection_history.record_detection({"基本信息": {}}, None, {}) is None
+    assert detection_history.record_detection(None, None, {}) is None
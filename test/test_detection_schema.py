@@ -0,0 +1,114 @@
+"""
+检测结果JSON校验与规范化测试
+"""
+
+import copy
+import json
+import os
+
+import pytest
+
+from backend.detection_schema import (
+    coerce_count,
+    coerce_percentage,
+    normalize_detection,
+    to_record_fields,
+)
+from backend.dify_client import process_dify_response
+
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output.json")
+
+
+@pytest.fixture
+def detection():
+    with open(OUTPUT_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("75%", 75.0), ("75", 75.0), (75, 75.0), (0.75, 75.0), ("约 82.5 %", 82.5), ("1%", 1.0),
+    ("七成五", None), (150, None), (None, None), (True, None),
+])
+def test_coerce_percentage(value, expected):
+    assert coerce_percentage(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [(2, 2), ("2", 2), ("2个", 2), (2.0, 2), ("两个", None), (-1, None)])
+def test_coerce_count(value, expected):
+    assert coerce_count(value) == expected
+
+
+def test_counts_are_recomputed_from_detail_items(detection):
+    normalized = normalize_detection(detection)
+
+    assert normalized.valid
+    assessment = normalized.data["合规性评估"]
+    results = {item["检测结果"] for item in normalized.data["详细检测结果"]}
+    assert results == {"合格", "不合格"}
+    assert assessment["关键问题"] == 1
+    assert assessment["一般问题"] == 3
+    assert assessment["合规率"] == "75%"
+    assert any("不符合要求" in repair for repair in normalized.repairs)
+    # 原始输出不被修改
+    assert detection["合规性评估"]["关键问题"] == 2
+
+
+def test_aliases_are_repaired_and_mapped_to_record(detection):
+    perturbed = copy.deepcopy(detection)
+    perturbed["合规性评估"].update({"合规率": 0.6, "总体评级": "部分合格", "关键问题": "5个"})
+    perturbed["详细检测结果"][0].update({"检测结果": "通过", "风险等级": "无"})
+    failed = next(item for item in perturbed["详细检测结果"] if item["检测结果"] == "不合格")
+    failed["风险等级"] = "严重"
+
+    record = to_record_fields(normalize_detection(perturbed))
+
+    assert record.compliance_rate == 60.0
+    assert record.overall_rating == "基本合格"
+    assert record.key_issues == 2
+    assert record.general_issues == 2
+    assert record.product_name == detection["基本信息"]["产品名称"]
+    assert record.detection_result["详细检测结果"][0]["检测结果"] == "合格"
+
+
+def test_record_issue_counts_match_the_assessment(detection):
+    normalized = normalize_detection(detection)
+    record = to_record_fields(normalized)
+    failed = [item["风险等级"] for item in normalized.data["详细检测结果"] if item["检测结果"] == "不合格"]
+
+    assert record.key_issues == normalized.data["合规性评估"]["关键问题"] == failed.count("高风险")
+    assert record.general_issues == normalized.data["合规性评估"]["一般问题"] == 3
+    assert record.general_issues == failed.count("中风险") + failed.count("低风险")
+    assert record.low_risk_issues == failed.count("低风险") <= record.general_issues
+
+
+def test_missing_rate_is_derived_and_missing_items_rejected(detection):
+    perturbed = copy.deepcopy(detection)
+    perturbed["合规性评估"]["合规率"] = "未知"
+    normalized = normalize_detection(perturbed)
+    assert normalized.data["合规性评估"]["合规率"] == "60%"
+
+    del perturbed["详细检测结果"]
+    rejected = normalize_detection(perturbed)
+    assert not rejected.valid
+    with pytest.raises(ValueError):
+        to_record_fields(rejected)
+
+
+def test_process_dify_response_attaches_validation(detection):
+    text = json.dumps(detection, ensure_ascii=False, indent=2) + "\n\n### 不规范内容总结报告\n\n- 问题总数：5个\n"
+
+    processed = process_dify_response({"data": {"outputs": {"text": text}}})
+
+    outputs = processed["outputs"]
+    assert outputs["validation"]["valid"]
+    assert outputs["json_data"]["合规性评估"]["关键问题"] == 1
+    assert outputs["markdown_content"].startswith("### 不规范内容总结报告")
+
+
+def test_text_field_priority_does_not_depend_on_earlier_responses():
+    process_dify_response({"data": {"outputs": {"result": '{"来源": "result"}'}}})
+
+    processed = process_dify_response({"data": {"outputs": {
+        "text": '{"来源": "text"}', "result": '{"来源": "result"}'}}})
+
+    assert processed["outputs"]["json_data"] == {"来源": "text"}
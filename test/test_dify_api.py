@@ -0,0 +1,107 @@
+"""
+Dify客户端测试（使用进程内的Dify模拟服务，不访问真实Dify）
+"""
+
+import json
+import asyncio
+
+import httpx
+import pytest
+
+from backend import dify_client
+from mock_dify_server import MockConfig, create_app
+
+
+def run_with_mock(coro_factory, **config):
+    """在挂载模拟Dify的共享客户端上执行协程"""
+    mock = create_app(MockConfig(latency="fixed:0", upload_latency="fixed:0", seed=7718, **config))
+
+    async def runner():
+        dify_client.set_http_client(httpx.AsyncClient(transport=httpx.ASGITransport(app=mock)))
+        try:
+            return await coro_factory()
+        finally:
+            await dify_client.close_http_client()
+
+    return asyncio.run(runner()), mock.state.stats
+
+
+def test_upload_image_returns_file_id(tmp_path):
+    image = tmp_path / "label.png"
+    image.write_bytes(b"\x89PNG fake")
+
+    file_info, stats = run_with_mock(lambda: dify_client.upload_image_to_dify(str(image), "user-1"))
+
+    assert file_info["id"]
+    assert file_info["mime_type"] == "image/png"
+    assert stats["uploads"] == 1
+
+
+@pytest.mark.parametrize("response_mode", ["blocking", "streaming"])
+def test_call_dify_workflow_separates_json_and_markdown(tmp_path, response_mode):
+    image = tmp_path / "label.jpg"
+    image.write_bytes(b"\xff\xd8fake")
+
+    result, stats = run_with_mock(lambda: dify_client.call_dify_workflow(
+        str(image), "糕点", "直接提供给消费者的预包装食品", "单件", "最大表面面积大于35cm2",
+        max_retries=0, response_mode=response_mode,
+    ))
+
+    assert result["success"], result
+    processed = dify_client.process_dify_response(result["data"])
+    assert processed["outputs"]["json_data"]["基本信息"]["产品名称"] == "稻香村月饼富贵佳礼盒（广式月饼）"
+    assert "不规范内容总结报告" in processed["outputs"]["markdown_content"]
+    assert stats[response_mode] == 1
+
+
+def test_streaming_transport_accumulates_metadata():
+    payload = dify_client.build_workflow_payload([], "糕点", "x", "单件", "y", "streaming", "user-1")
+
+    result, _ = run_with_mock(lambda: dify_client.get_transport("streaming").run_workflow(payload))
+
+    assert result["success"]
+    assert result["data"]["task_id"]
+    assert result["data"]["metadata"]["total_tokens"] > 0
+    assert result["data"]["metadata"]["total_price"] == pytest.approx(0.0004)
+
+
+def test_blocking_transport_reports_malformed_json():
+    payload = dify_client.build_workflow_payload([], "糕点", "x", "单件", "y", "blocking", "user-1")
+
+    result, _ = run_with_mock(
+        lambda: dify_client.get_transport("blocking").run_workflow(payload), malformed_rate=1.0
+    )
+
+    assert not result["success"]
+    assert result["message"] == "响应格式错误"
+
+
+def test_blocking_transport_reports_http_errors():
+    payload = dify_client.build_workflow_payload([], "糕点", "x", "单件", "y", "blocking", "user-1")
+
+    result, _ = run_with_mock(
+        lambda: dify_client.get_transport("blocking").run_workflow(payload), error_rate=1.0
+    )
+
+    assert not result["success"]
+    assert "500" in result["error"]
+
+
+def test_parse_streaming_response_skips_malformed_events():
+    lines = [
+        'data: {"event": "workflow_started", "task_id": "t-1", "workflow_run_id": "r-1", "data": {}}',
+        'data: {"event": "node_finished", "data": {"outputs": ',
+        "data: " + json.dumps({"event": "workflow_finished",
+                               "data": {"status": "succeeded", "outputs": {"text": "ok"}}}),
+    ]
+
+    result = dify_client.parse_streaming_response(lines)
+
+    assert result["success"]
+    assert result["data"]["task_id"] == "t-1"
+    assert result["data"]["outputs"] == {"text": "ok"}
+
+
+def test_unknown_response_mode_is_rejected():
+    with pytest.raises(ValueError):
+        dify_client.get_transport("websocket")
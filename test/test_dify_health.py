@@ -0,0 +1,110 @@
+"""
+Dify健康探测测试
+"""
+
+import asyncio
+
+import httpx
+
+from backend import dify_client
+from backend import main_simple_fixed as main
+from backend.dify_health import DifyHealthProber
+from backend.dify_pool import DifyBackendConfig, DifyPool
+from backend.rate_limit import TokenBucket
+
+
+def make_pool(names=("a", "b", "c")):
+    return DifyPool([DifyBackendConfig(name=name, base_url=f"http://{name}.dify/v1", api_token=f"app-{name}")
+                     for name in names])
+
+
+def test_prober_marks_unreachable_and_unauthorized_backends():
+    pool = make_pool()
+    down = {"b.dify", "c.dify"}
+
+    def fake_dify(request):
+        assert request.url.path == "/v1/info"
+        host = request.url.host
+        if host == "b.dify":
+            return httpx.Response(401, json={"code": "unauthorized"})
+        if host in down:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json={"name": "app"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake_dify))
+    prober = DifyHealthProber(pool, failures=2, client_factory=lambda: client)
+
+    async def probe(times):
+        for _ in range(times):
+            summary = await prober.probe_once()
+        return summary
+
+    summary = asyncio.run(probe(1))
+    statuses = {backend["name"]: backend["status"] for backend in summary["backends"]}
+    # 鉴权失败立即判定不可用，连接失败要连续达到阈值
+    assert statuses == {"a": "healthy", "b": "auth_failed", "c": "unknown"}
+    assert [pool.get(name).probe_healthy for name in "abc"] == [True, False, True]
+
+    summary = asyncio.run(probe(1))
+    assert summary["status"] == "degraded"
+    assert pool.get("c").probe_healthy is False
+    assert summary["backends"][2]["last_error"].startswith("ConnectError")
+    for _ in range(5):
+        assert pool.choose() is pool.get("a")
+
+    down.add("a.dify")
+    summary = asyncio.run(probe(2))
+    assert summary["status"] == "unhealthy"
+    assert not pool.reachable()
+
+    down.clear()
+    summary = asyncio.run(probe(1))
+    assert [backend["status"] for backend in summary["backends"]] == ["healthy", "auth_failed", "healthy"]
+    assert prober.summary() is summary
+
+
+def test_no_retries_when_every_backend_is_down(tmp_path, monkeypatch, dify_mock):
+    pool = make_pool(names=("a",))
+    monkeypatch.setattr(dify_client, "dify_pool", pool)
+    image = tmp_path / "label.jpg"
+    image.write_bytes(b"\xff\xd8down")
+    attempts = []
+
+    def fake_dify(request):
+        attempts.append(request.url.path)
+        # 探测在请求失败后判定后端不可用
+        pool.get("a").probe_healthy = False
+        raise httpx.ConnectError("connection refused", request=request)
+
+    result = dify_mock(fake_dify, lambda client: dify_client.call_dify_workflow(
+        str(image), "糕点", "x", "单件", "y", max_retries=2, response_mode="blocking",
+    ))
+
+    assert not result["success"] and result["attempts"] == 1
+    assert attempts == ["/v1/files/upload"]
+
+
+def test_health_reports_probe_and_diagnostic_is_rate_limited(monkeypatch, dify_mock):
+    monkeypatch.setattr(main, "dify_diagnostic_bucket", TokenBucket(rate=1 / 300, burst=1))
+    monkeypatch.setattr(main, "last_dify_diagnostic", {})
+    runs = []
+
+    def fake_dify(request):
+        runs.append(request.url.path)
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded", "outputs": {"text": "{}"}}})
+
+    async def scenario(client):
+        health = await client.get("/health")
+        first = await client.get("/api/test-dify", params={"response_mode": "blocking"})
+        second = await client.get("/api/test-dify", params={"response_mode": "blocking"})
+        return health, first, second
+
+    health, first, second = dify_mock(fake_dify, scenario, app=main.app)
+
+    assert health.status_code == 200
+    assert health.json()["dify"]["status"] in ("unknown", "healthy", "degraded", "unhealthy")
+    assert first.status_code == 200 and first.json()["success"]
+    assert second.status_code == 429
+    assert int(second.headers["Retry-After"]) > 200
+    assert second.json()["last_result"]["success"]
+    assert len(runs) == 1
@@ -0,0 +1,92 @@
+"""
+Dify后端池测试
+"""
+
+import json
+
+import httpx
+
+from backend import dify_client
+from backend.dify_pool import DifyBackendConfig, DifyPool, DifyPoolSettings
+
+
+def make_pool(names=("a", "b"), **options):
+    return DifyPool(
+        [DifyBackendConfig(name=name, base_url=f"http://{name}.dify/v1", api_token=f"app-{name}") for name in names],
+        **options
+    )
+
+
+def test_settings_parse_backends_from_json_env(monkeypatch):
+    monkeypatch.setenv("DIFY_BACKENDS", json.dumps([
+        {"name": "a", "base_url": "http://a.dify/v1", "api_token": "app-a"},
+        {"name": "b", "base_url": "http://b.dify/v1", "api_token": "app-b", "weight": 2},
+    ]))
+    monkeypatch.setenv("DIFY_EJECT_FAILURES", "5")
+    default = DifyBackendConfig(name="default", base_url="http://default/v1", api_token="app-default")
+
+    pool = DifyPool.from_settings(DifyPoolSettings(), default)
+
+    assert [backend.name for backend in pool.backends] == ["a", "b"]
+    assert pool.get("b").weight == 2
+    assert pool.get("b").file_url == "http://b.dify/v1/files/upload"
+    assert pool.eject_failures == 5
+
+
+def test_routing_prefers_fast_idle_backends_and_ejects_failing_ones():
+    pool = make_pool(eject_failures=2, eject_seconds=60)
+    a, b = pool.backends
+    pool.record(a, 10.0, True)
+    pool.record(b, 40.0, True)
+
+    assert pool.choose() is a
+    # a 上已有 4 个进行中的请求：10×5 > 40×1
+    a.outstanding = 4
+    assert pool.choose() is b
+    a.outstanding = 0
+    assert pool.choose(exclude=["a"]) is b
+
+    pool.record(a, 1.0, False)
+    assert pool.choose() is a
+    pool.record(a, 1.0, False)
+    assert pool.choose() is b
+    # 全部被摘除时仍然返回一个后端
+    pool.eject(b, "测试")
+    assert pool.choose() is a
+
+
+def test_failover_keeps_upload_and_run_on_the_same_backend(tmp_path, monkeypatch, dify_mock):
+    monkeypatch.setattr(dify_client, "dify_pool", make_pool())
+    image = tmp_path / "label.jpg"
+    image.write_bytes(b"\xff\xd8pool")
+    requests = []
+
+    def fake_dify(request):
+        host = request.url.host
+        if request.url.path.endswith("/files/upload"):
+            requests.append((host, "upload", request.headers["authorization"]))
+            return httpx.Response(201, json={"id": f"file-on-{host}"})
+        inputs = json.loads(request.content)["inputs"]
+        requests.append((host, "run", inputs["TagImage"][0]["upload_file_id"]))
+        if host == "a.dify":
+            return httpx.Response(503, text="busy")
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded", "outputs": {"text": "{}"}}})
+
+    async def scenario(client):
+        # 先让 a 成为首选
+        dify_client.dify_pool.record(dify_client.dify_pool.get("a"), 1.0, True)
+        dify_client.dify_pool.record(dify_client.dify_pool.get("b"), 5.0, True)
+        return await dify_client.call_dify_workflow(
+            str(image), "糕点", "x", "单件", "y", max_retries=1, response_mode="blocking",
+        )
+
+    result = dify_mock(fake_dify, scenario)
+
+    assert result["success"] and result["backend"] == "b"
+    assert requests == [
+        ("a.dify", "upload", "Bearer app-a"),
+        ("a.dify", "run", "file-on-a.dify"),
+        ("b.dify", "upload", "Bearer app-b"),
+        ("b.dify", "run", "file-on-b.dify"),
+    ]
+    assert dify_client.dify_pool.get("a").consecutive_failures == 1
@@ -0,0 +1,149 @@
+"""
+检测历史导出测试
+"""
+
+import csv
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from backend import export
+from backend.export import (
+    CsvExportWriter,
+    build_query,
+    flatten_detection,
+    make_resume_token,
+    main,
+    parse_resume_token,
+    read_last_resume_token,
+)
+
+RECORD_ID = ObjectId("64b7f0c2a1b2c3d4e5f60718")
+DETECTION_TIME = datetime(2025, 1, 2, 3, 4, 5)
+DOC = {
+    "_id": RECORD_ID,
+    "product_name": "月饼",
+    "detection_time": DETECTION_TIME,
+    "detection_result": {"详细检测结果": [
+        {"检测项目": "食品名称", "检测结果": "合格"},
+        {"检测项目": "配料表", "检测结果": "不合格", "问题描述": "第一行\n第二行, 带逗号和\"引号\""},
+    ]},
+}
+
+
+def test_flatten_detection_yields_one_row_per_item_with_its_own_token():
+    rows = list(flatten_detection(DOC))
+    empty, = flatten_detection({"_id": RECORD_ID, "detection_time": DETECTION_TIME})
+
+    assert [row["item_index"] for row in rows] == [0, 1]
+    assert [row["检测项目"] for row in rows] == ["食品名称", "配料表"]
+    assert rows[0]["record_id"] == str(RECORD_ID) and rows[0]["detection_time"] == DETECTION_TIME.isoformat()
+    assert [parse_resume_token(row["resume_token"]) for row in rows] == [
+        (DETECTION_TIME, RECORD_ID, 0), (DETECTION_TIME, RECORD_ID, 1)]
+    assert empty["item_index"] is None and parse_resume_token(empty["resume_token"]) == (DETECTION_TIME, RECORD_ID, None)
+
+
+def test_resume_token_round_trip_and_invalid_tokens():
+    assert parse_resume_token(make_resume_token(DETECTION_TIME, RECORD_ID, 3)) == (DETECTION_TIME, RECORD_ID, 3)
+    assert parse_resume_token(make_resume_token(DETECTION_TIME, RECORD_ID)) == (DETECTION_TIME, RECORD_ID, None)
+    for token in ("", "2025-01-02", f"2025-01-02|{RECORD_ID}|x", f"2025-01-02|{RECORD_ID}|-1", "bad|64b7"):
+        with pytest.raises(ValueError):
+            parse_resume_token(token)
+
+
+def test_build_query_with_resume_token():
+    start = datetime(2025, 1, 1)
+    record = build_query(start=start, resume_after=make_resume_token(DETECTION_TIME, RECORD_ID))
+    item = build_query(resume_after=make_resume_token(DETECTION_TIME, RECORD_ID, 1))
+
+    assert record == {"$and": [
+        {"detection_time": {"$gte": start}},
+        {"$or": [{"detection_time": {"$gt": DETECTION_TIME}},
+                 {"detection_time": DETECTION_TIME, "_id": {"$gt": RECORD_ID}}]},
+    ]}
+    # 中断在记录中间时包含该记录本身，剩下的检测项目继续导出
+    assert item["$or"][1] == {"detection_time": DETECTION_TIME, "_id": {"$gte": RECORD_ID}}
+    with pytest.raises(ValueError):
+        build_query(resume_after="not-a-token")
+
+
+def test_resume_skips_items_already_exported(monkeypatch):
+    later = {"_id": ObjectId(), "detection_time": datetime(2025, 1, 3)}
+
+    class Cursor:
+        def __init__(self, docs):
+            self.docs = docs
+
+        def __aiter__(self):
+            return self._iterate()
+
+        async def _iterate(self):
+            for doc in self.docs:
+                yield doc
+
+        async def close(self):
+            pass
+
+    class Collection:
+        def find(self, query, **kwargs):
+            return Cursor([DOC, later])
+
+    async def collection():
+        return Collection()
+
+    monkeypatch.setattr(export, "_detection_collection", collection)
+
+    async def scenario():
+        resume_after = make_resume_token(DETECTION_TIME, RECORD_ID, 0)
+        return [row async for rows in export.iter_detection_batches({}, 10, resume_after) for row in rows]
+
+    rows = asyncio.run(scenario())
+
+    assert [(row["record_id"], row["item_index"]) for row in rows] == [(str(RECORD_ID), 1), (str(later["_id"]), None)]
+
+
+def write_export(path, rows, header=True):
+    with open(path, "wb") as f:
+        f.write(CsvExportWriter(write_header=header).encode(rows))
+
+
+def test_read_last_resume_token_with_multi_line_quoted_field(tmp_path):
+    path = tmp_path / "export.csv"
+    write_export(path, [])
+    assert read_last_resume_token(str(path)) is None
+
+    rows = list(flatten_detection(DOC))
+    write_export(path, rows)
+
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        assert list(csv.DictReader(f))[-1]["问题描述"] == rows[1]["问题描述"]
+    assert read_last_resume_token(str(path)) == rows[1]["resume_token"]
+    assert read_last_resume_token(str(tmp_path / "missing.csv")) is None
+
+
+def test_read_last_resume_token_rejects_truncated_file(tmp_path):
+    path = tmp_path / "export.csv"
+    write_export(path, list(flatten_detection(DOC)))
+    content = path.read_bytes()
+
+    embedded_newline = content.index("第一行\n".encode()) + len("第一行\n".encode())
+
+    # 中断在最后一个令牌中间，或正好中断在带引号的多行字段的换行之后
+    for truncated in (content[:-3], content[:embedded_newline]):
+        path.write_bytes(truncated)
+        with pytest.raises(ValueError):
+            read_last_resume_token(str(path))
+
+
+def test_cli_resume_never_truncates(tmp_path, capsys):
+    path = tmp_path / "export.csv"
+    write_export(path, list(flatten_detection(DOC)))
+    truncated = path.read_bytes()[:-5]
+    path.write_bytes(truncated)
+
+    assert main(["--resume", "-o", str(path)]) == 2
+    assert path.read_bytes() == truncated
+    assert main(["--resume-after", "not-a-token", "-o", str(tmp_path / "other.csv")]) == 2
+    assert "无效的resume_token" in capsys.readouterr().err
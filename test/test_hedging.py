@@ -0,0 +1,86 @@
+"""
+对冲请求测试
+"""
+
+import json
+import asyncio
+
+import httpx
+
+from backend import dify_client
+from backend.dify_pool import DifyBackendConfig, DifyPool
+from backend.hedging import HedgePolicy, HedgeSettings
+
+
+def make_policy(samples=(0.05,) * 5, **settings):
+    policy = HedgePolicy(HedgeSettings(**dict(dict(enabled=True, min_samples=5, min_delay=0.0), **settings)))
+    for seconds in samples:
+        policy.observe(seconds)
+    return policy
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    policy = make_policy()
+    cancelled = []
+
+    async def run(name, seconds):
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+        return name
+
+    async def scenario():
+        result = await policy.run(lambda: run("primary", 5), lambda: run("hedge", 0.01))
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(scenario()) == "hedge"
+    assert cancelled == ["primary"]
+
+
+def test_no_hedge_without_samples_or_budget():
+    calls = []
+
+    async def run(name, seconds=0.1):
+        calls.append(name)
+        await asyncio.sleep(seconds)
+        return name
+
+    assert make_policy(samples=()).delay() is None
+    assert make_policy(enabled=False).delay() is None
+
+    policy = make_policy(budget=1)
+    policy.budget.tokens = 0
+    assert asyncio.run(policy.run(lambda: run("primary"), lambda: run("hedge"))) == "primary"
+    assert calls == ["primary"]
+
+
+def test_hedge_runs_on_another_backend(tmp_path, monkeypatch, dify_mock):
+    pool = DifyPool([DifyBackendConfig(name=name, base_url=f"http://{name}.dify/v1", api_token=f"app-{name}")
+                     for name in ("a", "b")])
+    pool.record(pool.get("a"), 1.0, True)
+    pool.record(pool.get("b"), 2.0, True)
+    monkeypatch.setattr(dify_client, "dify_pool", pool)
+    monkeypatch.setattr(dify_client, "hedge_policy", make_policy())
+    image = tmp_path / "label.jpg"
+    image.write_bytes(b"\xff\xd8hedge")
+    runs = []
+
+    async def fake_dify(request):
+        host = request.url.host
+        if request.url.path.endswith("/files/upload"):
+            return httpx.Response(201, json={"id": f"file-on-{host}"})
+        runs.append((host, json.loads(request.content)["inputs"]["TagImage"][0]["upload_file_id"]))
+        if host == "a.dify":
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded", "outputs": {"text": "{}"}}})
+
+    result = dify_mock(fake_dify, lambda client: dify_client.call_dify_workflow(
+        str(image), "糕点", "x", "单件", "y", max_retries=0, response_mode="blocking",
+    ))
+
+    assert result["success"] and result["backend"] == "b"
+    assert runs == [("a.dify", "file-on-a.dify"), ("b.dify", "file-on-b.dify")]
+    assert pool.get("a").outstanding == 0
@@ -0,0 +1,87 @@
+"""
+检测请求幂等键测试
+"""
+
+import io
+import json
+import asyncio
+
+import httpx
+import pytest
+
+from backend.idempotency import IdempotencyStore, idempotency_store
+
+DIFY_DELAY = 0.2
+
+FORM = {"Foodtype": "糕点", "PackageFoodType": "直接提供给消费者的预包装食品", "SingleOrMulti": "单件",
+        "PackageSize": "最大表面面积大于35cm2", "DetectionTime": "2025-01-01", "ResponseMode": "blocking"}
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setenv("PRESCREEN_MODE", "off")
+    monkeypatch.setenv("NEAR_DUP_MODE", "off")
+    idempotency_store.clear()
+    yield
+    idempotency_store.clear()
+
+
+def test_repeats_attach_to_the_running_detection_and_replay_its_result(dify_mock):
+    runs = []
+
+    async def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            return httpx.Response(201, json={"id": "file-1"})
+        runs.append(json.loads(request.content))
+        await asyncio.sleep(DIFY_DELAY)
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded", "outputs": {"text": "{}"}}})
+
+    async def scenario(client):
+        def post(key, image=b"\xff\xd8same"):
+            return client.post(
+                "/api/detect",
+                files={"file": ("label.jpg", io.BytesIO(image), "image/jpeg")},
+                data=FORM,
+                headers={"X-API-Key": "idempotency-test", "Idempotency-Key": key},
+            )
+
+        first, retry = await asyncio.gather(post("submit-1"), post("submit-1"))
+        replay = await post("submit-1")
+        conflict = await post("submit-1", image=b"\xff\xd8other")
+        return first, retry, replay, conflict
+
+    first, retry, replay, conflict = dify_mock(fake_dify, scenario)
+
+    assert len(runs) == 1
+    assert first.status_code == retry.status_code == replay.status_code == 200
+    assert first.json()["detection_id"] == retry.json()["detection_id"] == replay.json()["detection_id"]
+    assert "idempotent-replayed" not in first.headers
+    assert retry.headers["idempotent-replayed"] == replay.headers["idempotent-replayed"] == "true"
+    assert conflict.status_code == 422
+
+
+def test_failed_runs_are_not_stored_and_completed_entries_expire():
+    store = IdempotencyStore(ttl=60, max_entries=10)
+    calls = []
+
+    async def failing():
+        calls.append("fail")
+        raise RuntimeError("Dify 超时")
+
+    async def succeeding():
+        calls.append("ok")
+        return {"detection_id": "d1"}
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await store.run(("c", "k"), "fp", failing)
+        result, status = await store.run(("c", "k"), "fp", succeeding)
+        assert (result, status) == ({"detection_id": "d1"}, "new")
+        assert (await store.run(("c", "k"), "fp", succeeding))[1] == "replayed"
+        # 超过有效期后重新检测
+        store._entries[("c", "k")].completed_at -= 61
+        assert (await store.run(("c", "k"), "fp", succeeding))[1] == "new"
+
+    asyncio.run(scenario())
+
+    assert calls == ["fail", "ok", "ok"]
@@ -0,0 +1,122 @@
+"""
+感知哈希与近重复检测测试
+"""
+
+import io
+import os
+import random
+
+import httpx
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance
+
+from backend import main_simple_fixed
+from backend.image_hash import MultiIndexHash, NearDuplicateIndex, compute_hashes, hamming
+from backend.result_cache import ResultCache
+
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output.json")
+
+
+def synthetic_label(seed: int, size=(1200, 900)) -> Image.Image:
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, (240, 230, 200))
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle([x, y, x + rng.randint(20, 300), y + rng.randint(10, 60)],
+                       fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+
+def to_jpeg(image: Image.Image, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def test_reshoots_are_close_and_other_labels_are_far():
+    label = synthetic_label(1)
+    original = compute_hashes(to_jpeg(label))
+    reshoots = [
+        to_jpeg(label, quality=50),
+        to_jpeg(ImageEnhance.Brightness(label).enhance(1.3)),
+        to_jpeg(label.crop((30, 20, 1170, 880))),
+        to_jpeg(label.resize((600, 450))),
+    ]
+    index = NearDuplicateIndex()
+    index.add(original, "params", detection_id="first")
+
+    for content in reshoots:
+        match = index.find(compute_hashes(content), "params")
+        assert match and match["detection_id"] == "first"
+        assert index.find(compute_hashes(content), "other-params") is None
+    for seed in range(2, 6):
+        assert index.find(compute_hashes(to_jpeg(synthetic_label(seed))), "params") is None
+
+
+def test_multi_index_hash_matches_linear_scan():
+    rng = random.Random(7718)
+    keys = [rng.getrandbits(64) for _ in range(2000)]
+    # 加入一批彼此接近的哈希
+    keys += [keys[0] ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for _ in range(50)]
+    index = MultiIndexHash()
+    for position, key in enumerate(keys):
+        index.add(key, position)
+
+    for query in keys[:20] + [rng.getrandbits(64) for _ in range(20)]:
+        found, compared = index.search(query, 8)
+        expected = sorted(position for position, key in enumerate(keys) if hamming(query, key) <= 8)
+        assert sorted(position for _, position in found) == expected
+        assert compared < len(keys) // 10
+
+
+def test_index_rebuild_keeps_recent_entries():
+    index = NearDuplicateIndex(max_entries=10)
+    for number in range(11):
+        index.add((number, number), "params", detection_id=str(number))
+
+    assert len(index) == 5
+    assert index.find((10, 10), "params")["detection_id"] == "10"
+    assert index.find((0, 0), "params")["detection_id"] != "0"
+
+
+def test_near_duplicate_upload_is_served_from_prior_result(monkeypatch, dify_mock):
+    monkeypatch.setenv("PRESCREEN_MODE", "off")
+    monkeypatch.setenv("NEAR_DUP_MODE", "serve")
+    monkeypatch.setattr(main_simple_fixed, "result_cache", ResultCache(max_entries=8))
+    monkeypatch.setattr(main_simple_fixed, "near_duplicate_index", NearDuplicateIndex())
+    with open(OUTPUT_PATH, encoding="utf-8") as f:
+        text = f.read() + "\n\n### 不规范内容总结报告\n"
+    runs = []
+
+    def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            return httpx.Response(201, json={"id": "file-1"})
+        runs.append(1)
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded", "outputs": {"text": text}}})
+
+    label = synthetic_label(1)
+    uploads = [to_jpeg(label), to_jpeg(ImageEnhance.Brightness(label).enhance(0.8), quality=60)]
+
+    async def scenario(client):
+        bodies = []
+        for content in uploads:
+            response = await client.post(
+                "/api/detect",
+                files={"file": ("label.jpg", io.BytesIO(content), "image/jpeg")},
+                data={"Foodtype": "糕点", "PackageFoodType": "直接提供给消费者的预包装食品",
+                      "SingleOrMulti": "单件", "PackageSize": "最大表面面积大于35cm2",
+                      "DetectionTime": "2025-01-01", "ResponseMode": "blocking"},
+                headers={"X-API-Key": "near-dup-test"},
+            )
+            assert response.status_code == 200, response.text
+            bodies.append(response.json())
+        return bodies
+
+    first, second = dify_mock(fake_dify, scenario)
+
+    assert len(runs) == 1
+    assert first["near_duplicate"] is None
+    assert second["cache"] == "near_duplicate"
+    assert second["near_duplicate"]["detection_id"] == first["detection_id"]
+    assert second["near_duplicate"]["served"] is True
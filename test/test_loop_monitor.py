@@ -0,0 +1,56 @@
+"""
+事件循环监控测试：阻塞调用应被检测并记录调用栈
+"""
+
+import time
+import asyncio
+import logging
+
+from backend.loop_monitor import EventLoopMonitor, loop_blocked, loop_lag
+from backend.metrics import metrics
+
+
+def blocking_handler():
+    time.sleep(0.3)
+
+
+def test_monitor_reports_blocking_callback_with_stack(caplog):
+    async def scenario():
+        monitor = EventLoopMonitor(interval=0.02, threshold=0.1)
+        monitor.start()
+        await asyncio.sleep(0.1)
+        blocking_handler()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+        return monitor
+
+    blocked_before = loop_blocked.value()
+    with caplog.at_level(logging.WARNING, logger="backend.loop_monitor"):
+        monitor = asyncio.run(scenario())
+
+    assert loop_blocked.value() == blocked_before + 1
+    assert monitor.max_lag >= 0.25
+    assert any("blocking_handler" in record.getMessage() for record in caplog.records)
+
+
+def test_monitor_stays_quiet_for_cooperative_code():
+    async def scenario():
+        monitor = EventLoopMonitor(interval=0.02, threshold=0.1)
+        monitor.start()
+        await asyncio.gather(*(asyncio.sleep(0.05) for _ in range(100)))
+        await asyncio.sleep(0.2)
+        await monitor.stop()
+
+    blocked_before = loop_blocked.value()
+    samples_before = loop_lag.count()
+    asyncio.run(scenario())
+
+    assert loop_blocked.value() == blocked_before
+    assert loop_lag.count() > samples_before
+
+
+def test_lag_is_exported_as_metric():
+    rendered = metrics.render()
+
+    assert "# TYPE event_loop_lag_seconds histogram" in rendered
+    assert "event_loop_blocked_total" in rendered
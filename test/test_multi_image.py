@@ -0,0 +1,64 @@
+"""
+多图检测测试（同一产品的多个标签面在一次工作流运行中提交）
+"""
+
+import io
+import json
+import time
+import asyncio
+
+import httpx
+
+UPLOAD_DELAY = 0.2
+
+
+def post_images(images):
+    async def scenario(client):
+        return await client.post(
+            "/api/detect",
+            files=[("file", (name, io.BytesIO(data), "image/jpeg")) for name, data in images],
+            data={"Foodtype": "糕点", "PackageFoodType": "直接提供给消费者的预包装食品",
+                  "SingleOrMulti": "单件", "PackageSize": "最大表面面积大于35cm2",
+                  "DetectionTime": "2025-01-01", "ResponseMode": "blocking"},
+            headers={"X-API-Key": "multi-image-test"},
+        )
+
+    return scenario
+
+
+def test_panels_are_uploaded_concurrently_and_sent_in_one_run(monkeypatch, dify_mock):
+    monkeypatch.setenv("PRESCREEN_MODE", "off")
+    monkeypatch.setenv("NEAR_DUP_MODE", "off")
+    uploads, runs = [], []
+
+    async def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            uploads.append(request)
+            file_id = f"file-{len(uploads)}"
+            await asyncio.sleep(UPLOAD_DELAY)
+            return httpx.Response(201, json={"id": file_id})
+        runs.append(json.loads(request.content)["inputs"])
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded", "outputs": {"text": "{}"}}})
+
+    images = [("front.jpg", b"\xff\xd8front"), ("back.jpg", b"\xff\xd8back"), ("side.jpg", b"\xff\xd8side")]
+    started = time.perf_counter()
+    response = dify_mock(fake_dify, post_images(images))
+    elapsed = time.perf_counter() - started
+
+    assert response.status_code == 200, response.text
+    assert len(runs) == 1
+    assert sorted(image["upload_file_id"] for image in runs[0]["TagImage"]) == ["file-1", "file-2", "file-3"]
+    assert elapsed < UPLOAD_DELAY * len(images)
+    body = response.json()
+    assert [item["filename"] for item in body["files"]] == ["front.jpg", "back.jpg", "side.jpg"]
+    assert all(item["upload_ms"] >= UPLOAD_DELAY * 1000 * 0.9 for item in body["files"])
+    assert body["file_info"]["filename"] == "front.jpg"
+
+
+def test_too_many_images_are_rejected(dify_mock):
+    def fail(request):
+        raise AssertionError("超出数量限制时不应调用Dify")
+
+    response = dify_mock(fail, post_images([(f"{index}.jpg", b"\xff\xd8x") for index in range(7)]))
+
+    assert response.status_code == 400
@@ -0,0 +1,92 @@
+"""
+预上传测试
+"""
+
+import io
+import json
+
+import httpx
+
+from backend import dify_client
+from backend.dify_pool import DifyBackendConfig, DifyPool
+from backend.rate_limit import rate_limiter
+
+FORM = {"Foodtype": "糕点", "PackageFoodType": "直接提供给消费者的预包装食品", "SingleOrMulti": "单件",
+        "PackageSize": "最大表面面积大于35cm2", "DetectionTime": "2025-01-01", "ResponseMode": "blocking"}
+
+
+def test_detect_with_upload_id_skips_dify_upload(monkeypatch, dify_mock):
+    # 句柄按客户端隔离，两个客户端都需要是已登记的密钥
+    monkeypatch.setattr(rate_limiter, "config",
+                        rate_limiter.config.model_copy(update={"api_keys": ["pre-upload-test", "someone-else"]}))
+    requests = []
+
+    def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            requests.append("upload")
+            return httpx.Response(201, json={"id": "pre-uploaded-file"})
+        requests.append(json.loads(request.content)["inputs"]["TagImage"][0]["upload_file_id"])
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded", "outputs": {"text": "{}"}}})
+
+    async def scenario(client):
+        uploaded = await client.post(
+            "/api/upload",
+            files={"file": ("label.jpg", io.BytesIO(b"\xff\xd8pre-upload"), "image/jpeg")},
+            headers={"X-API-Key": "pre-upload-test"},
+        )
+        upload_id = uploaded.json()["upload_id"]
+        detected = [
+            await client.post("/api/detect", data=dict(FORM, UploadId=upload_id),
+                              headers={"X-API-Key": "pre-upload-test"})
+            for _ in range(2)
+        ]
+        # 句柄按客户端隔离
+        other = await client.post("/api/detect", data=dict(FORM, UploadId=upload_id),
+                                  headers={"X-API-Key": "someone-else"})
+        missing = await client.post("/api/detect", data=FORM, headers={"X-API-Key": "pre-upload-test"})
+        return uploaded, detected, other, missing
+
+    uploaded, detected, other, missing = dify_mock(fake_dify, scenario)
+
+    assert uploaded.status_code == 200
+    for response in detected:
+        assert response.status_code == 200
+        body = response.json()
+        assert body["files"][0]["filename"] == "label.jpg"
+        assert body["files"][0]["pre_uploaded"] is True
+    # 只上传了一次，两次检测都复用预上传的文件ID
+    assert requests == ["upload", "pre-uploaded-file", "pre-uploaded-file"]
+    assert other.status_code == 404
+    assert missing.status_code == 400
+
+
+def test_pre_upload_routes_to_the_category_workflow(monkeypatch, dify_mock):
+    monkeypatch.setattr(dify_client, "dify_pool", DifyPool([
+        DifyBackendConfig(name="general", base_url="http://general.dify/v1", api_token="app-general"),
+        DifyBackendConfig(name="nd", base_url="http://nd.dify/v1", api_token="app-nd", categories=["non_direct"]),
+    ]))
+    requests = []
+
+    def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            requests.append((request.url.host, "upload"))
+            return httpx.Response(201, json={"id": "pre-uploaded-file"})
+        requests.append((request.url.host, "run"))
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded", "outputs": {"text": "{}"}}})
+
+    form = dict(FORM, PackageFoodType="非直接提供给消费者的预包装食品")
+
+    async def scenario(client):
+        uploaded = await client.post(
+            "/api/upload",
+            files={"file": ("label.jpg", io.BytesIO(b"\xff\xd8category"), "image/jpeg")},
+            data={"PackageFoodType": form["PackageFoodType"], "PackageSize": form["PackageSize"]},
+        )
+        return await client.post("/api/detect", data=dict(form, UploadId=uploaded.json()["upload_id"]))
+
+    response = dify_mock(fake_dify, scenario)
+
+    assert response.status_code == 200
+    assert response.json()["files"][0]["pre_uploaded"] is True
+    # 预上传到专门工作流所在的后端，检测时不再上传
+    assert requests == [("nd.dify", "upload"), ("nd.dify", "run")]
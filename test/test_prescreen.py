@@ -0,0 +1,128 @@
+"""
+本地预筛查测试（离线，不访问Dify）
+"""
+
+import io
+import json
+import time
+
+import httpx
+
+from backend.prescreen import build_context, evaluate_rules, summarize_findings
+
+COMPLIANT_LABEL = """
+稻香村广式月饼
+配料：小麦粉、白砂糖、植物油、鸡蛋、莲蓉
+致敏物质提示：本产品含有小麦、鸡蛋
+营养成分表 项目 每100克 能量 1800千焦 蛋白质 6.0克
+净含量：500克
+生产日期：2025年08月01日 保质期：60天
+贮存条件：置于阴凉干燥处
+生产商：北京稻香村食品有限责任公司 地址：北京市昌平区 电话：010-12345678
+食品生产许可证编号：SC12311011400123
+产品标准代号：GB/T 19855
+"""
+
+DEFECTIVE_LABEL = """
+稻香村广式月饼 不添加防腐剂
+小麦粉、白砂糖、植物油、鸡蛋、莲蓉
+净含量：500
+生产日期：01/08/2025 保质期：60天
+生产商：北京稻香村食品有限责任公司 地址：北京市昌平区
+食品生产许可证编号：SC1231101140
+"""
+
+DIRECT = build_context("直接提供给消费者的预包装食品", "最大表面面积大于35cm2", None)
+
+
+def results_by_item(findings):
+    return {finding["检测项目"]: finding for finding in findings}
+
+
+def test_compliant_label_passes_all_checks():
+    findings = evaluate_rules(COMPLIANT_LABEL, DIRECT)
+    summary = summarize_findings(findings)
+
+    assert summary["failed"] == 0, [f for f in findings if f["检测结果"] == "不合格"]
+    assert results_by_item(findings)["食品名称"]["检测结果"] == "待复核"
+
+
+def test_mechanical_defects_are_reported_with_risk_levels():
+    findings = results_by_item(evaluate_rules(DEFECTIVE_LABEL, DIRECT))
+
+    assert findings["配料表"]["检测结果"] == "不合格"
+    assert findings["配料表"]["风险等级"] == "高风险"
+    assert "净含量缺少法定计量单位" in findings["净含量和规格"]["问题描述"]
+    assert "日期未按年月日顺序标示" in findings["日期标示"]["问题描述"]
+    assert "缺少联系方式" in findings["生产者/经营者信息"]["问题描述"]
+    assert "许可证编号格式错误" in findings["食品生产许可证编号"]["问题描述"]
+    assert findings["配料定量标示"]["检测结果"] == "不合格"
+    assert findings["致敏物质提示"]["风险等级"] == "低风险"
+
+
+def test_imported_food_is_exempt_from_license_and_standard_code():
+    context = build_context("直接提供给消费者的预包装食品", "最大表面面积大于35cm2", "进口食品")
+    findings = results_by_item(evaluate_rules(DEFECTIVE_LABEL, context))
+
+    assert findings["食品生产许可证编号"]["检测结果"] == "豁免"
+    assert findings["产品标准代号"]["检测结果"] == "豁免"
+
+
+def test_rules_run_in_milliseconds():
+    started = time.perf_counter()
+    for _ in range(100):
+        evaluate_rules(COMPLIANT_LABEL, DIRECT)
+    assert (time.perf_counter() - started) / 100 < 0.005
+
+
+def post_detect(label_text):
+    async def scenario(client):
+        return await client.post(
+            "/api/detect",
+            files={"file": ("label.jpg", io.BytesIO(b"\xff\xd8fake"), "image/jpeg")},
+            data={
+                "Foodtype": "糕点",
+                "PackageFoodType": "直接提供给消费者的预包装食品",
+                "SingleOrMulti": "单件",
+                "PackageSize": "最大表面面积大于35cm2",
+                "DetectionTime": "2025-01-01",
+                "LabelText": label_text,
+                "ResponseMode": "blocking",
+            },
+            headers={"X-API-Key": "prescreen-test"},
+        )
+
+    return scenario
+
+
+def test_short_circuit_skips_dify(monkeypatch, dify_mock):
+    monkeypatch.setenv("PRESCREEN_MODE", "short_circuit")
+
+    def fail(request):
+        raise AssertionError("短路模式下不应调用Dify")
+
+    response = dify_mock(fail, post_detect(DEFECTIVE_LABEL))
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["dify_result"]["metadata"]["source"] == "prescreen"
+    assert body["dify_result"]["outputs"]["json_data"]["合规性评估"]["总体评级"] == "不合格"
+    assert body["prescreen"]["summary"]["高风险"] >= 1
+    assert body["usage"]["total_tokens"] == 0
+
+
+def test_enrich_mode_passes_findings_to_workflow(monkeypatch, dify_mock):
+    monkeypatch.setenv("PRESCREEN_MODE", "enrich")
+    sent = {}
+
+    def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            return httpx.Response(201, json={"id": "file-1"})
+        sent.update(json.loads(request.content)["inputs"])
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded", "outputs": {"text": "{}"}}})
+
+    response = dify_mock(fake_dify, post_detect(DEFECTIVE_LABEL))
+
+    assert response.status_code == 200, response.text
+    assert "净含量缺少法定计量单位" in sent["PreScreenFindings"]
+    assert response.json()["prescreen"]["status"] == "completed"
@@ -0,0 +1,75 @@
+"""
+按检测参数组装提示词测试
+"""
+
+import io
+import json
+
+import httpx
+
+from backend import dify_client
+from backend.dify_pool import DifyBackendConfig, DifyPool
+from backend.prompt_assembly import DEFAULT_PROMPT_FILE, assemble, prompt_context, prompt_input_name
+
+FORM = {"Foodtype": "糕点", "PackageFoodType": "非直接提供给消费者的预包装食品", "SingleOrMulti": "单件",
+        "PackageSize": "最大表面面积大于35cm2", "DetectionTime": "2025-01-01", "ResponseMode": "blocking"}
+
+
+def test_assemble_keeps_only_sections_for_the_category():
+    with open(DEFAULT_PROMPT_FILE, encoding="utf-8") as f:
+        template = f.read()
+
+    full = assemble(template)
+    non_direct_domestic = assemble(template, prompt_context(FORM["PackageFoodType"], FORM["PackageSize"], "国产"))
+    imported_large = assemble(template, prompt_context("直接提供给消费者的预包装食品", "最大表面面积大于60cm2", "进口食品"))
+
+    assert "<!--" not in full and "10项必备内容" in full and "进口食品附加检测" in full
+    assert "10项必备内容" not in non_direct_domestic and "对于非直接消费者产品" in non_direct_domestic
+    assert "进口食品附加检测" not in non_direct_domestic and "进口食品豁免" not in non_direct_domestic
+    assert "对于非直接消费者产品" not in imported_large and "进口食品附加检测" in imported_large
+    # 只有明确超过60cm²时才去掉 INS 编码标示方式；「大于35cm2」可能在35-60cm²之间
+    assert "INS编码" not in imported_large and "INS编码" in non_direct_domestic
+    assert len(non_direct_domestic) < len(full) and len(imported_large) < len(full)
+
+
+def test_blank_parameters_keep_their_sections():
+    with open(DEFAULT_PROMPT_FILE, encoding="utf-8") as f:
+        template = f.read()
+
+    context = prompt_context("直接提供给消费者的预包装食品", "最大表面面积大于35cm2", "")
+    prompt = assemble(template, context)
+
+    assert context == {"non_direct": False, "imported": None, "over_60cm2": None}
+    # 没有填写特殊要求时不能断定不是进口食品
+    assert "进口食品附加检测" in prompt and "进口食品豁免" in prompt and "INS编码" in prompt
+    assert assemble(template, prompt_context(None, None, None)) == assemble(template)
+
+
+def test_detect_sends_assembled_prompt_and_routes_to_category_workflow(monkeypatch, dify_mock):
+    monkeypatch.setenv("PROMPT_ASSEMBLY", "input")
+    monkeypatch.setattr(dify_client, "dify_pool", DifyPool([
+        DifyBackendConfig(name="general", base_url="http://general.dify/v1", api_token="app-general"),
+        DifyBackendConfig(name="nd", base_url="http://nd.dify/v1", api_token="app-nd", categories=["non_direct"]),
+    ]))
+    runs = []
+
+    def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            return httpx.Response(201, json={"id": "file-1"})
+        runs.append((request.url.host, json.loads(request.content)["inputs"]))
+        return httpx.Response(200, json={"task_id": "t", "data": {"status": "succeeded", "outputs": {"text": "{}"}}})
+
+    async def scenario(client):
+        for package_food_type in ("非直接提供给消费者的预包装食品", "直接提供给消费者的预包装食品"):
+            response = await client.post(
+                "/api/detect", data=dict(FORM, PackageFoodType=package_food_type),
+                files={"file": ("label.jpg", io.BytesIO(package_food_type.encode()), "image/jpeg")},
+            )
+            assert response.status_code == 200
+
+    dify_mock(fake_dify, scenario)
+
+    (non_direct_host, non_direct), (direct_host, direct) = runs
+    assert (non_direct_host, direct_host) == ("nd.dify", "general.dify")
+    assert "10项必备内容" not in non_direct[prompt_input_name()]
+    assert "10项必备内容" in direct[prompt_input_name()]
@@ -0,0 +1,104 @@
+"""
+提示词/工作流版本登记与结果缓存测试
+"""
+
+import io
+import os
+import json
+
+import httpx
+import pytest
+
+from backend import main_simple_fixed
+from backend.prompt_registry import PromptRegistry
+from backend.result_cache import ResultCache, request_digest
+
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output.json")
+
+
+@pytest.fixture
+def prompt_dir(tmp_path):
+    (tmp_path / "prompt.md").write_text("# 提示词 v1", encoding="utf-8")
+    (tmp_path / "prompt_law.md").write_text("", encoding="utf-8")
+    return tmp_path
+
+
+def test_fingerprint_follows_prompt_and_workflow_changes(prompt_dir):
+    registry = PromptRegistry(str(prompt_dir), refresh_interval=0)
+    first = registry.fingerprint
+    assert registry.fingerprint == first
+    assert set(registry.current()["prompts"]) == {"prompt.md", "prompt_law.md"}
+
+    (prompt_dir / "prompt.md").write_text("# 提示词 v2（修改了判定标准）", encoding="utf-8")
+    second = registry.fingerprint
+    assert second != first
+
+    registry.observe_workflow({"task_id": "t", "data": {"workflow_id": "wf-2", "outputs": {}}})
+    assert registry.current()["workflow"]["workflow_id"] == "wf-2"
+    assert registry.fingerprint not in (first, second)
+    assert [entry["fingerprint"] for entry in registry.history][1:] == [second, first]
+
+
+def test_cache_entries_are_scoped_by_version():
+    cache = ResultCache(max_entries=2)
+    digest = request_digest(b"image", ("糕点", None))
+
+    cache.put("v1", digest, {"outputs": {"json_data": 1}})
+    assert cache.get("v1", digest) == {"outputs": {"json_data": 1}}
+    assert cache.get("v2", digest) is None
+
+    cache.put("v2", digest, {"outputs": {"json_data": 2}})
+    cache.put("v2", "other", {})
+    # 旧版本条目按LRU淘汰，无需整体清空
+    assert cache.get("v1", digest) is None
+    assert cache.stats()["generations"] == {"v2": 2}
+    assert digest != request_digest(b"image", ("糕点", "进口"))
+
+
+def test_detect_reuses_results_until_prompt_changes(monkeypatch, prompt_dir, dify_mock):
+    monkeypatch.setenv("PRESCREEN_MODE", "off")
+    registry = PromptRegistry(str(prompt_dir), refresh_interval=0)
+    monkeypatch.setattr(main_simple_fixed, "prompt_registry", registry)
+    monkeypatch.setattr(main_simple_fixed, "result_cache", ResultCache(max_entries=8))
+    with open(OUTPUT_PATH, encoding="utf-8") as f:
+        text = f.read() + "\n\n### 不规范内容总结报告\n"
+    runs = []
+
+    def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            return httpx.Response(201, json={"id": "file-1"})
+        runs.append(1)
+        return httpx.Response(200, json={"task_id": "t", "data": {
+            "workflow_id": "wf-1", "status": "succeeded", "outputs": {"text": text}, "total_tokens": 900,
+        }})
+
+    async def scenario(client):
+        async def post(detection_time="2025-01-01"):
+            response = await client.post(
+                "/api/detect",
+                files={"file": ("label.jpg", io.BytesIO(b"\xff\xd8same-image"), "image/jpeg")},
+                data={"Foodtype": "糕点", "PackageFoodType": "直接提供给消费者的预包装食品",
+                      "SingleOrMulti": "单件", "PackageSize": "最大表面面积大于35cm2",
+                      "DetectionTime": detection_time, "ResponseMode": "blocking"},
+                headers={"X-API-Key": "cache-test"},
+            )
+            assert response.status_code == 200, response.text
+            return response.json()
+
+        first = await post()
+        second = await post("2025-03-15")
+        (prompt_dir / "prompt.md").write_text("# 提示词 v2", encoding="utf-8")
+        third = await post()
+        return first, second, third
+
+    first, second, third = dify_mock(fake_dify, scenario)
+
+    assert (first["cache"], second["cache"], third["cache"]) == ("miss", "hit", "miss")
+    assert len(runs) == 2
+    assert second["prompt_version"] == first["prompt_version"] != third["prompt_version"]
+    assert second["usage"]["total_tokens"] == 0
+    first_data, second_data = first["dify_result"]["outputs"]["json_data"], second["dify_result"]["outputs"]["json_data"]
+    # 命中缓存时检测时间取本次请求的值，检测结论与首次检测相同
+    assert second_data["基本信息"]["检测时间"] == "2025-03-15"
+    assert second_data["详细检测结果"] == first_data["详细检测结果"]
+    assert second["detection_id"] != first["detection_id"]
@@ -0,0 +1,140 @@
+"""
+限流与Dify并发池加权公平调度测试
+"""
+
+import io
+import asyncio
+
+import httpx
+import pytest
+from starlette.requests import Request
+
+from backend.main_simple import app
+from backend.rate_limit import RateLimitConfig, RateLimitPolicy, RateLimiter, TokenBucket, rate_limiter
+from backend.scheduler import FairScheduler
+
+
+@pytest.fixture
+def limiter_config():
+    original = rate_limiter.config
+    yield
+    rate_limiter.update(original)
+
+
+def test_token_bucket_refuses_when_empty():
+    bucket = TokenBucket(rate=0.5, burst=2)
+
+    assert bucket.consume() == 0
+    assert bucket.consume() == 0
+    assert bucket.consume() == pytest.approx(2.0, abs=0.01)
+
+
+def test_interactive_requests_overtake_bulk_backlog():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        order = []
+        gate = asyncio.Event()
+
+        async def job(flow, priority, name):
+            async with scheduler.slot(flow, priority):
+                order.append(name)
+                await gate.wait()
+
+        blocker = asyncio.create_task(job("bulk-team", "bulk", "bulk-0"))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(job("bulk-team", "bulk", f"bulk-{i}")) for i in range(1, 6)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(job("ip:10.0.0.1", "interactive", "interactive")))
+        await asyncio.sleep(0)
+        assert scheduler.waiting == 6
+
+        gate.set()
+        await asyncio.gather(blocker, *tasks)
+        return order
+
+    order = asyncio.run(scenario())
+
+    # 批量积压排在前面，交互式请求仍应在第一个批量请求之后立即获得槽位
+    assert order.index("interactive") <= 2
+    assert order[0] == "bulk-0"
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await scheduler.acquire("a")
+        waiter = asyncio.create_task(scheduler.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        scheduler.release()
+        return scheduler.active, scheduler.waiting
+
+    assert asyncio.run(scenario()) == (0, 0)
+
+
+def test_detect_returns_429_with_retry_after(limiter_config):
+    rate_limiter.update(RateLimitConfig(default=RateLimitPolicy(rate=0.01, burst=1), api_keys=["team-a", "team-b"]))
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            data = {"Foodtype": "糕点", "PackageFoodType": "x", "SingleOrMulti": "单件",
+                    "PackageSize": "y", "DetectionTime": "2025-01-01"}
+            # 不支持的文件类型在调用Dify之前即被拒绝，但同样会消耗令牌
+            files = {"file": ("label.txt", io.BytesIO(b"text"), "text/plain")}
+            first = await client.post("/api/detect", files=files, data=data, headers={"X-API-Key": "team-a"})
+            second = await client.post("/api/detect", files=files, data=data, headers={"X-API-Key": "team-a"})
+            other = await client.post("/api/detect", files=files, data=data, headers={"X-API-Key": "team-b"})
+            return first, second, other
+
+    first, second, other = asyncio.run(scenario())
+
+    assert first.status_code == 400
+    assert second.status_code == 429
+    assert int(second.headers["Retry-After"]) >= 1
+    assert other.status_code == 400
+
+
+def test_client_key_ignores_unknown_api_keys_and_untrusted_proxy_headers(limiter_config):
+    rate_limiter.update(RateLimitConfig(default=RateLimitPolicy(rate=1, burst=1), api_keys=["team-a"],
+                                        overrides={"team-b": RateLimitPolicy(rate=5, burst=5, priority="bulk")}))
+    limiter = RateLimiter(rate_limiter.config, trusted_proxies=["127.0.0.1/32"])
+
+    def request(peer, **headers):
+        return Request({"type": "http", "client": (peer, 1234),
+                        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]})
+
+    assert limiter.client_key(request("10.0.0.5"), "team-a") == "team-a"
+    assert limiter.client_key(request("10.0.0.5"), "team-b") == "team-b"
+    # 未登记的密钥按IP计算，不能靠更换密钥重置令牌桶
+    assert limiter.client_key(request("10.0.0.5"), "made-up-key") == "ip:10.0.0.5"
+    # 只有可信代理设置的 X-Real-IP 被采用，X-Forwarded-For 一律忽略
+    assert limiter.client_key(request("10.0.0.5", x_real_ip="1.2.3.4"), None) == "ip:10.0.0.5"
+    assert limiter.client_key(request("127.0.0.1", x_real_ip="1.2.3.4"), None) == "ip:1.2.3.4"
+    assert limiter.client_key(request("127.0.0.1", x_forwarded_for="1.2.3.4"), None) == "ip:127.0.0.1"
+
+
+def test_admin_endpoint_updates_limits(monkeypatch, limiter_config):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    payload = {
+        "default": {"rate": 2, "burst": 5},
+        "overrides": {"batch-key": {"rate": 10, "burst": 100, "priority": "bulk"}},
+    }
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            denied = await client.put("/api/admin/rate-limits", json=payload, headers={"X-Admin-Token": "wrong"})
+            invalid = await client.put("/api/admin/rate-limits", headers={"X-Admin-Token": "secret"},
+                                       json={"default": {"rate": 1, "burst": 1, "priority": "urgent"}})
+            updated = await client.put("/api/admin/rate-limits", json=payload, headers={"X-Admin-Token": "secret"})
+            current = await client.get("/api/admin/rate-limits", headers={"X-Admin-Token": "secret"})
+            return denied, invalid, updated, current
+
+    denied, invalid, updated, current = asyncio.run(scenario())
+
+    assert denied.status_code == 401
+    assert invalid.status_code == 422
+    assert updated.status_code == 200
+    assert current.json()["config"]["overrides"]["batch-key"]["priority"] == "bulk"
+    assert rate_limiter.policy_for("batch-key").burst == 100
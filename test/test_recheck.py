@@ -0,0 +1,154 @@
+"""
+定向复核测试
+"""
+
+import io
+import json
+
+import httpx
+import pytest
+
+from backend import recheck
+from backend.detection_schema import normalize_detection
+
+
+@pytest.fixture
+def previous():
+    with open("test/output.json", encoding="utf-8") as f:
+        return normalize_detection(json.load(f)).data
+
+
+def recheck_output(previous):
+    # 日期标示已整改；配料表仍不合格；额外输出的非复核项目被忽略
+    items = {item["检测项目"]: item for item in previous["详细检测结果"]}
+    return {"详细检测结果": [
+        dict(items["日期标示"], 检测结果="合格", 风险等级="无风险", 问题描述="", 实际情况="已直接标示生产日期"),
+        dict(items["配料表"], 实际情况="仍缺少引导词"),
+        dict(items["食品名称"], 检测结果="不合格", 风险等级="高风险"),
+    ]}
+
+
+def test_merge_replaces_only_rechecked_items(previous):
+    targets = recheck.failed_items(previous)
+    assert [item["检测项目"] for item in targets] == ["配料表", "日期标示", "产品标准代号", "致敏物质提示"]
+
+    merged, changes = recheck.merge_recheck(previous, recheck_output(previous), targets)
+
+    assert changes == [
+        {"检测项目": "配料表", "原结论": "不合格", "新结论": "不合格"},
+        {"检测项目": "日期标示", "原结论": "不合格", "新结论": "合格"},
+    ]
+    items = {item["检测项目"]: item for item in merged["详细检测结果"]}
+    assert items["食品名称"]["检测结果"] == "合格"
+    assert items["配料表"]["实际情况"] == "仍缺少引导词" and "复核时间" in items["配料表"]
+    assert merged["合规性评估"] == {"总体评级": "基本合格", "关键问题": 0, "一般问题": 3, "合规率": "70%"}
+    assert merged["不规范内容汇总"]["高风险问题"] == []
+    assert [entry["问题"] for entry in merged["整改优先级排序"]][0] == "配料表缺少引导词"
+    # 原记录不被修改
+    assert previous["详细检测结果"][5]["检测结果"] == "不合格"
+
+
+def test_recheck_endpoint_sends_only_failed_items_and_reports_savings(previous, monkeypatch, dify_mock):
+    record_id = "64b7f0c2a1b2c3d4e5f60718"
+    saved = {}
+
+    async def load_record(requested):
+        assert requested == record_id
+        return {"_id": requested, "product_type": "直接提供给消费者的预包装食品",
+                "package_size_category": "最大表面面积大于35cm2", "detection_result": previous}
+
+    async def full_run_baseline(food_type):
+        return 5000.0, 12
+
+    async def save_recheck(requested, merged, entry, prompt_version=None):
+        saved.update(merged=merged, entry=entry)
+
+    monkeypatch.setattr(recheck, "load_record", load_record)
+    monkeypatch.setattr(recheck, "full_run_baseline", full_run_baseline)
+    monkeypatch.setattr(recheck, "save_recheck", save_recheck)
+    runs = []
+
+    def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            return httpx.Response(201, json={"id": "file-1"})
+        runs.append(json.loads(request.content)["inputs"])
+        return httpx.Response(200, json={"task_id": "t", "data": {
+            "status": "succeeded", "total_tokens": 1200,
+            "outputs": {"text": json.dumps(recheck_output(previous), ensure_ascii=False)}}})
+
+    response = dify_mock(fake_dify, lambda client: client.post(
+        f"/api/detections/{record_id}/recheck",
+        files={"file": ("fixed.jpg", io.BytesIO(b"\xff\xd8fixed"), "image/jpeg")},
+        data={"Foodtype": "糕点", "ResponseMode": "blocking"},
+    ))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["rechecked"] == ["配料表", "日期标示", "产品标准代号", "致敏物质提示"]
+    assert body["token_savings"] == {"recheck_tokens": 1200, "full_run_tokens": 5000, "baseline_samples": 12,
+                                     "saved_tokens": 3800, "saved_pct": 76.0}
+    instructions = runs[0][recheck.recheck_input_name()]
+    assert "日期标示" in instructions and "食品名称" not in instructions
+    assert runs[0]["PackageFoodType"] == "直接提供给消费者的预包装食品"
+    assert saved["merged"]["合规性评估"]["合规率"] == "70%"
+    assert saved["entry"]["changes"][1]["新结论"] == "合格"
+
+
+def test_detect_writes_the_record_that_recheck_reads(previous, monkeypatch, dify_mock):
+    from backend import detection_history
+
+    monkeypatch.setenv("DETECTION_HISTORY_ENABLED", "true")
+    monkeypatch.setenv("PRESCREEN_MODE", "off")
+    monkeypatch.setenv("NEAR_DUP_MODE", "off")
+    records = {}
+
+    async def insert_record(document):
+        records[str(document["id"])] = dict(document, _id=document["id"])
+
+    async def load_record(record_id):
+        return records.get(record_id)
+
+    async def full_run_baseline(food_type):
+        return None, 0
+
+    async def save_recheck(record_id, merged, entry, prompt_version=None):
+        records[record_id]["detection_result"] = merged
+
+    monkeypatch.setattr(detection_history, "_insert_record", insert_record)
+    monkeypatch.setattr(recheck, "load_record", load_record)
+    monkeypatch.setattr(recheck, "full_run_baseline", full_run_baseline)
+    monkeypatch.setattr(recheck, "save_recheck", save_recheck)
+    runs = []
+
+    def fake_dify(request):
+        if request.url.path.endswith("/files/upload"):
+            return httpx.Response(201, json={"id": "file-1"})
+        inputs = json.loads(request.content)["inputs"]
+        runs.append(inputs)
+        output = recheck_output(previous) if recheck.recheck_input_name() in inputs else previous
+        return httpx.Response(200, json={"task_id": "t", "data": {
+            "status": "succeeded", "outputs": {"text": json.dumps(output, ensure_ascii=False)}}})
+
+    async def scenario(client):
+        detected = await client.post(
+            "/api/detect",
+            files={"file": ("label.jpg", io.BytesIO(b"\xff\xd8original"), "image/jpeg")},
+            data={"Foodtype": "糕点", "PackageFoodType": "非直接提供给消费者的预包装食品", "SingleOrMulti": "多件",
+                  "PackageSize": "最大表面面积大于35cm2", "DetectionTime": "2025-01-01", "ResponseMode": "blocking"},
+        )
+        record_id = detected.json()["record_id"]
+        rechecked = await client.post(
+            f"/api/detections/{record_id}/recheck",
+            files={"file": ("fixed.jpg", io.BytesIO(b"\xff\xd8fixed"), "image/jpeg")},
+            data={"ResponseMode": "blocking"},
+        )
+        return record_id, rechecked
+
+    record_id, rechecked = dify_mock(fake_dify, scenario)
+
+    assert rechecked.status_code == 200, rechecked.text
+    assert rechecked.json()["rechecked"] == ["配料表", "日期标示", "产品标准代号", "致敏物质提示"]
+    # 复核沿用原检测提交的参数
+    assert (runs[1]["Foodtype"], runs[1]["PackageFoodType"], runs[1]["SingleOrMulti"]) == (
+        "糕点", "非直接提供给消费者的预包装食品", "多件")
+    assert records[record_id]["detection_result"]["合规性评估"]["合规率"] == "70%"
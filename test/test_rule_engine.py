@@ -0,0 +1,63 @@
+"""
+GB 7718 规则引擎测试
+"""
+
+import random
+
+import pytest
+
+from backend.rule_engine import AhoCorasick, RuleCatalogue, default_catalogue, normalize_text
+
+
+def test_aho_corasick_matches_naive_search():
+    rng = random.Random(7718)
+    alphabet = "配料表净含量生产日期ab"
+    keywords = sorted({"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(60)})
+    automaton = AhoCorasick(keywords)
+
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        expected = {index for index, keyword in enumerate(keywords) if keyword in text}
+        assert automaton.search(text) == expected
+
+
+def test_normalize_text_handles_fullwidth_and_ocr_spacing():
+    assert normalize_text("净 含 量：５００ｇ\nSC 123") == "净含量:500g\nsc123"
+
+
+def test_catalogue_compiles_all_keywords_into_one_automaton():
+    catalogue = default_catalogue()
+
+    assert len(catalogue.rules) >= 10
+    assert "净含量" in catalogue.automaton.keywords
+    assert catalogue.pattern_count > 0
+
+
+def test_prefilter_does_not_change_results():
+    catalogue = default_catalogue()
+    texts = [
+        "配料：小麦粉 净含量：500克 生产日期：2025年1月1日 保质期：6个月 SC12311011400123",
+        "净含量 500 生产日期 01/02/2025 QS110112345678 电话 010-12345678",
+        "本品可治疗失眠 不添加防腐剂 执行标准：GB/T 20977",
+        "",
+    ]
+    for text in texts:
+        for context in ({}, {"imported": True}, {"non_direct": True}):
+            assert catalogue.evaluate(text, context) == catalogue.evaluate(text, context, prefilter=False)
+
+
+def test_imported_only_rules_apply_to_imported_food():
+    catalogue = default_catalogue()
+    domestic = {finding["规则"] for finding in catalogue.evaluate("配料：水", {})}
+    imported = {finding["规则"]: finding for finding in catalogue.evaluate("配料：水", {"imported": True})}
+
+    assert "imported_origin" not in domestic
+    assert imported["imported_origin"]["检测结果"] == "不合格"
+
+
+def test_catalogue_rejects_incomplete_rules():
+    with pytest.raises(ValueError):
+        RuleCatalogue({"rules": [{"id": "x", "检测类别": "强制内容"}]})
+    with pytest.raises(ValueError):
+        RuleCatalogue({"rules": [{"id": "x", "检测类别": "a", "检测项目": "b", "标准要求": "c",
+                                  "风险等级": "严重", "违反条款": "d", "整改建议": "e"}]})
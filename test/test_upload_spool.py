@@ -0,0 +1,89 @@
+"""
+上传暂存区测试
+"""
+
+import os
+import time
+import asyncio
+import threading
+
+import pytest
+
+from backend import upload_spool
+from backend.upload_spool import TEMP_SUFFIX, UploadSpool
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return UploadSpool(root=str(tmp_path / "uploads"), retention=60, max_bytes=1000)
+
+
+def test_identical_content_is_stored_once(spool):
+    async def scenario():
+        return await asyncio.gather(spool.store(b"label", ".JPG"), spool.store(b"label", ".jpg"))
+
+    first, second = asyncio.run(scenario())
+
+    assert first == second
+    assert first.endswith(".jpg")
+    assert os.listdir(spool.root) == [os.path.basename(first)]
+
+
+def test_sweep_respects_leases_retention_and_quota(spool):
+    leased = asyncio.run(spool.store(b"in use" * 100, ".jpg"))
+    released = asyncio.run(spool.store(b"done", ".jpg"))
+    spool.release(released)
+    # 没有租约记录的旧文件（如上次进程遗留）
+    old = os.path.join(spool.root, "old.png")
+    with open(old, "wb") as f:
+        f.write(b"old" * 200)
+    os.utime(old, (time.time() - 3600, time.time() - 3600))
+
+    removed = spool.sweep()
+
+    assert removed["expired"] == 1 and not os.path.exists(old)
+    assert os.path.exists(leased) and os.path.exists(released)
+
+    # 超出配额时删除最旧的未租用文件，租用中的文件保留
+    spool.max_bytes = 100
+    removed = spool.sweep()
+    assert removed["quota"] == 1 and not os.path.exists(released)
+    assert os.path.exists(leased)
+
+    spool.release(leased)
+    assert spool.sweep(now=time.time() + 61)["expired"] == 1
+    assert os.listdir(spool.root) == []
+
+
+def test_startup_recovery_removes_orphans(spool):
+    os.makedirs(spool.root)
+    for name in ("orphan.jpg", "half-written.jpg.1234" + TEMP_SUFFIX):
+        with open(os.path.join(spool.root, name), "wb") as f:
+            f.write(b"x")
+
+    assert spool.recover() == 2
+    assert os.listdir(spool.root) == []
+
+
+def test_sweep_does_not_remove_a_file_being_reused(spool, monkeypatch):
+    path = asyncio.run(spool.store(b"label", ".jpg"))
+    spool.release(path)
+    remove = os.remove
+    threads, stored = [], []
+
+    def store_then_remove(candidate):
+        # 请求恰好在清理任务检查租约之后、删除文件之前复用同一文件
+        thread = threading.Thread(target=lambda: stored.append(asyncio.run(spool.store(b"label", ".jpg"))))
+        thread.start()
+        thread.join(0.2)
+        threads.append(thread)
+        remove(candidate)
+
+    monkeypatch.setattr(upload_spool.os, "remove", store_then_remove)
+    removed = spool.sweep(now=time.time() + 61)
+    monkeypatch.undo()
+    threads[0].join(5)
+
+    assert removed["expired"] == 1
+    # 复用的请求拿到的文件必须存在
+    assert stored == [path] and os.path.exists(path)